@@ -141,10 +141,61 @@ print('Terminal log level is', LOGS_TERMINAL)
 WRITE_TO_PLC = config_ini.getboolean("plc", "WRITE_TO_PLC", fallback=True)
 print('PLC write flag is', WRITE_TO_PLC)
 
+# Adaptive PLC poll rate (seconds): fast after a trigger, backing off towards max when idle.
+# The rate is per PLC, not per station: one read per tick serves every station on that PLC and it
+# runs at the fastest of their intervals, so an idle station sharing a PLC with one in cycle is
+# read every POLL_MIN_INTERVAL too. Reads per second per PLC stay within 1 / POLL_MIN_INTERVAL;
+# raise POLL_MIN_INTERVAL to lower the S7 load of busy shared PLCs.
+PLC_POLL_MIN_INTERVAL = config_ini.getfloat("plc", "POLL_MIN_INTERVAL", fallback=0.075)
+PLC_POLL_MAX_INTERVAL = config_ini.getfloat("plc", "POLL_MAX_INTERVAL", fallback=1.5)
+PLC_POLL_BACKOFF = config_ini.getfloat("plc", "POLL_BACKOFF", fallback=1.5)
+PLC_POLL_BOOST_WINDOW = config_ini.getfloat("plc", "POLL_BOOST_WINDOW", fallback=20.0)
+PLC_POLL_DISCONNECTED_INTERVAL = config_ini.getfloat("plc", "POLL_DISCONNECTED_INTERVAL", fallback=5.0)
+
+# Production ingest group commit: events collected for INGEST_WINDOW seconds (or INGEST_MAX_BATCH events) share one commit
+INGEST_WINDOW = config_ini.getfloat("mysql", "INGEST_WINDOW", fallback=0.05)
+INGEST_MAX_BATCH = config_ini.getint("mysql", "INGEST_MAX_BATCH", fallback=200)
+# id_modulo -> objects.id entries kept by the reference data cache
+OBJECT_CACHE_SIZE = config_ini.getint("mysql", "OBJECT_CACHE_SIZE", fallback=20000)
+
+# Deferred DB writes: workers (per-key ordered), in-memory bound, crash journal (empty = disabled)
+DB_QUEUE_WORKERS = config_ini.getint("db_queue", "WORKERS", fallback=4)
+DB_QUEUE_SIZE = config_ini.getint("db_queue", "SIZE", fallback=1000)
+DB_QUEUE_MAX_BATCH = config_ini.getint("db_queue", "MAX_BATCH", fallback=50)
+DB_QUEUE_JOURNAL = config_ini.get("db_queue", "JOURNAL", fallback=str(BASE_DIR / "db_write_queue.journal"))
+DB_QUEUE_FSYNC = config_ini.getboolean("db_queue", "FSYNC", fallback=False)
+
+# Hourly production rollup: backfill depth (0 = all history), catch-up re-derivation of the recent hours
+ROLLUP_BACKFILL_DAYS = config_ini.getint("rollup", "BACKFILL_DAYS", fallback=0)
+ROLLUP_CATCHUP_INTERVAL = config_ini.getfloat("rollup", "CATCHUP_INTERVAL", fallback=600.0)
+ROLLUP_CATCHUP_HOURS = config_ini.getint("rollup", "CATCHUP_HOURS", fallback=26)
+
+# PLC traffic record / replay (empty dir = disabled); replay replaces the real PLCs
+PLC_RECORD_DIR = config_ini.get("replay", "RECORD_DIR", fallback="")
+PLC_REPLAY_DIR = config_ini.get("replay", "REPLAY_DIR", fallback="")
+PLC_REPLAY_SPEED = config_ini.getfloat("replay", "REPLAY_SPEED", fallback=1.0)
+PLC_REPLAY_LOOP = config_ini.getboolean("replay", "REPLAY_LOOP", fallback=False)
+
 # PLC write flag
 ELL_VISUAL = config_ini.getboolean("visuals", "ELL_VISUAL", fallback=True)
 print('ELL visual flag is', ELL_VISUAL)
 
+# visual_data checkpoint for warm restarts; empty path disables it
+VISUAL_CHECKPOINT = config_ini.get("visuals", "CHECKPOINT", fallback=str(BASE_DIR / "visual_data.ckpt"))
+VISUAL_CHECKPOINT_INTERVAL = config_ini.getfloat("visuals", "CHECKPOINT_INTERVAL", fallback=60.0)
+VISUAL_CHECKPOINT_MAX_AGE = config_ini.getfloat("visuals", "CHECKPOINT_MAX_AGE", fallback=8.0)  # hours
+
+# WebSocket fan-out: messages queued per client, seconds one send may take before the client is dropped
+WS_SEND_QUEUE = config_ini.getint("websocket", "SEND_QUEUE", fallback=64)
+WS_SEND_TIMEOUT = config_ini.getfloat("websocket", "SEND_TIMEOUT", fallback=5.0)
+
+# Streaming Excel export: whole modules read and written per chunk
+EXPORT_CHUNK_MODULES = config_ini.getint("export", "CHUNK_MODULES", fallback=2000)
+# Worker processes rendering the sheets of a one-shot Excel export; 1 renders them in the request thread.
+# Opt-in: the workers are forked from the service process while its PLC, DB queue and executor threads
+# run, and a lock one of them held at fork time (logging, malloc, BLAS) can hang a worker
+EXPORT_SHEET_WORKERS = config_ini.getint("export", "SHEET_WORKERS", fallback=1)
+
 print('Debug value is', debug)
 
 ML_MODELS_DIR = BASE_DIR / "models"
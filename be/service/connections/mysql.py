@@ -3,6 +3,7 @@ from calendar import c
 from datetime import datetime, timedelta
 import json
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 from typing import Optional
@@ -14,7 +15,10 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from service.connections.temp_data import get_latest_issues
+from service.helpers.db_queue import RETRYABLE_ERRORS
+from service.helpers.executor import run_in_thread
 from service.helpers.helpers import detect_category, parse_issue_path, compress_base64_to_jpeg_blob
+from service.helpers.plc_decoder import compile_station_decoders
 from service.routes.broadcast import broadcast_stringatrice_warning
 from service.state import global_state
 
@@ -57,29 +61,52 @@ def log_pool_status(tag: str = ""):
         logger.warning(f"[POOL] Failed to log status: {e}")
 
 def get_mysql_connection():
-    conn = global_state.mysql_pool.get_connection()
+    t0 = time.perf_counter()
+    try:
+        conn = global_state.mysql_pool.get_connection()
+    except Exception:
+        global_state.metrics.inc("pms_mysql_pool_errors_total")
+        raise
+    global_state.metrics.observe("pms_mysql_pool_wait_seconds", time.perf_counter() - t0)
     #log_pool_status("GET")
     return conn
 
+async def run_db(func, *args, **kwargs):
+    """
+    Run ``func(conn, *args, **kwargs)`` on the DB executor with a pooled
+    connection and await its result. Async routes must go through this (or
+    ``run_in_thread``) instead of calling pymysql directly: a blocking query
+    inside a coroutine stalls the event loop, PLC polling included.
+    """
+    def _call():
+        with get_mysql_connection() as conn:
+            return func(conn, *args, **kwargs)
+    return await run_in_thread(_call)
+
 def get_line_name(line_id: int):
     """Return the production line name for a given ID."""
+    reference_data = global_state.reference_data
+    if reference_data.loaded:
+        return reference_data.line_name(line_id)
     with get_mysql_connection() as conn:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT name FROM production_lines WHERE id = %s", (line_id,))
-            row = cursor.fetchone()
-            return row["name"] if row else None
+        return reference_data.ensure(conn).line_name(line_id)
 
 def load_channels_from_db() -> tuple[dict, dict]:
     """
     Load station configs from MySQL and return:
     1. CHANNELS dict: {line_name: {station_name: config_dict}}
     2. PLC DB RANGES dict: {(ip, slot): {db_number: {'min': x, 'max': y}}}
+    Each station config is also compiled once into a buffer decoder
+    (global_state.station_decoders).
     """
     # ✅ Use connection pool (automatically reused and closed)
     with get_mysql_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute("SELECT id, line_id, name, config, plc FROM stations")
             rows = cursor.fetchall()
+        # Station configs are (re)read: refresh lines / stations / defects with them
+        reference_data = global_state.reference_data
+        reference_data.load(conn)
 
     channels: dict = {}
     plc_db_ranges: dict[tuple[str, int], dict[int, dict[str, int]]] = {}
@@ -88,7 +115,7 @@ def load_channels_from_db() -> tuple[dict, dict]:
         if row["config"] is None:
             continue
 
-        line_name = get_line_name(row["line_id"])
+        line_name = reference_data.line_name(row["line_id"])
         if not line_name or line_name != "Linea2":
             continue
 
@@ -135,8 +162,41 @@ def load_channels_from_db() -> tuple[dict, dict]:
                 db_range["max"] = max(db_range["max"], byte + extra_bytes)
 
     logger.debug(f"PLC_DB_RANGES: {plc_db_ranges}")
+
+    global_state.station_decoders.clear()
+    global_state.station_decoders.update(compile_station_decoders(channels, plc_db_ranges))
+
     return channels, plc_db_ranges
 
+def active_line_name(data) -> str:
+    """Line name (Linea1–5) flagged in Linea_in_Lavorazione."""
+    linea_flags = data.get("Linea_in_Lavorazione", [False] * 5)
+    try:
+        linea_index = linea_flags.index(True) + 1
+    except ValueError:
+        raise ValueError("No active line found in Linea_in_Lavorazione")
+    return f"Linea{linea_index}"
+
+def str_station_name(data) -> str | None:
+    """Stringatrice (STR01…) that worked the module, if flagged."""
+    str_flags = data.get("Lavorazione_Eseguita_Su_Stringatrice", [])
+    if any(str_flags):
+        return f"STR{str_flags.index(True) + 1:02d}"
+    return None
+
+def final_esito_for(data, station_name, fine_buona) -> int:
+    final_esito = 6 if data.get("Compilato_Su_Ipad_Scarto_Presente") else 1
+    if station_name == "RMI01":
+        final_esito = 5 if fine_buona else 6
+    return final_esito
+
+def rollback_quietly(connection) -> None:
+    """Roll back after an error that may have taken the connection with it."""
+    try:
+        connection.rollback()
+    except Exception:
+        pass
+
 def insert_initial_production_data(data, station_name, connection, esito):
     """
     Inserts a production record using data available at cycle start.
@@ -150,37 +210,26 @@ def insert_initial_production_data(data, station_name, connection, esito):
             if not id_modulo:
                 raise ValueError("Missing Id_Modulo")
 
-            # Get line name (Linea1–5)
-            linea_flags = data.get("Linea_in_Lavorazione", [False] * 5)
-            try:
-                linea_index = linea_flags.index(True) + 1
-            except ValueError:
-                raise ValueError("No active line found in Linea_in_Lavorazione")
-            actual_line = f"Linea{linea_index}"
+            actual_line = active_line_name(data)
 
-            # Fetch line_id + station_id together
-            cursor.execute("""
-                SELECT l.id AS line_id, s.id AS station_id
-                FROM production_lines l
-                JOIN stations s ON s.line_id = l.id
-                WHERE l.name = %s AND s.name = %s
-                LIMIT 1
-            """, (actual_line, station_name))
-            result = cursor.fetchone()
-            if not result:
+            reference_data = global_state.reference_data
+            station = reference_data.station(connection, actual_line, station_name)
+            if not station:
                 raise ValueError(f"Line '{actual_line}' or Station '{station_name}' not found")
-            line_id, station_id = result["line_id"], result["station_id"]
+            station_id = station.id
 
-            # Insert (or confirm existence of) object
-            cursor.execute("""
-                INSERT INTO objects (id_modulo, creator_station_id)
-                VALUES (%s, %s)
-                ON DUPLICATE KEY UPDATE id_modulo = id_modulo
-            """, (id_modulo, station_id))
+            object_id = reference_data.object_id(id_modulo)
+            if object_id is None:
+                # Insert (or confirm existence of) object
+                cursor.execute("""
+                    INSERT INTO objects (id_modulo, creator_station_id)
+                    VALUES (%s, %s)
+                    ON DUPLICATE KEY UPDATE id_modulo = id_modulo
+                """, (id_modulo, station_id))
 
-            # Get object_id
-            cursor.execute("SELECT id FROM objects WHERE id_modulo = %s", (id_modulo,))
-            object_id = cursor.fetchone()["id"]
+                # Get object_id
+                cursor.execute("SELECT id FROM objects WHERE id_modulo = %s", (id_modulo,))
+                object_id = cursor.fetchone()["id"]
 
             # Check for existing partial production
             cursor.execute("""
@@ -192,21 +241,17 @@ def insert_initial_production_data(data, station_name, connection, esito):
             if existing:
                 production_id = existing["id"]
                 connection.commit()
+                reference_data.remember_object(id_modulo, object_id)
                 logger.debug(f"✅ Existing production found: ID {production_id} for object {object_id}")
                 return production_id
 
             # Determine last_station_id
             last_station_id = None
-            str_flags = data.get("Lavorazione_Eseguita_Su_Stringatrice", [])
-            if any(str_flags):
-                str_index = str_flags.index(True) + 1
-                str_name = f"STR{str_index:02d}"
-                cursor.execute("""
-                    SELECT id FROM stations WHERE name = %s AND line_id = %s
-                """, (str_name, line_id))
-                str_row = cursor.fetchone()
-                if str_row:
-                    last_station_id = str_row["id"]
+            str_name = str_station_name(data)
+            if str_name:
+                str_station = reference_data.station(connection, actual_line, str_name)
+                if str_station:
+                    last_station_id = str_station.id
             elif data.get("Last_Station"):
                 last_station_id = data["Last_Station"]
 
@@ -225,10 +270,15 @@ def insert_initial_production_data(data, station_name, connection, esito):
             ))
             production_id = cursor.lastrowid
             connection.commit()
+            # Only committed objects go into the cache
+            reference_data.remember_object(id_modulo, object_id)
 
             logger.debug(f"✅ New production inserted: ID {production_id} for object {object_id}")
             return production_id
 
+    except RETRYABLE_ERRORS:
+        rollback_quietly(connection)
+        raise   # MySQL unavailable: left to the caller's retry
     except Exception as e:
         connection.rollback()
         logger.error(f"❌ insert_initial_production_data error: {e}")
@@ -237,9 +287,7 @@ def insert_initial_production_data(data, station_name, connection, esito):
 def update_production_final(production_id, data, station_name, connection, fine_buona, fine_scarto):
     try:
         with connection.cursor() as cursor:
-            final_esito = 6 if data.get("Compilato_Su_Ipad_Scarto_Presente") else 1
-            if station_name == "RMI01":
-                final_esito = 5 if fine_buona else 6
+            final_esito = final_esito_for(data, station_name, fine_buona)
 
             end_time = data.get("DataFine")
 
@@ -254,8 +302,9 @@ def update_production_final(production_id, data, station_name, connection, fine_
                     END
                 WHERE id = %s
             """
-            cursor.execute(sql_update, (end_time, station_name, final_esito, production_id))
-            affected = cursor.rowcount
+            with global_state.production_rollup.track(cursor, [production_id]):
+                cursor.execute(sql_update, (end_time, station_name, final_esito, production_id))
+                affected = cursor.rowcount
 
             connection.commit()
 
@@ -266,71 +315,69 @@ def update_production_final(production_id, data, station_name, connection, fine_
             logger.debug(f"✅ Updated production {production_id}: end_time={end_time}, esito={final_esito}")
             return True, final_esito, end_time
 
+    except RETRYABLE_ERRORS:
+        rollback_quietly(connection)
+        raise   # MySQL unavailable: left to the caller's retry
     except Exception as e:
         connection.rollback()
         logger.error(f"Error updating production {production_id}: {e}")
         return False, None, None
 
-def insert_defects(
+OBJECT_DEFECT_COLUMNS = (
+    "production_id", "defect_id", "defect_type", "stringa",
+    "s_ribbon", "i_ribbon", "ribbon_lato", "extra_data", "photo_id",
+)
+
+def _defect_row(production_id, defect_id, defect_type, stringa=None, s_ribbon=None,
+                i_ribbon=None, ribbon_lato=None, extra_data=None, photo=None) -> dict:
+    return {
+        "production_id": production_id,
+        "defect_id": defect_id,
+        "defect_type": defect_type,
+        "stringa": stringa,
+        "s_ribbon": s_ribbon,
+        "i_ribbon": i_ribbon,
+        "ribbon_lato": ribbon_lato,
+        "extra_data": extra_data,
+        "photo": photo,          # compressed JPEG blob, stored in photos
+        "photo_id": None,
+    }
+
+def build_defect_rows(
     data,
     production_id,
     channel_id,
     line_name,
-    cursor,
+    cat_map: dict,
     from_vpf: bool = False,
     from_ain: bool = False,
     from_ell: bool = False
-):
-    # 1. Get defect categories mapping from DB
-    cursor.execute("SELECT id, category FROM defects")
-    cat_map = {row["category"]: row["id"] for row in cursor.fetchall()}
-
+) -> list[dict]:
+    """
+    object_defects rows for one production, without touching the DB.
+    ``cat_map`` is {category: defect_id} from the defects table.
+    """
     # --- VPF Defects ---
     if from_vpf:
         flags = data.get("Tipo_NG_VPF", [])
-        for idx, flag in enumerate(flags):
-            if not flag or idx not in VPF_DEFECT_ID_MAP:
-                continue
-            defect_id = VPF_DEFECT_ID_MAP[idx]
-            cursor.execute("""
-                INSERT INTO object_defects (
-                    production_id, defect_id, defect_type, stringa,
-                    s_ribbon, i_ribbon, ribbon_lato, extra_data, photo_id
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                production_id,
-                defect_id,
-                f"VPF_NG_{idx+1}",
-                None, None, None, None, None, None
-            ))
-        cursor.connection.commit()
-        return
+        return [
+            _defect_row(production_id, VPF_DEFECT_ID_MAP[idx], f"VPF_NG_{idx+1}")
+            for idx, flag in enumerate(flags)
+            if flag and idx in VPF_DEFECT_ID_MAP
+        ]
 
     if from_ain:
         flags = data.get("Tipo_NG_AIN", [])
-        for idx, flag in enumerate(flags):
-            if not flag or idx not in AIN_DEFECT_ID_MAP:
-                continue
-            defect_id = AIN_DEFECT_ID_MAP[idx]
-            defect_type = f"AIN_NG{idx + 2}"
-            cursor.execute("""
-                INSERT INTO object_defects (
-                    production_id, defect_id, defect_type, stringa,
-                    s_ribbon, i_ribbon, ribbon_lato, extra_data, photo_id
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                production_id,
-                defect_id,
-                defect_type,
-                None, None, None, None, None, None
-            ))
-        cursor.connection.commit()
-        return
+        return [
+            _defect_row(production_id, AIN_DEFECT_ID_MAP[idx], f"AIN_NG{idx + 2}")
+            for idx, flag in enumerate(flags)
+            if flag and idx in AIN_DEFECT_ID_MAP
+        ]
 
     # --- ELL Defects ---
     mbj = data.get("MBJ_Defects")
     if from_ell and isinstance(mbj, dict):
-        defects_to_insert = []
+        rows = []
         cell_defects_data = mbj.get("cell_defects", {})
         cracked_cells = []
         bad_solder_cells = []
@@ -344,47 +391,15 @@ def insert_defects(
                 if 81 in defects:
                     bad_solder_cells.append(cell_index)
 
-        # ➤ Insert Celle Rotte (defect_id=6)
+        # ➤ Celle Rotte (defect_id=6)
         if cracked_cells:
-            defects_to_insert.append({
-                "production_id": production_id,
-                "defect_id": 6,
-                "defect_type": "ELL_MBJ",
-                "i_ribbon": None,
-                "stringa": None,
-                "ribbon_lato": None,
-                "s_ribbon": None,
-                "extra_data": None,
-                "photo_id": None
-            })
-
-        # ➤ Insert Bad Soldering (defect_id=10)
+            rows.append(_defect_row(production_id, 6, "ELL_MBJ"))
+
+        # ➤ Bad Soldering (defect_id=10)
         if bad_solder_cells:
-            defects_to_insert.append({
-                "production_id": production_id,
-                "defect_id": 10,
-                "defect_type": "ELL_MBJ",
-                "i_ribbon": None,
-                "stringa": None,
-                "ribbon_lato": None,
-                "s_ribbon": None,
-                "extra_data": None,
-                "photo_id": None
-            })
-
-        if defects_to_insert:
-            cursor.executemany("""INSERT INTO object_defects (
-                production_id, defect_id, defect_type, i_ribbon,
-                stringa, ribbon_lato, s_ribbon, extra_data, photo_id
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)""", [
-                (
-                    d["production_id"], d["defect_id"], d["defect_type"], d["i_ribbon"],
-                    d["stringa"], d["ribbon_lato"], d["s_ribbon"], d["extra_data"], d["photo_id"]
-                )
-                for d in defects_to_insert
-            ])
-            cursor.connection.commit()
+            rows.append(_defect_row(production_id, 10, "ELL_MBJ"))
 
+        if rows:
             # ✅ For mirroring: attach clean summary list for ELL buffer
             data["Defect_Rows"] = [
                 {
@@ -394,14 +409,15 @@ def insert_defects(
                     "object_id": data.get("object_id"),
                     "defect_type": d["defect_type"]
                 }
-                for d in defects_to_insert
+                for d in rows
             ]
-        return
+        return rows
 
     # --- Fallback: Vision-based Issues ---
     issues = get_latest_issues(line_name, channel_id)
     data["issues"] = issues
 
+    rows = []
     for issue in issues:
         path = issue.get("path")
         image_base64 = issue.get("image_base64")
@@ -412,32 +428,58 @@ def insert_defects(
         defect_id = cat_map.get(category, cat_map["Altro"])
         parsed = parse_issue_path(path, category)
 
-        photo_id = None
+        image_blob = None
         if image_base64:
             image_blob = compress_base64_to_jpeg_blob(image_base64, quality=70)
             if image_blob is None:
                 raise ValueError(f"Invalid image for defect path: {path}")
 
-            cursor.execute("INSERT INTO photos (photo) VALUES (%s)", (pymysql.Binary(image_blob),))
-            photo_id = cursor.lastrowid
-
-        cursor.execute("""
-            INSERT INTO object_defects (
-                production_id, defect_id, defect_type, stringa,
-                s_ribbon, i_ribbon, ribbon_lato, extra_data, photo_id
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
+        rows.append(_defect_row(
             production_id,
             defect_id,
             parsed["defect_type"],
-            parsed["stringa"],
-            parsed["s_ribbon"],
-            parsed["i_ribbon"],
-            parsed["ribbon_lato"],
-            parsed["extra_data"],
-            photo_id
+            stringa=parsed["stringa"],
+            s_ribbon=parsed["s_ribbon"],
+            i_ribbon=parsed["i_ribbon"],
+            ribbon_lato=parsed["ribbon_lato"],
+            extra_data=parsed["extra_data"],
+            photo=image_blob,
         ))
-        cursor.connection.commit()
+    return rows
+
+def write_defect_rows(cursor, rows: list[dict]) -> None:
+    """Insert photos (one by one, their IDs are needed) then all object_defects rows at once."""
+    for row in rows:
+        if row["photo"] is not None:
+            cursor.execute("INSERT INTO photos (photo) VALUES (%s)", (pymysql.Binary(row["photo"]),))
+            row["photo_id"] = cursor.lastrowid
+    if rows:
+        # executemany turns this into a single multi-row INSERT
+        cursor.executemany(f"""
+            INSERT INTO object_defects ({", ".join(OBJECT_DEFECT_COLUMNS)})
+            VALUES ({", ".join(["%s"] * len(OBJECT_DEFECT_COLUMNS))})
+        """, [tuple(row[col] for col in OBJECT_DEFECT_COLUMNS) for row in rows])
+
+def get_defect_categories(cursor) -> dict:
+    """{category: defect_id}, from the reference data cache."""
+    return global_state.reference_data.ensure(cursor.connection).defect_categories
+
+def insert_defects(
+    data,
+    production_id,
+    channel_id,
+    line_name,
+    cursor,
+    from_vpf: bool = False,
+    from_ain: bool = False,
+    from_ell: bool = False
+):
+    rows = build_defect_rows(
+        data, production_id, channel_id, line_name, get_defect_categories(cursor),
+        from_vpf=from_vpf, from_ain=from_ain, from_ell=from_ell,
+    )
+    write_defect_rows(cursor, rows)
+    cursor.connection.commit()
 
 def insert_str_data(data, station_id, timestamp, line_name, cursor):
     """
@@ -470,7 +512,8 @@ def update_esito(esito: int, production_id: int, cursor, connection):
             SET esito = %s 
             WHERE id = %s
         """
-        cursor.execute(sql_update, (esito, production_id))
+        with global_state.production_rollup.track(cursor, [production_id]):
+            cursor.execute(sql_update, (esito, production_id))
         return True
     except Exception as e:
         if connection:
@@ -536,7 +579,13 @@ def save_warning_on_mysql(
         logger.error(f"❌ Failed to save warning to MySQL: {e}")
         return None
 
-async def check_stringatrice_warnings(line_name: str, mysql_conn, settings):
+def collect_stringatrice_warnings(line_name: str, mysql_conn, settings) -> list[dict]:
+    """
+    Evaluate the stringatrice warning rules and save the triggered warnings.
+    Returns the saved rows; broadcasting them is left to the caller so this
+    can run on a worker thread.
+    """
+    warnings: list[dict] = []
     try:
         logger.debug(f"[{line_name}] ▶️ Starting check_stringatrice_warnings")
 
@@ -552,7 +601,7 @@ async def check_stringatrice_warnings(line_name: str, mysql_conn, settings):
 
             if not last_prod:
                 logger.warning(f"[{line_name}] ⚠️ No production data found.")
-                return
+                return warnings
 
             prod_id = last_prod["production_id"]
             object_id = last_prod["object_id"]
@@ -563,7 +612,7 @@ async def check_stringatrice_warnings(line_name: str, mysql_conn, settings):
 
             if last_station_id is None:
                 logger.warning(f"[{line_name}] ⛔ Skipping: last_station_id is None")
-                return
+                return warnings
 
             # Step 2: Get source station debug
             cursor.execute("""
@@ -575,7 +624,7 @@ async def check_stringatrice_warnings(line_name: str, mysql_conn, settings):
             source_station = cursor.fetchone()
             if not source_station:
                 logger.warning(f"[{line_name}] ⚠️ Source station ID {station_id} not found")
-                return
+                return warnings
 
             # Step 3: Get last station debug
             cursor.execute("""
@@ -588,7 +637,7 @@ async def check_stringatrice_warnings(line_name: str, mysql_conn, settings):
 
             if not station:
                 logger.warning(f"[{line_name}] ⚠️ Last station ID {last_station_id} not found")
-                return
+                return warnings
 
             full_station_id = f"{station['line_name']}.{station['name']}"
             logger.debug(f"[{line_name}] Full station ID for check: {full_station_id}")
@@ -633,7 +682,7 @@ async def check_stringatrice_warnings(line_name: str, mysql_conn, settings):
 
             if not current:
                 logger.warning(f"[{line_name}] ❗ No defect data found for current production ID {prod_id}")
-                return
+                return warnings
 
             productions = [current] + recent_productions
 
@@ -696,8 +745,8 @@ async def check_stringatrice_warnings(line_name: str, mysql_conn, settings):
                                         if row.get("photo") is not None:
                                             row["photo"] = base64.b64encode(row["photo"]).decode("utf-8")
 
-                                        await broadcast_stringatrice_warning(row["line_name"], row)
-                                        logger.debug(f"[{full_station_id}] 📡 Broadcasted consecutive warning for {defect_name}")
+                                        warnings.append(row)
+                                        logger.debug(f"[{full_station_id}] 📡 Queued consecutive warning for {defect_name}")
 
                             break  # stop checking if already triggered
                     else:
@@ -732,14 +781,22 @@ async def check_stringatrice_warnings(line_name: str, mysql_conn, settings):
                                 if row.get("photo") is not None:
                                     row["photo"] = base64.b64encode(row["photo"]).decode("utf-8")
 
-                                await broadcast_stringatrice_warning(row["line_name"], row)
-                                logger.debug(f"[{full_station_id}] 📡 Broadcasted threshold warning for {defect_name}")
+                                warnings.append(row)
+                                logger.debug(f"[{full_station_id}] 📡 Queued threshold warning for {defect_name}")
 
         logger.debug(f"[{line_name}] ✅ check_stringatrice_warnings completed")
 
     except Exception as e:
         logger.exception(f"[{line_name}] ❌ Error in check_stringatrice_warnings: {e}")
 
+    return warnings
+
+async def check_stringatrice_warnings(line_name: str, settings):
+    """Run the warning rules on the DB executor, then broadcast what they triggered."""
+    for row in await run_db(collect_stringatrice_warnings, line_name, settings):
+        await broadcast_stringatrice_warning(row["line_name"], row)
+        logger.debug(f"[{line_name}] 📡 Broadcasted {row.get('type')} warning for {row.get('defect')}")
+
 def get_last_station_id_from_productions(id_modulo, connection):
     try:
         with connection.cursor() as cursor:
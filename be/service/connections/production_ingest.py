@@ -0,0 +1,393 @@
+import asyncio
+from dataclasses import dataclass, field
+import logging
+import time
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from service.config.config import INGEST_MAX_BATCH, INGEST_WINDOW
+from service.connections.mysql import (
+    active_line_name,
+    build_defect_rows,
+    final_esito_for,
+    get_defect_categories,
+    insert_defects,
+    insert_initial_production_data,
+    rollback_quietly,
+    run_db,
+    str_station_name,
+    update_production_final,
+    write_defect_rows,
+)
+from service.helpers.db_queue import RETRYABLE_ERRORS
+from service.helpers.ell_buffer import mirror_ell_production
+from service.state import global_state
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProductionStart:
+    data: dict
+    station_name: str
+    esito: int
+    mirror_station_id: int | None    # also upsert into ell_productions_buffer
+    future: asyncio.Future = field(repr=False)
+    result: int | Exception | None = field(default=None, init=False)
+    # Resolved while writing
+    line: str | None = field(default=None, init=False)
+    station_id: int | None = field(default=None, init=False)
+    last_station_id: int | None = field(default=None, init=False)
+    object_id: int | None = field(default=None, init=False)
+
+
+@dataclass
+class ProductionEnd:
+    production_id: int
+    data: dict
+    station_name: str
+    fine_buona: bool
+    future: asyncio.Future = field(repr=False)
+    result: tuple | Exception | None = field(default=None, init=False)
+
+
+@dataclass
+class DefectBatch:
+    data: dict
+    production_id: int
+    channel_id: str
+    line_name: str
+    flags: dict                      # from_vpf / from_ain / from_ell
+    future: asyncio.Future = field(repr=False)
+    result: list | Exception | None = field(default=None, init=False)
+
+
+def _placeholders(n: int) -> str:
+    return ", ".join(["%s"] * n)
+
+
+def _open_productions(cursor, object_ids) -> dict[tuple[int, int], int]:
+    """{(object_id, station_id): id} of the in-progress productions (esito 2, no end) of ``object_ids``."""
+    object_ids = list(object_ids)
+    if not object_ids:
+        return {}
+    cursor.execute(f"""
+        SELECT id, object_id, station_id FROM productions
+        WHERE object_id IN ({_placeholders(len(object_ids))}) AND esito = 2 AND end_time IS NULL
+        ORDER BY start_time
+    """, object_ids)
+    # Ascending start_time: the latest open production of a key wins
+    return {(r["object_id"], r["station_id"]): r["id"] for r in cursor.fetchall()}
+
+
+def _write_ends(cursor, ends: list[ProductionEnd]) -> None:
+    ids = list({e.production_id for e in ends})
+    cursor.execute(f"SELECT id FROM productions WHERE id IN ({_placeholders(len(ids))})", ids)
+    existing = {r["id"] for r in cursor.fetchall()}
+
+    latest: dict[int, tuple] = {}
+    for e in ends:
+        final_esito = final_esito_for(e.data, e.station_name, e.fine_buona)
+        end_time = e.data.get("DataFine")
+        if e.production_id in existing:
+            # Same production ended twice in one window: the last end wins, as it would row by row
+            latest[e.production_id] = (e.production_id, end_time, final_esito, e.station_name == "RMI01")
+            e.result = (True, final_esito, end_time)
+        else:
+            logger.warning(f"No rows updated for production {e.production_id}")
+            e.result = (False, None, None)
+
+    if latest:
+        values = " UNION ALL ".join(
+            ["SELECT %s AS id, %s AS end_time, %s AS esito, %s AS force_esito"] * len(latest)
+        )
+        with global_state.production_rollup.track(cursor, latest):
+            cursor.execute(f"""
+                UPDATE productions p
+                JOIN ({values}) v ON p.id = v.id
+                SET
+                    p.end_time = v.end_time,
+                    p.esito = CASE WHEN p.esito = 2 OR v.force_esito THEN v.esito ELSE p.esito END
+            """, [x for row in latest.values() for x in row])
+
+
+def _write_starts(cursor, starts: list[ProductionStart]) -> list[tuple[str, int]]:
+    """Returns the (id_modulo, object_id) pairs to cache once the batch is committed."""
+    reference_data = global_state.reference_data
+    # 1. Line / station / stringatrice IDs from the reference data cache
+    resolved = []
+    for s in starts:
+        id_modulo = s.data.get("Id_Modulo")
+        try:
+            if not id_modulo:
+                raise ValueError("Missing Id_Modulo")
+            s.line = active_line_name(s.data)
+        except ValueError as e:
+            logger.error(f"❌ insert_initial_production_data error: {e}")
+            continue
+        station = reference_data.station(cursor.connection, s.line, s.station_name)
+        if station is None:
+            logger.error(f"❌ insert_initial_production_data error: Line '{s.line}' or Station '{s.station_name}' not found")
+            continue
+        s.station_id = station.id
+        str_name = str_station_name(s.data)
+        if str_name:
+            str_station = reference_data.station(cursor.connection, s.line, str_name)
+            s.last_station_id = str_station.id if str_station else None
+        else:
+            s.last_station_id = s.data.get("Last_Station") or None
+        resolved.append(s)
+    if not resolved:
+        return []
+
+    # 2. Objects: cached ones are known, the rest get one upsert and one lookup
+    object_ids: dict[str, int] = {}
+    creators: dict[str, int] = {}
+    for s in resolved:
+        id_modulo = s.data["Id_Modulo"]
+        object_id = reference_data.object_id(id_modulo)
+        if object_id is not None:
+            object_ids[id_modulo] = object_id
+        else:
+            creators.setdefault(id_modulo, s.station_id)
+    if creators:
+        cursor.executemany("""
+            INSERT INTO objects (id_modulo, creator_station_id)
+            VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE id_modulo = id_modulo
+        """, list(creators.items()))
+        cursor.execute(
+            f"SELECT id, id_modulo FROM objects WHERE id_modulo IN ({_placeholders(len(creators))})",
+            list(creators),
+        )
+        object_ids.update({r["id_modulo"]: r["id"] for r in cursor.fetchall()})
+    for s in resolved:
+        s.object_id = object_ids[s.data["Id_Modulo"]]
+
+    # 3. Reuse open productions, insert the rest in one statement
+    open_rows = _open_productions(cursor, {s.object_id for s in resolved})
+    new_rows: dict[tuple[int, int], ProductionStart] = {}
+    for s in resolved:
+        key = (s.object_id, s.station_id)
+        if key not in open_rows:
+            new_rows.setdefault(key, s)
+    if new_rows:
+        cursor.executemany("""
+            INSERT INTO productions (
+                object_id, station_id, start_time, end_time, esito, operator_id, last_station_id
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, [
+            (s.object_id, s.station_id, s.data.get("DataInizio"), None, s.esito, s.data.get("Id_Utente"), s.last_station_id)
+            for s in new_rows.values()
+        ])
+        # A multi-row INSERT only reports its first ID: read the new rows back by key.
+        # Rows of other transactions are not visible to this one, so id >= first is ours.
+        first_id = cursor.lastrowid
+        new_objects = list({key[0] for key in new_rows})
+        cursor.execute(f"""
+            SELECT id, object_id, station_id FROM productions
+            WHERE id >= %s AND object_id IN ({_placeholders(len(new_objects))})
+        """, [first_id, *new_objects])
+        for r in cursor.fetchall():
+            key = (r["object_id"], r["station_id"])
+            if key in new_rows:
+                open_rows[key] = r["id"]
+
+    mirrors = []
+    for s in resolved:
+        s.result = open_rows.get((s.object_id, s.station_id))
+        if s.result and s.mirror_station_id is not None:
+            mirrors.append((s.result, s.object_id, s.mirror_station_id, s.data.get("DataInizio"), None, s.esito))
+    if mirrors:
+        cursor.executemany("""
+            INSERT INTO ell_productions_buffer
+                (id, object_id, station_id, start_time, end_time, esito)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                end_time = VALUES(end_time),
+                esito = VALUES(esito)
+        """, mirrors)
+
+    return [(id_modulo, object_ids[id_modulo]) for id_modulo in creators]
+
+
+def _write_defects(cursor, batches: list[DefectBatch]) -> None:
+    cat_map = get_defect_categories(cursor)
+    rows = []
+    for b in batches:
+        try:
+            b.result = build_defect_rows(b.data, b.production_id, b.channel_id, b.line_name, cat_map, **b.flags)
+        except Exception as e:
+            # Bad input (e.g. an unreadable photo) only fails its own production
+            b.result = e
+            continue
+        rows.extend(b.result)
+    write_defect_rows(cursor, rows)
+
+
+def write_ingest_batch(conn, items: list) -> None:
+    """
+    Write one window of ingest events in a single transaction. Ends go first
+    so that a module leaving and re-entering a station in the same window is
+    not matched to its closing production. Results are left on ``item.result``.
+    """
+    ends = [i for i in items if isinstance(i, ProductionEnd)]
+    starts = [i for i in items if isinstance(i, ProductionStart)]
+    defects = [i for i in items if isinstance(i, DefectBatch)]
+    new_objects = []
+    try:
+        with conn.cursor() as cursor:
+            if ends:
+                _write_ends(cursor, ends)
+            if starts:
+                new_objects = _write_starts(cursor, starts)
+            if defects:
+                _write_defects(cursor, defects)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    for id_modulo, object_id in new_objects:
+        global_state.reference_data.remember_object(id_modulo, object_id)
+
+
+def write_ingest_each(conn, items: list) -> None:
+    """
+    Fallback after a failed batch: every event in its own transaction, as
+    before batching. Once MySQL is unreachable the event and the ones after
+    it get that error as their result; those before it stay committed.
+    """
+    for index, item in enumerate(items):
+        try:
+            if isinstance(item, ProductionEnd):
+                item.result = update_production_final(
+                    item.production_id, item.data, item.station_name, conn, item.fine_buona, False
+                )
+            elif isinstance(item, ProductionStart):
+                item.result = insert_initial_production_data(item.data, item.station_name, conn, item.esito)
+                if item.result and item.mirror_station_id is not None:
+                    mirror_ell_production({
+                        "id": item.result,
+                        "object_id": item.data.get("Id_Modulo"),
+                        "station_id": item.mirror_station_id,
+                        "start_time": item.data.get("DataInizio"),
+                        "end_time": None,
+                        "esito": item.esito,
+                    }, conn)
+            else:
+                with conn.cursor() as cursor:
+                    insert_defects(item.data, item.production_id, item.channel_id, item.line_name, cursor, **item.flags)
+                item.result = item.data.get("Defect_Rows", [])
+        except RETRYABLE_ERRORS as e:
+            rollback_quietly(conn)
+            for rest in items[index:]:
+                rest.result = e
+            return
+        except Exception as e:
+            conn.rollback()
+            item.result = e
+
+
+class ProductionIngest:
+    """
+    Group commit for the production hot path. Production starts, ends and
+    defect rows from every station are collected for ``window`` seconds and
+    written with multi-row statements and a single commit; each caller
+    awaits a future resolved with its own result (production ID, final
+    update outcome, defect rows). A window that fails as a whole is retried
+    event by event, so one bad event cannot take its neighbours down. An
+    event that fails on its own, or finds MySQL unreachable, raises the error
+    from its future (``RETRYABLE_ERRORS`` for the latter).
+    """
+
+    def __init__(self, window: float = INGEST_WINDOW, max_batch: int = INGEST_MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: list = []
+        self._flush_task: asyncio.Task | None = None
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()   # windows commit in order
+        # Counters exposed on /metrics
+        self.batches = 0
+        self.events = 0
+        self.fallbacks = 0
+
+    def _submit(self, cls, *args) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(cls(*args, future))
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+        if len(self._pending) >= self.max_batch:
+            # Full window: write it now instead of waiting for the timer
+            self._full.set()
+        return future
+
+    def start_production(self, data: dict, station_name: str, esito: int,
+                         mirror_station_id: int | None = None) -> asyncio.Future:
+        """Future resolving to the production ID (None if it was rejected); raises what writing it raised."""
+        return self._submit(ProductionStart, data, station_name, esito, mirror_station_id)
+
+    def end_production(self, production_id: int, data: dict, station_name: str,
+                       fine_buona: bool) -> asyncio.Future:
+        """Future resolving to ``(success, final_esito, end_time)``; raises what writing it raised."""
+        return self._submit(ProductionEnd, production_id, data, station_name, fine_buona)
+
+    def add_defects(self, data: dict, production_id: int, channel_id: str, line_name: str,
+                    **flags) -> asyncio.Future:
+        """Future resolving to the inserted object_defects rows; raises what building them raised."""
+        return self._submit(DefectBatch, data, production_id, channel_id, line_name, flags)
+
+    async def flush(self) -> None:
+        """Write everything submitted so far (used at shutdown)."""
+        task = self._flush_task
+        if task is not None:
+            self._full.set()
+            await task
+        async with self._flush_lock:
+            pass
+
+    async def _flush(self) -> None:
+        try:
+            await asyncio.wait_for(self._full.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        self._full.clear()
+        # Events submitted from now on go to the next window, committed after this one
+        batch, self._pending, self._flush_task = self._pending, [], None
+
+        items = [i for i in batch if not i.future.cancelled()]
+        if not items:
+            return
+
+        async with self._flush_lock:
+            t0 = time.perf_counter()
+            try:
+                await run_db(write_ingest_batch, items)
+            except RETRYABLE_ERRORS as e:
+                # MySQL unavailable: event by event would fail the same way, the callers retry
+                logger.warning(f"⚠️ Ingest batch of {len(items)} events failed, MySQL unavailable: {e}")
+                for item in items:
+                    item.result = e
+            except Exception as e:
+                self.fallbacks += 1
+                logger.warning(f"⚠️ Ingest batch of {len(items)} events failed ({e}), retrying one by one")
+                try:
+                    await run_db(write_ingest_each, items)
+                except Exception as e:
+                    for item in items:
+                        item.result = e
+            global_state.metrics.observe("pms_ingest_commit_seconds", time.perf_counter() - t0)
+            self.batches += 1
+            self.events += len(items)
+
+        for item in items:
+            if item.future.done():
+                continue
+            result = item.result
+            if isinstance(result, Exception):
+                # Errors reach the callers as such: MySQL unavailable goes to their retry path
+                item.future.set_exception(result)
+            else:
+                item.future.set_result(result)
@@ -27,6 +27,13 @@ class FakePLCConnection(PLCConnection):
     def reconnect(self, retries=3, delay=5):
         logger.debug("🔌 (Fake) Reconnect called.")
 
+    def reconnect_once(self):
+        logger.debug("🔌 (Fake) Reconnect called.")
+        return True
+
+    def disconnect(self):
+        logger.debug("🔌 (Fake) Disconnect called.")
+
     def read_bool(self, db, byte, bit):
         with self.lock:
             return global_state.debug_triggers.get(self.station_id, False)
@@ -35,6 +42,12 @@ class FakePLCConnection(PLCConnection):
         with self.lock:
             logger.debug(f"✍️ (Fake) Write bool to DB{db}.{byte}.{bit} = {value}")
 
+    def write_batch(self, writes):
+        with self.lock:
+            for db, byte, bit, value in writes:
+                logger.debug(f"✍️ (Fake) Write DB{db}.{byte}.{bit} = {value}")
+            return True
+
     def read_string(self, db, byte, length):
         with self.lock:
             return global_state.debug_moduli.get(self.station_id, "Fake String")
@@ -68,6 +81,9 @@ class FakePLCConnection(PLCConnection):
 
         return buffer
 
+    def read_areas(self, areas):
+        return [self.db_read(db, start, size) for db, start, size in areas]
+
 class FakeClient:
     def __init__(self):
         self.connected = True
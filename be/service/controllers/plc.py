@@ -1,7 +1,9 @@
 import asyncio
+import ctypes
 import snap7.client as c
 import snap7.util as u
-from snap7.type import Area, Parameter
+from snap7.error import check_error
+from snap7.type import Area, Parameter, S7DataItem, WordLen
 import logging
 import time
 from threading import Lock, Thread
@@ -16,6 +18,14 @@ from service.config.config import WRITE_TO_PLC
 
 DEFAULT_CHUNK   = 480           # safe chunk size for DB reads
 MAX_BACKOFF_SEC = 5.0           # exponential back-off ceiling
+MAX_MULTI_VARS  = 20            # S7 limit of items in one multi-variable request
+MIN_PDU_LENGTH  = 240           # smallest PDU any S7 CPU negotiates
+MULTI_READ_REQ_HEADER  = 19     # request header + parameter head of ReadMultiVars
+MULTI_READ_REQ_ITEM    = 12     # request bytes per item
+MULTI_READ_RESP_HEADER = 18     # response header + parameter head of ReadMultiVars
+MULTI_READ_RESP_ITEM   = 4      # response bytes per item before its data
+MULTI_WRITE_REQ_HEADER = 19     # request header + parameter head of WriteMultiVars
+MULTI_WRITE_REQ_ITEM   = 16     # request bytes per item (parameter + data header)
 
 # Dedicated logger for DB read errors
 db_read_logger = logging.getLogger("db_read_errors")
@@ -33,7 +43,7 @@ if not db_read_logger.handlers:
 
 class PLCConnection:
     def __init__(self, ip_address, slot, *, max_chunk: int = DEFAULT_CHUNK,
-                 status_callback=None):
+                 status_callback=None, background_reconnect: bool = True):
         self.lock = Lock()
         self.client = c.Client()
         self.client.set_connection_type(3)
@@ -46,9 +56,13 @@ class PLCConnection:
         self.connected = False
         self.status_callback = status_callback
         self.max_chunk = max_chunk
+        self.error_count = 0
+        # False when an AsyncPLCClient owns reconnection: calls fail fast while down
+        self.background_reconnect = background_reconnect
         self._connect()
         self._reconnect_count = 0
-        Thread(target=self._background_reconnector, daemon=True).start()
+        if background_reconnect:
+            Thread(target=self._background_reconnector, daemon=True).start()
 
     def _check_tcp_port(self, port=102, timeout=1.0):
         try:
@@ -73,6 +87,15 @@ class PLCConnection:
             time.sleep(1)
 
 
+    def reconnect_once(self) -> bool:
+        """Single reconnect attempt (port probe + snap7 connect); True if connected."""
+        if not self._check_tcp_port():
+            logger.warning(f"🚫 Cannot reach PLC {self.ip_address} on port 102")
+            return False
+        logger.debug("🔎 Port 102 open, trying Snap7 reconnect…")
+        self._try_connect()
+        return self.connected
+
     def _try_connect(self):
         self._reconnect_count += 1
         if self._reconnect_count % 10 == 0:
@@ -130,6 +153,7 @@ class PLCConnection:
                 logger.error(f"❌ Initial connect to PLC {self.ip_address} failed: {e}")
 
     def _recover_on_error(self, context: str, exc: Exception):
+        self.error_count = getattr(self, "error_count", 0) + 1
         self.connected = False
         try:
             self.client.disconnect()
@@ -147,6 +171,8 @@ class PLCConnection:
             return False
 
     def _ensure_connection(self):
+        if not self.background_reconnect:
+            return
         now = time.time()
         if now - getattr(self, '_last_check', 0) < 1.0:
             return
@@ -358,3 +384,201 @@ class PLCConnection:
                     time.sleep(backoff)
                     backoff = min(backoff * 2, MAX_BACKOFF_SEC)
         return buffer
+
+    def _pdu_length(self) -> int:
+        try:
+            return self.client.get_pdu_length() or MIN_PDU_LENGTH
+        except Exception:
+            return MIN_PDU_LENGTH
+
+    def _multi_read_limits(self) -> tuple[int, int]:
+        """Return (max items, max response payload) for one ReadMultiVars request."""
+        pdu = self._pdu_length()
+        max_items = min(MAX_MULTI_VARS, (pdu - MULTI_READ_REQ_HEADER) // MULTI_READ_REQ_ITEM)
+        return max(1, max_items), pdu - MULTI_READ_RESP_HEADER
+
+    @staticmethod
+    def _pack_multi_read(areas, max_items: int, max_payload: int,
+                         item_overhead: int = MULTI_READ_RESP_ITEM):
+        """
+        Split ``areas`` into PDU-sized pieces and group them into requests.
+        Returns a list of requests, each a list of (area_index, offset, db, start, size).
+        """
+        max_piece = (max_payload - item_overhead) & ~1
+        requests, current, used = [], [], 0
+        for idx, (db, start, size) in enumerate(areas):
+            offset = 0
+            while offset < size:
+                piece = min(max_piece, size - offset)
+                # Odd-sized items are padded to a word in the response
+                cost = item_overhead + piece + (piece & 1)
+                if current and (len(current) >= max_items or used + cost > max_payload):
+                    requests.append(current)
+                    current, used = [], 0
+                current.append((idx, offset, db, start + offset, piece))
+                used += cost
+                offset += piece
+        if current:
+            requests.append(current)
+        return requests
+
+    @staticmethod
+    def _data_items(request, payloads):
+        """Build the S7DataItem array of one multi-variable request over ``payloads``."""
+        items = (S7DataItem * len(request))()
+        for item, (_, _, db, start, size), raw in zip(items, request, payloads):
+            item.Area = ctypes.c_int32(Area.DB.value)
+            item.WordLen = ctypes.c_int32(WordLen.Byte.value)
+            item.Result = ctypes.c_int32(0)
+            item.DBNumber = ctypes.c_int32(db)
+            item.Start = ctypes.c_int32(start)
+            item.Amount = ctypes.c_int32(size)
+            item.pData = ctypes.cast(ctypes.pointer(raw), ctypes.POINTER(ctypes.c_uint8))
+        return items
+
+    def _read_areas_locked(self, areas, buffers) -> bool:
+        """
+        ReadMultiVars of ``areas`` into ``buffers``; caller holds the lock.
+        False on comms error or when the PLC refused an item (its bytes stay zero).
+        """
+        ok = True
+        max_items, max_payload = self._multi_read_limits()
+        for request in self._pack_multi_read(areas, max_items, max_payload):
+            raw_buffers = [ctypes.create_string_buffer(size) for *_, size in request]
+            items = self._data_items(request, raw_buffers)
+
+            try:
+                t0 = time.perf_counter()
+                self.client.read_multi_vars(items)
+                logger.debug("ReadMultiVars %d items OK in %.3fs",
+                             len(request), time.perf_counter() - t0)
+            except Exception as e:
+                self._recover_on_error(f"read_areas ({len(request)} items)", e)
+                return False
+
+            for item, raw, (idx, offset, db, start, size) in zip(items, raw_buffers, request):
+                if item.Result != 0:
+                    db_read_logger.error(
+                        f"{self.ip_address} ReadMultiVars DB{db}[{start}:{size}] result=0x{item.Result:X}"
+                    )
+                    ok = False
+                    continue
+                buffers[idx][offset:offset + size] = raw.raw[:size]
+        return ok
+
+    def _write_multi_vars(self, items) -> None:
+        """
+        WriteMultiVars of the ``items`` array in place, so that the per-item
+        Result codes end up in it (python-snap7's write_multi_vars sends a copy).
+        """
+        client = self.client
+        result = client._lib.Cli_WriteMultiVars(client._s7_client, ctypes.byref(items), ctypes.c_int32(len(items)))
+        check_error(result, context="client")
+
+    def read_areas(self, areas: list[tuple[int, int, int]]) -> list[bytearray]:
+        """
+        Read several ``(db, start, size)`` areas with as few ReadMultiVars
+        round-trips as the negotiated PDU allows. Areas that cannot be read
+        (PLC down or comms error) come back zero-filled, like ``db_read``.
+        """
+        buffers = [bytearray(size) for _, _, size in areas]
+        if not areas:
+            return buffers
+
+        with self.lock:
+            self._ensure_connection()
+            if not self.connected:
+                return buffers
+            self._read_areas_locked(areas, buffers)
+
+        return buffers
+
+    @staticmethod
+    def _contiguous_runs(image: dict[tuple[int, int], int]) -> list[tuple[int, int, bytearray]]:
+        """Group ``{(db, byte): value}`` into ``(db, start, data)`` runs of adjacent bytes."""
+        runs: list[tuple[int, int, bytearray]] = []
+        for db, byte in sorted(image):
+            if runs and runs[-1][0] == db and runs[-1][1] + len(runs[-1][2]) == byte:
+                runs[-1][2].append(image[(db, byte)])
+            else:
+                runs.append((db, byte, bytearray([image[(db, byte)]])))
+        return runs
+
+    def write_batch(self, writes: list[tuple[int, int, int | None, bool | bytes]]) -> bool:
+        """
+        Apply ``(db, byte, bit, value)`` writes in order with one ReadMultiVars
+        (only for the bytes that carry bit writes) and one WriteMultiVars per
+        PDU. ``bit=None`` writes ``value`` as raw bytes starting at ``byte``.
+        Only bytes actually touched are written back, never the gaps between them.
+        False when the PLC is unreachable or refused one of the reads or writes.
+        """
+        if not writes:
+            return True
+        if not WRITE_TO_PLC:
+            logger.debug("SKIPPED write_batch of %d writes", len(writes))
+            return True
+
+        with self.lock:
+            self._ensure_connection()
+            if not self.connected:
+                return False
+
+            # Bytes fully overwritten before their first bit write need no read
+            covered: set[tuple[int, int]] = set()
+            to_read: set[tuple[int, int]] = set()
+            for db, byte, bit, value in writes:
+                if bit is None:
+                    covered.update((db, byte + i) for i in range(len(value)))
+                elif (db, byte) not in covered:
+                    to_read.add((db, byte))
+
+            image: dict[tuple[int, int], int] = {}
+            if to_read:
+                runs = self._contiguous_runs(dict.fromkeys(to_read, 0))
+                areas = [(db, start, len(data)) for db, start, data in runs]
+                buffers = [bytearray(size) for *_, size in areas]
+                if not self._read_areas_locked(areas, buffers):
+                    return False
+                for (db, start, _), buffer in zip(areas, buffers):
+                    image.update(((db, start + i), b) for i, b in enumerate(buffer))
+
+            for db, byte, bit, value in writes:
+                if bit is None:
+                    image.update(((db, byte + i), b) for i, b in enumerate(value))
+                else:
+                    current = image[(db, byte)]
+                    image[(db, byte)] = (current | (1 << bit)) if value else (current & ~(1 << bit))
+
+            runs = self._contiguous_runs(image)
+            areas = [(db, start, len(data)) for db, start, data in runs]
+            pdu = self._pdu_length()
+            max_items = max(1, min(MAX_MULTI_VARS, (pdu - MULTI_WRITE_REQ_HEADER) // MULTI_WRITE_REQ_ITEM))
+            requests = self._pack_multi_read(
+                areas, max_items, pdu - MULTI_WRITE_REQ_HEADER, item_overhead=MULTI_WRITE_REQ_ITEM
+            )
+
+            ok = True
+            t0 = time.perf_counter()
+            for request in requests:
+                payloads = [
+                    ctypes.create_string_buffer(bytes(runs[idx][2][offset:offset + size]), size)
+                    for idx, offset, _, _, size in request
+                ]
+                items = self._data_items(request, payloads)
+                try:
+                    self._write_multi_vars(items)
+                except Exception as e:
+                    self._recover_on_error(f"write_batch ({len(request)} items)", e)
+                    return False
+                for item, (_, _, db, start, size) in zip(items, request):
+                    if item.Result != 0:
+                        logger.error(
+                            f"❌ {self.ip_address} WriteMultiVars DB{db}[{start}:{size}] result=0x{item.Result:X}"
+                        )
+                        ok = False
+
+            dt = time.perf_counter() - t0
+            log = logger.warning if dt > 0.05 else logger.debug
+            log("%s ⏱ write_batch(%d writes, %d areas, %d requests) %.3fs",
+                self.ip_address, len(writes), len(areas), len(requests), dt)
+        return ok
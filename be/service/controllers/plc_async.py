@@ -0,0 +1,264 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import logging
+import random
+import time
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from service.controllers.plc import PLCConnection
+from service.controllers.plc_replay import PLCRecorder
+from service.state.global_state import metrics
+
+logger = logging.getLogger(__name__)
+
+REQUEST_QUEUE_SIZE  = 64        # pending S7 requests per connection before callers wait
+HEALTH_CHECK_PERIOD = 1.0       # seconds between two is_connected() checks
+RECONNECT_MIN_DELAY = 0.5       # first reconnect back-off (seconds)
+RECONNECT_MAX_DELAY = 30.0      # reconnect back-off ceiling (seconds)
+WRITE_COALESCE_WINDOW = 0.005   # seconds writes wait to be merged into one batch
+WRITE_RETRIES = 3               # attempts per write batch before its futures report failure
+
+
+class AsyncPLCClient:
+    """
+    Asyncio front-end of one ``PLCConnection``.
+
+    Requests go through a bounded queue (callers wait when it is full) and
+    are executed in order by a single worker on the connection's own thread,
+    so snap7 is never touched by two threads and the lock is never
+    contended. A request cancelled while still queued is dropped without
+    reaching the PLC. Reconnection is an asyncio task with jittered
+    exponential back-off instead of a polling thread per connection.
+
+    Writes are write-behind: each one gets a future and is held for
+    ``WRITE_COALESCE_WINDOW`` so that every write issued in the same tick is
+    applied in issue order by a single ``PLCConnection.write_batch``.
+    """
+
+    def __init__(self, plc_connection: PLCConnection, queue_size: int = REQUEST_QUEUE_SIZE,
+                 recorder: PLCRecorder | None = None):
+        self.plc = plc_connection
+        self.recorder = recorder
+        self.ip_address = plc_connection.ip_address
+        self.slot = plc_connection.slot
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"plc-{self.ip_address}")
+        self._tasks: list[asyncio.Task] = []
+        self._connected_event = asyncio.Event()
+        self.reconnect_count = 0
+        self.reconnect_success = 0
+        self._writes: list[tuple[int, int, int | None, bool | bytes, asyncio.Future]] = []
+        self._flush_task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()   # batches (and their retries) reach the PLC in order
+        if self.plc.connected:
+            self._connected_event.set()
+
+    # ---- lifecycle -------------------------------------------------------
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._worker()),
+                asyncio.create_task(self._reconnector()),
+            ]
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            await self._flush_task
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            future, *_ = self._queue.get_nowait()
+            future.cancel()
+        await asyncio.get_running_loop().run_in_executor(self._thread, self.plc.disconnect)
+        self._thread.shutdown(wait=False)
+        if self.recorder is not None:
+            self.recorder.close()
+
+    # ---- connection state -----------------------------------------------
+
+    @property
+    def connected(self) -> bool:
+        return bool(self.plc.connected)
+
+    def is_connected(self) -> bool:
+        return self.plc.is_connected()
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    async def wait_connected(self, timeout: float | None = None) -> bool:
+        """Wait until the reconnector brings the PLC back; False on timeout."""
+        if self.connected:
+            return True
+        try:
+            await asyncio.wait_for(self._connected_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self.connected
+
+    async def _reconnector(self) -> None:
+        delay = RECONNECT_MIN_DELAY
+        loop = asyncio.get_running_loop()
+        while True:
+            if self.plc.connected and self.plc.is_connected():
+                self._connected_event.set()
+                delay = RECONNECT_MIN_DELAY
+                await asyncio.sleep(HEALTH_CHECK_PERIOD)
+                continue
+
+            self._connected_event.clear()
+            self.reconnect_count += 1
+            try:
+                ok = await loop.run_in_executor(self._thread, self.plc.reconnect_once)
+            except Exception as e:
+                logger.error(f"❌ Reconnect attempt to PLC {self.ip_address} failed: {e}")
+                ok = False
+
+            if ok:
+                self.reconnect_success += 1
+                self._connected_event.set()
+                delay = RECONNECT_MIN_DELAY
+                continue
+
+            # Full jitter keeps several PLC clients from retrying in lockstep
+            await asyncio.sleep(random.uniform(RECONNECT_MIN_DELAY, delay))
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    # ---- request queue ---------------------------------------------------
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            future, method, args, kwargs, queued_at = await self._queue.get()
+            try:
+                if future.cancelled():
+                    continue
+                wait = time.perf_counter() - queued_at
+                if wait > 0.25:
+                    logger.warning(f"{self.ip_address} ⏱ {method.__name__} waited {wait:.3f}s in queue")
+                t0 = time.perf_counter()
+                try:
+                    result = await loop.run_in_executor(self._thread, partial(method, *args, **kwargs))
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+                finally:
+                    metrics.observe("pms_plc_request_seconds", time.perf_counter() - t0,
+                                    plc=f"{self.ip_address}:{self.slot}", method=method.__name__)
+            finally:
+                self._queue.task_done()
+
+    async def call(self, method, *args, **kwargs):
+        """Queue ``method(*args, **kwargs)`` on the PLC thread and await its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((future, method, args, kwargs, time.perf_counter()))
+        return await future
+
+    # ---- write-behind ----------------------------------------------------
+
+    def _queue_write(self, db_number: int, byte_index: int, bit_index: int | None,
+                     value: bool | bytes) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._writes.append((db_number, byte_index, bit_index, value, future))
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_writes())
+        return future
+
+    def queue_write_bool(self, db_number: int, byte_index: int, bit_index: int,
+                         value: bool) -> asyncio.Future:
+        """Schedule a bit write; the future resolves to True once it reached the PLC."""
+        return self._queue_write(db_number, byte_index, bit_index, bool(value))
+
+    def queue_write_bytes(self, db_number: int, byte_index: int, data: bytes) -> asyncio.Future:
+        """Schedule a raw byte write; the future resolves to True once it reached the PLC."""
+        return self._queue_write(db_number, byte_index, None, bytes(data))
+
+    async def _flush_writes(self) -> None:
+        await asyncio.sleep(WRITE_COALESCE_WINDOW)
+        # Writes issued from now on go to the next batch, queued after this one
+        batch, self._writes, self._flush_task = self._writes, [], None
+        batch = [w for w in batch if not w[4].cancelled()]
+        if not batch:
+            return
+
+        writes = [w[:4] for w in batch]
+        ok = False
+        delay = 0.01
+        async with self._flush_lock:
+            for attempt in range(WRITE_RETRIES):
+                try:
+                    ok = await self.call(self.plc.write_batch, writes)
+                except Exception as e:
+                    logger.warning(f"⚠️ write batch attempt {attempt + 1}/{WRITE_RETRIES} on {self.ip_address} failed: {e}")
+                    ok = False
+                if ok or not self.connected:
+                    break
+                await asyncio.sleep(delay)
+                delay *= 2
+
+        if not ok:
+            logger.error(f"❌ {len(batch)} PLC writes on {self.ip_address} not applied")
+        for *_, future in batch:
+            if not future.done():
+                future.set_result(ok)
+
+    # ---- PLCConnection API ----------------------------------------------
+
+    def _record(self, areas, buffers) -> None:
+        # Zero-filled reads of a PLC that is down are not traffic worth replaying
+        if self.recorder is not None and self.connected:
+            try:
+                self.recorder.record(areas, buffers)
+            except Exception as e:
+                logger.error(f"❌ PLC recording to {self.recorder.path} failed, disabled: {e}")
+                self.recorder = None
+
+    async def read_areas(self, areas: list[tuple[int, int, int]]) -> list[bytearray]:
+        buffers = await self.call(self.plc.read_areas, areas)
+        self._record(areas, buffers)
+        return buffers
+
+    async def db_read(self, db_number: int, start_byte: int, size: int) -> bytearray:
+        buffer = await self.call(self.plc.db_read, db_number, start_byte, size)
+        self._record([(db_number, start_byte, size)], [buffer])
+        return buffer
+
+    async def read_bool(self, db_number, byte_index, bit_index):
+        return await self.call(self.plc.read_bool, db_number, byte_index, bit_index)
+
+    async def write_bool(self, db_number, byte_index, bit_index, value):
+        return await self.queue_write_bool(db_number, byte_index, bit_index, value)
+
+    async def read_integer(self, db_number, byte_index):
+        return await self.call(self.plc.read_integer, db_number, byte_index)
+
+    async def write_integer(self, db_number, byte_index, value):
+        return await self.queue_write_bytes(db_number, byte_index, int(value).to_bytes(2, "big", signed=True))
+
+    async def read_string(self, db_number, byte_index, max_size):
+        return await self.call(self.plc.read_string, db_number, byte_index, max_size)
+
+    async def write_string(self, db_number, byte_index, value, max_size):
+        value = value[:max_size].encode("ascii", errors="ignore")
+        payload = bytes([max_size, len(value)]) + value.ljust(max_size, b"\0")
+        return await self.queue_write_bytes(db_number, byte_index, payload)
+
+    async def read_byte(self, db_number, byte_index):
+        return await self.call(self.plc.read_byte, db_number, byte_index)
+
+    async def read_real(self, db_number, byte_index):
+        return await self.call(self.plc.read_real, db_number, byte_index)
+
+    async def read_date_time(self, db_number, byte_index):
+        return await self.call(self.plc.read_date_time, db_number, byte_index)
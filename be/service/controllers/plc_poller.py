@@ -0,0 +1,187 @@
+import asyncio
+from dataclasses import dataclass
+import logging
+import time
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from service.config.config import (
+    PLC_DB_RANGES,
+    PLC_POLL_BACKOFF,
+    PLC_POLL_BOOST_WINDOW,
+    PLC_POLL_DISCONNECTED_INTERVAL,
+    PLC_POLL_MAX_INTERVAL,
+    PLC_POLL_MIN_INTERVAL,
+)
+from service.controllers.plc_async import AsyncPLCClient
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.45    # seconds between two reads of the same DB range (no rate registered)
+
+
+@dataclass(frozen=True)
+class PLCSnapshot:
+    """Immutable image of one DB range, shared by every consumer of a tick."""
+    db: int
+    start: int
+    data: bytes
+    tick: int
+    timestamp: float
+
+
+class StationPollRate:
+    """
+    Poll interval wanted by one consumer of a PLC. ``boost`` (trigger edge)
+    pins it to ``min_interval`` for ``boost_window`` seconds so the end of
+    cycle is caught quickly; ``idle`` (end of cycle) or the boost window
+    expiring lets it grow by ``backoff`` at every tick up to ``max_interval``.
+    """
+
+    def __init__(self, name: str,
+                 min_interval: float = PLC_POLL_MIN_INTERVAL,
+                 max_interval: float = PLC_POLL_MAX_INTERVAL,
+                 backoff: float = PLC_POLL_BACKOFF,
+                 boost_window: float = PLC_POLL_BOOST_WINDOW):
+        self.name = name
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff = max(1.0, backoff)
+        self.boost_window = boost_window
+        self.interval = self.max_interval
+        self.fast_until = 0.0
+
+    def boost(self) -> None:
+        self.interval = self.min_interval
+        self.fast_until = time.monotonic() + self.boost_window
+
+    def idle(self) -> None:
+        self.fast_until = 0.0
+
+    def step(self, now: float) -> float:
+        """Advance the backoff curve by one tick and return the wanted interval."""
+        if now < self.fast_until:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        return self.interval
+
+    def status(self) -> dict:
+        return {
+            "interval": round(self.interval, 3),
+            "boosted": time.monotonic() < self.fast_until,
+        }
+
+
+class PLCBlockPoller:
+    """
+    One scheduler per (ip, slot): every registered DB range is read once per
+    tick and the resulting snapshot is handed to all the station and fermi
+    consumers of that PLC, instead of each of them issuing its own db_read.
+    """
+
+    def __init__(self, plc_connection: AsyncPLCClient, ip: str, slot: int,
+                 interval: float = POLL_INTERVAL, time_scale: float = 1.0):
+        self.plc = plc_connection
+        self.plc_key = (ip, slot)
+        self.interval = interval
+        self.time_scale = time_scale    # > 1 when replaying a recording faster than real time
+        self.ranges: dict[int, tuple[int, int]] = {}   # {db: (start_byte, size)}
+        self.snapshots: dict[int, PLCSnapshot] = {}
+        self.rates: dict[str, StationPollRate] = {}
+        self.effective_interval = interval
+        self.last_read_duration = 0.0
+        self.tick = 0
+        self._new_tick = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def register(self, db: int) -> tuple[int, int] | None:
+        """Add a DB to the polling set and return its (start_byte, size)."""
+        if db in self.ranges:
+            return self.ranges[db]
+
+        raw = PLC_DB_RANGES.get(self.plc_key, {}).get(db)
+        if not raw:
+            logger.error(f"No DB range defined for {self.plc_key} DB{db}")
+            return None
+
+        self.ranges[db] = (raw["min"], raw["max"] - raw["min"] + 1)
+        logger.debug(f"[{self.plc_key}] DB{db} registered for polling: {self.ranges[db]}")
+        return self.ranges[db]
+
+    def poll_rate(self, name: str, **kwargs) -> StationPollRate:
+        """
+        Adaptive rate of one consumer. The poller runs at the fastest of them:
+        the DBs of every consumer go out in the same read, so a consumer
+        backed off to its max interval still gets the boosted ones' rate.
+        """
+        if name not in self.rates:
+            self.rates[name] = StationPollRate(name, **kwargs)
+        return self.rates[name]
+
+    def _next_interval(self, connected: bool) -> float:
+        if not connected:
+            return max(self.interval, PLC_POLL_DISCONNECTED_INTERVAL)
+        if not self.rates:
+            return self.interval / self.time_scale
+        now = time.monotonic()
+        return min(rate.step(now) for rate in self.rates.values()) / self.time_scale
+
+    def status(self) -> dict:
+        interval = self.effective_interval
+        return {
+            "plc": f"{self.plc_key[0]}:{self.plc_key[1]}",
+            "connected": bool(self.plc.connected),
+            "interval": round(interval, 3),
+            "reads_per_second": round(1 / interval, 2) if interval > 0 else None,
+            "last_read_ms": round(self.last_read_duration * 1000, 1),
+            "tick": self.tick,
+            "stations": {name: rate.status() for name, rate in self.rates.items()},
+        }
+
+    def start(self) -> None:
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    def latest(self, db: int) -> PLCSnapshot | None:
+        return self.snapshots.get(db)
+
+    async def next_snapshot(self, db: int, after_tick: int = 0) -> PLCSnapshot:
+        """Wait for a snapshot of ``db`` newer than ``after_tick``."""
+        while True:
+            snapshot = self.snapshots.get(db)
+            if snapshot is not None and snapshot.tick > after_tick:
+                return snapshot
+            await self._new_tick.wait()
+
+    async def _read_ranges(self, tick: int) -> None:
+        # All DB ranges of this PLC go out in as few multi-variable requests as the PDU allows
+        areas = [(db, start, size) for db, (start, size) in self.ranges.items()]
+        buffers = await self.plc.read_areas(areas)
+        now = time.time()
+        for (db, start, _), buffer in zip(areas, buffers):
+            self.snapshots[db] = PLCSnapshot(db, start, bytes(buffer), tick, now)
+
+    async def _run(self) -> None:
+        logger.debug(f"[{self.plc_key}] Starting DB block poller.")
+        while True:
+            t0 = time.perf_counter()
+            connected = False
+            try:
+                connected = bool(self.plc.connected and self.plc.is_connected())
+                if self.ranges and connected:
+                    self.tick += 1
+                    await self._read_ranges(self.tick)
+            except Exception as e:
+                logger.error(f"[{self.plc_key}] Error in DB block poller: {e}")
+            finally:
+                # Wake consumers even on partial reads: they only pick up DBs whose tick advanced
+                new_tick, self._new_tick = self._new_tick, asyncio.Event()
+                new_tick.set()
+
+            elapsed = time.perf_counter() - t0
+            self.last_read_duration = elapsed
+            self.effective_interval = max(elapsed, self._next_interval(connected))
+            await asyncio.sleep(max(0.0, self.effective_interval - elapsed))
@@ -0,0 +1,294 @@
+from datetime import datetime
+import logging
+import mmap
+from pathlib import Path
+import struct
+import time
+from threading import Lock
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from service.controllers.plc import PLCConnection
+
+logger = logging.getLogger(__name__)
+
+# File layout: FILE_MAGIC, then frames. Every frame starts with
+#   kind (b"K" keyframe / b"D" delta), timestamp (float64), db, start, length
+# K: ``length`` raw bytes follow.
+# D: ``length`` runs follow, each (offset from start, size) + ``size`` bytes.
+FILE_MAGIC = b"PMSREC\x01\n"
+FILE_SUFFIX = ".pmsrec"
+_FRAME = struct.Struct(">cdHII")
+_RUN = struct.Struct(">IH")
+KEYFRAME_EVERY = 1000       # frames of the same area between two keyframes
+RUN_MERGE_GAP = 8           # unchanged bytes tolerated inside one delta run
+
+
+def recording_path(directory: str | Path, ip: str, slot: int) -> Path:
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return Path(directory) / f"{ip}_{slot}_{stamp}{FILE_SUFFIX}"
+
+
+def find_recording(directory: str | Path, ip: str, slot: int) -> Path | None:
+    """Latest recording of (ip, slot) in ``directory``."""
+    matches = sorted(Path(directory).glob(f"{ip}_{slot}_*{FILE_SUFFIX}"))
+    return matches[-1] if matches else None
+
+
+def _delta_runs(old: bytes, new: bytes) -> list[tuple[int, bytes]]:
+    runs: list[tuple[int, bytes]] = []
+    start = end = None
+    for i in range(len(new)):
+        if old[i] == new[i]:
+            continue
+        if start is not None and i - end <= RUN_MERGE_GAP:
+            end = i + 1
+            continue
+        if start is not None:
+            runs.append((start, new[start:end]))
+        start, end = i, i + 1
+    if start is not None:
+        runs.append((start, new[start:end]))
+    return runs
+
+
+class PLCRecorder:
+    """
+    Appends the areas read from one PLC to a compact binary log. Unchanged
+    reads cost nothing, changed ones are stored as byte runs against the
+    previous read of the same area, with a keyframe every ``KEYFRAME_EVERY``.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        new_file = not self.path.exists() or self.path.stat().st_size == 0
+        self._file = open(self.path, "ab", buffering=64 * 1024)
+        if new_file:
+            self._file.write(FILE_MAGIC)
+        self._last: dict[tuple[int, int, int], bytes] = {}
+        self._since_key: dict[tuple[int, int, int], int] = {}
+        self.frames = 0
+        self.bytes_written = 0
+        self._last_flush = time.monotonic()
+
+    def record(self, areas: list[tuple[int, int, int]], buffers: list, timestamp: float | None = None) -> None:
+        ts = time.time() if timestamp is None else timestamp
+        for (db, start, size), buffer in zip(areas, buffers):
+            data = bytes(buffer)
+            key = (db, start, size)
+            previous = self._last.get(key)
+            if previous == data:
+                continue
+            self._last[key] = data
+
+            runs = None
+            if previous is not None and self._since_key.get(key, 0) < KEYFRAME_EVERY:
+                runs = _delta_runs(previous, data)
+                if sum(_RUN.size + len(chunk) for _, chunk in runs) >= size:
+                    runs = None
+
+            if runs is None:
+                frame = _FRAME.pack(b"K", ts, db, start, size) + data
+                self._since_key[key] = 0
+            else:
+                frame = _FRAME.pack(b"D", ts, db, start, len(runs)) + b"".join(
+                    _RUN.pack(offset, len(chunk)) + chunk for offset, chunk in runs
+                )
+                self._since_key[key] += 1
+
+            self._file.write(frame)
+            self.frames += 1
+            self.bytes_written += len(frame)
+
+        if time.monotonic() - self._last_flush > 1.0:
+            self.flush()
+
+    def flush(self) -> None:
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+
+class PLCRecordReader:
+    """Memory-mapped reader of a ``PLCRecorder`` log."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(FILE_MAGIC)] != FILE_MAGIC:
+            raise ValueError(f"{self.path} is not a PLC recording")
+
+    def frames(self):
+        """Yield ``(timestamp, db, start, [(offset, bytes), ...])`` per frame; stops at a truncated tail."""
+        buf, pos, end = self._map, len(FILE_MAGIC), len(self._map)
+        while pos + _FRAME.size <= end:
+            kind, ts, db, start, length = _FRAME.unpack_from(buf, pos)
+            pos += _FRAME.size
+            if kind == b"K":
+                if pos + length > end:
+                    return
+                runs = [(0, buf[pos:pos + length])]
+                pos += length
+            else:
+                runs = []
+                for _ in range(length):
+                    if pos + _RUN.size > end:
+                        return
+                    offset, size = _RUN.unpack_from(buf, pos)
+                    pos += _RUN.size
+                    if pos + size > end:
+                        return
+                    runs.append((offset, buf[pos:pos + size]))
+                    pos += size
+            yield ts, db, start, runs
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class _ReplayClient:
+    """Minimal snap7 client facade over the replay image."""
+
+    def __init__(self, replay: "ReplayPLCConnection"):
+        self._replay = replay
+
+    def get_connected(self):
+        return True
+
+    def get_pdu_length(self):
+        return 480
+
+    def db_read(self, db_number, start, size):
+        return self._replay._slice(db_number, start, size)
+
+    def write_area(self, area, db_number, start, data):
+        self._replay.writes += 1
+
+    def disconnect(self):
+        pass
+
+
+class ReplayPLCConnection(PLCConnection):
+    """
+    Serves reads from a recorded log instead of a PLC, ``speed`` times faster
+    than real time. In lockstep mode (default) every read advances by at most
+    one recorded tick, so no recorded state is skipped even when the readers
+    cannot keep up with the requested speed; ``lag`` reports how far behind
+    the replay clock they are. Writes are counted and dropped.
+    """
+
+    def __init__(self, path: str | Path, ip_address: str, slot: int, *,
+                 speed: float = 1.0, lockstep: bool = True, loop: bool = False):
+        self.ip_address = ip_address
+        self.slot = slot
+        self.connected = True
+        self.background_reconnect = False
+        self.lock = Lock()
+        self.client = _ReplayClient(self)
+        self.speed = speed
+        self.lockstep = lockstep
+        self.loop = loop
+        self.reader = PLCRecordReader(path)
+        self.images: dict[int, bytearray] = {}
+        self.frames_applied = 0
+        self.writes = 0
+        self.finished = False
+        self._rewind()
+
+    def _rewind(self) -> None:
+        self.images.clear()
+        self._frames = self.reader.frames()
+        self._pending = next(self._frames, None)
+        self._rec_t0 = self._pending[0] if self._pending else 0.0
+        self._wall_t0 = time.monotonic()
+
+    @property
+    def lag(self) -> float:
+        """Recorded seconds not yet replayed although the replay clock passed them."""
+        if self._pending is None:
+            return 0.0
+        now_rec = self._rec_t0 + (time.monotonic() - self._wall_t0) * self.speed
+        return max(0.0, now_rec - self._pending[0])
+
+    def _apply(self, frame) -> None:
+        _, db, start, runs = frame
+        image = self.images.setdefault(db, bytearray())
+        for offset, chunk in runs:
+            pos = start + offset
+            if len(image) < pos + len(chunk):
+                image.extend(bytes(pos + len(chunk) - len(image)))
+            image[pos:pos + len(chunk)] = chunk
+        self.frames_applied += 1
+
+    def _advance(self) -> None:
+        now_rec = self._rec_t0 + (time.monotonic() - self._wall_t0) * self.speed
+        while self._pending is not None and self._pending[0] <= now_rec:
+            tick_ts = self._pending[0]
+            # Frames of one poller tick share their timestamp
+            while self._pending is not None and self._pending[0] == tick_ts:
+                self._apply(self._pending)
+                self._pending = next(self._frames, None)
+            if self.lockstep:
+                break
+
+        if self._pending is None and not self.finished:
+            elapsed = time.monotonic() - self._wall_t0
+            logger.info(f"⏹️ Replay of {self.reader.path.name} finished: "
+                        f"{self.frames_applied} frames in {elapsed:.1f}s, {self.writes} writes")
+            if self.loop:
+                self._rewind()
+            else:
+                self.finished = True
+
+    def _slice(self, db: int, start: int, size: int) -> bytearray:
+        image = self.images.get(db, b"")
+        out = bytearray(image[start:start + size])
+        if len(out) < size:
+            out.extend(bytes(size - len(out)))
+        return out
+
+    def is_connected(self):
+        return True
+
+    def reconnect_once(self):
+        return True
+
+    def disconnect(self):
+        pass
+
+    def read_areas(self, areas):
+        with self.lock:
+            self._advance()
+            return [self._slice(db, start, size) for db, start, size in areas]
+
+    def db_read(self, db_number, start_byte, size):
+        with self.lock:
+            self._advance()
+            return self._slice(db_number, start_byte, size)
+
+    def write_batch(self, writes):
+        with self.lock:
+            self.writes += len(writes)
+            return True
+
+
+if __name__ == "__main__":
+    # Summary of a recording: python plc_replay.py <file.pmsrec>
+    reader = PLCRecordReader(sys.argv[1])
+    count, first, last, areas = 0, None, None, set()
+    for ts, db, start, runs in reader.frames():
+        count += 1
+        first = ts if first is None else first
+        last = ts
+        areas.add(db)
+    size = reader.path.stat().st_size
+    span = (last - first) if count else 0.0
+    print(f"{reader.path.name}: {count} frames, {len(areas)} DBs, {span:.0f}s recorded, "
+          f"{size / 1024:.1f} KiB ({size / max(span, 1):.0f} B/s)")
@@ -30,7 +30,8 @@ def extract_s7_string(buffer: bytes, offset: int) -> str:
 
 def extract_int(buffer, byte_offset, base_offset):
     pos = byte_offset - base_offset
-    return u.get_int(buffer, pos)
+    # Works on the immutable ``bytes`` snapshots too (snap7's get_int mutates its slice)
+    return int.from_bytes(buffer[pos:pos + 2], "big", signed=True)
 
 def extract_swapped_int(buffer, byte_offset, base_offset):
     pos = byte_offset - base_offset
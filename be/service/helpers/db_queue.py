@@ -1,57 +1,414 @@
 import asyncio
+from collections import deque
+import contextvars
+from dataclasses import dataclass, field
+import importlib
 import logging
+import os
+from pathlib import Path
+import pickle
+import struct
+from typing import Callable
+import zlib
+
+from pymysql import err as pymysql_err
 
 logger = logging.getLogger(__name__)
 
+DB_QUEUE_WORKERS = 4            # shards; jobs with the same key always run on the same one, in order
+DB_QUEUE_SIZE = 1000            # jobs held in memory (all shards) before new ones spill to the journal
+DB_QUEUE_MAX_BATCH = 50         # same-type jobs coalesced into one batch handler call
+DB_QUEUE_MAX_SPILLED = 200_000  # jobs left on disk only before enqueue() waits for room
+RETRY_MAX_DELAY = 30.0          # back-off ceiling (seconds) while MySQL is unreachable
+
+# Errors that mean "MySQL is not there right now": the job is retried until it goes through
+RETRYABLE_ERRORS = (pymysql_err.OperationalError, pymysql_err.InterfaceError, ConnectionError)
+
+_LEN = struct.Struct("<I")
+
+
+@dataclass
+class Job:
+    seq: int
+    func: Callable
+    args: tuple
+    kwargs: dict
+    key: str | None = None
+    ctx: contextvars.Context | None = None
+    journaled: bool = False
+
+
+@dataclass
+class _Spilled:
+    """A journaled job whose arguments were dropped from memory; reloaded by its worker."""
+    seq: int
+    func: Callable
+    offset: int
+
+
+@dataclass
+class _Shard:
+    jobs: deque = field(default_factory=deque)   # Job | _Spilled, FIFO
+    ready: asyncio.Event = field(default_factory=asyncio.Event)
+    spilled: int = 0
+    waiting: deque = field(default_factory=deque)   # seq of the jobs whose enqueue() waits for room, FIFO
+
+
+def _func_ref(func: Callable) -> str | None:
+    module, qualname = getattr(func, "__module__", None), getattr(func, "__qualname__", "")
+    if not module or "<" in qualname:
+        return None     # lambdas / nested functions cannot be found again after a restart
+    return f"{module}:{qualname}"
+
+
+def _resolve_func(ref: str) -> Callable:
+    module, qualname = ref.split(":", 1)
+    obj = importlib.import_module(module)
+    for part in qualname.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+class WriteJournal:
+    """
+    Append-only file of queued jobs.
+
+    Every job that can be pickled is written when it is enqueued and an
+    acknowledgement is appended once it is done, so whatever is not
+    acknowledged when the process dies is replayed at the next start.
+    Records are ``<len><pickle>``; a torn record at the end (crash mid write)
+    is ignored. The file is rewritten with only the pending jobs at startup
+    and truncated whenever the queue drains.
+    """
+
+    def __init__(self, path: str | Path, fsync: bool = False):
+        self.path = Path(path)
+        self.fsync = fsync
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "ab")
+        self._reader = open(self.path, "rb")
+
+    def close(self) -> None:
+        self._file.close()
+        self._reader.close()
+
+    def _write(self, record) -> int:
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        offset = self._file.tell()
+        self._file.write(_LEN.pack(len(payload)) + payload)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        return offset
+
+    def append_job(self, job: Job) -> int | None:
+        """Offset of the job record, None when the job cannot be persisted."""
+        ref = _func_ref(job.func)
+        if ref is None:
+            return None
+        try:
+            return self._write(("job", job.seq, job.key, ref, job.args, job.kwargs))
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            logger.debug(f"DB queue job {ref} kept in memory only: {e}")
+            return None
+
+    def append_done(self, seq: int) -> None:
+        self._write(("done", seq))
+
+    def read_job(self, offset: int) -> Job:
+        self._reader.seek(offset)
+        (size,) = _LEN.unpack(self._reader.read(_LEN.size))
+        _, seq, key, ref, args, kwargs = pickle.loads(self._reader.read(size))
+        return Job(seq, _resolve_func(ref), args, kwargs, key, journaled=True)
+
+    def _records(self):
+        with open(self.path, "rb") as f:
+            while True:
+                offset = f.tell()
+                header = f.read(_LEN.size)
+                if len(header) < _LEN.size:
+                    return
+                (size,) = _LEN.unpack(header)
+                payload = f.read(size)
+                if len(payload) < size:
+                    logger.warning(f"⚠️ DB queue journal {self.path} ends with a torn record, ignored")
+                    return
+                yield offset, pickle.loads(payload)
+
+    def recover(self) -> list[tuple[int, str | None, str, int]]:
+        """
+        Compact the journal to the jobs never acknowledged and return them
+        as ``(seq, key, func_ref, offset)`` in enqueue order.
+        """
+        pending: dict[int, tuple] = {}
+        try:
+            for _, record in self._records():
+                if record[0] == "job":
+                    pending[record[1]] = record
+                else:
+                    pending.pop(record[1], None)
+        except Exception as e:
+            logger.error(f"❌ DB queue journal {self.path} unreadable after {len(pending)} jobs: {e}")
+
+        self._file.close()
+        self._reader.close()
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        recovered = []
+        with open(tmp, "wb") as f:
+            for seq in sorted(pending):
+                record = pending[seq]
+                payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+                recovered.append((seq, record[2], record[3], f.tell()))
+                f.write(_LEN.pack(len(payload)) + payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._file = open(self.path, "ab")
+        self._reader = open(self.path, "rb")
+        return recovered
+
+    def truncate(self) -> None:
+        self._file.truncate(0)
+        self._file.seek(0)
+
+    @property
+    def size(self) -> int:
+        return self._file.tell()
+
+
 class DBWriteQueue:
-    """Asyncio-based queue with graceful shutdown and retry logic for DB writes."""
+    """
+    Deferred DB writes run by ``workers`` asyncio workers.
+
+    - Ordering: ``enqueue(..., key=...)`` always lands on the same worker, so
+      jobs sharing a key (a station, a production) run in enqueue order.
+      Jobs without a key go to the shortest queue.
+    - Batching: a function registered with ``register_batch`` is coalesced
+      with the same-function jobs queued right behind it on its worker and
+      handed to its batch handler in one call.
+    - Durability / bounds: jobs are journaled (``WriteJournal``) when they are
+      enqueued and acknowledged when done; pending ones are replayed by
+      ``start()``. Past ``max_size`` jobs in memory, new ones live on disk
+      only and are reloaded by their worker; jobs that cannot be journaled
+      wait for room instead (backpressure).
+    - Retries: ``RETRYABLE_ERRORS`` (MySQL down, connection lost) are retried
+      with back-off until they succeed, any other error ``max_retries`` times.
+    """
 
-    def __init__(self, max_retries: int = 3, timeout: float = 30.0) -> None:
-        self.queue: asyncio.Queue = asyncio.Queue()
-        self.worker_task: asyncio.Task | None = None
-        self._shutdown = asyncio.Event()
+    def __init__(self, max_retries: int = 3, timeout: float = 30.0, workers: int = DB_QUEUE_WORKERS,
+                 max_size: int = DB_QUEUE_SIZE, max_batch: int = DB_QUEUE_MAX_BATCH,
+                 max_spilled: int = DB_QUEUE_MAX_SPILLED, journal_path: str | Path | None = None,
+                 fsync: bool = False) -> None:
         self.max_retries = max_retries
         self.timeout = timeout
+        self.max_size = max_size
+        self.max_batch = max_batch
+        self.max_spilled = max_spilled
+        self.journal_path = journal_path
+        self.fsync = fsync
+        self.journal: WriteJournal | None = None
+        self._shards = [_Shard() for _ in range(max(1, workers))]
+        self._worker_tasks: list[asyncio.Task] = []
+        self._batch_handlers: dict[Callable, Callable] = {}
+        self._seq = 0
+        self._in_memory = 0
+        self._running = 0
+        self._room = asyncio.Condition()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        # Counters exposed on /metrics
+        self.completed = 0
+        self.retries = 0
+        self.failures = 0
+        self.batches = 0
+        self.spills = 0
+        self.replayed = 0
+
+    # ---- lifecycle -------------------------------------------------------
+
+    def register_batch(self, func: Callable, batch_func: Callable) -> None:
+        """``batch_func(list_of_args)`` replaces consecutive ``func(*args)`` jobs (no kwargs)."""
+        self._batch_handlers[func] = batch_func
 
     def start(self) -> None:
-        """Start background worker task."""
-        if not self.worker_task:
-            self.worker_task = asyncio.create_task(self._worker())
-
-    async def enqueue(self, func, *args, **kwargs) -> None:
-        """Add a coroutine function to the queue."""
-        await self.queue.put((func, args, kwargs))
-
-    async def shutdown(self) -> None:
-        """Stop accepting new tasks and wait for queue to drain."""
-        self._shutdown.set()
-        await self.queue.join()  # Wait for all tasks to finish
-        if self.worker_task:
-            self.worker_task.cancel()
+        """Replay the journal, then start the workers."""
+        if self._worker_tasks:
+            return
+        if self.journal_path and self.journal is None:
             try:
-                await self.worker_task
-            except asyncio.CancelledError:
-                pass
+                self.journal = WriteJournal(self.journal_path, fsync=self.fsync)
+                self._replay()
+            except Exception as e:
+                logger.error(f"❌ DB queue journal {self.journal_path} disabled: {e}")
+                self.journal = None
+        self._worker_tasks = [asyncio.create_task(self._worker(shard)) for shard in self._shards]
 
-    async def _worker(self) -> None:
-        while not self._shutdown.is_set():
+    def _replay(self) -> None:
+        for seq, key, ref, offset in self.journal.recover():
             try:
-                func, args, kwargs = await asyncio.wait_for(self.queue.get(), timeout=1)
-            except asyncio.TimeoutError:
-                continue  # Allows checking for shutdown periodically
+                func = _resolve_func(ref)
+            except Exception as e:
+                logger.error(f"❌ DB queue job {seq} ({ref}) cannot be replayed: {e}")
+                continue
+            shard = self._shard_for(key)
+            shard.jobs.append(_Spilled(seq, func, offset))
+            shard.spilled += 1
+            shard.ready.set()
+            self._seq = max(self._seq, seq)
+            self.replayed += 1
+        if self.replayed:
+            self._idle.clear()
+            logger.warning(f"⚠️ Replaying {self.replayed} DB writes left pending by the previous run")
+
+    async def shutdown(self, timeout: float | None = None) -> None:
+        """Wait for the queue to drain (at most ``timeout``); what is left stays in the journal."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ DB queue shutdown with {self.depth} jobs pending"
+                           f"{' (kept in the journal)' if self.journal else ''}")
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    # ---- state -----------------------------------------------------------
+
+    @property
+    def depth(self) -> int:
+        return sum(len(shard.jobs) for shard in self._shards) + self._running
+
+    @property
+    def spilled(self) -> int:
+        return sum(shard.spilled for shard in self._shards)
+
+    def _shard_for(self, key: str | None) -> _Shard:
+        if key is None:
+            return min(self._shards, key=lambda s: len(s.jobs))
+        return self._shards[zlib.crc32(str(key).encode()) % len(self._shards)]
+
+    # ---- enqueue ---------------------------------------------------------
+
+    async def enqueue(self, func, *args, key: str | None = None, **kwargs) -> None:
+        """Queue ``func(*args, **kwargs)``; it runs in the caller's context, after earlier jobs with the same ``key``."""
+        self._seq += 1
+        job = Job(self._seq, func, args, kwargs, key, contextvars.copy_context())
+        shard = self._shard_for(key)
+
+        offset = self.journal.append_job(job) if self.journal is not None else None
+        job.journaled = offset is not None
+
+        # Once a shard spills, later jobs follow it to disk so that the shard stays FIFO;
+        # while earlier jobs of the shard wait for room, later ones queue up behind them
+        if job.journaled and (self._in_memory >= self.max_size or shard.spilled) \
+                and self.spilled < self.max_spilled and not shard.waiting:
+            shard.jobs.append(_Spilled(job.seq, func, offset))
+            shard.spilled += 1
+            self.spills += 1
+        else:
+            shard.waiting.append(job.seq)
+            async with self._room:
+                try:
+                    await self._room.wait_for(
+                        lambda: shard.waiting[0] == job.seq and self._in_memory < self.max_size
+                    )
+                    shard.jobs.append(job)
+                    self._in_memory += 1
+                finally:
+                    shard.waiting.remove(job.seq)
+                    self._room.notify_all()     # the next waiter of the shard may go now
+        self._idle.clear()
+        shard.ready.set()
+
+    # ---- workers ---------------------------------------------------------
+
+    def _pop(self, shard: _Shard) -> Job:
+        entry = shard.jobs.popleft()
+        if isinstance(entry, _Spilled):
+            shard.spilled -= 1
+            return self.journal.read_job(entry.offset)
+        self._in_memory -= 1
+        return entry
+
+    async def _release_room(self) -> None:
+        async with self._room:
+            self._room.notify_all()
+
+    async def _worker(self, shard: _Shard) -> None:
+        while True:
+            if not shard.jobs:
+                shard.ready.clear()
+                await shard.ready.wait()
+                continue
+
+            batch = [self._pop(shard)]
+            self._running += 1
             try:
-                for attempt in range(1, self.max_retries + 1):
-                    try:
-                        await asyncio.wait_for(func(*args, **kwargs), timeout=self.timeout)
-                        break  # Success
-                    except asyncio.TimeoutError:
-                        logger.warning(f"Task timed out (attempt {attempt}): {func.__name__}")
-                    except Exception as e:
-                        logger.warning(f"Task failed (attempt {attempt}): {e}")
-                        await asyncio.sleep(1)
+                batch_func = self._batch_handlers.get(batch[0].func)
+                if batch_func is not None and not batch[0].kwargs:
+                    while len(batch) < self.max_batch and shard.jobs and shard.jobs[0].func is batch[0].func:
+                        job = self._pop(shard)
+                        if job.kwargs:
+                            shard.jobs.appendleft(job)
+                            self._in_memory += 1
+                            break
+                        batch.append(job)
+                await self._release_room()
+
+                if len(batch) > 1:
+                    self.batches += 1
+                    await self._run(batch, batch_func, ([job.args for job in batch],), {})
                 else:
-                    logger.error(f"Task permanently failed after {self.max_retries} attempts: {func.__name__}")
+                    job = batch[0]
+                    await self._run(batch, job.func, job.args, job.kwargs)
             except Exception as e:
                 logger.error(f"Unexpected DB queue error: {e}")
             finally:
-                self.queue.task_done()
+                self._running -= 1
+            # Not reached when cancelled at shutdown: the job stays pending in the journal
+            self._acknowledge(batch)
+
+    async def _run(self, batch: list[Job], func, args, kwargs) -> None:
+        name = getattr(func, "__name__", repr(func))
+        attempt = 0
+        delay = 1.0
+        while True:
+            attempt += 1
+            try:
+                task = asyncio.create_task(func(*args, **kwargs), context=batch[0].ctx)
+                await asyncio.wait_for(task, timeout=self.timeout)
+                self.completed += len(batch)
+                return
+            except asyncio.TimeoutError:
+                logger.warning(f"Task timed out (attempt {attempt}): {name}")
+                retryable = False
+            except RETRYABLE_ERRORS as e:
+                logger.warning(f"Task failed, MySQL unavailable (attempt {attempt}): {name}: {e}")
+                retryable = True
+            except Exception as e:
+                logger.warning(f"Task failed (attempt {attempt}): {e}")
+                retryable = False
+
+            if not retryable and attempt >= self.max_retries:
+                self.failures += len(batch)
+                logger.error(f"Task permanently failed after {attempt} attempts: {name}")
+                return
+            self.retries += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX_DELAY)
+
+    def _acknowledge(self, batch: list[Job]) -> None:
+        if self.journal is not None:
+            try:
+                for job in batch:
+                    if job.journaled:
+                        self.journal.append_done(job.seq)
+                if self.depth == 0 and self.journal.size:
+                    self.journal.truncate()
+            except OSError as e:
+                logger.error(f"❌ DB queue journal write failed: {e}")
+        if self.depth == 0:
+            self._idle.set()
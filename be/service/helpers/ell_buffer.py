@@ -1,6 +1,8 @@
 # service/helpers/ell_buffer.py
 from typing import Optional, Sequence
 
+from service.state import global_state
+
 ELL_STATIONS = (3, 9)  # RMI01 = 3, ELL01 = 9
 
 def mirror_ell_production(row: dict, connection) -> None:
@@ -11,14 +13,10 @@ def mirror_ell_production(row: dict, connection) -> None:
     with connection.cursor() as c:
         # If object_id is a string, resolve it to int via objects table
         if isinstance(row["object_id"], str):
-            c.execute(
-                "SELECT id FROM objects WHERE id_modulo = %s",
-                (row["object_id"],)
-            )
-            res = c.fetchone()
-            if not res:
+            object_id = global_state.reference_data.resolve_object_id(c, row["object_id"])
+            if object_id is None:
                 raise ValueError(f"Invalid id_modulo: {row['object_id']} not found in objects table")
-            row["object_id"] = res["id"]
+            row["object_id"] = object_id
 
         # Insert with upsert — cycle_time is now computed in MySQL, not passed
         c.execute(
@@ -77,3 +75,23 @@ def mirror_defects(rows: Sequence[dict], connection) -> None:
             payload,
         )
     connection.commit()
+
+
+def prune_ell_buffers(connection, shift_start) -> int:
+    """
+    Drop the buffer rows of shifts before ``shift_start``: the buffers only
+    ever hold the running shift. Returns the productions rows removed.
+    """
+    with connection.cursor() as c:
+        c.execute(
+            """DELETE FROM ell_defects_buffer
+               WHERE production_id IN (
+                   SELECT id FROM ell_productions_buffer WHERE start_time < %s
+               )
+            """,
+            (shift_start,),
+        )
+        c.execute("DELETE FROM ell_productions_buffer WHERE start_time < %s", (shift_start,))
+        removed = c.rowcount
+    connection.commit()
+    return removed
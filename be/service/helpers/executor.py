@@ -1,7 +1,10 @@
 import asyncio
+import contextvars
 from service.state import global_state
 
 async def run_in_thread(func, *args, **kwargs):
     loop = asyncio.get_running_loop()
     executor = global_state.executor
-    return await loop.run_in_executor(executor, lambda: func(*args, **kwargs))
+    # Carry context variables (e.g. the current cycle trace) into the worker thread
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(executor, lambda: ctx.run(func, *args, **kwargs))
@@ -7,17 +7,33 @@ from openpyxl import Workbook
 from openpyxl.styles import Alignment
 from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.styles import Alignment, Font, PatternFill
-from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell import Cell, WriteOnlyCell
+from openpyxl.packaging.relationship import RelationshipList
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.numbers import BUILTIN_FORMATS_MAX_SIZE
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
+import numpy as np
 import pandas as pd
-from collections import defaultdict
-from typing import Dict, Any, List
-
+from pandas.api.types import infer_dtype, is_datetime64_any_dtype
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import cached_property
+from typing import Dict, Any, Iterable, List
+
+import logging
+import multiprocessing
 import os
+import re
+import shutil
 import sys
+import tempfile
+import zipfile
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from service.routes.mbj_routes import get_mbj_details
 
+logger = logging.getLogger(__name__)
+
 EXPORT_DIR = "./exports"
 os.makedirs(EXPORT_DIR, exist_ok=True)
 
@@ -51,6 +67,172 @@ MBJ_FIELD_PREFIXES = {
 }
 
 
+# Columns every production row starts with, in the Risolutivo and NG sheets
+HEAD_COLUMNS = [
+    "Line", "Eq - PMS", "Stringatrice", "Module Id",
+    "Checkin - PMS", "Checkout - PMS", "Esito", "Tempo Ciclo",
+]
+
+
+def parse_cycle_seconds(cycle_time) -> Optional[float]:
+    """'H:MM:SS' (or a timedelta) as seconds, None when missing or unreadable."""
+    if not cycle_time:
+        return None
+    try:
+        h, m, s = map(float, str(cycle_time).split(":"))
+        return h * 3600 + m * 60 + s
+    except Exception:
+        return None
+
+
+class ExportDataset:
+    """
+    The fetched export data indexed once for all the sheets of an export.
+
+    Rows are the productions with a module, in export order; their
+    HEAD_COLUMNS values are kept column by column (``columns``). Defects are
+    grouped once by production, by (production, category) and by category,
+    and the QG ones (found at a "qc" station) by (category, module), so a
+    sheet looks them up instead of rescanning ``object_defects`` per row.
+    The NG sheets join the same data as DataFrames (``frame``,
+    ``defect_frame``) instead.
+    """
+
+    def __init__(self, data: dict):
+        productions = data.get("productions", [])
+        min_cycle_threshold = data.get("min_cycle_threshold", 3.0)
+
+        self.objects_by_id = {o["id"]: o for o in data.get("objects", [])}
+        self.stations_by_id = {s["id"]: s for s in data.get("stations", [])}
+        self.lines_by_id = {l["id"]: l for l in data.get("production_lines", [])}
+        self.productions_by_id = {p["id"]: p for p in productions}
+        self._object_defects = data.get("object_defects", [])
+
+        self.productions: List[dict] = []
+        self.station_types: List[Optional[str]] = []
+        self.columns: Dict[str, list] = {col: [] for col in HEAD_COLUMNS}
+
+        for prod in productions:
+            obj = self.objects_by_id.get(prod.get("object_id"))
+            id_modulo = obj.get("id_modulo") if obj else None
+            if not id_modulo:
+                continue
+
+            station = self.stations_by_id.get(prod.get("station_id"))
+            if station:
+                line_name = self.lines_by_id.get(station.get("line_id"), {}).get("display_name", "Unknown")
+                line_name = line_name.removeprefix("Linea ")
+            else:
+                line_name = "Unknown"
+            station_name = station.get("name", "Unknown") if station else "Unknown"
+
+            last_station_id = prod.get("last_station_id")
+            last_station_name = (
+                self.stations_by_id.get(last_station_id, {}).get("name", "N/A")
+                if last_station_id
+                else "N/A"
+            )
+
+            cycle_time = prod.get("cycle_time")
+            esito = map_esito(prod.get("esito"), prod.get("station_id"),
+                              parse_cycle_seconds(cycle_time), min_cycle_threshold)
+
+            self.productions.append(prod)
+            self.station_types.append(station.get("type") if station else None)
+            head = (
+                line_name,
+                f"{station_name}{line_name}",
+                f"{last_station_name}{line_name}",
+                id_modulo,
+                prod.get("start_time"),
+                prod.get("end_time"),
+                esito,
+                str(cycle_time or ""),
+            )
+            for col, value in zip(HEAD_COLUMNS, head):
+                self.columns[col].append(value)
+
+        self.defects_by_production: Dict[Any, List[dict]] = defaultdict(list)
+        self.defects_by_category: Dict[Any, List[dict]] = defaultdict(list)
+        self._by_production_category: Dict[tuple, List[dict]] = defaultdict(list)
+        self._qg_by_category_module: Dict[tuple, List[dict]] = defaultdict(list)
+
+        for d in self._object_defects:
+            prod_id = d.get("production_id")
+            category = d.get("category")
+            self.defects_by_production[prod_id].append(d)
+            self.defects_by_category[category].append(d)
+            self._by_production_category[(prod_id, category)].append(d)
+
+            prod = self.productions_by_id.get(prod_id) if prod_id else None
+            if not prod or self.stations_by_id.get(prod.get("station_id"), {}).get("type") != "qc":
+                continue
+            obj = self.objects_by_id.get(prod.get("object_id"))
+            if obj:
+                self._qg_by_category_module[(category, obj["id_modulo"])].append(d)
+
+    def __len__(self) -> int:
+        return len(self.productions)
+
+    @cached_property
+    def frame(self) -> pd.DataFrame:
+        """The rows as a DataFrame: HEAD_COLUMNS, production_id and rework."""
+        frame = pd.DataFrame(self.columns, columns=HEAD_COLUMNS)
+        frame["production_id"] = pd.Series([p.get("id") for p in self.productions], dtype=object)
+        frame["rework"] = pd.Series(self.station_types, dtype=object).eq("rework")
+        return frame
+
+    @cached_property
+    def defect_frame(self) -> pd.DataFrame:
+        """
+        object_defects as an object DataFrame, values as fetched (missing ones
+        None), with ``seq`` (position in object_defects), ``row`` (row of its
+        production, NaN when not exported) and ``qg_module`` (module of its
+        production when found at a QG station, None otherwise).
+        """
+        defects = pd.DataFrame(self._object_defects, dtype=object)
+        for col in ("production_id", "category", "defect_type", "stringa",
+                    "ribbon_lato", "i_ribbon", "s_ribbon", "extra_data"):
+            if col not in defects:
+                defects[col] = None
+        defects = defects.where(defects.notna(), None).reset_index(names="seq")
+
+        row_of_production = {p.get("id"): i for i, p in enumerate(self.productions)}
+        qg_module = {}
+        for prod_id, prod in self.productions_by_id.items():
+            if not prod_id or self.stations_by_id.get(prod.get("station_id"), {}).get("type") != "qc":
+                continue
+            obj = self.objects_by_id.get(prod.get("object_id"))
+            if obj:
+                qg_module[prod_id] = obj["id_modulo"]
+
+        defects["row"] = defects["production_id"].map(row_of_production)
+        qg = defects["production_id"].map(qg_module)
+        defects["qg_module"] = qg.astype(object).where(qg.notna(), None)
+        return defects
+
+    def row(self, i: int) -> Dict[str, Any]:
+        """HEAD_COLUMNS of row ``i`` as a fresh dict, for the sheet to add its own columns to."""
+        return {col: self.columns[col][i] for col in HEAD_COLUMNS}
+
+    def is_rework(self, i: int) -> bool:
+        return self.station_types[i] == "rework"
+
+    def defects(self, production_id, category: str) -> List[dict]:
+        """Defects of ``category`` recorded on one production."""
+        return self._by_production_category.get((production_id, category), [])
+
+    def qg_defects(self, category: str, id_modulo) -> List[dict]:
+        """Defects of ``category`` found at a QG station on the module."""
+        return self._qg_by_category_module.get((category, id_modulo), [])
+
+
+def export_dataset(data: dict) -> ExportDataset:
+    """The dataset export_full_excel built for this export, or a new one for a sheet built on its own."""
+    dataset = data.get("dataset")
+    return dataset if isinstance(dataset, ExportDataset) else ExportDataset(data)
+
+
 def clean_old_exports(max_age_hours: int = 2):
     now = time.time()
     for filename in os.listdir(EXPORT_DIR):
@@ -60,11 +242,15 @@ def clean_old_exports(max_age_hours: int = 2):
             if age > max_age_hours * 3600:
                 os.remove(path)
 
-def export_full_excel(data: dict, progress_callback=None) -> str:
+def export_full_excel(data: dict, progress_callback=None, workers: int = 1) -> str:
     """
     Generate the Excel file and stream progress updates.
     Handles row-level errors inside sheets (via _append_dataframe).
     Always sends "done" to stop frontend shimmer.
+
+    With ``workers`` > 1 every sheet but Metadata is rendered in one of that many
+    worker processes, each to its own sheet XML part, and the workbook is
+    assembled from the parts in SHEET_NAMES order (see _render_in_workers).
     """
     filename = f"Esportazione_PMS_{datetime.now().strftime('%d-%m-%Y.%H-%M')}.xlsx"
     filepath = os.path.join(EXPORT_DIR, filename)
@@ -81,53 +267,386 @@ def export_full_excel(data: dict, progress_callback=None) -> str:
             "callback": progress_callback,
             "current": 0,
             "total": total_modules,
-            "seen": set(),
             "sheet": None,
         }
 
+        # Indexed once here, read by every sheet
+        data = {**data, "dataset": ExportDataset(data)}
+
         if progress_callback:
             progress_callback("start_sheets", 0, total_modules)
 
-        for sheet_name in SHEET_NAMES:
-            func = SHEET_FUNCTIONS.get(sheet_name)
-            if not func:
-                continue
+        sheet_names = [name for name in SHEET_NAMES if name in SHEET_FUNCTIONS]
 
-            progress_state["sheet"] = sheet_name
-            progress_state["last_key"] = None
+        with tempfile.TemporaryDirectory(prefix="export_") as workdir:
+            parts = {}
+            if workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+                parts = _render_in_workers(
+                    [name for name in sheet_names if name != "Metadata"],
+                    data, workers, workdir, progress_callback,
+                )
 
-            ws = wb.create_sheet(title=sheet_name)
+            # Parts first: their styles then mostly keep the worker's indexes
+            for sheet_name in sheet_names:
+                if sheet_name in parts:
+                    _add_sheet_part(wb, sheet_name, *parts[sheet_name])
 
-            try:
-                # Each sheet function calls _append_dataframe internally,
-                # which now skips bad rows instead of crashing the sheet.
-                result = func(ws, data, progress=progress_state)
-            except Exception as e:
-                # Log but don't kill the whole export
-                import traceback
-                traceback.print_exc()
-                # Write a red placeholder row so sheet isn't empty
-                from openpyxl.cell import WriteOnlyCell
-                from openpyxl.styles import Font, PatternFill
-
-                placeholder = WriteOnlyCell(ws, value=f"Sheet failed: {sheet_name}")
-                placeholder.font = Font(color="FF0000", bold=True)
-                placeholder.fill = PatternFill(start_color="FFFFAAAA", end_color="FFFFAAAA", fill_type="solid")
-                ws.append([placeholder])
-                result = True  # Keep sheet
+            for index, sheet_name in enumerate(sheet_names):
+                if sheet_name in parts:
+                    continue
+
+                progress_state["sheet"] = sheet_name
+                progress_state["last_key"] = None
+
+                ws = wb.create_sheet(title=sheet_name, index=index)
+                _render_sheet(ws, sheet_name, data, progress_state)
+
+                if progress_callback:
+                    progress_callback(f"finished:{sheet_name}",
+                                      progress_state["current"],
+                                      progress_state["total"])
 
             if progress_callback:
-                progress_callback(f"finished:{sheet_name}",
-                                  progress_state["current"],
-                                  progress_state["total"])
+                progress_callback("saving", progress_state["current"], progress_state["total"])
+
+            wb.save(filepath)
 
         if progress_callback:
-            progress_callback("saving", progress_state["current"], progress_state["total"])
+            progress_callback("done", progress_state["total"], progress_state["total"])
 
-        wb.save(filepath)
+        return filename
 
+    except Exception:
+        # Ensure frontend shimmer stops even if export fails completely
         if progress_callback:
-            progress_callback("done", progress_state["total"], progress_state["total"])
+            progress_callback("error", 0, 1)
+            progress_callback("done", 1, 1)
+        raise
+
+def _render_sheet(ws, sheet_name: str, data: dict, progress_state: dict):
+    """Write one sheet; a failing sheet gets a red placeholder row instead of killing the export."""
+    try:
+        # Each sheet function calls _append_dataframe internally,
+        # which now skips bad rows instead of crashing the sheet.
+        SHEET_FUNCTIONS[sheet_name](ws, data, progress=progress_state)
+    except Exception:
+        # Log but don't kill the whole export
+        import traceback
+        traceback.print_exc()
+        # Write a red placeholder row so sheet isn't empty
+        placeholder = WriteOnlyCell(ws, value=f"Sheet failed: {sheet_name}")
+        placeholder.font = Font(color="FF0000", bold=True)
+        placeholder.fill = PatternFill(start_color="FFFFAAAA", end_color="FFFFAAAA", fill_type="solid")
+        ws.append([placeholder])
+
+# ---------------------------------------------------------------------------
+# Sheets rendered in worker processes ------------------------------------------
+# ---------------------------------------------------------------------------
+
+# Set in each worker process by _init_sheet_worker
+_worker_state: Dict[str, Any] = {}
+
+# Style index of a cell in the sheet XML written by openpyxl
+_CELL_STYLE = re.compile(rb'(<c r="[A-Z]+[0-9]+") s="([0-9]+)"')
+
+
+def _render_in_workers(sheet_names: List[str], data: dict, workers: int, workdir: str,
+                       progress_callback=None) -> Dict[str, tuple]:
+    """
+    Render ``sheet_names`` in a pool of forked worker processes, each sheet
+    to its own XML part in ``workdir``; returns {sheet: (path, styles)} for
+    _add_sheet_part. The workers inherit ``data`` (and its already built
+    dataset frames) from the fork, nothing is pickled but the results.
+    Their progress events come back through a queue and are passed on to
+    ``progress_callback`` here. A sheet whose worker broke is left out, so
+    the caller renders it itself. A worker that hangs on a lock copied in a
+    held state by the fork is not detected: hence [export] SHEET_WORKERS
+    defaults to 1.
+    """
+    dataset = data["dataset"]
+    dataset.frame, dataset.defect_frame    # built once, before the fork
+
+    ctx = multiprocessing.get_context("fork")
+    events = ctx.SimpleQueue()
+    parts = {}
+
+    def relay():
+        while not events.empty():
+            stage, current, total = events.get()
+            if progress_callback:
+                progress_callback(stage, current, total)
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(sheet_names)),
+        mp_context=ctx,
+        initializer=_init_sheet_worker,
+        initargs=(data, events),
+    ) as pool:
+        pending = {
+            pool.submit(_sheet_worker, sheet_name, os.path.join(workdir, f"sheet{i}.xml")): sheet_name
+            for i, sheet_name in enumerate(sheet_names)
+        }
+        while pending:
+            done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            relay()
+            for future in done:
+                sheet_name = pending.pop(future)
+                try:
+                    parts[sheet_name], current, total = future.result()
+                except Exception as e:
+                    logger.warning(f"Sheet {sheet_name} not rendered by a worker, rendering it here: {e!r}")
+                    continue
+                if progress_callback:
+                    progress_callback(f"finished:{sheet_name}", current, total)
+    relay()
+    return parts
+
+
+def _init_sheet_worker(data: dict, events):
+    _worker_state["data"] = data
+    _worker_state["events"] = events
+
+
+def _sheet_worker(sheet_name: str, path: str):
+    """Render one sheet in a workbook of its own and move its XML part to ``path``."""
+    events = _worker_state["events"]
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_name)
+    progress_state = {
+        "callback": lambda stage, current, total: events.put((stage, current, total)),
+        "current": 0,
+        "total": 1,
+        "sheet": sheet_name,
+        "last_key": None,
+    }
+    _render_sheet(ws, sheet_name, _worker_state["data"], progress_state)
+    ws.close()
+    shutil.move(ws._writer.out, path)
+
+    styles = (list(wb._cell_styles), wb._fonts, wb._fills, wb._borders,
+              wb._alignments, wb._protections, wb._number_formats)
+    return (path, styles), progress_state["current"], progress_state["total"]
+
+
+class _SheetPart:
+    """Stands in for the writer of a sheet whose XML a worker already wrote."""
+
+    def __init__(self, path: str):
+        self.out = path
+        self._rels = RelationshipList()
+
+    def cleanup(self):
+        os.remove(self.out)
+
+
+class _RenderedSheet(WriteOnlyWorksheet):
+    """A write-only sheet saved from the XML part a worker rendered."""
+
+    def __init__(self, parent, title: str, path: str):
+        super().__init__(parent, title)
+        self._writer = _SheetPart(path)
+
+    @property
+    def closed(self):
+        return True
+
+
+def _add_sheet_part(wb, sheet_name: str, path: str, styles: tuple):
+    """
+    Append the sheet a worker rendered to ``wb``. Its cells point into the
+    worker's style tables: the styles are added to ``wb`` and, when their
+    indexes differ there, the part is rewritten with the ones of ``wb``.
+    """
+    cell_styles, fonts, fills, borders, alignments, protections, number_formats = styles
+    mapping = {}
+    for idx, worker_style in enumerate(cell_styles):
+        style = StyleArray(worker_style)
+        style.fontId = wb._fonts.add(fonts[style.fontId])
+        style.fillId = wb._fills.add(fills[style.fillId])
+        style.borderId = wb._borders.add(borders[style.borderId])
+        style.alignmentId = wb._alignments.add(alignments[style.alignmentId])
+        style.protectionId = wb._protections.add(protections[style.protectionId])
+        if style.numFmtId >= BUILTIN_FORMATS_MAX_SIZE:
+            fmt = number_formats[style.numFmtId - BUILTIN_FORMATS_MAX_SIZE]
+            style.numFmtId = wb._number_formats.add(fmt) + BUILTIN_FORMATS_MAX_SIZE
+        mapping[idx] = wb._cell_styles.add(style)
+
+    if any(idx != new_idx for idx, new_idx in mapping.items()):
+        restyled = path + ".restyled"
+        with open(path, "rb") as src, open(restyled, "wb") as dst:
+            tail = b""
+            # Blocks cut after a tag, so no cell tag is split between two
+            while block := src.read(1 << 22):
+                block = tail + block
+                cut = block.rfind(b">") + 1
+                block, tail = block[:cut], block[cut:]
+                dst.write(_CELL_STYLE.sub(lambda m: b'%s s="%d"' % (m[1], mapping[int(m[2])]), block))
+            dst.write(tail)
+        os.replace(restyled, path)
+
+    wb._add_sheet(_RenderedSheet(wb, sheet_name, path))
+
+# ---------------------------------------------------------------------------
+# Export formats ----------------------------------------------------------------
+# ---------------------------------------------------------------------------
+
+class _OpenpyxlBook:
+    """The styled workbook, written by openpyxl (the default format)."""
+
+    extension = "xlsx"
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.wb = Workbook(write_only=True)
+
+    def sheet(self, name: str) -> "SheetWriter":
+        return SheetWriter(self.wb.create_sheet(title=name))
+
+    def save(self):
+        self.wb.save(self.filepath)
+
+
+class _XlsxWriterBook:
+    """The same styled workbook, written by xlsxwriter in constant-memory mode."""
+
+    extension = "xlsx"
+
+    def __init__(self, filepath: str):
+        import xlsxwriter
+
+        self.wb = xlsxwriter.Workbook(filepath, {
+            "constant_memory": True,
+            # Cell text as it is, as openpyxl writes it
+            "strings_to_numbers": False,
+            "strings_to_formulas": False,
+            "strings_to_urls": False,
+        })
+
+    def sheet(self, name: str) -> "SheetWriter":
+        return XlsxWriterSheet(self.wb, self.wb.add_worksheet(name))
+
+    def save(self):
+        self.wb.close()
+
+
+class _TableBundle:
+    """One file per sheet (``table_format``), zipped together."""
+
+    extension = None
+    table_format = None
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.tmp = tempfile.TemporaryDirectory(prefix="export_")
+        self.writers: List["TableSheetWriter"] = []
+
+    def sheet(self, name: str) -> "SheetWriter":
+        writer = TableSheetWriter(os.path.join(self.tmp.name, f"{name}.{self.table_format}"), self.table_format)
+        self.writers.append(writer)
+        return writer
+
+    def save(self):
+        # Parquet files are compressed already
+        compression = zipfile.ZIP_DEFLATED if self.table_format == "csv" else zipfile.ZIP_STORED
+        with zipfile.ZipFile(self.filepath, "w", compression=compression) as bundle:
+            for writer in self.writers:
+                writer.close()
+                for path in (writer.path, f"{writer.path}.error.txt"):
+                    if os.path.exists(path):
+                        bundle.write(path, os.path.basename(path))
+        self.tmp.cleanup()
+
+
+class _CsvBundle(_TableBundle):
+    extension = "csv.zip"
+    table_format = "csv"
+
+
+class _ParquetBundle(_TableBundle):
+    extension = "parquet.zip"
+    table_format = "parquet"
+
+
+# format -> book the export is written to
+EXPORT_FORMATS = {
+    "xlsx": _OpenpyxlBook,
+    "xlsx-fast": _XlsxWriterBook,
+    "csv": _CsvBundle,
+    "parquet": _ParquetBundle,
+}
+
+
+def export_streaming(chunks: Iterable[dict], meta: dict, progress_callback=None, export_format: str = "xlsx") -> str:
+    """
+    Generate the export from ``chunks`` of export data, each holding whole
+    modules: objects, their productions (ordered by object) and
+    object_defects. Every chunk is indexed, appended to all the sheets and
+    dropped, so memory is bounded by the chunk size, not by the export.
+
+    ``meta`` carries what the sheets need upfront: stations,
+    production_lines, filters, min_cycle_threshold, altro_descriptions (the
+    NG Altro columns) and module_total (for progress). The Metadata sheet is
+    written last, from the counts gathered along the way.
+
+    ``export_format`` picks the book from EXPORT_FORMATS: the styled
+    workbook by openpyxl ("xlsx") or xlsxwriter ("xlsx-fast"), or a zip of
+    one CSV / Parquet file per sheet ("csv", "parquet").
+    """
+    book_class = EXPORT_FORMATS[export_format]
+    filename = f"Esportazione_PMS_{datetime.now().strftime('%d-%m-%Y.%H-%M')}.{book_class.extension}"
+    filepath = os.path.join(EXPORT_DIR, filename)
+
+    try:
+        total_modules = meta.get("module_total") or 1
+        min_cycle_threshold = meta.get("min_cycle_threshold", 3.0)
+
+        if progress_callback:
+            progress_callback("init", 0, total_modules)
+
+        book = book_class(filepath)
+        writers = {
+            sheet_name: book.sheet(sheet_name)
+            for sheet_name in SHEET_NAMES
+            if sheet_name in SHEET_FUNCTIONS
+        }
+        summary = {"module_count": 0, "production_count": 0, "esito_counts": Counter()}
+
+        if progress_callback:
+            progress_callback("start_sheets", 0, total_modules)
+
+        for chunk in chunks:
+            data = {**meta, **chunk}
+            data["dataset"] = ExportDataset(data)
+
+            productions = chunk.get("productions", [])
+            summary["module_count"] += len(chunk.get("objects", []))
+            summary["production_count"] += len(productions)
+            summary["esito_counts"].update(esito_counts(productions, min_cycle_threshold))
+
+            for sheet_name, writer in writers.items():
+                if sheet_name == "Metadata" or writer.failed:
+                    continue
+                try:
+                    SHEET_FUNCTIONS[sheet_name](writer, data)
+                except Exception:
+                    # Flag the sheet once and leave it out of the next chunks
+                    import traceback
+                    traceback.print_exc()
+                    writer.failed = True
+                    writer._mark_row_as_removed(f"Sheet failed: {sheet_name}")
+
+            if progress_callback:
+                progress_callback("excel", min(summary["module_count"], total_modules), total_modules)
+
+        metadata_sheet(writers["Metadata"], {**meta, **summary})
+
+        if progress_callback:
+            progress_callback("saving", total_modules, total_modules)
+
+        book.save()
+
+        if progress_callback:
+            progress_callback("done", total_modules, total_modules)
 
         return filename
 
@@ -164,6 +683,13 @@ def autofit_columns(ws, align_center_for: Optional[Set[str]] = None):
 
         ws.column_dimensions[col_letter].width = max_len + 2
 
+def esito_counts(productions: List[dict], min_cycle_threshold: float = 3.0) -> Counter:
+    """Productions per mapped Esito, as reported in the Metadata sheet."""
+    return Counter(
+        map_esito(p.get("esito"), p.get("station_id"), parse_cycle_seconds(p.get("cycle_time")), min_cycle_threshold)
+        for p in productions
+    )
+
 def metadata_sheet(ws, data: dict, progress=None):
     from datetime import datetime
 
@@ -177,41 +703,15 @@ def metadata_sheet(ws, data: dict, progress=None):
     lines.append(["📝 METADATI ESPORTAZIONE"])
     lines.append([])
     lines.append(["Data e ora esportazione:", current_time])
-    lines.append(["Numero totale moduli esportati:", len(id_moduli)])
-    lines.append(["Numero totale eventi esportati:", len(productions)])
+    lines.append(["Numero totale moduli esportati:", data.get("module_count", len(id_moduli))])
+    lines.append(["Numero totale eventi esportati:", data.get("production_count", len(productions))])
 
     # Stats
-    good = no_good = ok_op = not_checked = escluso = in_production = 0
-
-    for p in productions:
-        cycle_time_obj = p.get("cycle_time")
-        cycle_seconds = None
-        if cycle_time_obj:
-            try:
-                h, m, s = map(float, str(cycle_time_obj).split(":"))
-                cycle_seconds = h * 3600 + m * 60 + s
-            except:
-                pass
-
-        mapped_esito = map_esito(
-            p.get("esito"),
-            p.get("station_id"),
-            cycle_seconds,
-            min_cycle_threshold
-        )
-
-        if mapped_esito == "G":
-            good += 1
-        elif mapped_esito == "NG":
-            no_good += 1
-        elif mapped_esito == "G Operatore":
-            ok_op += 1
-        elif mapped_esito == "NC":
-            not_checked += 1
-        elif mapped_esito == "Escluso":
-            escluso += 1
-        elif mapped_esito == "In Produzione":
-            in_production += 1
+    counts = data.get("esito_counts")
+    if counts is None:
+        counts = esito_counts(productions, min_cycle_threshold)
+    good, no_good, ok_op = counts["G"], counts["NG"], counts["G Operatore"]
+    not_checked, escluso, in_production = counts["NC"], counts["Escluso"], counts["In Produzione"]
 
     lines.extend([
         ["Good:", good],
@@ -236,26 +736,8 @@ def metadata_sheet(ws, data: dict, progress=None):
 
     lines.append([])
 
-    # Now write to worksheet with formatting
-    left_align = Alignment(horizontal="left", vertical="center")
-
-    col_widths = defaultdict(int)
-
-    for row in lines:
-        excel_row = []
-        for idx, value in enumerate(row):
-            cell = WriteOnlyCell(ws, value=value)
-            cell.alignment = left_align
-            excel_row.append(cell)
-
-            length = len(str(value)) if value else 0
-            col_letter = get_column_letter(idx + 1)
-            col_widths[col_letter] = max(col_widths[col_letter], length)
-        ws.append(excel_row)
-
-    # Set column widths
-    for col_letter, width in col_widths.items():
-        ws.column_dimensions[col_letter].width = width + 4
+    writer = ws if isinstance(ws, SheetWriter) else SheetWriter(ws)
+    writer.write_lines(lines)
 
 # ---------------------------------------------------------------------------
 # Helper utilities -----------------------------------------------------------
@@ -268,135 +750,341 @@ FILL_QG = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid
 
 # Excel helpers --------------------------------------------------------------
 
-def _append_dataframe(
-    ws,
-    df: pd.DataFrame,
-    zebra_key: str = "Module Id",
-    progress: dict | None = None,
-    align_center_for: Optional[Set[str]] = None,
-    grey_cells: Optional[Set[tuple[int, str]]] = None,
-    update_every: int = 200,  # report progress every 200 rows
-):
+# Characters XML (and so openpyxl) refuses: controls other than \t \n \r
+_ILLEGAL_XML_CHARS = r"[\x00-\x08\x0b\x0c\x0e-\x1f]"
+DATE_COLUMNS = {"Checkin - PMS", "Checkout - PMS"}
+DATE_FORMAT = "%d.%m.%y %H:%M:%S"
+
+
+def _cell_values(df: pd.DataFrame) -> np.ndarray:
     """
-    Write a DataFrame to Excel with zebra striping and progress updates.
-    Handles IllegalCharacterError by skipping bad rows instead of failing.
+    ``df`` as written to Excel, as a 2-D object array: dates formatted,
+    illegal XML characters stripped from the strings (one regex pass over
+    all the cells), missing values as "".
     """
-    if align_center_for is None:
-        align_center_for = set()
+    frame = df.copy(deep=False)
+    for pos, col in enumerate(df.columns):
+        if col in DATE_COLUMNS and is_datetime64_any_dtype(df.iloc[:, pos]):
+            frame.isetitem(pos, df.iloc[:, pos].dt.strftime(DATE_FORMAT))
+
+    values = frame.to_numpy(dtype=object)
+    cells = pd.Series(values.ravel(), dtype=object)
+    if infer_dtype(cells, skipna=True) in ("string", "mixed", "mixed-integer"):
+        cleaned = cells.str.replace(_ILLEGAL_XML_CHARS, "", regex=True)
+        cells = cleaned.where(cleaned.notna(), cells)
+    return cells.where(cells.notna(), "").to_numpy().reshape(values.shape)
 
-    def sanitize_value(val):
-        """Remove illegal XML characters from strings for Excel safety."""
-        if val is None:
-            return ""
-        if isinstance(val, str):
-            return ''.join(c for c in val if ord(c) >= 32 or c in ("\n", "\r", "\t"))
-        return val
 
-    def mark_row_as_removed(reason="ROW REMOVED: invalid characters"):
+class SheetWriter:
+    """
+    Rows of one write-only sheet, appended in one or more DataFrames.
+
+    The header goes out with the first DataFrame and the column widths are
+    sized on it (a write-only sheet takes them before its first row); the
+    zebra band, row numbers and grey cells carry over between appends, so a
+    streamed export writes the same sheet as a one-shot one.
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.rows = 0            # data rows written so far
+        self.last_key = None
+        self.blue = False
+        self.failed = False      # set by the streaming export when the sheet broke
+        self._styles = None
+
+    def _row_style(self, columns, fill, align_center_for):
+        styles = []
+        for col in columns:
+            template = WriteOnlyCell(self.ws)
+            template.fill = fill
+            template.alignment = Alignment(horizontal="center" if col in align_center_for else "left",
+                                           vertical="center")
+            styles.append(template._style)
+        return styles
+
+    @staticmethod
+    def _column_widths(columns, values) -> List[int]:
+        """Auto-fit widths: the longest of the header and the values, plus 2."""
+        return [
+            max(len(str(col)), int(pd.Series(values[:, pos]).astype(str).str.len().max()) if len(values) else 0) + 2
+            for pos, col in enumerate(columns)
+        ]
+
+    def _start(self, columns, values, align_center_for):
+        for pos, width in enumerate(self._column_widths(columns, values)):
+            self.ws.column_dimensions[get_column_letter(pos + 1)].width = width
+        self._styles = tuple(self._row_style(columns, fill, align_center_for)
+                             for fill in (FILL_WHITE, FILL_BLUE, FILL_QG))
+
+        # Header row
+        self.ws.append([WriteOnlyCell(self.ws, value=c) for c in columns])
+
+    def _mark_row_as_removed(self, reason="ROW REMOVED: invalid characters"):
         """Insert a placeholder row with a red background to flag skipped rows."""
-        placeholder = WriteOnlyCell(ws, value=reason)
+        placeholder = WriteOnlyCell(self.ws, value=reason)
         placeholder.font = Font(color="FF0000", bold=True)
         placeholder.fill = PatternFill(start_color="FFFFAAAA", end_color="FFFFAAAA", fill_type="solid")
-        ws.append([placeholder])
-
-    current_key = None
-    current_fill = FILL_WHITE
-    columns = list(df.columns)
-    max_lens = [len(str(c)) for c in columns]
-
-    # Header row
-    header_cells = [WriteOnlyCell(ws, value=c) for c in columns]
-    ws.append(header_cells)
-
-    zebra_idx = df.columns.get_loc(zebra_key) if zebra_key in df.columns else None
-    cb = progress.get("callback") if progress else None
-    current_sheet = progress.get("sheet") if progress else "unknown"
-    grey_lookup = set(grey_cells or set())
-
-    # Reset seen for progress tracking per sheet
-    if progress and zebra_idx is not None:
-        if progress.get("last_key") != current_sheet:
-            progress["current"] = 0
-            progress["seen"] = set()
-            progress["last_key"] = current_sheet
-        progress["total"] = df.iloc[:, zebra_idx].nunique() or len(df)
-
-    # Iterate rows with error handling
-    for row_idx, row_tuple in enumerate(df.itertuples(index=False, name=None), start=2):
-        try:
-            # Zebra striping logic
-            if zebra_idx is not None:
-                key_value = row_tuple[zebra_idx]
-                if key_value != current_key:
-                    current_fill = FILL_BLUE if current_fill == FILL_WHITE else FILL_WHITE
-                    current_key = key_value
-
-            # Build row cells with sanitization
-            row_cells = []
-            for idx, val in enumerate(row_tuple):
-                col = columns[idx]
-                if col in {"Checkin - PMS", "Checkout - PMS"} and val:
-                    try:
-                        val = val.strftime("%d.%m.%y %H:%M:%S")
-                    except Exception:
-                        pass
-                val = sanitize_value(val)
-                cell = WriteOnlyCell(ws, value=val)
-                cell.fill = FILL_QG if (row_idx, col) in grey_lookup else current_fill
-                cell.alignment = Alignment(horizontal="center" if col in align_center_for else "left",
-                                           vertical="center")
-                row_cells.append(cell)
-                max_lens[idx] = max(max_lens[idx], len(str(val)) if val is not None else 0)
+        self.ws.append([placeholder])
+
+    def _write_row(self, row_values: list, styles):
+        self.ws.append([
+            Cell(self.ws, row=1, column=1, value=val, style_array=style)
+            for val, style in zip(row_values, styles)
+        ])
+
+    def write_lines(self, lines: List[list]):
+        """Plain left-aligned rows (the Metadata sheet), columns sized on them."""
+        left_align = Alignment(horizontal="left", vertical="center")
+
+        col_widths = defaultdict(int)
+
+        for row in lines:
+            excel_row = []
+            for idx, value in enumerate(row):
+                cell = WriteOnlyCell(self.ws, value=value)
+                cell.alignment = left_align
+                excel_row.append(cell)
+
+                length = len(str(value)) if value else 0
+                col_letter = get_column_letter(idx + 1)
+                col_widths[col_letter] = max(col_widths[col_letter], length)
+            self.ws.append(excel_row)
+
+        # Set column widths
+        for col_letter, width in col_widths.items():
+            self.ws.column_dimensions[col_letter].width = width + 4
+
+    def append(
+        self,
+        df: pd.DataFrame,
+        zebra_key: str = "Module Id",
+        progress: dict | None = None,
+        align_center_for: Optional[Set[str]] = None,
+        grey_cells: Optional[Set[tuple[int, str]]] = None,
+        update_every: int = 200,
+    ):
+        """
+        Append ``df``; ``grey_cells`` are (row, column) with row 2 the first
+        row of ``df``, as if it were the whole sheet.
+        """
+        columns = list(df.columns)
+        values = _cell_values(df)
+        if self._styles is None:
+            self._start(columns, values, align_center_for or set())
+        white_style, blue_style, grey_style = self._styles
+
+        # Zebra striping: the band flips on every change of zebra_key
+        zebra_idx = df.columns.get_loc(zebra_key) if zebra_key in df.columns else None
+        if zebra_idx is not None and len(df):
+            keys = df.iloc[:, zebra_idx]
+            flips = keys.ne(keys.shift(fill_value=self.last_key)).cumsum().to_numpy()
+            blue = (flips % 2 == 1) ^ self.blue
+            self.last_key, self.blue = keys.iloc[-1], bool(blue[-1])
+        else:
+            blue = np.full(len(df), self.blue)
 
-            ws.append(row_cells)
+        col_pos = {col: pos for pos, col in enumerate(columns)}
+        grey_by_row: Dict[int, List[int]] = defaultdict(list)
+        for row_idx, col in grey_cells or ():
+            if col in col_pos:
+                grey_by_row[row_idx].append(col_pos[col])
 
-        except Exception:
-            # If row can't be written (illegal chars, openpyxl crash), flag it
-            mark_row_as_removed()
+        cb = progress.get("callback") if progress else None
+        current_sheet = progress.get("sheet") if progress else "unknown"
+        seen = None
 
-        # Progress update
+        # Reset progress per sheet; seen[i]: modules met up to row i
         if progress and zebra_idx is not None:
-            key_value = row_tuple[zebra_idx]
-            if key_value not in progress.get("seen", set()):
-                progress.setdefault("seen", set()).add(key_value)
-                progress["current"] += 1
-            if cb and row_idx % update_every == 0:
+            if progress.get("last_key") != current_sheet:
+                progress["current"] = 0
+                progress["last_key"] = current_sheet
+            progress["total"] = keys.nunique() or len(df)
+            seen = progress["current"] + (~keys.duplicated()).cumsum().to_numpy()
+
+        # Write rows with error handling
+        for row_idx, row_values in enumerate(values.tolist(), start=2):
+            styles = blue_style if blue[row_idx - 2] else white_style
+            if row_idx in grey_by_row:
+                styles = list(styles)
+                for pos in grey_by_row[row_idx]:
+                    styles[pos] = grey_style[pos]
+            try:
+                self._write_row(row_values, styles)
+            except Exception:
+                # If row can't be written (illegal chars, openpyxl crash), flag it
+                self._mark_row_as_removed()
+
+            # Progress update
+            if cb and seen is not None and row_idx % update_every == 0:
+                progress["current"] = int(seen[row_idx - 2])
                 cb(f"creating:{current_sheet}", progress["current"], progress["total"])
 
-    # Auto-fit column widths
-    for idx, width in enumerate(max_lens, start=1):
-        ws.column_dimensions[get_column_letter(idx)].width = width + 2
+        if seen is not None and len(seen):
+            progress["current"] = int(seen[-1])
+        self.rows += len(df)
+
+
+class XlsxWriterSheet(SheetWriter):
+    """
+    SheetWriter on an xlsxwriter worksheet (the "xlsx-fast" export format):
+    the same rows, zebra bands and grey QG cells as the openpyxl sheet,
+    written by xlsxwriter in constant-memory mode.
+    """
+
+    def __init__(self, workbook, ws):
+        super().__init__(ws)
+        self.workbook = workbook
+        self._row = 0            # next worksheet row, 0-based
+        self._formats = {}
+
+    def _format(self, **props):
+        key = tuple(sorted(props.items()))
+        if key not in self._formats:
+            self._formats[key] = self.workbook.add_format(props)
+        return self._formats[key]
+
+    def _start(self, columns, values, align_center_for):
+        for pos, width in enumerate(self._column_widths(columns, values)):
+            self.ws.set_column(pos, pos, width)
+        self._styles = tuple(
+            [
+                self._format(bg_color=f"#{fill.fgColor.rgb[-6:]}", pattern=1, valign="vcenter",
+                             align="center" if col in align_center_for else "left")
+                for col in columns
+            ]
+            for fill in (FILL_WHITE, FILL_BLUE, FILL_QG)
+        )
+
+        # Header row
+        self.ws.write_row(0, 0, columns)
+        self._row = 1
+
+    def _mark_row_as_removed(self, reason="ROW REMOVED: invalid characters"):
+        """Insert a placeholder row with a red background to flag skipped rows."""
+        placeholder = self._format(font_color="#FF0000", bold=True, bg_color="#FFAAAA", pattern=1)
+        self.ws.write_string(self._row, 0, reason, placeholder)
+        self._row += 1
+
+    def _write_row(self, row_values: list, styles):
+        row = self._row
+        for col, (value, style) in enumerate(zip(row_values, styles)):
+            if value == "":
+                self.ws.write_blank(row, col, None, style)
+            elif isinstance(value, str):
+                self.ws.write_string(row, col, value, style)
+            else:
+                self.ws.write(row, col, value, style)
+        self._row += 1
+
+    def write_lines(self, lines: List[list]):
+        left_align = self._format(align="left", valign="vcenter")
+        col_widths = defaultdict(int)
+        for row in lines:
+            for col, value in enumerate(row):
+                self.ws.write(self._row, col, value, left_align)
+                col_widths[col] = max(col_widths[col], len(str(value)) if value else 0)
+            self._row += 1
+        for col, width in col_widths.items():
+            self.ws.set_column(col, col, width + 4)
+
+
+class TableSheetWriter(SheetWriter):
+    """
+    SheetWriter for the CSV / Parquet bundles: each DataFrame is appended to
+    the sheet's file at ``path`` as it is (real dates and numbers, no zebra
+    bands or grey cells, which only mean something in the workbook).
+    """
+
+    def __init__(self, path: str, table_format: str):
+        super().__init__(None)
+        self.path = path
+        self.table_format = table_format
+        self._out = None         # open CSV file / ParquetWriter after the first append
+        self._schema = None
+
+    def append(self, df: pd.DataFrame, *args, **kwargs):
+        if self.table_format == "csv":
+            if self._out is None:
+                self._out = open(self.path, "w", encoding="utf-8", newline="")
+                df.to_csv(self._out, index=False)
+            else:
+                df.to_csv(self._out, index=False, header=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            df = _table_frame(df)
+            if self._out is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                # A column still empty in the first chunk holds the strings of the next ones
+                self._schema = pa.schema([
+                    field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                    for field in table.schema
+                ])
+                self._out = pq.ParquetWriter(self.path, self._schema)
+                table = table.cast(self._schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            self._out.write_table(table)
+        self.rows += len(df)
+
+    def _mark_row_as_removed(self, reason="ROW REMOVED: invalid characters"):
+        # Next to the sheet's file, which may be missing or cut short
+        with open(f"{self.path}.error.txt", "w", encoding="utf-8") as f:
+            f.write(reason + "\n")
+
+    def write_lines(self, lines: List[list]):
+        self.append(pd.DataFrame([(row + [None, None])[:2] for row in lines if row], columns=["Voce", "Valore"]))
+
+    def close(self):
+        if self._out is not None:
+            self._out.close()
+
+
+def _table_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """``df`` for Parquet: object columns mixing kinds of values (strings and numbers) become strings."""
+    frame = df.copy(deep=False)
+    for pos in range(frame.shape[1]):
+        column = frame.iloc[:, pos]
+        if column.dtype == object and infer_dtype(column, skipna=True) in ("mixed", "mixed-integer"):
+            frame.isetitem(pos, column.map(lambda v: v if v is None or v != v else str(v)))
+    return frame
+
+
+def _append_dataframe(
+    ws,
+    df: pd.DataFrame,
+    zebra_key: str = "Module Id",
+    progress: dict | None = None,
+    align_center_for: Optional[Set[str]] = None,
+    grey_cells: Optional[Set[tuple[int, str]]] = None,
+    update_every: int = 200,  # report progress every 200 rows
+):
+    """
+    Write a DataFrame to Excel with zebra striping and progress updates.
+    Values, zebra bands and column widths are computed on whole columns;
+    each row then only picks one of the precomputed style lists.
+    Handles IllegalCharacterError by skipping bad rows instead of failing.
+    ``ws`` may be a SheetWriter, to continue a sheet written in chunks.
+    """
+    writer = ws if isinstance(ws, SheetWriter) else SheetWriter(ws)
+    writer.append(df, zebra_key, progress, align_center_for, grey_cells, update_every)
 # ---------------------------------------------------------------------------
 # Sheet generators -----------------------------------------------------------
 # ---------------------------------------------------------------------------
 
 def risolutivo_sheet(ws: Worksheet, data: Dict[str, Any], progress=None):
-    objects = data.get("objects", [])
-    productions = data.get("productions", [])
-    stations = data.get("stations", [])
-    production_lines = data.get("production_lines", [])
-    object_defects = data.get("object_defects", [])
-    min_cycle_threshold: float = data.get("min_cycle_threshold", 3.0)
-
-    objects_by_id = {o["id"]: o for o in objects}
-    stations_by_id = {s["id"]: s for s in stations}
-    lines_by_id = {l["id"]: l for l in production_lines}
-
-    # Map defects by production_id
-    defects_by_production = {}
-    for d in object_defects:
-        pid = d.get("production_id")
-        if pid not in defects_by_production:
-            defects_by_production[pid] = []
-        defects_by_production[pid].append(d)
+    ds = export_dataset(data)
+    defects_by_production = ds.defects_by_production
 
     # Pre-sort QC productions by object for quick lookup
     qg_by_object: Dict[int, List[tuple]] = defaultdict(list)
-    for p in productions:
+    for p in data.get("productions", []):
         obj_id = p.get("object_id")
         if obj_id is None:
             continue
-        st = stations_by_id.get(p.get("station_id"))
+        st = ds.stations_by_id.get(p.get("station_id"))
         if st and st.get("type") == "qc":
             qg_by_object[obj_id].append((p.get("start_time"), p.get("id")))
     for lst in qg_by_object.values():
@@ -406,55 +1094,13 @@ def risolutivo_sheet(ws: Worksheet, data: Dict[str, Any], progress=None):
     # Initialize rework counter per (module_id, station_id)
     rework_counters = defaultdict(int)
 
-    for prod in productions:
-        obj = objects_by_id.get(prod.get("object_id"))
-        if not obj:
-            continue
-
-        id_modulo = obj.get("id_modulo")
-        if not id_modulo:
-            continue
-
+    for i, prod in enumerate(ds.productions):
         station_id = prod.get("station_id")
         if not station_id:
             continue
 
+        id_modulo = ds.columns["Module Id"][i]
         production_id = prod.get("id")
-        start_time = prod.get("start_time")
-        end_time = prod.get("end_time")
-        cycle_time_obj = prod.get("cycle_time")
-        cycle_time_str = str(cycle_time_obj or "")
-
-        cycle_seconds = None
-        if cycle_time_obj:
-            try:
-                h, m, s = map(float, str(cycle_time_obj).split(":"))
-                cycle_seconds = h * 3600 + m * 60 + s
-            except Exception:
-                pass
-
-        esito = map_esito(prod.get("esito"), prod.get("station_id"), cycle_seconds, min_cycle_threshold)
-
-        station = stations_by_id.get(prod.get("station_id"))
-
-        station_name = station.get("name", "Unknown") if station else "Unknown"
-
-        if station:
-            line_display_name = lines_by_id.get(station.get("line_id"), {}).get("display_name", "Unknown")
-            line_display_name = line_display_name.removeprefix("Linea ")
-        else:
-            line_display_name = "Unknown"
-
-        station_name = f"{station_name}{line_display_name}"
-
-
-        last_station_id = prod.get("last_station_id")
-        last_station_name = (
-            stations_by_id.get(last_station_id, {}).get("name", "N/A")
-            if last_station_id
-            else "N/A"
-        )
-        last_station_name = f"{last_station_name}{line_display_name}"
 
         # Compute current rework count
         pair = (id_modulo, station_id)
@@ -495,7 +1141,7 @@ def risolutivo_sheet(ws: Worksheet, data: Dict[str, Any], progress=None):
 
         # Only for Rework stations, get the NG from the latest QG before this
         ng_labels_qg = set()
-        if station and station.get("type") == "rework":
+        if ds.is_rework(i):
             obj_id = prod.get("object_id")
             prod_time = prod.get("start_time")
 
@@ -537,21 +1183,11 @@ def risolutivo_sheet(ws: Worksheet, data: Dict[str, Any], progress=None):
                         elif cat == "Altro":
                             ng_labels_qg.add("NG Altro")
 
-        rows.append(
-            {
-                "Line": line_display_name,
-                "Eq - PMS": station_name,
-                "Stringatrice": last_station_name,
-                "Module Id": id_modulo,
-                "Checkin - PMS": start_time,
-                "Checkout - PMS": end_time,
-                "Rework": current_rework,
-                "Esito": esito,
-                "Tempo Ciclo": cycle_time_str,
-                "NG Causale": ";".join(sorted(ng_labels)) if ng_labels else "",
-                "NG Causale (QG)": ";".join(sorted(ng_labels_qg)) if ng_labels_qg else "",
-            }
-        )
+        row = ds.row(i)
+        row["Rework"] = current_rework
+        row["NG Causale"] = ";".join(sorted(ng_labels)) if ng_labels else ""
+        row["NG Causale (QG)"] = ";".join(sorted(ng_labels_qg)) if ng_labels_qg else ""
+        rows.append(row)
 
     df = pd.DataFrame(
         rows,
@@ -936,1939 +1572,346 @@ def mbj_sheet(ws: Worksheet, data: Dict[str, Any], progress=None):
     df = pd.DataFrame(rows)
     _append_dataframe(ws, df, progress=progress, align_center_for={"Esito", "Tempo Ciclo"})
 
-def ng_generali_sheet(ws, data: dict, progress=None) -> bool:
-    """
-    Generate the 'NG Generali' sheet using pre-fetched data.
-    Both QG-originated and ReWork defects show "NG", but only QG-only cells get gray fill.
-    """
-    rows_written = 0
-    objects = data.get("objects", [])
-    productions = data.get("productions", [])
-    stations = data.get("stations", [])
-    production_lines = data.get("production_lines", [])
-    object_defects = data.get("object_defects", [])
-    min_cycle_threshold = data.get("min_cycle_threshold", 3.0)
-
-    # Build lookups
-    objects_by_id = {obj["id"]: obj for obj in objects}
-    stations_by_id = {s["id"]: s for s in stations}
-    lines_by_id = {l["id"]: l for l in production_lines}
-    productions_by_id = {p["id"]: p for p in productions}
-    station_type_by_prod = {
-        p["id"]: stations_by_id.get(p["station_id"], {}).get("type")
-        for p in productions
-    }
-
-    # 1) Group all QG‐found "Generali" defects by id_modulo
-    qg_gen_by_modulo = {}
-    for d in object_defects:
-        prod_id = d.get("production_id")
-        if not prod_id:
-            continue
-        # Only consider defects that happened in a QC station
-        if station_type_by_prod.get(prod_id) != "qc":
-            continue
-        if d.get("category") != "Generali":
-            continue
-
-        prod = productions_by_id.get(prod_id)
-        if not prod:
-            continue
-
-        obj = objects_by_id.get(prod.get("object_id"))
-        if not obj:
-            continue
+def _int_values(values: pd.Series, strict: bool = False) -> pd.Series:
+    """int() of every value as floats, NaN where it fails (``strict``: ints only, no parsing)."""
+    numbers = np.trunc(pd.to_numeric(values, errors="coerce"))
+    if strict:
+        numbers = numbers.where(values.map(lambda v: isinstance(v, int)))
+    return numbers
 
-        mod_id = obj["id_modulo"]
-        qg_gen_by_modulo.setdefault(mod_id, []).append(d)
 
-    # 2) Build the header
-    defect_columns = [
-        "Poe Scaduto", "No Good da Bussing", "Materiale Esterno su Celle", "Passthrough al Bussing",
-        "Poe in Eccesso", "Solo Poe", "Solo Vetro", "Matrice Incompleta",
-        "Molteplici Bus Bar", "Test"
-    ]
-    header = [
-        "Line", "Eq - PMS", "Stringatrice", "Module Id",
-        "Checkin - PMS", "Checkout - PMS", "Esito", "Tempo Ciclo"
-    ] + defect_columns
+def _stringa_slot(defects: pd.DataFrame, strict: bool = False, suffix="") -> pd.Series:
+    """'Stringa N' (+ ``suffix``) column of each defect, NaN outside 1-12."""
+    n = _int_values(defects["stringa"], strict=strict)
+    return ("Stringa " + n.astype("Int64").astype(str) + suffix).where(n.between(1, 12))
 
-    all_rows = []
-    grey_cells = []
 
-    for prod in productions:
-        object_id = prod.get("object_id")
-        obj = objects_by_id.get(object_id)
-        if not obj:
-            continue
-        id_modulo = obj.get("id_modulo")
-        if not id_modulo:
-            continue
+def _ribbon_slot(defects: pd.DataFrame, columns: List[str]) -> pd.Series:
+    """'Ribbon N <lato>' column of each defect, NaN when not among ``columns``."""
+    n = _int_values(defects["i_ribbon"])
+    name = "Ribbon " + n.astype("Int64").astype(str) + " " + defects["ribbon_lato"].astype(str)
+    return name.where(name.isin(columns))
 
-        production_id = prod.get("id")
-        start_time = prod.get("start_time")
-        end_time = prod.get("end_time")
-        cycle_time_obj = prod.get("cycle_time")
-        cycle_time_str = str(cycle_time_obj or "")
 
-        cycle_seconds = None
-        if cycle_time_obj:
-            try:
-                h, m, s = map(float, str(cycle_time_obj).split(":"))
-                cycle_seconds = h * 3600 + m * 60 + s
-            except Exception:
-                pass
+def _defect_matrix(
+    ds: ExportDataset,
+    category: str,
+    columns: List[str],
+    slot,
+    keep=None,
+    keep_qg=None,
+    text=None,
+    qg_rows: str = "fallback",
+):
+    """
+    Rows of an NG sheet for ``category``, built with joins and a pivot.
 
-        esito = map_esito(prod.get("esito"), prod.get("station_id"), cycle_seconds, min_cycle_threshold)
+    ``slot(defects)`` names the column each defect marks (NaN: none) and
+    ``keep(defects)`` selects the defects that count (``keep_qg`` the QG ones,
+    default ``keep``). A row is written when it has defects of its own or,
+    with ``qg_rows="fallback"``, when it is a ReWork row without any whose
+    module has QG defects; with ``qg_rows="all"`` every row also gets the QG
+    defects of its module. A cell says "NG", or ``text(defects)`` joined by a
+    space, and is grey when only QG defects mark it.
 
-        station = stations_by_id.get(prod.get("station_id"))
+    Returns (DataFrame, grey cells) for _append_dataframe, None without rows.
+    """
+    rows = ds.frame
+    defects = ds.defect_frame
+    defects = defects[defects["category"] == category]
+    if defects.empty:
+        return None
+    defects = defects.assign(
+        column=slot(defects),
+        value=text(defects) if text else "NG",
+    )
 
-        station_name = station.get("name", "Unknown") if station else "Unknown"
+    local = defects[defects["row"].notna()]
+    if keep is not None:
+        local = local[keep(local)]
+    local = local.assign(row=local["row"].astype(int), qg=False)
 
-        if station:
-            line_display_name = lines_by_id.get(station.get("line_id"), {}).get("display_name", "Unknown")
-            line_display_name = line_display_name.removeprefix("Linea ")
-        else:
-            line_display_name = "Unknown"
+    qg = defects[defects["qg_module"].notna()]
+    keep_qg = keep if keep_qg is None else keep_qg
+    if keep_qg is not None:
+        qg = qg[keep_qg(qg)]
 
-        station_name = f"{station_name}{line_display_name}"
+    if qg_rows == "all":
+        targets = rows
+    else:
+        targets = rows[rows["rework"] & ~rows.index.isin(local["row"])]
+    inherited = (
+        pd.DataFrame({"row": targets.index, "qg_module": targets["Module Id"].astype(object)})
+        .merge(qg.drop(columns="row"), on="qg_module")
+        .assign(qg=True)
+    )
 
+    hits = pd.concat([local, inherited], ignore_index=True)
+    if hits.empty:
+        return None
+    included = np.unique(hits["row"].to_numpy(dtype=int))
 
-        last_station_id = prod.get("last_station_id")
-        last_station_name = (
-            stations_by_id.get(last_station_id, {}).get("name", "N/A")
-            if last_station_id
-            else "N/A"
-        )
-        last_station_name = f"{last_station_name}{line_display_name}"
+    cells = hits[hits["column"].notna()].sort_values(["row", "seq"], kind="stable")
+    grid = cells.groupby(["row", "column"]).agg(
+        value=("value", " ".join if text else "first"),
+        qg=("qg", "all"),
+    )
+    matrix = grid["value"].unstack("column").reindex(index=included, columns=columns).fillna("")
+    matrix.columns.name = None
 
-        # 3) Collect ReWork defects for "Generali"
-        rework_defects_dict = {
-            d.get("defect_type")
-            for d in object_defects
-            if d.get("production_id") == production_id and d.get("category") == "Generali"
-        }
+    df = pd.concat(
+        [rows.loc[included, HEAD_COLUMNS].reset_index(drop=True), matrix.reset_index(drop=True)],
+        axis=1,
+    )
 
-        # 4) Get QG defects for this id_modulo
-        fallback_qg_list = qg_gen_by_modulo.get(id_modulo, [])
-        qg_defect_types = {d.get("defect_type") for d in fallback_qg_list}
+    # +2: row 1 is the header
+    position = pd.Series(np.arange(len(included)) + 2, index=included)
+    grey = grid[grid["qg"]].reset_index()
+    grey_cells = set(zip(position[grey["row"]].tolist(), grey["column"]))
+    return df, grey_cells
 
-        # 5) Build final "all_defects" set (= union of QG types and ReWork types)
-        all_defect_types = qg_defect_types.union(rework_defects_dict)
-        if not all_defect_types:
-            continue
 
-        # 6) Build row dictionary
-        row = {
-            "Line": line_display_name,
-            "Eq - PMS": station_name,
-            "Stringatrice": last_station_name,
-            "Module Id": id_modulo,
-            "Checkin - PMS": start_time,
-            "Checkout - PMS": end_time,
-            "Esito": esito,
-            "Tempo Ciclo": cycle_time_str,
-        }
+def ng_generali_sheet(ws, data: dict, progress=None) -> bool:
+    """
+    Generate the 'NG Generali' sheet using pre-fetched data.
+    Both QG-originated and ReWork defects show "NG", but only QG-only cells get gray fill.
+    """
+    defect_columns = [
+        "Poe Scaduto", "No Good da Bussing", "Materiale Esterno su Celle", "Passthrough al Bussing",
+        "Poe in Eccesso", "Solo Poe", "Solo Vetro", "Matrice Incompleta",
+        "Molteplici Bus Bar", "Test"
+    ]
 
-        # 7) For each defect column, assign "NG" if present, and gray‐fill only if QG-only.
-        for col in defect_columns:
-            if col in rework_defects_dict or col in qg_defect_types:
-                row[col] = "NG"
-                # Only gray if it is in QG set AND not overridden by ReWork
-                if col in qg_defect_types and col not in rework_defects_dict:
-                    grey_cells.append((len(all_rows) + 2, col))
-            else:
-                row[col] = ""
-
-        all_rows.append(row)
-        rows_written += 1
-
-    # 8) Append DataFrame and apply gray fill
-    if rows_written > 0:
-        import pandas as pd
-        df = pd.DataFrame(all_rows, columns=header)
-        _append_dataframe(
-            ws,
-            df,
-            zebra_key="Module Id",
-            progress=progress,
-            align_center_for=set(defect_columns + ["Esito"]),
-            grey_cells=set(grey_cells),
-        )
-        # Gray cells handled during DataFrame creation
-        return True
+    # Every row gets the QG defects of its module next to its own
+    result = _defect_matrix(
+        export_dataset(data), "Generali", defect_columns,
+        slot=lambda d: d["defect_type"].where(d["defect_type"].isin(defect_columns)),
+        qg_rows="all",
+    )
+    if result is None:
+        return False
 
-    return False
+    df, grey_cells = result
+    _append_dataframe(
+        ws,
+        df,
+        zebra_key="Module Id",
+        progress=progress,
+        align_center_for=set(defect_columns + ["Esito"]),
+        grey_cells=grey_cells,
+    )
+    return True
 
 def ng_saldature_sheet(ws, data: dict, progress=None) -> bool:
     """
     Generate the 'NG Saldature' sheet using pre-fetched data.
     One row per production that has at least one 'Saldatura' defect,
     either directly or inherited from QG (colored in gray).
+    Each cell lists "NG: <s_ribbon>;" for every defect on that stringa
+    ("Stringa NM" for lato M).
     """
-    rows_written = 0
-    objects = data.get("objects", [])
-    productions = data.get("productions", [])
-    stations = data.get("stations", [])
-    production_lines = data.get("production_lines", [])
-    object_defects = data.get("object_defects", [])
-    min_cycle_threshold = data.get("min_cycle_threshold", 3.0)
+    header = HEAD_COLUMNS + [f"Stringa {i}" for i in range(1, 13)] + [f"Stringa {i}M" for i in range(1, 13)]
 
-    # Build lookups
-    objects_by_id = {obj["id"]: obj for obj in objects}
-    stations_by_id = {s["id"]: s for s in stations}
-    lines_by_id = {l["id"]: l for l in production_lines}
-    productions_by_id = {p["id"]: p for p in productions}
-    station_type_by_prod = {
-        p["id"]: stations_by_id.get(p["station_id"], {}).get("type")
-        for p in productions
-    }
+    result = _defect_matrix(
+        export_dataset(data), "Saldatura", header[8:],
+        slot=lambda d: _stringa_slot(d).where(d["ribbon_lato"].ne("M"), _stringa_slot(d, suffix="M")),
+        text=lambda d: "NG: " + d["s_ribbon"].map(str) + ";",
+    )
+    if result is None:
+        return False
 
-    # 1) Group all QG‐found “Saldatura” defects by id_modulo,
-    #    exactly the same pattern you use in ng_disall_ribbon_sheet:
-    qg_sald_by_modulo = {}
-    for d in object_defects:
-        prod_id = d.get("production_id")
-        if not prod_id or station_type_by_prod.get(prod_id) != "qc":
-            continue
-        if d.get("category") != "Saldatura":
-            continue
+    df, grey_cells = result
+    _append_dataframe(
+        ws,
+        df,
+        zebra_key="Module Id",
+        progress=progress,
+        align_center_for=set(header),
+        grey_cells=grey_cells,
+    )
+    return True
 
-        prod = productions_by_id.get(prod_id)
-        if not prod:
-            continue
+RIBBON_COLUMNS = [
+    "Ribbon 1 F", "Ribbon 2 F", "Ribbon 3 F",
+    "Ribbon 1 M", "Ribbon 2 M", "Ribbon 3 M", "Ribbon 4 M",
+    "Ribbon 1 B", "Ribbon 2 B", "Ribbon 3 B"
+]
 
-        obj = objects_by_id.get(prod.get("object_id"))
-        if not obj:
-            continue
+def ng_disall_ribbon_sheet(ws, data: dict, progress=None) -> bool:
+    header = HEAD_COLUMNS + RIBBON_COLUMNS
 
-        mod_id = obj["id_modulo"]
-        qg_sald_by_modulo.setdefault(mod_id, []).append(d)
+    result = _defect_matrix(
+        export_dataset(data), "Disallineamento", RIBBON_COLUMNS,
+        slot=lambda d: _ribbon_slot(d, RIBBON_COLUMNS),
+        keep=lambda d: d["i_ribbon"].notna() & d["ribbon_lato"].isin(["F", "M", "B"]),
+    )
+    if result is None:
+        return False
 
-    # 2) Build the exact header order
-    header = [
-        "Line", "Eq - PMS", "Stringatrice", "Module Id",
-        "Checkin - PMS", "Checkout - PMS", "Esito", "Tempo Ciclo",
-    ] + [f"Stringa {i}" for i in range(1, 13)] + [f"Stringa {i}M" for i in range(1, 13)]
+    df, grey_cells = result
+    _append_dataframe(
+        ws,
+        df,
+        zebra_key="Module Id",
+        progress=progress,
+        align_center_for=set(header),
+        grey_cells=grey_cells,
+    )
+    return True
 
-    all_rows = []
-    grey_cells = []
+def ng_disall_stringa_sheet(ws, data: dict, progress=None) -> bool:
+    header = HEAD_COLUMNS + [f"Stringa {i}" for i in range(1, 13)]
+
+    result = _defect_matrix(
+        export_dataset(data), "Disallineamento", header[8:],
+        slot=_stringa_slot,
+        keep=lambda d: d["stringa"].notna(),
+        # QG stringa must be truthy, not just present
+        keep_qg=lambda d: d["stringa"].notna() & d["stringa"].astype(bool),
+    )
+    if result is None:
+        return False
 
-    for prod in productions:
-        obj = objects_by_id.get(prod.get("object_id"))
-        if not obj:
-            continue
+    df, grey_cells = result
+    _append_dataframe(
+        ws,
+        df,
+        zebra_key="Module Id",
+        progress=progress,
+        align_center_for=set(header),
+        grey_cells=grey_cells,
+    )
+    return True
 
-        id_modulo = obj.get("id_modulo")
-        if not id_modulo:
-            continue
+def ng_mancanza_ribbon_sheet(ws, data: dict, progress=None) -> bool:
+    header = HEAD_COLUMNS + RIBBON_COLUMNS
 
-        production_id = prod.get("id")
-        start_time = prod.get("start_time")
-        end_time = prod.get("end_time")
-        cycle_time_obj = prod.get("cycle_time")
-        cycle_time_str = str(cycle_time_obj or "")
+    result = _defect_matrix(
+        export_dataset(data), "Mancanza Ribbon", RIBBON_COLUMNS,
+        slot=lambda d: _ribbon_slot(d, RIBBON_COLUMNS),
+    )
+    if result is None:
+        return False
 
-        # Convert cycle time to seconds
-        cycle_seconds = None
-        if cycle_time_obj:
-            try:
-                h, m, s = map(float, str(cycle_time_obj).split(":"))
-                cycle_seconds = h * 3600 + m * 60 + s
-            except Exception:
-                pass
+    df, grey_cells = result
+    _append_dataframe(
+        ws,
+        df,
+        zebra_key="Module Id",
+        progress=progress,
+        align_center_for=set(header),
+        grey_cells=grey_cells,
+    )
+    return True
 
-        esito = map_esito(prod.get("esito"), prod.get("station_id"), cycle_seconds, min_cycle_threshold)
+def ng_iribbon_leadwire_sheet(ws, data: dict, progress=None) -> bool:
+    """
+    Generate the 'NG I_Ribbon Leadwire' sheet using pre-fetched data.
+    Includes ReWork rows and shows QG-inherited defects in gray.
+    """
+    ribbon_columns = ["Ribbon 1 M", "Ribbon 2 M", "Ribbon 3 M", "Ribbon 4 M"]
+    header = HEAD_COLUMNS + ribbon_columns
 
-        station = stations_by_id.get(prod.get("station_id"))
-        is_rework = (station.get("type") == "rework") if station else False
+    result = _defect_matrix(
+        export_dataset(data), "I_Ribbon Leadwire", ribbon_columns,
+        slot=lambda d: _ribbon_slot(d, ribbon_columns),
+    )
+    if result is None:
+        return False
 
-        station_name = station.get("name", "Unknown") if station else "Unknown"
+    df, grey_cells = result
+    _append_dataframe(
+        ws,
+        df,
+        zebra_key="Module Id",
+        progress=progress,
+        align_center_for=set(header),
+        grey_cells=grey_cells,
+    )
+    return True
 
-        if station:
-            line_name = lines_by_id.get(station.get("line_id"), {}).get("display_name", "Unknown")
-            line_name = line_name.removeprefix("Linea ")
-        else:
-            line_name = "Unknown"
+def _ng_stringa_sheet(ws, data: dict, category: str, progress=None, parse_stringa=False) -> bool:
+    """
+    One row per production with a ``category`` defect, NG in its Stringa 1-12
+    columns; a ReWork row with none of its own shows the QG ones in gray.
+    """
+    header = HEAD_COLUMNS + [f"Stringa {i}" for i in range(1, 13)]
 
-        station_name = f"{station_name}{line_name}"
+    result = _defect_matrix(
+        export_dataset(data), category, header[8:],
+        slot=lambda d: _stringa_slot(d, strict=not parse_stringa),
+    )
+    if result is None:
+        return False
 
+    df, grey_cells = result
+    _append_dataframe(
+        ws,
+        df,
+        zebra_key="Module Id",
+        progress=progress,
+        align_center_for=set(header),
+        grey_cells=grey_cells,
+    )
+    return True
 
-        last_station_id = prod.get("last_station_id")
-        last_station_name = (
-            stations_by_id.get(last_station_id, {}).get("name", "N/A")
-            if last_station_id
-            else "N/A"
-        )
-        last_station_name = f"{last_station_name}{line_name}"
-
-        # 3) Collect all Saldatura defects at ReWork station
-        prod_defects = [
-            d for d in object_defects
-            if d.get("production_id") == production_id and d.get("category") == "Saldatura"
-        ]
-
-        # 4) If there are none in ReWork, but this is a ReWork row,
-        #    fall back to any QG‐collected Saldatura defects for that module:
-        fallback_qg_defects = []
-        if not prod_defects and is_rework:
-            fallback_qg_defects = qg_sald_by_modulo.get(id_modulo, [])
-
-        # If we have neither, skip
-        if not prod_defects and not fallback_qg_defects:
-            continue
-
-        # 5) Prepare a 24‐cell buffer, one slot per header column
-        saldatura_cols = [""] * 24
-        grey_indexes = set()
-
-        def _mark_ng(stringa, lato, s_ribbon, is_qg_flag=False):
-            """
-            stringa: the stringa number
-            lato: “M” or something else
-            s_ribbon: the s_ribbon value to show
-            is_qg_flag: if True, we'll gray‐highlight later
-            """
-            try:
-                si = int(stringa)
-            except:
-                return
-            if not (1 <= si <= 12):
-                return
-
-            # If lato != "M": map to index 0..11
-            # If lato == "M": map to index 12..23
-            if lato == "M":
-                idx = (si - 1) + 12
-            else:
-                idx = (si - 1)
-
-            # Append “NG: s_ribbon;” to that cell
-            text = f"NG: {s_ribbon};"
-            if saldatura_cols[idx]:
-                saldatura_cols[idx] += " " + text
-            else:
-                saldatura_cols[idx] = text
-
-            if is_qg_flag:
-                grey_indexes.add(idx)
-            else:
-                grey_indexes.discard(idx)
-
-        # 6) First mark all fallback QG defects in “gray” (is_qg_flag=True)
-        for d in fallback_qg_defects:
-            _mark_ng(d.get("stringa"), d.get("ribbon_lato"), d.get("s_ribbon"), is_qg_flag=True)
-
-        # 7) Then override any of those with actual ReWork defects (is_qg_flag=False)
-        for d in prod_defects:
-            _mark_ng(d.get("stringa"), d.get("ribbon_lato"), d.get("s_ribbon"), is_qg_flag=False)
-
-        # 8) Build our row dict exactly in header order
-        row = {
-            "Line": line_name,
-            "Eq - PMS": station_name,
-            "Stringatrice": last_station_name,
-            "Module Id": id_modulo,
-            "Checkin - PMS": start_time,
-            "Checkout - PMS": end_time,
-            "Esito": esito,
-            "Tempo Ciclo": cycle_time_str,
-        }
-        # Fill columns “Stringa 1” … “Stringa 12” then “Stringa 1M” … “Stringa 12M”
-        for i in range(1, 13):
-            row[f"Stringa {i}"] = saldatura_cols[i - 1]
-            row[f"Stringa {i}M"] = saldatura_cols[(i - 1) + 12]
-
-        # 9) Record which (row, column) need gray‐fill
-        #    We use len(all_rows)+2 because row 1 is header, row 2 is first data.
-        for idx in grey_indexes:
-            col_name = header[8 + idx]
-            grey_cells.append((len(all_rows) + 2, col_name))
-
-        all_rows.append(row)
-        rows_written += 1
-
-    # 10) Dump to DataFrame and apply gray fill during write
-    if rows_written > 0:
-        import pandas as pd
-        df = pd.DataFrame(all_rows, columns=header)
-        _append_dataframe(
-            ws,
-            df,
-            zebra_key="Module Id",
-            progress=progress,
-            align_center_for=set(header),
-            grey_cells=set(grey_cells),
-        )
-
-        return True
-
-    return False
-
-def ng_disall_ribbon_sheet(ws, data: dict, progress=None) -> bool:
-    rows_written = 0
-    objects = data.get("objects", [])
-    productions = data.get("productions", [])
-    stations = data.get("stations", [])
-    production_lines = data.get("production_lines", [])
-    object_defects = data.get("object_defects", [])
-    min_cycle_threshold = data.get("min_cycle_threshold", 3.0)
-
-    objects_by_id = {obj["id"]: obj for obj in objects}
-    stations_by_id = {s["id"]: s for s in stations}
-    lines_by_id = {l["id"]: l for l in production_lines}
-    productions_by_id = {p["id"]: p for p in productions}
-    station_type_by_prod = {p["id"]: stations_by_id.get(p["station_id"], {}).get("type") for p in productions}
-
-    # Group QG Disallineamento Ribbon defects by id_modulo
-    qg_disall_by_modulo = {}
-    for d in object_defects:
-        prod_id = d.get("production_id")
-        if not prod_id or station_type_by_prod.get(prod_id) != "qc":
-            continue
-        if d.get("category") == "Disallineamento" and d.get("i_ribbon") is not None and d.get("ribbon_lato") in {"F", "M", "B"}:
-            prod = productions_by_id.get(prod_id)
-            obj = objects_by_id.get(prod.get("object_id")) if prod else None
-            if obj:
-                qg_disall_by_modulo.setdefault(obj["id_modulo"], []).append(d)
-
-    header = [
-        "Line", "Eq - PMS", "Stringatrice", "Module Id",
-        "Checkin - PMS", "Checkout - PMS", "Esito", "Tempo Ciclo",
-        "Ribbon 1 F", "Ribbon 2 F", "Ribbon 3 F",
-        "Ribbon 1 M", "Ribbon 2 M", "Ribbon 3 M", "Ribbon 4 M",
-        "Ribbon 1 B", "Ribbon 2 B", "Ribbon 3 B"
-    ]
-
-    ribbon_map = {
-        ("F", 1): 0, ("F", 2): 1, ("F", 3): 2,
-        ("M", 1): 3, ("M", 2): 4, ("M", 3): 5, ("M", 4): 6,
-        ("B", 1): 7, ("B", 2): 8, ("B", 3): 9,
-    }
-
-    all_rows = []
-    grey_cells = []
-
-    for prod in productions:
-        obj = objects_by_id.get(prod.get("object_id"))
-        if not obj:
-            continue
-
-        id_modulo = obj.get("id_modulo")
-        if not id_modulo:
-            continue
-
-        production_id = prod.get("id")
-        start_time = prod.get("start_time")
-        end_time = prod.get("end_time")
-        cycle_time_obj = prod.get("cycle_time")
-        cycle_time_str = str(cycle_time_obj or "")
-
-        # Convert cycle time to seconds
-        cycle_seconds = None
-        if cycle_time_obj:
-            try:
-                h, m, s = map(float, str(cycle_time_obj).split(":"))
-                cycle_seconds = h * 3600 + m * 60 + s
-            except Exception:
-                pass
-
-        esito = map_esito(prod.get("esito"), prod.get("station_id"), cycle_seconds, min_cycle_threshold)
-
-        station = stations_by_id.get(prod.get("station_id"))
-        is_rework = (station.get("type") == "rework") if station else False
-
-        station_name = station.get("name", "Unknown") if station else "Unknown"
-
-        if station:
-            line_name = lines_by_id.get(station.get("line_id"), {}).get("display_name", "Unknown")
-            line_name = line_name.removeprefix("Linea ")
-        else:
-            line_name = "Unknown"
-
-        station_name = f"{station_name}{line_name}"
-
-
-        last_station_id = prod.get("last_station_id")
-        last_station_name = (
-            stations_by_id.get(last_station_id, {}).get("name", "N/A")
-            if last_station_id
-            else "N/A"
-        )
-        last_station_name = f"{last_station_name}{line_name}"
-
-        # Local defects
-        prod_defects = [
-            d for d in object_defects
-            if d.get("production_id") == production_id and
-               d.get("category") == "Disallineamento" and
-               d.get("i_ribbon") is not None and
-               d.get("ribbon_lato") in ["F", "M", "B"]
-        ]
-
-        # Fallback to QG defects if ReWork has none
-        fallback_qg_defects = []
-        if not prod_defects and is_rework:
-            fallback_qg_defects = qg_disall_by_modulo.get(id_modulo, [])
-
-        if not prod_defects and not fallback_qg_defects:
-            continue
-
-        ribbon_cols = [""] * 10
-        grey_indexes = set()
-
-        for d in fallback_qg_defects:
-            lato = d.get("ribbon_lato")
-            i_ribbon = d.get("i_ribbon")
-            try:
-                idx = ribbon_map.get((str(lato), int(i_ribbon)))  # type: ignore
-                if idx is not None:
-                    ribbon_cols[idx] = "NG"
-                    grey_indexes.add(idx)
-            except Exception:
-                continue
-
-        for d in prod_defects:
-            lato = d.get("ribbon_lato")
-            i_ribbon = d.get("i_ribbon")
-            try:
-                idx = ribbon_map.get((str(lato), int(i_ribbon)))  # type: ignore
-                if idx is not None:
-                    ribbon_cols[idx] = "NG"
-                    if idx in grey_indexes:
-                        grey_indexes.remove(idx)
-            except Exception:
-                continue
-
-        row = {
-            "Line": line_name,
-            "Eq - PMS": station_name,
-            "Stringatrice": last_station_name,
-            "Module Id": id_modulo,
-            "Checkin - PMS": start_time,
-            "Checkout - PMS": end_time,
-            "Esito": esito,
-            "Tempo Ciclo": cycle_time_str,
-        }
-
-        # Fill in Ribbon values
-        for i, col in enumerate([
-            "Ribbon 1 F", "Ribbon 2 F", "Ribbon 3 F",
-            "Ribbon 1 M", "Ribbon 2 M", "Ribbon 3 M", "Ribbon 4 M",
-            "Ribbon 1 B", "Ribbon 2 B", "Ribbon 3 B"
-        ]):
-            row[col] = ribbon_cols[i]
-
-        for idx in grey_indexes:
-            grey_cells.append((len(all_rows) + 2, list(header)[8 + idx]))  # +2 to account for header
-
-        all_rows.append(row)
-        rows_written += 1
-
-    if rows_written > 0:
-        df = pd.DataFrame(all_rows, columns=header)
-        _append_dataframe(
-            ws,
-            df,
-            zebra_key="Module Id",
-            progress=progress,
-            align_center_for=set(header),
-            grey_cells=set(grey_cells),
-        )
-
-        return True
-
-    return False
-
-def ng_disall_stringa_sheet(ws, data: dict, progress=None) -> bool:
-    rows_written = 0
-    objects = data.get("objects", [])
-    productions = data.get("productions", [])
-    stations = data.get("stations", [])
-    production_lines = data.get("production_lines", [])
-    object_defects = data.get("object_defects", [])
-    min_cycle_threshold = data.get("min_cycle_threshold", 3.0)
-
-    objects_by_id = {obj["id"]: obj for obj in objects}
-    stations_by_id = {s["id"]: s for s in stations}
-    lines_by_id = {l["id"]: l for l in production_lines}
-    productions_by_id = {p["id"]: p for p in productions}
-    station_type_by_prod = {p["id"]: stations_by_id.get(p["station_id"], {}).get("type") for p in productions}
-
-    # Group QG Disallineamento defects by id_modulo
-    qg_disall_by_modulo = {}
-    for d in object_defects:
-        prod_id = d.get("production_id")
-        if not prod_id or station_type_by_prod.get(prod_id) != "qc":
-            continue
-        prod = productions_by_id.get(prod_id)
-        obj = objects_by_id.get(prod.get("object_id")) if prod else None
-        if obj and d.get("category") == "Disallineamento" and d.get("stringa"):
-            qg_disall_by_modulo.setdefault(obj["id_modulo"], []).append(d)
-
-    header = [
-        "Line", "Eq - PMS", "Stringatrice", "Module Id",
-        "Checkin - PMS", "Checkout - PMS", "Esito", "Tempo Ciclo"
-    ] + [f"Stringa {i}" for i in range(1, 13)]
-
-    all_rows = []
-    grey_cells = []
-
-    for prod in productions:
-        obj = objects_by_id.get(prod.get("object_id"))
-        if not obj:
-            continue
-
-        id_modulo = obj.get("id_modulo")
-        if not id_modulo:
-            continue
-
-        production_id = prod.get("id")
-        start_time = prod.get("start_time")
-        end_time = prod.get("end_time")
-        cycle_time_obj = prod.get("cycle_time")
-        cycle_time_str = str(cycle_time_obj or "")
-
-        # Convert cycle time to seconds
-        cycle_seconds = None
-        if cycle_time_obj:
-            try:
-                h, m, s = map(float, str(cycle_time_obj).split(":"))
-                cycle_seconds = h * 3600 + m * 60 + s
-            except Exception:
-                pass
-
-        esito = map_esito(prod.get("esito"), prod.get("station_id"), cycle_seconds, min_cycle_threshold)
-
-        station = stations_by_id.get(prod.get("station_id"))
-        is_rework = (station.get("type") == "rework") if station else False
-
-        station_name = station.get("name", "Unknown") if station else "Unknown"
-
-        if station:
-            line_name = lines_by_id.get(station.get("line_id"), {}).get("display_name", "Unknown")
-            line_name = line_name.removeprefix("Linea ")
-        else:
-            line_name = "Unknown"
-
-        station_name = f"{station_name}{line_name}"
-
-
-        last_station_id = prod.get("last_station_id")
-        last_station_name = (
-            stations_by_id.get(last_station_id, {}).get("name", "N/A")
-            if last_station_id
-            else "N/A"
-        )
-        last_station_name = f"{last_station_name}{line_name}"
-
-        # Get local defects
-        prod_defects = [
-            d for d in object_defects
-            if d.get("production_id") == production_id and
-               d.get("category") == "Disallineamento" and
-               d.get("stringa") is not None
-        ]
-
-        # If Rework has no defects, fallback to QG
-        fallback_qg_defects = []
-        if not prod_defects and is_rework:
-            fallback_qg_defects = qg_disall_by_modulo.get(id_modulo, [])
-
-        if not prod_defects and not fallback_qg_defects:
-            continue
-
-        stringa_cols = [""] * 12
-        grey_indexes = set()
-
-        for defect in fallback_qg_defects:
-            stringa_num = defect.get("stringa")
-            try:
-                idx = int(stringa_num)
-                if 1 <= idx <= 12:
-                    stringa_cols[idx - 1] = "NG"
-                    grey_indexes.add(idx - 1)
-            except Exception:
-                continue
-
-        for defect in prod_defects:
-            stringa_num = defect.get("stringa")
-            try:
-                idx = int(stringa_num)
-                if 1 <= idx <= 12:
-                    stringa_cols[idx - 1] = "NG"
-                    if idx - 1 in grey_indexes:
-                        grey_indexes.remove(idx - 1)
-            except Exception:
-                continue
-
-        row = {
-            "Line": line_name,
-            "Eq - PMS": station_name,
-            "Stringatrice": last_station_name,
-            "Module Id": id_modulo,
-            "Checkin - PMS": start_time,
-            "Checkout - PMS": end_time,
-            "Esito": esito,
-            "Tempo Ciclo": cycle_time_str
-        }
-        for i in range(12):
-            row[f"Stringa {i + 1}"] = stringa_cols[i]
-
-        for idx in grey_indexes:
-            grey_cells.append((len(all_rows) + 2, f"Stringa {idx + 1}"))  # row+2 for header offset
-
-        all_rows.append(row)
-        rows_written += 1
-
-    if rows_written > 0:
-        df = pd.DataFrame(all_rows, columns=header)
-        _append_dataframe(
-            ws,
-            df,
-            zebra_key="Module Id",
-            progress=progress,
-            align_center_for=set(header),
-            grey_cells=set(grey_cells),
-        )
-
-        return True
-
-    return False
-
-def ng_mancanza_ribbon_sheet(ws, data: dict, progress=None) -> bool:
-    rows_written = 0
-    objects = data.get("objects", [])
-    productions = data.get("productions", [])
-    stations = data.get("stations", [])
-    production_lines = data.get("production_lines", [])
-    object_defects = data.get("object_defects", [])
-    min_cycle_threshold = data.get("min_cycle_threshold", 3.0)
-
-    objects_by_id = {obj["id"]: obj for obj in objects}
-    stations_by_id = {station["id"]: station for station in stations}
-    lines_by_id = {line["id"]: line for line in production_lines}
-    productions_by_id = {p["id"]: p for p in productions}
-    station_type_by_prod = {
-        p["id"]: stations_by_id.get(p["station_id"], {}).get("type") for p in productions
-    }
-
-    # Collect QG defects by id_modulo
-    qg_defects_by_modulo = {}
-    for defect in object_defects:
-        prod_id = defect.get("production_id")
-        if not prod_id or station_type_by_prod.get(prod_id) != "qc":
-            continue
-        prod = productions_by_id.get(prod_id)
-        obj = objects_by_id.get(prod["object_id"]) if prod else None
-        if obj:
-            qg_defects_by_modulo.setdefault(obj["id_modulo"], []).append(defect)
-
-    header = [
-        "Line", "Eq - PMS", "Stringatrice", "Module Id",
-        "Checkin - PMS", "Checkout - PMS", "Esito", "Tempo Ciclo",
-        "Ribbon 1 F", "Ribbon 2 F", "Ribbon 3 F",
-        "Ribbon 1 M", "Ribbon 2 M", "Ribbon 3 M", "Ribbon 4 M",
-        "Ribbon 1 B", "Ribbon 2 B", "Ribbon 3 B"
-    ]
-
-    ribbon_map = {
-        ("F", 1): 0, ("F", 2): 1, ("F", 3): 2,
-        ("M", 1): 3, ("M", 2): 4, ("M", 3): 5, ("M", 4): 6,
-        ("B", 1): 7, ("B", 2): 8, ("B", 3): 9,
-    }
-
-    all_rows = []
-    grey_cells = []
-
-    for prod in productions:
-        obj = objects_by_id.get(prod.get("object_id"))
-        if not obj:
-            continue
-
-        id_modulo = obj.get("id_modulo")
-        if not id_modulo:
-            continue
-
-        production_id = prod.get("id")
-        start_time = prod.get("start_time")
-        end_time = prod.get("end_time")
-        cycle_time_obj = prod.get("cycle_time")
-        cycle_time_str = str(cycle_time_obj or "")
-
-        cycle_seconds = None
-        if cycle_time_obj:
-            try:
-                h, m, s = map(float, str(cycle_time_obj).split(":"))
-                cycle_seconds = h * 3600 + m * 60 + s
-            except Exception:
-                pass
-
-        esito = map_esito(prod.get("esito"), prod.get("station_id"), cycle_seconds, min_cycle_threshold)
-
-        station = stations_by_id.get(prod.get("station_id"))
-        is_rework = (station.get("type") == "rework") if station else False
-
-        station_name = station.get("name", "Unknown") if station else "Unknown"
-
-        if station:
-            line_name = lines_by_id.get(station.get("line_id"), {}).get("display_name", "Unknown")
-            line_name = line_name.removeprefix("Linea ")
-        else:
-            line_name = "Unknown"
-
-        station_name = f"{station_name}{line_name}"
-
-
-        last_station_id = prod.get("last_station_id")
-        last_station_name = (
-            stations_by_id.get(last_station_id, {}).get("name", "N/A")
-            if last_station_id
-            else "N/A"
-        )
-        last_station_name = f"{last_station_name}{line_name}"
-
-        prod_defects = [
-            d for d in object_defects
-            if d.get("production_id") == production_id and d.get("category") == "Mancanza Ribbon"
-        ]
-
-        fallback_qg_defects = []
-        if not prod_defects and is_rework:
-            fallback_qg_defects = [
-                d for d in qg_defects_by_modulo.get(id_modulo, [])
-                if d.get("category") == "Mancanza Ribbon"
-            ]
-
-        if not prod_defects and not fallback_qg_defects:
-            continue
-
-        ribbon_cols = [""] * 10
-        grey_map = set()
-
-        for defect in fallback_qg_defects:
-            lato = defect.get("ribbon_lato")
-            i_ribbon = defect.get("i_ribbon")
-            try:
-                idx = ribbon_map.get((str(lato), int(i_ribbon))) # type: ignore
-                if idx is not None:
-                    ribbon_cols[idx] = "NG"
-                    grey_map.add(idx)
-            except Exception:
-                continue
-
-        for defect in prod_defects:
-            lato = defect.get("ribbon_lato")
-            i_ribbon = defect.get("i_ribbon")
-            try:
-                idx = ribbon_map.get((str(lato), int(i_ribbon))) # type: ignore
-                if idx is not None:
-                    ribbon_cols[idx] = "NG"
-                    if idx in grey_map:
-                        grey_map.remove(idx)
-            except Exception:
-                continue
-
-        row = {
-            "Line": line_name,
-            "Eq - PMS": station_name,
-            "Stringatrice": last_station_name,
-            "Module Id": id_modulo,
-            "Checkin - PMS": start_time,
-            "Checkout - PMS": end_time,
-            "Esito": esito,
-            "Tempo Ciclo": cycle_time_str,
-            "Ribbon 1 F": ribbon_cols[0],
-            "Ribbon 2 F": ribbon_cols[1],
-            "Ribbon 3 F": ribbon_cols[2],
-            "Ribbon 1 M": ribbon_cols[3],
-            "Ribbon 2 M": ribbon_cols[4],
-            "Ribbon 3 M": ribbon_cols[5],
-            "Ribbon 4 M": ribbon_cols[6],
-            "Ribbon 1 B": ribbon_cols[7],
-            "Ribbon 2 B": ribbon_cols[8],
-            "Ribbon 3 B": ribbon_cols[9],
-        }
-
-        for idx in grey_map:
-            col_name = header[8 + idx]  # first 8 cols before ribbon cols
-            grey_cells.append((len(all_rows) + 2, col_name))
-
-        all_rows.append(row)
-        rows_written += 1
-
-    if rows_written > 0:
-        df = pd.DataFrame(all_rows, columns=header)
-        _append_dataframe(
-            ws,
-            df,
-            zebra_key="Module Id",
-            progress=progress,
-            align_center_for=set(header),
-            grey_cells=set(grey_cells),
-        )
-
-        return True
-
-    return False
-    
-def ng_iribbon_leadwire_sheet(ws, data: dict, progress=None) -> bool:
-    """
-    Generate the 'NG I_Ribbon Leadwire' sheet using pre-fetched data.
-    Includes ReWork rows and shows QG-inherited defects in gray.
-    """
-    rows_written = 0
-    objects = data.get("objects", [])
-    productions = data.get("productions", [])
-    stations = data.get("stations", [])
-    production_lines = data.get("production_lines", [])
-    object_defects = data.get("object_defects", [])
-    min_cycle_threshold = data.get("min_cycle_threshold", 3.0)
-
-    objects_by_id = {obj["id"]: obj for obj in objects}
-    stations_by_id = {s["id"]: s for s in stations}
-    lines_by_id = {l["id"]: l for l in production_lines}
-    productions_by_id = {p["id"]: p for p in productions}
-    station_type_by_prod = {
-        p["id"]: stations_by_id.get(p["station_id"], {}).get("type") for p in productions
-    }
-
-    # Collect QG defects by id_modulo
-    qg_defects_by_modulo = {}
-    for defect in object_defects:
-        prod_id = defect.get("production_id")
-        if not prod_id or station_type_by_prod.get(prod_id) != "qc":
-            continue
-        prod = productions_by_id.get(prod_id)
-        obj = objects_by_id.get(prod["object_id"]) if prod else None
-        if obj:
-            qg_defects_by_modulo.setdefault(obj["id_modulo"], []).append(defect)
-
-    header = [
-        "Line", "Eq - PMS", "Stringatrice", "Module Id",
-        "Checkin - PMS", "Checkout - PMS", "Esito", "Tempo Ciclo",
-        "Ribbon 1 M", "Ribbon 2 M", "Ribbon 3 M", "Ribbon 4 M"
-    ]
-
-    all_rows = []
-    grey_cells = []
-
-    for prod in productions:
-        obj = objects_by_id.get(prod.get("object_id"))
-        if not obj:
-            continue
-
-        id_modulo = obj.get("id_modulo")
-        if not id_modulo:
-            continue
-
-        production_id = prod.get("id")
-        start_time = prod.get("start_time")
-        end_time = prod.get("end_time")
-        cycle_time_obj = prod.get("cycle_time")
-        cycle_time_str = str(cycle_time_obj or "")
-
-        cycle_seconds = None
-        if cycle_time_obj:
-            try:
-                h, m, s = map(float, str(cycle_time_obj).split(":"))
-                cycle_seconds = h * 3600 + m * 60 + s
-            except Exception:
-                pass
-
-        esito = map_esito(prod.get("esito"), prod.get("station_id"), cycle_seconds, min_cycle_threshold)
-
-        station = stations_by_id.get(prod.get("station_id"))
-        is_rework = (station.get("type") == "rework") if station else False
-
-        station_name = station.get("name", "Unknown") if station else "Unknown"
-
-        if station:
-            line_name = lines_by_id.get(station.get("line_id"), {}).get("display_name", "Unknown")
-            line_name = line_name.removeprefix("Linea ")
-        else:
-            line_name = "Unknown"
-
-        station_name = f"{station_name}{line_name}"
-
-
-        last_station_id = prod.get("last_station_id")
-        last_station_name = (
-            stations_by_id.get(last_station_id, {}).get("name", "N/A")
-            if last_station_id
-            else "N/A"
-        )
-        last_station_name = f"{last_station_name}{line_name}"
-
-        prod_defects = [
-            d for d in object_defects
-            if d.get("production_id") == production_id and d.get("category") == "I_Ribbon Leadwire"
-        ]
-        fallback_qg_defects = []
-        if not prod_defects and is_rework:
-            fallback_qg_defects = [
-                d for d in qg_defects_by_modulo.get(id_modulo, [])
-                if d.get("category") == "I_Ribbon Leadwire"
-            ]
-
-        if not prod_defects and not fallback_qg_defects:
-            continue
-
-        ribbon_cols = [""] * 4
-        grey_map = set()
-        ribbon_map = {1: 0, 2: 1, 3: 2, 4: 3}
-
-        for d in fallback_qg_defects:
-            lato = d.get("ribbon_lato")
-            i_ribbon = d.get("i_ribbon")
-            if lato == "M":
-                try:
-                    idx = ribbon_map.get(int(i_ribbon))
-                    if idx is not None:
-                        ribbon_cols[idx] = "NG"
-                        grey_map.add(idx)
-                except Exception:
-                    continue
-
-        for d in prod_defects:
-            lato = d.get("ribbon_lato")
-            i_ribbon = d.get("i_ribbon")
-            if lato == "M":
-                try:
-                    idx = ribbon_map.get(int(i_ribbon))
-                    if idx is not None:
-                        ribbon_cols[idx] = "NG"
-                        if idx in grey_map:
-                            grey_map.remove(idx)  # override QG mark
-                except Exception:
-                    continue
-
-        row = {
-            "Line": line_name,
-            "Eq - PMS": station_name,
-            "Stringatrice": last_station_name,
-            "Module Id": id_modulo,
-            "Checkin - PMS": start_time,
-            "Checkout - PMS": end_time,
-            "Esito": esito,
-            "Ribbon 1 M": ribbon_cols[0],
-            "Ribbon 2 M": ribbon_cols[1],
-            "Ribbon 3 M": ribbon_cols[2],
-            "Ribbon 4 M": ribbon_cols[3],
-        }
-
-        for idx in grey_map:
-            grey_cells.append((len(all_rows) + 2, f"Ribbon {idx + 1} M"))  # +2: account for header
-
-        all_rows.append(row)
-        rows_written += 1
-
-    if rows_written > 0:
-        df = pd.DataFrame(all_rows, columns=header)
-        _append_dataframe(
-            ws,
-            df,
-            zebra_key="Module Id",
-            progress=progress,
-            align_center_for=set(header),
-            grey_cells=set(grey_cells),
-        )
-
-        return True
-
-    return False
-
-def ng_macchie_eca_sheet(ws, data: dict, progress=None) -> bool:
-    """
-    Generate the 'NG Macchie ECA' sheet using pre-fetched data.
-    Includes ReWork productions and marks inherited QG defects in gray.
-    """
-    rows_written = 0
-    objects = data.get("objects", [])
-    productions = data.get("productions", [])
-    stations = data.get("stations", [])
-    production_lines = data.get("production_lines", [])
-    object_defects = data.get("object_defects", [])
-    min_cycle_threshold = data.get("min_cycle_threshold", 3.0)
-
-    objects_by_id = {obj["id"]: obj for obj in objects}
-    stations_by_id = {station["id"]: station for station in stations}
-    lines_by_id = {line["id"]: line for line in production_lines}
-    productions_by_id = {p["id"]: p for p in productions}
-    station_type_by_prod = {
-        p["id"]: stations_by_id.get(p["station_id"], {}).get("type") for p in productions
-    }
-
-    # Collect QG defects by id_modulo
-    qg_defects_by_modulo = {}
-    for defect in object_defects:
-        prod_id = defect.get("production_id")
-        if not prod_id or station_type_by_prod.get(prod_id) != "qc":
-            continue
-        prod = productions_by_id.get(prod_id)
-        obj = objects_by_id.get(prod["object_id"]) if prod else None
-        if obj:
-            qg_defects_by_modulo.setdefault(obj["id_modulo"], []).append(defect)
-
-    header = [
-        "Line", "Eq - PMS", "Stringatrice", "Module Id",
-        "Checkin - PMS", "Checkout - PMS", "Esito", "Tempo Ciclo"
-    ] + [f"Stringa {i}" for i in range(1, 13)]
-
-    all_rows = []
-    grey_cells = []
-
-    for prod in productions:
-        obj = objects_by_id.get(prod.get("object_id"))
-        if not obj:
-            continue
-
-        id_modulo = obj.get("id_modulo")
-        if not id_modulo:
-            continue
-
-        production_id = prod.get("id")
-        start_time = prod.get("start_time")
-        end_time = prod.get("end_time")
-        cycle_time_obj = prod.get("cycle_time")
-        cycle_time_str = str(cycle_time_obj or "")
-
-        cycle_seconds = None
-        if cycle_time_obj:
-            try:
-                h, m, s = map(float, str(cycle_time_obj).split(":"))
-                cycle_seconds = h * 3600 + m * 60 + s
-            except Exception:
-                pass
-
-        esito = map_esito(prod.get("esito"), prod.get("station_id"), cycle_seconds, min_cycle_threshold)
-
-        station = stations_by_id.get(prod.get("station_id"))
-        is_rework = (station.get("type") == "rework") if station else False
-
-        station_name = station.get("name", "Unknown") if station else "Unknown"
-
-        if station:
-            line_name = lines_by_id.get(station.get("line_id"), {}).get("display_name", "Unknown")
-            line_name = line_name.removeprefix("Linea ")
-        else:
-            line_name = "Unknown"
-
-        station_name = f"{station_name}{line_name}"
-
-
-        last_station_id = prod.get("last_station_id")
-        last_station_name = (
-            stations_by_id.get(last_station_id, {}).get("name", "N/A")
-            if last_station_id
-            else "N/A"
-        )
-        last_station_name = f"{last_station_name}{line_name}"
-
-        prod_defects = [
-            d for d in object_defects
-            if d.get("production_id") == production_id and d.get("category") == "Macchie ECA"
-        ]
-        fallback_qg_defects = []
-        if not prod_defects and is_rework:
-            fallback_qg_defects = [
-                d for d in qg_defects_by_modulo.get(id_modulo, [])
-                if d.get("category") == "Macchie ECA"
-            ]
-
-        if not prod_defects and not fallback_qg_defects:
-            continue
-
-        found_stringa = {}
-        for d in fallback_qg_defects:
-            idx = d.get("stringa")
-            if isinstance(idx, int) and 1 <= idx <= 12:
-                found_stringa[idx] = "QG"
-        for d in prod_defects:
-            idx = d.get("stringa")
-            if isinstance(idx, int) and 1 <= 12:
-                found_stringa[idx] = "CURRENT"
-
-        row = {
-            "Line": line_name,
-            "Eq - PMS": station_name,
-            "Stringatrice": last_station_name,
-            "Module Id": id_modulo,
-            "Checkin - PMS": start_time,
-            "Checkout - PMS": end_time,
-            "Esito": esito,
-            "Tempo Ciclo": cycle_time_str
-        }
-
-        for i in range(1, 13):
-            if found_stringa.get(i):
-                row[f"Stringa {i}"] = "NG"
-                if found_stringa[i] == "QG":
-                    grey_cells.append((len(all_rows) + 2, f"Stringa {i}"))  # +2 because of header
-            else:
-                row[f"Stringa {i}"] = ""
-
-        all_rows.append(row)
-        rows_written += 1
-
-    if rows_written > 0:
-        df = pd.DataFrame(all_rows, columns=header)
-        _append_dataframe(
-            ws,
-            df,
-            zebra_key="Module Id",
-            progress=progress,
-            align_center_for=set(header),
-            grey_cells=set(grey_cells),
-        )
-
-        return True
-
-    return False
-
-def ng_bad_soldering_sheet(ws, data: dict, progress=None) -> bool:
-    """
-    Generate the 'NG Bad Soldering' sheet using pre-fetched data.
-    Includes ReWork productions and marks inherited QG defects in gray.
-    """
-    rows_written = 0
-    objects = data.get("objects", [])
-    productions = data.get("productions", [])
-    stations = data.get("stations", [])
-    production_lines = data.get("production_lines", [])
-    object_defects = data.get("object_defects", [])
-    min_cycle_threshold = data.get("min_cycle_threshold", 3.0)
-
-    objects_by_id = {obj["id"]: obj for obj in objects}
-    stations_by_id = {station["id"]: station for station in stations}
-    lines_by_id = {line["id"]: line for line in production_lines}
-    productions_by_id = {p["id"]: p for p in productions}
-    station_type_by_prod = {
-        p["id"]: stations_by_id.get(p["station_id"], {}).get("type") for p in productions
-    }
-
-    # Collect QG defects by id_modulo
-    qg_defects_by_modulo = {}
-    for defect in object_defects:
-        prod_id = defect.get("production_id")
-        if not prod_id or station_type_by_prod.get(prod_id) != "qc":
-            continue
-        prod = productions_by_id.get(prod_id)
-        obj = objects_by_id.get(prod["object_id"]) if prod else None
-        if obj:
-            qg_defects_by_modulo.setdefault(obj["id_modulo"], []).append(defect)
-
-    header = [
-        "Line", "Eq - PMS", "Stringatrice", "Module Id",
-        "Checkin - PMS", "Checkout - PMS", "Esito", "Tempo Ciclo"
-    ] + [f"Stringa {i}" for i in range(1, 13)]
-
-    all_rows = []
-    grey_cells = []
-
-    for prod in productions:
-        obj = objects_by_id.get(prod.get("object_id"))
-        if not obj:
-            continue
-
-        id_modulo = obj.get("id_modulo")
-        if not id_modulo:
-            continue
-
-        production_id = prod.get("id")
-        start_time = prod.get("start_time")
-        end_time = prod.get("end_time")
-        cycle_time_obj = prod.get("cycle_time")
-        cycle_time_str = str(cycle_time_obj or "")
-
-        cycle_seconds = None
-        if cycle_time_obj:
-            try:
-                h, m, s = map(float, str(cycle_time_obj).split(":"))
-                cycle_seconds = h * 3600 + m * 60 + s
-            except Exception:
-                pass
-
-        esito = map_esito(prod.get("esito"), prod.get("station_id"), cycle_seconds, min_cycle_threshold)
-
-        station = stations_by_id.get(prod.get("station_id"))
-        is_rework = (station.get("type") == "rework") if station else False
-
-        station_name = station.get("name", "Unknown") if station else "Unknown"
-
-        if station:
-            line_name = lines_by_id.get(station.get("line_id"), {}).get("display_name", "Unknown")
-            line_name = line_name.removeprefix("Linea ")
-        else:
-            line_name = "Unknown"
-
-        station_name = f"{station_name}{line_name}"
-
-
-        last_station_id = prod.get("last_station_id")
-        last_station_name = (
-            stations_by_id.get(last_station_id, {}).get("name", "N/A")
-            if last_station_id
-            else "N/A"
-        )
-        last_station_name = f"{last_station_name}{line_name}"
-
-        prod_defects = [
-            d for d in object_defects
-            if d.get("production_id") == production_id and d.get("category") == "Bad Soldering"
-        ]
-        fallback_qg_defects = []
-        if not prod_defects and is_rework:
-            fallback_qg_defects = [
-                d for d in qg_defects_by_modulo.get(id_modulo, [])
-                if d.get("category") == "Bad Soldering"
-            ]
-
-        if not prod_defects and not fallback_qg_defects:
-            continue
-
-        found_stringa = {}
-        for d in fallback_qg_defects:
-            idx = d.get("stringa")
-            if isinstance(idx, int) and 1 <= idx <= 12:
-                found_stringa[idx] = "QG"
-        for d in prod_defects:
-            idx = d.get("stringa")
-            if isinstance(idx, int) and 1 <= idx <= 12:
-                found_stringa[idx] = "CURRENT"
-
-        row = {
-            "Line": line_name,
-            "Eq - PMS": station_name,
-            "Stringatrice": last_station_name,
-            "Module Id": id_modulo,
-            "Checkin - PMS": start_time,
-            "Checkout - PMS": end_time,
-            "Esito": esito,
-            "Tempo Ciclo": cycle_time_str
-        }
-
-        for i in range(1, 13):
-            if found_stringa.get(i):
-                row[f"Stringa {i}"] = "NG"
-                if found_stringa[i] == "QG":
-                    grey_cells.append((len(all_rows) + 2, f"Stringa {i}"))  # +2 accounts for header row
-            else:
-                row[f"Stringa {i}"] = ""
-
-        all_rows.append(row)
-        rows_written += 1
-
-    if rows_written > 0:
-        df = pd.DataFrame(all_rows, columns=header)
-        _append_dataframe(
-            ws,
-            df,
-            zebra_key="Module Id",
-            progress=progress,
-            align_center_for=set(header),
-            grey_cells=set(grey_cells),
-        )
-
-        return True
-
-    return False
-
-def ng_celle_rotte_sheet(ws, data: dict, progress=None) -> bool:
-    """
-    Generate the 'NG Celle Rotte' sheet using pre-fetched data.
-    Includes QG defects shown in ReWork step with gray background.
-    """
-    rows_written = 0
-    objects = data.get("objects", [])
-    productions = data.get("productions", [])
-    stations = data.get("stations", [])
-    production_lines = data.get("production_lines", [])
-    object_defects = data.get("object_defects", [])
-    min_cycle_threshold = data.get("min_cycle_threshold", 3.0)
-
-    objects_by_id = {obj["id"]: obj for obj in objects}
-    stations_by_id = {station["id"]: station for station in stations}
-    lines_by_id = {line["id"]: line for line in production_lines}
-    productions_by_id = {p["id"]: p for p in productions}
-    station_type_by_prod = {
-        p["id"]: stations_by_id.get(p["station_id"], {}).get("type") for p in productions
-    }
-
-    # Group QG defects by id_modulo
-    qg_defects_by_modulo = {}
-    for defect in object_defects:
-        prod_id = defect.get("production_id")
-        if not prod_id or station_type_by_prod.get(prod_id) != "qc":
-            continue
-        prod = productions_by_id.get(prod_id)
-        obj = objects_by_id.get(prod["object_id"]) if prod else None
-        if obj:
-            qg_defects_by_modulo.setdefault(obj["id_modulo"], []).append(defect)
-
-    header = [
-        "Line", "Eq - PMS", "Stringatrice", "Module Id",
-        "Checkin - PMS", "Checkout - PMS", "Esito", "Tempo Ciclo"
-    ] + [f"Stringa {i}" for i in range(1, 13)]
-
-    all_rows = []
-    grey_cells = []
-
-    for prod in productions:
-        obj = objects_by_id.get(prod.get("object_id"))
-        if not obj:
-            continue
-
-        id_modulo = obj.get("id_modulo")
-        if not id_modulo:
-            continue
-
-        production_id = prod.get("id")
-        start_time = prod.get("start_time")
-        end_time = prod.get("end_time")
-        cycle_time_obj = prod.get("cycle_time")
-        cycle_time_str = str(cycle_time_obj or "")
-
-        cycle_seconds = None
-        if cycle_time_obj:
-            try:
-                h, m, s = map(float, str(cycle_time_obj).split(":"))
-                cycle_seconds = h * 3600 + m * 60 + s
-            except Exception:
-                pass
-
-        esito = map_esito(prod.get("esito"), prod.get("station_id"), cycle_seconds, min_cycle_threshold)
-
-        station = stations_by_id.get(prod.get("station_id"))
-        is_rework = (station.get("type") == "rework") if station else False
-
-        station_name = station.get("name", "Unknown") if station else "Unknown"
-
-        if station:
-            line_name = lines_by_id.get(station.get("line_id"), {}).get("display_name", "Unknown")
-            line_name = line_name.removeprefix("Linea ")
-        else:
-            line_name = "Unknown"
-
-        station_name = f"{station_name}{line_name}"
-
-
-        last_station_id = prod.get("last_station_id")
-        last_station_name = (
-            stations_by_id.get(last_station_id, {}).get("name", "N/A")
-            if last_station_id
-            else "N/A"
-        )
-        last_station_name = f"{last_station_name}{line_name}"
-
-        prod_defects = [
-            d for d in object_defects
-            if d.get("production_id") == production_id and d.get("category") == "Celle Rotte"
-        ]
-        fallback_qg_defects = []
-        if not prod_defects and is_rework:
-            fallback_qg_defects = [
-                d for d in qg_defects_by_modulo.get(id_modulo, [])
-                if d.get("category") == "Celle Rotte"
-            ]
-
-        if not prod_defects and not fallback_qg_defects:
-            continue
-
-        found_stringa = {}
-        for d in fallback_qg_defects:
-            idx = d.get("stringa")
-            if isinstance(idx, int) and 1 <= idx <= 12:
-                found_stringa[idx] = "QG"
-        for d in prod_defects:
-            idx = d.get("stringa")
-            if isinstance(idx, int) and 1 <= idx <= 12:
-                found_stringa[idx] = "CURRENT"
-
-        row = {
-            "Line": line_name,
-            "Eq - PMS": station_name,
-            "Stringatrice": last_station_name,
-            "Module Id": id_modulo,
-            "Checkin - PMS": start_time,
-            "Checkout - PMS": end_time,
-            "Esito": esito,
-            "Tempo Ciclo": cycle_time_str
-        }
-
-        for i in range(1, 13):
-            if found_stringa.get(i):
-                row[f"Stringa {i}"] = "NG"
-                if found_stringa[i] == "QG":
-                    grey_cells.append((len(all_rows) + 2, f"Stringa {i}"))  # +2 = header + 1-based row
-            else:
-                row[f"Stringa {i}"] = ""
-
-        all_rows.append(row)
-        rows_written += 1
-
-    if rows_written > 0:
-        df = pd.DataFrame(all_rows, columns=header)
-        _append_dataframe(
-            ws,
-            df,
-            zebra_key="Module Id",
-            progress=progress,
-            align_center_for=set(header),
-            grey_cells=set(grey_cells),
-        )
+def ng_macchie_eca_sheet(ws, data: dict, progress=None) -> bool:
+    """
+    Generate the 'NG Macchie ECA' sheet using pre-fetched data.
+    Includes ReWork productions and marks inherited QG defects in gray.
+    """
+    return _ng_stringa_sheet(ws, data, "Macchie ECA", progress=progress)
 
-        return True
+def ng_bad_soldering_sheet(ws, data: dict, progress=None) -> bool:
+    """
+    Generate the 'NG Bad Soldering' sheet using pre-fetched data.
+    Includes ReWork productions and marks inherited QG defects in gray.
+    """
+    return _ng_stringa_sheet(ws, data, "Bad Soldering", progress=progress)
 
-    return False
+def ng_celle_rotte_sheet(ws, data: dict, progress=None) -> bool:
+    """
+    Generate the 'NG Celle Rotte' sheet using pre-fetched data.
+    Includes QG defects shown in ReWork step with gray background.
+    """
+    return _ng_stringa_sheet(ws, data, "Celle Rotte", progress=progress)
 
 def ng_lunghezza_string_ribbon_sheet(ws, data: dict, progress=None) -> bool:
-    rows_written = 0
-    objects = data.get("objects", [])
-    productions = data.get("productions", [])
-    stations = data.get("stations", [])
-    production_lines = data.get("production_lines", [])
-    object_defects = data.get("object_defects", [])
-    min_cycle_threshold = data.get("min_cycle_threshold", 3.0)
-
-    objects_by_id = {obj["id"]: obj for obj in objects}
-    stations_by_id = {station["id"]: station for station in stations}
-    lines_by_id = {line["id"]: line for line in production_lines}
-    productions_by_id = {p["id"]: p for p in productions}
-    station_type_by_prod = {
-        p["id"]: stations_by_id.get(p["station_id"], {}).get("type") for p in productions
-    }
-
-    # Group QG defects by id_modulo
-    qg_defects_by_modulo = {}
-    for defect in object_defects:
-        prod_id = defect.get("production_id")
-        if not prod_id or station_type_by_prod.get(prod_id) != "qc":
-            continue
-        prod = productions_by_id.get(prod_id)
-        obj = objects_by_id.get(prod["object_id"]) if prod else None
-        if obj:
-            qg_defects_by_modulo.setdefault(obj["id_modulo"], []).append(defect)
-
-    header = [
-        "Line", "Eq - PMS", "Stringatrice", "Module Id",
-        "Checkin - PMS", "Checkout - PMS", "Esito", "Tempo Ciclo"
-    ] + [f"Stringa {i}" for i in range(1, 13)]
-
-    all_rows = []
-    grey_cells = []
-
-    for prod in productions:
-        obj = objects_by_id.get(prod.get("object_id"))
-        if not obj:
-            continue
-
-        id_modulo = obj.get("id_modulo")
-        if not id_modulo:
-            continue
-
-        production_id = prod.get("id")
-        start_time = prod.get("start_time")
-        end_time = prod.get("end_time")
-        cycle_time_obj = prod.get("cycle_time")
-        cycle_time_str = str(cycle_time_obj or "")
-
-        # Convert cycle time
-        cycle_seconds = None
-        if cycle_time_obj:
-            try:
-                h, m, s = map(float, str(cycle_time_obj).split(":"))
-                cycle_seconds = h * 3600 + m * 60 + s
-            except Exception:
-                pass
-
-        esito = map_esito(prod.get("esito"), prod.get("station_id"), cycle_seconds, min_cycle_threshold)
-
-        station = stations_by_id.get(prod.get("station_id"))
-        is_rework = (station.get("type") == "rework") if station else False
-
-        station_name = station.get("name", "Unknown") if station else "Unknown"
-
-        if station:
-            line_name = lines_by_id.get(station.get("line_id"), {}).get("display_name", "Unknown")
-            line_name = line_name.removeprefix("Linea ")
-        else:
-            line_name = "Unknown"
-
-        station_name = f"{station_name}{line_name}"
-
-
-        last_station_id = prod.get("last_station_id")
-        last_station_name = (
-            stations_by_id.get(last_station_id, {}).get("name", "N/A")
-            if last_station_id
-            else "N/A"
-        )
-        last_station_name = f"{last_station_name}{line_name}"
-
-        prod_defects = [
-            d for d in object_defects
-            if d.get("production_id") == production_id and d.get("category") == "Lunghezza String Ribbon"
-        ]
-        fallback_qg_defects = []
-        if not prod_defects and is_rework:
-            fallback_qg_defects = [
-                d for d in qg_defects_by_modulo.get(id_modulo, [])
-                if d.get("category") == "Lunghezza String Ribbon"
-            ]
-
-        if not prod_defects and not fallback_qg_defects:
-            continue
-
-        found_stringa = {}
-        for d in fallback_qg_defects:
-            idx = d.get("stringa")
-            if isinstance(idx, int) and 1 <= idx <= 12:
-                found_stringa[idx] = "QG"
-        for d in prod_defects:
-            idx = d.get("stringa")
-            if isinstance(idx, int) and 1 <= idx <= 12:
-                found_stringa[idx] = "CURRENT"
-
-        row = {
-            "Line": line_name,
-            "Eq - PMS": station_name,
-            "Stringatrice": last_station_name,
-            "Module Id": id_modulo,
-            "Checkin - PMS": start_time,
-            "Checkout - PMS": end_time,
-            "Esito": esito,
-            "Tempo Ciclo": cycle_time_str,
-        }
-
-        for i in range(1, 13):
-            if found_stringa.get(i):
-                row[f"Stringa {i}"] = "NG"
-                if found_stringa[i] == "QG":
-                    grey_cells.append((len(all_rows) + 2, f"Stringa {i}"))
-            else:
-                row[f"Stringa {i}"] = ""
-
-        all_rows.append(row)
-        rows_written += 1
-
-    if rows_written > 0:
-        df = pd.DataFrame(all_rows, columns=header)
-        _append_dataframe(
-            ws,
-            df,
-            zebra_key="Module Id",
-            progress=progress,
-            align_center_for=set(header),
-            grey_cells=set(grey_cells),
-        )
-
-        return True
-    return False
+    return _ng_stringa_sheet(ws, data, "Lunghezza String Ribbon", progress=progress)
 
 def ng_graffio_su_cella_sheet(ws, data: dict, progress=None) -> bool:
-    rows_written = 0
-    objects = data.get("objects", [])
-    productions = data.get("productions", [])
-    stations = data.get("stations", [])
-    production_lines = data.get("production_lines", [])
-    object_defects = data.get("object_defects", [])
-    min_cycle_threshold = data.get("min_cycle_threshold", 3.0)
-
-    objects_by_id = {obj["id"]: obj for obj in objects}
-    stations_by_id = {station["id"]: station for station in stations}
-    lines_by_id = {line["id"]: line for line in production_lines}
-    productions_by_id = {p["id"]: p for p in productions}
-
-    station_type_by_prod = {
-        p["id"]: stations_by_id.get(p["station_id"], {}).get("type")
-        for p in productions
-    }
-
-    # id_modulo → QG defects
-    qg_defects_by_modulo = {}
-    for defect in object_defects:
-        prod_id = defect.get("production_id")
-        if not prod_id or station_type_by_prod.get(prod_id) != "qc":
-            continue
-        prod = productions_by_id.get(prod_id)
-        obj = objects_by_id.get(prod["object_id"]) if prod else None
-        if obj:
-            qg_defects_by_modulo.setdefault(obj["id_modulo"], []).append(defect)
-
-    header = [
-        "Line", "Eq - PMS", "Stringatrice", "Module Id",
-        "Checkin - PMS", "Checkout - PMS", "Esito", "Tempo Ciclo"
-    ] + [f"Stringa {i}" for i in range(1, 13)]
-
-    rows = []
-    grey_cells = []  # List of (row_index, column_name)
-
-    for prod in productions:
-        obj = objects_by_id.get(prod.get("object_id"))
-        if not obj:
-            continue
-        id_modulo = obj.get("id_modulo")
-        if not id_modulo:
-            continue
-
-        production_id = prod.get("id")
-        start_time = prod.get("start_time")
-        end_time = prod.get("end_time")
-        cycle_time_obj = prod.get("cycle_time")
-        cycle_time_str = str(cycle_time_obj or "")
-        cycle_seconds = None
-        if cycle_time_obj:
-            try:
-                h, m, s = map(float, str(cycle_time_obj).split(":"))
-                cycle_seconds = h * 3600 + m * 60 + s
-            except Exception:
-                pass
-        esito = map_esito(prod.get("esito"), prod.get("station_id"), cycle_seconds, min_cycle_threshold)
-
-        station = stations_by_id.get(prod.get("station_id"))
-        is_rework = (station.get("type") == "rework") if station else False
-
-        station_name = station.get("name", "Unknown") if station else "Unknown"
-
-        if station:
-            line_name = lines_by_id.get(station.get("line_id"), {}).get("display_name", "Unknown")
-            line_name = line_name.removeprefix("Linea ")
-        else:
-            line_name = "Unknown"
-
-        station_name = f"{station_name}{line_name}"
-
-
-        last_station_id = prod.get("last_station_id")
-        last_station_name = (
-            stations_by_id.get(last_station_id, {}).get("name", "N/A")
-            if last_station_id
-            else "N/A"
-        )
-        last_station_name = f"{last_station_name}{line_name}"
-
-        prod_defects = [
-            d for d in object_defects
-            if d.get("production_id") == production_id and d.get("category") == "Graffio su Cella"
-        ]
-
-        fallback_qg_defects = []
-        if is_rework and not prod_defects:
-            fallback_qg_defects = [
-                d for d in qg_defects_by_modulo.get(id_modulo, [])
-                if d.get("category") == "Graffio su Cella"
-            ]
-
-        if not prod_defects and not fallback_qg_defects:
-            continue
+    # Stringa may come in as text here
+    return _ng_stringa_sheet(ws, data, "Graffio su Cella", progress=progress, parse_stringa=True)
 
-        # Map of stringa → origin
-        stringa_origin = {}
-        for d in fallback_qg_defects:
-            try:
-                i = int(d.get("stringa"))
-                if 1 <= i <= 12:
-                    stringa_origin[i] = "QG"
-            except: continue
-        for d in prod_defects:
-            try:
-                i = int(d.get("stringa"))
-                if 1 <= i <= 12:
-                    stringa_origin[i] = "CURRENT"
-            except: continue
+def ng_altro_sheet(ws, data: dict, progress=None) -> bool:
+    ds = export_dataset(data)
 
-        row = {
-            "Line": line_name,
-            "Eq - PMS": station_name,
-            "Stringatrice": last_station_name,
-            "Module Id": id_modulo,
-            "Checkin - PMS": start_time,
-            "Checkout - PMS": end_time,
-            "Esito": esito,
-            "Tempo Ciclo": cycle_time_str,
-        }
-        for i in range(1, 13):
-            label = f"Stringa {i}"
-            if i in stringa_origin:
-                row[label] = "NG"
-                if stringa_origin[i] == "QG":
-                    grey_cells.append((len(rows) + 2, label))  # +2 for Excel row offset (header + 1-based)
-            else:
-                row[label] = ""
+    def _description(d):
+        desc = d["extra_data"].astype(str).str.strip()
+        return desc.where(d["extra_data"].notna() & desc.ne(""))
 
-        rows.append(row)
+    # One column per "Altro" description found in the export (given upfront when streamed)
+    descriptions = data.get("altro_descriptions")
+    if descriptions is None:
+        altro = ds.defect_frame[ds.defect_frame["category"] == "Altro"]
+        descriptions = sorted(_description(altro).dropna().unique())
+    header = HEAD_COLUMNS + descriptions
 
-    if not rows:
+    result = _defect_matrix(ds, "Altro", descriptions, slot=_description)
+    if result is None:
         return False
 
-    # Zebra append with grey highlighting
+    df, grey_cells = result
     _append_dataframe(
         ws,
-        pd.DataFrame(rows, columns=header),
+        df,
         zebra_key="Module Id",
         progress=progress,
         align_center_for=set(header),
-        grey_cells=set(grey_cells),
+        grey_cells=grey_cells,
     )
-
     return True
 
-def ng_altro_sheet(ws, data: dict, progress=None) -> bool:
-    rows_written = 0
-    objects = data.get("objects", [])
-    productions = data.get("productions", [])
-    stations = data.get("stations", [])
-    production_lines = data.get("production_lines", [])
-    object_defects = data.get("object_defects", [])
-    min_cycle_threshold = data.get("min_cycle_threshold", 3.0)
-
-    objects_by_id = {obj["id"]: obj for obj in objects}
-    stations_by_id = {station["id"]: station for station in stations}
-    lines_by_id = {line["id"]: line for line in production_lines}
-    productions_by_id = {p["id"]: p for p in productions}
-    station_type_by_prod = {
-        p["id"]: stations_by_id.get(p["station_id"], {}).get("type") for p in productions
-    }
-
-    # Step 1: gather all unique "Altro" extra_data values
-    unique_altro_descriptions = sorted({
-        d.get("extra_data", "").strip()
-        for d in object_defects
-        if d.get("category") == "Altro" and d.get("extra_data")
-    })
-
-    # Step 2: QG defects by id_modulo
-    qg_defects_by_modulo = {}
-    for defect in object_defects:
-        prod_id = defect.get("production_id")
-        if not prod_id or station_type_by_prod.get(prod_id) != "qc":
-            continue
-        prod = productions_by_id.get(prod_id)
-        obj = objects_by_id.get(prod["object_id"]) if prod else None
-        if obj:
-            qg_defects_by_modulo.setdefault(obj["id_modulo"], []).append(defect)
-
-    # Step 3: Build rows and track grey cells
-    header = [
-        "Line", "Eq - PMS", "Stringatrice", "Module Id",
-        "Checkin - PMS", "Checkout - PMS", "Esito", "Tempo Ciclo"
-    ] + unique_altro_descriptions
-
-    all_rows = []
-    grey_cells = []
-
-    for prod in productions:
-        obj = objects_by_id.get(prod.get("object_id"))
-        if not obj:
-            continue
-
-        id_modulo = obj.get("id_modulo")
-        if not id_modulo:
-            continue
-
-        production_id = prod.get("id")
-        start_time = prod.get("start_time")
-        end_time = prod.get("end_time")
-        cycle_time_obj = prod.get("cycle_time")
-        cycle_time_str = str(cycle_time_obj or "")
-
-        cycle_seconds = None
-        if cycle_time_obj:
-            try:
-                h, m, s = map(float, str(cycle_time_obj).split(":"))
-                cycle_seconds = h * 3600 + m * 60 + s
-            except Exception:
-                pass
-
-        esito = map_esito(prod.get("esito"), prod.get("station_id"), cycle_seconds, min_cycle_threshold)
-
-        station = stations_by_id.get(prod.get("station_id"))
-        is_rework = (station.get("type") == "rework") if station else False
-
-        station_name = station.get("name", "Unknown") if station else "Unknown"
-
-        if station:
-            line_name = lines_by_id.get(station.get("line_id"), {}).get("display_name", "Unknown")
-            line_name = line_name.removeprefix("Linea ")
-        else:
-            line_name = "Unknown"
-
-        station_name = f"{station_name}{line_name}"
-
-
-        last_station_id = prod.get("last_station_id")
-        last_station_name = (
-            stations_by_id.get(last_station_id, {}).get("name", "N/A")
-            if last_station_id
-            else "N/A"
-        )
-        last_station_name = f"{last_station_name}{line_name}"
-
-        # Fetch ReWork defects first
-        prod_defects = [
-            d for d in object_defects
-            if d.get("production_id") == production_id and d.get("category") == "Altro"
-        ]
-        # Fallback to QG if ReWork has none
-        fallback_qg_defects = []
-        if not prod_defects and is_rework:
-            fallback_qg_defects = [
-                d for d in qg_defects_by_modulo.get(id_modulo, [])
-                if d.get("category") == "Altro"
-            ]
-
-        if not prod_defects and not fallback_qg_defects:
-            continue
-
-        row = {
-            "Line": line_name,
-            "Eq - PMS": station_name,
-            "Stringatrice": last_station_name,
-            "Module Id": id_modulo,
-            "Checkin - PMS": start_time,
-            "Checkout - PMS": end_time,
-            "Esito": esito,
-            "Tempo Ciclo": cycle_time_str,
-        }
-
-        # Track which fields are QG
-        found_descriptions = {}
-        for d in fallback_qg_defects:
-            desc = d.get("extra_data", "").strip()
-            if desc:
-                found_descriptions[desc] = "QG"
-        for d in prod_defects:
-            desc = d.get("extra_data", "").strip()
-            if desc:
-                found_descriptions[desc] = "CURRENT"
-
-        for desc in unique_altro_descriptions:
-            if found_descriptions.get(desc):
-                row[desc] = "NG"
-                if found_descriptions[desc] == "QG":
-                    grey_cells.append((len(all_rows) + 2, desc))  # +2 offset for Excel
-            else:
-                row[desc] = ""
-
-        all_rows.append(row)
-        rows_written += 1
-
-    # Step 4: Export + Zebra + Grey
-    if rows_written > 0:
-        df = pd.DataFrame(all_rows, columns=header)
-        _append_dataframe(
-            ws,
-            df,
-            zebra_key="Module Id",
-            progress=progress,
-            align_center_for=set(header),
-            grey_cells=set(grey_cells),
-        )
-
-        return True
-    return False
-
 # --- Mapping sheet names to functions ---
 SHEET_FUNCTIONS = {
     "Metadata": metadata_sheet,
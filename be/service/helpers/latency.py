@@ -0,0 +1,178 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+import logging
+from threading import Lock
+import time
+
+logger = logging.getLogger(__name__)
+
+SUB_BUCKETS = 32            # buckets per power of two: ~3% relative precision
+SLOW_CYCLE_THRESHOLD = 0.800  # seconds; slower cycles log their spans at WARNING
+
+
+def _bucket(us: int) -> int:
+    if us < 2 * SUB_BUCKETS:
+        return us
+    shift = us.bit_length() - SUB_BUCKETS.bit_length()
+    return 2 * SUB_BUCKETS + (shift - 1) * SUB_BUCKETS + (us >> shift) - SUB_BUCKETS
+
+
+def _bucket_value(idx: int) -> float:
+    """Midpoint (µs) of the values falling in bucket ``idx``."""
+    if idx < 2 * SUB_BUCKETS:
+        return float(idx)
+    shift = (idx - 2 * SUB_BUCKETS) // SUB_BUCKETS + 1
+    mantissa = (idx - 2 * SUB_BUCKETS) % SUB_BUCKETS + SUB_BUCKETS
+    return ((mantissa << shift) + ((mantissa + 1) << shift)) / 2
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram: exact below 64µs, then 32 linear buckets per power
+    of two, so memory stays bounded while percentiles keep ~3% precision.
+    """
+
+    __slots__ = ("counts", "count", "total", "max", "_lock")
+
+    def __init__(self) -> None:
+        self.counts: dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = Lock()
+
+    def record(self, seconds: float) -> None:
+        idx = _bucket(max(0, int(seconds * 1_000_000)))
+        with self._lock:
+            self.counts[idx] = self.counts.get(idx, 0) + 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def percentiles(self, *quantiles: float) -> list[float]:
+        """Values (seconds) at the given quantiles (0-1)."""
+        with self._lock:
+            items = sorted(self.counts.items())
+            count = self.count
+        results = []
+        for q in quantiles:
+            target = max(1, q * count)
+            seen = 0
+            value = 0.0
+            for idx, n in items:
+                seen += n
+                if seen >= target:
+                    value = _bucket_value(idx) / 1_000_000
+                    break
+            results.append(value)
+        return results
+
+    def summary(self) -> dict:
+        p50, p95, p99 = self.percentiles(0.50, 0.95, 0.99)
+        return {
+            "count": self.count,
+            "p50_ms": round(p50 * 1000, 1),
+            "p95_ms": round(p95 * 1000, 1),
+            "p99_ms": round(p99 * 1000, 1),
+            "max_ms": round(self.max * 1000, 1),
+            "mean_ms": round(self.total / self.count * 1000, 1) if self.count else 0.0,
+        }
+
+
+class LatencyRegistry:
+    """Histograms keyed by (station, stage)."""
+
+    def __init__(self) -> None:
+        self.histograms: dict[tuple[str, str], LatencyHistogram] = {}
+        self._lock = Lock()
+
+    def record(self, station: str, stage: str, seconds: float) -> None:
+        hist = self.histograms.get((station, stage))
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault((station, stage), LatencyHistogram())
+        hist.record(seconds)
+
+    def summary(self) -> dict[str, dict[str, dict]]:
+        out: dict[str, dict[str, dict]] = {}
+        for (station, stage), hist in sorted(self.histograms.items()):
+            out.setdefault(station, {})[stage] = hist.summary()
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+
+
+class CycleTrace:
+    """
+    Spans of one station cycle, from the PLC edge to the last broadcast.
+    Stages are recorded as ``<kind>.<stage>`` in the registry; ``finish``
+    records ``<kind>.total`` and logs the whole trace once.
+    """
+
+    def __init__(self, registry: LatencyRegistry, station: str, kind: str,
+                 detected_after: float = 0.0):
+        self.registry = registry
+        self.station = station
+        self.kind = kind
+        # Edge detection delay (snapshot read -> handler) counts towards the total
+        self.t0 = time.perf_counter() - detected_after
+        self.stages: dict[str, float] = {}
+        self.finished = False
+        if detected_after:
+            self._record("detect", detected_after)
+
+    def _record(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        self.registry.record(self.station, f"{self.kind}.{stage}", seconds)
+
+    @contextmanager
+    def span(self, stage: str):
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self._record(stage, time.perf_counter() - t0)
+
+    def checkpoint(self, stage: str) -> None:
+        """Record the time elapsed since the edge, e.g. when queued work starts."""
+        self._record(stage, time.perf_counter() - self.t0)
+
+    def finish(self) -> None:
+        if self.finished:
+            return
+        self.finished = True
+        total = time.perf_counter() - self.t0
+        self._record("total", total)
+        log_fn = logger.warning if total > SLOW_CYCLE_THRESHOLD else logger.debug
+        log_fn("", extra={"json": {
+            "event": "cycle_trace",
+            "station": self.station,
+            "kind": self.kind,
+            "total_ms": round(total * 1000, 1),
+            "stages_ms": {k: round(v * 1000, 1) for k, v in self.stages.items()},
+        }})
+
+
+# Trace of the cycle being processed; copied into tasks, DB queue jobs and worker threads
+current_trace: ContextVar[CycleTrace | None] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def trace_span(stage: str):
+    """Span on the current cycle trace, a no-op outside of a traced cycle."""
+    trace = current_trace.get()
+    if trace is None:
+        yield None
+        return
+    with trace.span(stage):
+        yield trace
+
+
+def traced_task(trace: CycleTrace, coro) -> asyncio.Task:
+    """Run ``coro`` in a task whose ``current_trace`` is ``trace``."""
+    ctx = copy_context()
+    ctx.run(current_trace.set, trace)
+    return asyncio.create_task(coro, context=ctx)
@@ -0,0 +1,125 @@
+import asyncio
+from dataclasses import dataclass
+import logging
+from typing import Any
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from service.helpers.plc_decoder import StationDecoder, StationRecord
+
+logger = logging.getLogger(__name__)
+
+RISING = "rising"
+FALLING = "falling"
+CHANGED = "changed"
+
+EDGE_BITS = ("trigger", "fine_buona", "fine_scarto")
+EDGE_STRINGS = ("id_modulo",)
+
+
+@dataclass(frozen=True)
+class EdgeEvent:
+    """One change of a configured PLC field between two consecutive snapshots."""
+    station: str
+    field: str
+    kind: str                   # RISING / FALLING for bits, CHANGED for strings
+    value: Any
+    previous: Any               # None on the first snapshot of a station
+    snapshot: Any               # PLCSnapshot the edge was detected on
+    record: StationRecord
+    levels: dict                # current value of every watched bit
+
+
+class SnapshotDiffer:
+    """
+    Compares consecutive snapshots of one station. Identical buffers cost a
+    single ``bytes`` comparison; otherwise the two buffers are XOR-ed and only
+    the watched bits / string spans are tested, and the snapshot is decoded
+    just once to build the events.
+    """
+
+    def __init__(self, station: str, decoder: StationDecoder,
+                 bits: tuple[str, ...] = EDGE_BITS, strings: tuple[str, ...] = EDGE_STRINGS):
+        self.station = station
+        self.decoder = decoder
+        bit_spans = decoder.bit_spans()
+        string_spans = decoder.string_spans()
+        self._bits = [(name, *bit_spans[name]) for name in bits if name in bit_spans]
+        self._strings = [(name, *string_spans[name]) for name in strings if name in string_spans]
+        self._prev: bytes | None = None
+        self._prev_overrides: dict | None = None
+        self._levels: dict[str, bool] = {}
+        self._strings_prev: dict[str, str] = {}
+
+    def diff(self, snapshot, overrides: dict[str, bool] | None = None) -> list[EdgeEvent]:
+        """Return the edge events of ``snapshot``; ``overrides`` force bit values (debug mode)."""
+        data = snapshot.data
+        if data == self._prev and overrides == self._prev_overrides:
+            return []
+
+        first = self._prev is None or len(self._prev) != len(data)
+        size = len(data)
+        changed = 0 if first else int.from_bytes(data, "big") ^ int.from_bytes(self._prev, "big")
+
+        flipped_bits = []
+        levels = {}
+        for name, pos, mask in self._bits:
+            if overrides is not None and name in overrides:
+                value = bool(overrides[name])
+                flipped = first or value != self._levels.get(name)
+            else:
+                value = data[pos] & mask != 0
+                flipped = first or (changed >> ((size - 1 - pos) * 8)) & 0xFF & mask != 0
+            levels[name] = value
+            if flipped:
+                flipped_bits.append((name, value, None if first else self._levels.get(name)))
+
+        changed_strings = [
+            (name, pos, width) for name, pos, width in self._strings
+            if first or (changed >> ((size - pos - width) * 8)) & ((1 << (width * 8)) - 1)
+        ]
+
+        self._prev = data
+        self._prev_overrides = dict(overrides) if overrides is not None else None
+        self._levels = levels
+
+        if not flipped_bits and not changed_strings:
+            return []
+
+        record = self.decoder.decode(data)
+        events = [
+            EdgeEvent(self.station, name, RISING if value else FALLING, value, previous,
+                      snapshot, record, levels)
+            for name, value, previous in flipped_bits
+        ]
+        for name, _, _ in changed_strings:
+            value = getattr(record, name)
+            previous = self._strings_prev.get(name)
+            self._strings_prev[name] = value
+            if value != previous:
+                events.append(EdgeEvent(self.station, name, CHANGED, value, previous,
+                                        snapshot, record, levels))
+        return events
+
+
+class EdgeChannel:
+    """Asyncio fan-out of edge events: every subscriber of a station gets each batch."""
+
+    def __init__(self) -> None:
+        self._subscribers: dict[str, list[asyncio.Queue]] = {}
+
+    def subscribe(self, station: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(station, []).append(queue)
+        return queue
+
+    def unsubscribe(self, station: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(station, [])
+        if queue in queues:
+            queues.remove(queue)
+
+    def publish(self, station: str, events: list[EdgeEvent]) -> None:
+        for queue in self._subscribers.get(station, []):
+            queue.put_nowait(events)
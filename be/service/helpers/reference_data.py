@@ -0,0 +1,149 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import logging
+from threading import Lock
+import time
+
+logger = logging.getLogger(__name__)
+
+OBJECT_CACHE_SIZE = 20_000      # id_modulo -> objects.id entries kept in memory
+RELOAD_ON_MISS_INTERVAL = 30.0  # seconds; a missing station reloads the tables at most this often
+
+
+@dataclass(frozen=True)
+class Line:
+    id: int
+    name: str
+    display_name: str | None
+
+
+@dataclass(frozen=True)
+class Station:
+    id: int
+    line_id: int
+    line_name: str | None
+    name: str
+    display_name: str | None
+    type: str | None
+
+
+class ReferenceData:
+    """
+    In-process copy of the small, mostly static tables the production hot
+    path keeps looking up: production_lines, stations and defects, plus a
+    bounded LRU of ``id_modulo -> objects.id``.
+
+    Tables are loaded with ``load(conn)`` (at startup, from
+    ``load_channels_from_db``) and reloaded lazily by ``ensure(conn)`` after
+    ``invalidate()``. Lookups are lock-free reads of dicts that ``load``
+    swaps in whole, so worker threads can use them concurrently.
+    """
+
+    def __init__(self, object_cache_size: int = OBJECT_CACHE_SIZE):
+        self.lines: dict[int, Line] = {}
+        self.lines_by_name: dict[str, Line] = {}
+        self.stations: dict[int, Station] = {}
+        self.stations_by_name: dict[tuple[str, str], Station] = {}
+        self.defect_categories: dict[str, int] = {}
+        self.loaded = False
+        self.loaded_at = 0.0
+        self._stale = True
+        self._load_lock = Lock()
+        self._objects: OrderedDict[str, int] = OrderedDict()
+        self._objects_lock = Lock()
+        self.object_cache_size = object_cache_size
+        # Counters exposed on /metrics
+        self.object_hits = 0
+        self.object_misses = 0
+        self.reloads = 0
+
+    # ---- tables ----------------------------------------------------------
+
+    def load(self, conn) -> None:
+        with self._load_lock:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT id, name, display_name FROM production_lines")
+                lines = {r["id"]: Line(r["id"], r["name"], r["display_name"]) for r in cursor.fetchall()}
+                cursor.execute("SELECT id, line_id, name, display_name, type FROM stations")
+                stations = {
+                    r["id"]: Station(
+                        r["id"], r["line_id"],
+                        lines[r["line_id"]].name if r["line_id"] in lines else None,
+                        r["name"], r["display_name"], r["type"],
+                    )
+                    for r in cursor.fetchall()
+                }
+                cursor.execute("SELECT id, category FROM defects")
+                defect_categories = {r["category"]: r["id"] for r in cursor.fetchall()}
+
+            self.lines = lines
+            self.lines_by_name = {line.name: line for line in lines.values()}
+            self.stations = stations
+            self.stations_by_name = {(s.line_name, s.name): s for s in stations.values()}
+            self.defect_categories = defect_categories
+            self.loaded = True
+            self.loaded_at = time.monotonic()
+            self._stale = False
+            self.reloads += 1
+        logger.debug(f"Reference data loaded: {len(lines)} lines, {len(stations)} stations, "
+                     f"{len(defect_categories)} defect categories")
+
+    def invalidate(self) -> None:
+        """Reload the tables on the next ``ensure``; the object LRU is kept (ids never change)."""
+        self._stale = True
+
+    def ensure(self, conn) -> "ReferenceData":
+        if self._stale:
+            self.load(conn)
+        return self
+
+    def line_name(self, line_id: int) -> str | None:
+        line = self.lines.get(line_id)
+        return line.name if line else None
+
+    def station(self, conn, line_name: str, station_name: str) -> Station | None:
+        """Station by (line, name); an unknown one reloads the tables (rate limited) before giving up."""
+        self.ensure(conn)
+        station = self.stations_by_name.get((line_name, station_name))
+        if station is None and time.monotonic() - self.loaded_at > RELOAD_ON_MISS_INTERVAL:
+            self.load(conn)
+            station = self.stations_by_name.get((line_name, station_name))
+        return station
+
+    # ---- objects LRU -----------------------------------------------------
+
+    def object_id(self, id_modulo: str) -> int | None:
+        with self._objects_lock:
+            object_id = self._objects.get(id_modulo)
+            if object_id is None:
+                self.object_misses += 1
+                return None
+            self._objects.move_to_end(id_modulo)
+            self.object_hits += 1
+            return object_id
+
+    def remember_object(self, id_modulo: str, object_id: int) -> None:
+        with self._objects_lock:
+            self._objects[id_modulo] = object_id
+            self._objects.move_to_end(id_modulo)
+            while len(self._objects) > self.object_cache_size:
+                self._objects.popitem(last=False)
+
+    def forget_objects(self) -> None:
+        with self._objects_lock:
+            self._objects.clear()
+
+    @property
+    def object_cache_len(self) -> int:
+        return len(self._objects)
+
+    def resolve_object_id(self, cursor, id_modulo: str) -> int | None:
+        """objects.id of an existing ``id_modulo``, from the LRU or the DB."""
+        object_id = self.object_id(id_modulo)
+        if object_id is None:
+            cursor.execute("SELECT id FROM objects WHERE id_modulo = %s", (id_modulo,))
+            row = cursor.fetchone()
+            if row:
+                object_id = row["id"]
+                self.remember_object(id_modulo, object_id)
+        return object_id
@@ -0,0 +1,366 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import logging
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+# Rows of a (object, station) pair feed three rollups:
+#   all    every ended production            (graph_data)
+#   first  the earliest one, i.e. first pass  (count_unique_objects_r0)
+#   latest the most recent one                (count_unique_objects, productions_summary)
+KIND_ALL, KIND_FIRST, KIND_LATEST = "all", "first", "latest"
+GOOD_ESITI = (1, 5, 7)
+NG_ESITO = 6
+NO_ESITO = -1   # productions.esito NULL, stored as -1 since it is part of the key
+
+ROLLUP_TABLE = "production_rollup_hourly"
+ROLLUP_TABLE_DDL = f"""
+    CREATE TABLE IF NOT EXISTS `{ROLLUP_TABLE}` (
+      `station_id` int NOT NULL,
+      `bucket` datetime NOT NULL,
+      `kind` enum('all','first','latest') NOT NULL,
+      `esito` int NOT NULL,
+      `n` int NOT NULL DEFAULT '0',
+      `cycle_seconds` bigint NOT NULL DEFAULT '0',
+      `cycle_n` int NOT NULL DEFAULT '0',
+      PRIMARY KEY (`station_id`,`bucket`,`kind`,`esito`),
+      KEY `idx_rollup_bucket` (`bucket`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
+"""
+
+_UPSERT = f"""
+    INSERT INTO {ROLLUP_TABLE} (station_id, bucket, kind, esito, n, cycle_seconds, cycle_n)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        n = n + VALUES(n),
+        cycle_seconds = cycle_seconds + VALUES(cycle_seconds),
+        cycle_n = cycle_n + VALUES(cycle_n)
+"""
+
+_INSERT = f"""
+    INSERT INTO {ROLLUP_TABLE} (station_id, bucket, kind, esito, n, cycle_seconds, cycle_n)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Per-production first / latest flags, aggregated per (station, hour, esito)
+_REBUILD_SELECT = """
+    SELECT
+        f.station_id,
+        f.bucket,
+        f.esito,
+        COUNT(*)                                  AS all_n,
+        COALESCE(SUM(f.cs), 0)                    AS all_cs,
+        COUNT(f.cs)                               AS all_cn,
+        SUM(f.is_first)                           AS first_n,
+        COALESCE(SUM(IF(f.is_first, f.cs, 0)), 0) AS first_cs,
+        SUM(f.is_first AND f.cs IS NOT NULL)      AS first_cn,
+        SUM(f.is_latest)                          AS latest_n,
+        COALESCE(SUM(IF(f.is_latest, f.cs, 0)), 0) AS latest_cs,
+        SUM(f.is_latest AND f.cs IS NOT NULL)     AS latest_cn
+    FROM (
+        SELECT
+            p.station_id,
+            DATE_FORMAT(p.end_time, '%%Y-%%m-%%d %%H:00:00') AS bucket,
+            COALESCE(p.esito, -1) AS esito,
+            TIME_TO_SEC(p.cycle_time) AS cs,
+            NOT EXISTS (
+                SELECT 1 FROM productions p2
+                WHERE p2.object_id = p.object_id AND p2.station_id = p.station_id
+                  AND (p2.end_time < p.end_time OR (p2.end_time = p.end_time AND p2.id < p.id))
+            ) AS is_first,
+            NOT EXISTS (
+                SELECT 1 FROM productions p2
+                WHERE p2.object_id = p.object_id AND p2.station_id = p.station_id
+                  AND (p2.end_time > p.end_time OR (p2.end_time = p.end_time AND p2.id > p.id))
+            ) AS is_latest
+        FROM productions p
+        WHERE p.end_time >= %s AND p.end_time < %s
+    ) f
+    GROUP BY f.station_id, f.bucket, f.esito
+"""
+
+
+def hour_floor(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def window_buckets(start: datetime, end: datetime, now: datetime | None = None) -> tuple[datetime, datetime] | None:
+    """
+    ``[first, last)`` hour buckets equivalent to ``end_time BETWEEN start AND
+    end``, or None when the window does not fall on hour boundaries. An end
+    in the future (an open shift) reads up to the current hour.
+    """
+    if start != hour_floor(start):
+        return None
+    if end == hour_floor(end):
+        return start, end
+    if (end.minute, end.second) == (59, 59):
+        return start, hour_floor(end) + timedelta(hours=1)
+    if end >= (now or datetime.now()):
+        return start, hour_floor(end) + timedelta(hours=1)
+    return None
+
+
+def esito_matches(esito: int, esito_filter: str | None) -> bool:
+    if esito_filter == "good":
+        return esito in GOOD_ESITI
+    if esito_filter == "ng":
+        return esito == NG_ESITO
+    return True
+
+
+def _contributions(rows) -> dict[tuple, list[int]]:
+    """{(station_id, bucket, kind, esito): [n, cycle_seconds, cycle_n]} of ended productions."""
+    by_key = defaultdict(list)
+    for r in rows:
+        by_key[(r["object_id"], r["station_id"])].append(r)
+
+    totals: dict[tuple, list[int]] = defaultdict(lambda: [0, 0, 0])
+
+    def add(r, kind):
+        cs = r["cycle_seconds"]
+        entry = totals[(r["station_id"], hour_floor(r["end_time"]), kind,
+                        NO_ESITO if r["esito"] is None else r["esito"])]
+        entry[0] += 1
+        if cs is not None:
+            entry[1] += int(cs)
+            entry[2] += 1
+
+    for key_rows in by_key.values():
+        key_rows.sort(key=lambda r: (r["end_time"], r["id"]))
+        for r in key_rows:
+            add(r, KIND_ALL)
+        add(key_rows[0], KIND_FIRST)
+        add(key_rows[-1], KIND_LATEST)
+    return totals
+
+
+# Single pass over productions: every production of the objects seen at the
+# stations in the range, ranked per (object, station) both ways, then counted
+# per hour for the rows that are first / latest of their pair
+_UNIQUE_COUNTS_SQL = """
+    WITH scoped AS (
+        SELECT p.id, p.object_id, p.station_id, p.end_time, p.esito
+        FROM productions p
+        WHERE p.station_id IN ({stations})
+          AND p.end_time IS NOT NULL
+          AND p.object_id IN (
+              SELECT DISTINCT p1.object_id FROM productions p1
+              WHERE p1.station_id IN ({stations})
+                AND p1.end_time >= %s AND p1.end_time < %s
+          )
+    ),
+    ranked AS (
+        SELECT
+            station_id, end_time, esito,
+            ROW_NUMBER() OVER (PARTITION BY object_id, station_id ORDER BY end_time, id)           AS rn_first,
+            ROW_NUMBER() OVER (PARTITION BY object_id, station_id ORDER BY end_time DESC, id DESC) AS rn_latest
+        FROM scoped
+    )
+    SELECT
+        s.name AS station_name,
+        DATE_FORMAT(r.end_time, '%%Y-%%m-%%d %%H:00:00') AS bucket,
+        COALESCE(r.esito, -1) AS esito,
+        SUM(r.rn_first = 1)  AS first_n,
+        SUM(r.rn_latest = 1) AS latest_n
+    FROM ranked r
+    JOIN stations s ON s.id = r.station_id
+    WHERE r.end_time >= %s AND r.end_time < %s
+    GROUP BY s.name, bucket, COALESCE(r.esito, -1)
+"""
+
+
+@dataclass
+class RollupView:
+    """Rollup rows of some stations over ``[start, end)``, loaded once and summed in memory."""
+    start: datetime
+    end: datetime
+    rows: dict[tuple, int] = field(default_factory=dict)   # (station_name, bucket, kind, esito) -> n
+    stations: frozenset = frozenset()
+
+    def count(self, station_names, start: datetime, end: datetime, kind: str,
+              esito_filter: str | None = None, now: datetime | None = None,
+              distinct_objects: bool = False) -> int | None:
+        """
+        Count for ``end_time BETWEEN start AND end``; None when the view cannot
+        answer it. The rows are per station, so distinct objects over several
+        stations (an object NG at two of them counts once) are not answered.
+        """
+        if distinct_objects and len(set(station_names)) > 1:
+            return None
+        buckets = window_buckets(start, end, now)
+        if buckets is None or buckets[0] < self.start or buckets[1] > self.end \
+                or not self.stations.issuperset(station_names):
+            return None
+        first, last = buckets
+        names = set(station_names)
+        return sum(
+            n for (name, bucket, row_kind, esito), n in self.rows.items()
+            if row_kind == kind and name in names and first <= bucket < last
+            and esito_matches(esito, esito_filter)
+        )
+
+
+def load_unique_counts(cursor, station_names, start: datetime, end: datetime) -> RollupView:
+    """
+    First-pass / latest unique-object counts of ``station_names`` for every
+    hour of ``[start, end)`` in one query, as a ``RollupView``. Same numbers
+    as the rollup table, computed from ``productions`` when it is not ready.
+    """
+    start, end = hour_floor(start), hour_floor(end)
+    names = sorted(set(station_names))
+    stations = f"SELECT id FROM stations WHERE name IN ({', '.join(['%s'] * len(names))})"
+    cursor.execute(
+        _UNIQUE_COUNTS_SQL.format(stations=stations),
+        (*names, *names, start, end, start, end),
+    )
+    rows = {}
+    for r in cursor.fetchall():
+        bucket = r["bucket"]
+        if isinstance(bucket, str):
+            bucket = datetime.fromisoformat(bucket)
+        for kind in (KIND_FIRST, KIND_LATEST):
+            n = int(r[f"{kind}_n"] or 0)
+            if n:
+                rows[(r["station_name"], bucket, kind, r["esito"])] = n
+    return RollupView(start, end, rows, frozenset(names))
+
+
+class ProductionRollup:
+    """
+    Per-station, per-hour production counts kept in ``production_rollup_hourly``.
+
+    Writers wrap their ``productions`` updates in ``track(cursor, ids)``: the
+    rollup rows of the touched (object, station) pairs are recomputed before
+    and after the update and only the difference is applied, in the same
+    transaction. ``rebuild`` recomputes a time range from ``productions``
+    (startup backfill and the periodic catch-up of ``tasks.rollup_task``).
+
+    Readers must check ``covers(start)``: hours are only trusted once the
+    backfill got past them.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.covered_from: datetime | None = None
+        self.complete = False      # backfill reached the oldest production
+        self._lock = Lock()
+        # Counters exposed on /metrics
+        self.deltas = 0
+        self.rebuilds = 0
+
+    def ensure_table(self, conn) -> None:
+        with conn.cursor() as cursor:
+            cursor.execute(ROLLUP_TABLE_DDL)
+        conn.commit()
+        self.enabled = True
+
+    def covers(self, start: datetime | None) -> bool:
+        """True when the rollup is complete from ``start`` on (None = all history)."""
+        if not self.enabled:
+            return False
+        if self.complete:
+            return True
+        return start is not None and self.covered_from is not None and start >= self.covered_from
+
+    def mark_covered(self, start: datetime, complete: bool = False) -> None:
+        with self._lock:
+            if self.covered_from is None or start < self.covered_from:
+                self.covered_from = start
+            self.complete = self.complete or complete
+
+    # ---- incremental maintenance ----------------------------------------
+
+    @staticmethod
+    def _pair_rows(cursor, pairs) -> list[dict]:
+        if not pairs:
+            return []
+        object_ids = sorted({o for o, _ in pairs})
+        cursor.execute(f"""
+            SELECT id, object_id, station_id, end_time, esito, TIME_TO_SEC(cycle_time) AS cycle_seconds
+            FROM productions
+            WHERE object_id IN ({", ".join(["%s"] * len(object_ids))}) AND end_time IS NOT NULL
+        """, object_ids)
+        return [r for r in cursor.fetchall() if (r["object_id"], r["station_id"]) in pairs]
+
+    @contextmanager
+    def track(self, cursor, production_ids):
+        """Apply the rollup delta of whatever the block changes in ``production_ids``."""
+        production_ids = sorted(set(production_ids))
+        if not self.enabled or not production_ids:
+            yield
+            return
+        cursor.execute(f"""
+            SELECT DISTINCT object_id, station_id FROM productions
+            WHERE id IN ({", ".join(["%s"] * len(production_ids))})
+        """, production_ids)
+        pairs = {(r["object_id"], r["station_id"]) for r in cursor.fetchall()}
+        before = _contributions(self._pair_rows(cursor, pairs))
+        yield
+        after = _contributions(self._pair_rows(cursor, pairs))
+
+        delta = []
+        for key in sorted(before.keys() | after.keys()):     # PK order keeps lock order stable
+            b, a = before.get(key, (0, 0, 0)), after.get(key, (0, 0, 0))
+            diff = [a[0] - b[0], a[1] - b[1], a[2] - b[2]]
+            if any(diff):
+                delta.append((*key, *diff))
+        if delta:
+            cursor.executemany(_UPSERT, delta)
+            self.deltas += 1
+
+    # ---- rebuild ---------------------------------------------------------
+
+    def rebuild(self, conn, start: datetime, end: datetime) -> int:
+        """Recompute the hours in ``[start, end)`` from productions; returns the rows written."""
+        start, end = hour_floor(start), hour_floor(end)
+        try:
+            with conn.cursor() as cursor:
+                # Delete first: the rows stay locked, so ingest deltas committed
+                # after our snapshot are applied on top of the rebuilt values
+                cursor.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE bucket >= %s AND bucket < %s", (start, end))
+                cursor.execute(_REBUILD_SELECT, (start, end))
+                rows = []
+                for r in cursor.fetchall():
+                    bucket = r["bucket"]
+                    if isinstance(bucket, str):
+                        bucket = datetime.fromisoformat(bucket)
+                    for kind in (KIND_ALL, KIND_FIRST, KIND_LATEST):
+                        n = int(r[f"{kind}_n"] or 0)
+                        if n:
+                            rows.append((r["station_id"], bucket, kind, r["esito"], n,
+                                         int(r[f"{kind}_cs"] or 0), int(r[f"{kind}_cn"] or 0)))
+                if rows:
+                    cursor.executemany(_INSERT, rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self.rebuilds += 1
+        return len(rows)
+
+    # ---- reads -----------------------------------------------------------
+
+    def load_view(self, cursor, station_names, start: datetime, end: datetime) -> RollupView | None:
+        """All rollup rows of ``station_names`` in ``[start, end)``, None if not covered yet."""
+        start, end = hour_floor(start), hour_floor(end)
+        if not station_names or not self.covers(start):
+            return None
+        names = sorted(set(station_names))
+        cursor.execute(f"""
+            SELECT s.name AS station_name, r.bucket, r.kind, r.esito, SUM(r.n) AS n
+            FROM {ROLLUP_TABLE} r
+            JOIN stations s ON s.id = r.station_id
+            WHERE s.name IN ({", ".join(["%s"] * len(names))})
+              AND r.bucket >= %s AND r.bucket < %s
+              AND r.kind IN ('first', 'latest')
+            GROUP BY s.name, r.bucket, r.kind, r.esito
+        """, (*names, start, end))
+        rows = {
+            (r["station_name"], r["bucket"], r["kind"], r["esito"]): int(r["n"] or 0)
+            for r in cursor.fetchall()
+        }
+        return RollupView(start, end, rows, frozenset(names))
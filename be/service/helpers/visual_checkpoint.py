@@ -0,0 +1,190 @@
+# service/helpers/visual_checkpoint.py
+"""
+On-disk checkpoint of ``global_state.visual_data``.
+
+A checkpoint is one msgpack document holding the zone states and the
+watermark of the productions already folded into them. On boot the zones
+are restored from it and only the productions ended after the watermark are
+replayed, instead of recomputing every snapshot from MySQL. Sets, datetimes
+and Decimals round-trip through msgpack extension types.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from decimal import Decimal
+import logging
+import os
+from pathlib import Path
+from threading import Lock
+import time
+
+import msgpack
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+
+# Productions ending this long before the watermark are replayed too, minus the
+# ones recorded as folded: folds of concurrent stations do not land in order
+REPLAY_OVERLAP = timedelta(minutes=5)
+
+_EXT_SET = 1
+_EXT_DATETIME = 2
+_EXT_DECIMAL = 3
+
+
+def _default(obj):
+    if isinstance(obj, (set, frozenset)):
+        return msgpack.ExtType(_EXT_SET, pack(list(obj)))
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, obj.isoformat().encode())
+    if isinstance(obj, Decimal):
+        return msgpack.ExtType(_EXT_DECIMAL, str(obj).encode())
+    raise TypeError(f"Cannot checkpoint {type(obj).__name__}")
+
+
+def _ext_hook(code: int, data: bytes):
+    if code == _EXT_SET:
+        return set(unpack(data))
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    if code == _EXT_DECIMAL:
+        return Decimal(data.decode())
+    return msgpack.ExtType(code, data)
+
+
+def pack(obj) -> bytes:
+    return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+
+def unpack(data: bytes):
+    # Map keys are not only strings (latest_esito is keyed by id_modulo, possibly None)
+    return msgpack.unpackb(data, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+
+@dataclass
+class Checkpoint:
+    saved_at: datetime
+    shift_start: datetime
+    last_end_time: datetime | None
+    last_production_id: int | None
+    folded: set = field(default_factory=set)    # {(zone, production_id)} near the watermark
+    zones: dict = field(default_factory=dict)
+
+    @property
+    def replay_from(self) -> datetime:
+        return (self.last_end_time or self.saved_at) - REPLAY_OVERLAP
+
+
+class VisualCheckpoint:
+    """
+    Watermark of the productions folded into ``visual_data`` and the file
+    the zone states are checkpointed to. ``note_folded`` is called by every
+    fold (zone lock held), ``save`` / ``load`` by the checkpoint task and the
+    warm start.
+    """
+
+    def __init__(self, path: str | None, max_age_hours: float = 8.0):
+        self.path = Path(path) if path else None
+        self.max_age = timedelta(hours=max_age_hours)
+        self._lock = Lock()
+        self.last_end_time: datetime | None = None
+        self.last_production_id: int | None = None
+        self._folded: dict[tuple[str, int], datetime] = {}
+        self._saved_mark = None
+        # Counters exposed on /metrics
+        self.saves = 0
+        self.size = 0
+        self.restored = 0
+        self.replayed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def note_folded(self, zone: str, end_time: datetime, production_id: int | None = None) -> None:
+        """Advance the watermark past a production folded into ``zone``."""
+        with self._lock:
+            if self.last_end_time is None or end_time > self.last_end_time:
+                self.last_end_time = end_time
+            if production_id is None:
+                return
+            self._folded[(zone, production_id)] = end_time
+            self.last_production_id = max(self.last_production_id or 0, production_id)
+            if len(self._folded) > 4096:
+                self._trim()
+
+    def _trim(self) -> None:
+        floor = self.last_end_time - REPLAY_OVERLAP
+        self._folded = {k: ts for k, ts in self._folded.items() if ts >= floor}
+
+    def marks(self) -> dict:
+        """Watermark fields of the next checkpoint; take it together with the zone states."""
+        with self._lock:
+            if self.last_end_time is not None:
+                self._trim()
+            return {
+                "last_end_time": self.last_end_time,
+                "last_production_id": self.last_production_id,
+                "folded": [[zone, pid] for zone, pid in self._folded],
+            }
+
+    def restore_marks(self, checkpoint: Checkpoint) -> None:
+        with self._lock:
+            self.last_end_time = checkpoint.last_end_time
+            self.last_production_id = checkpoint.last_production_id
+            floor_ts = checkpoint.last_end_time or checkpoint.saved_at
+            self._folded = {key: floor_ts for key in checkpoint.folded}
+
+    def save(self, zones: dict, shift_start: datetime, marks: dict) -> int:
+        """Write the checkpoint atomically; skipped (0) when nothing was folded since the last one."""
+        if not self.enabled:
+            return 0
+        mark = (marks["last_end_time"], marks["last_production_id"], shift_start)
+        if mark == self._saved_mark and self.path.exists():
+            return 0
+        t0 = time.perf_counter()
+        data = pack({
+            "version": CHECKPOINT_VERSION,
+            "saved_at": datetime.now(),
+            "shift_start": shift_start,
+            **marks,
+            "zones": zones,
+        })
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._saved_mark = mark
+        self.saves += 1
+        self.size = len(data)
+        logger.debug(f"💾 visual_data checkpoint: {len(data)} bytes in {time.perf_counter() - t0:.3f}s")
+        return len(data)
+
+    def load(self, now: datetime | None = None) -> Checkpoint | None:
+        """The checkpoint on disk, None when missing, unreadable or too old to replay from."""
+        if not self.enabled or not self.path.exists():
+            return None
+        try:
+            doc = unpack(self.path.read_bytes())
+            if doc.get("version") != CHECKPOINT_VERSION:
+                logger.info(f"visual_data checkpoint version {doc.get('version')} ignored")
+                return None
+            checkpoint = Checkpoint(
+                saved_at=doc["saved_at"],
+                shift_start=doc["shift_start"],
+                last_end_time=doc.get("last_end_time"),
+                last_production_id=doc.get("last_production_id"),
+                folded={(zone, pid) for zone, pid in doc.get("folded") or []},
+                zones=doc.get("zones") or {},
+            )
+        except Exception as e:
+            logger.warning(f"visual_data checkpoint {self.path} unreadable: {e}")
+            return None
+        age = (now or datetime.now()) - checkpoint.saved_at
+        if age > self.max_age:
+            logger.info(f"visual_data checkpoint is {age} old, recomputing instead")
+            return None
+        return checkpoint
@@ -6,6 +6,8 @@ import os
 import sys
 import copy
 from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
 from typing import Dict, DefaultDict, Any, List, Optional
 import json
 from statistics import median
@@ -15,9 +17,14 @@ from service.connections.mysql import get_mysql_connection
 from service.config.config import ELL_VISUAL, ZONE_SOURCES, TARGETS_FILE, DEFAULT_TARGETS
 from service.state import global_state
 from service.routes.broadcast import broadcast_zone_update
+from service.helpers.zone_delta import ZoneView, make_view
+from service.helpers.rollup import KIND_FIRST, KIND_LATEST, RollupView, load_unique_counts
 
 logger = logging.getLogger(__name__)
 
+# Hourly unique counts of the zone being computed; the count_unique_* helpers answer from them when they can
+_unique_counts: ContextVar[RollupView | None] = ContextVar("unique_counts", default=None)
+
 
 def load_targets():
     try:
@@ -57,90 +64,78 @@ def get_shift_label(now: datetime) -> str:
     else:
         return "S3"
 
-def count_unique_objects(cursor, station_names, start, end, esito_filter):
-    placeholders = ", ".join(["%s"] * len(station_names))
-    params = station_names + [start, end]
-    if esito_filter == "good":
-        esito_condition = "AND p.esito IN (1, 5, 7)"
-    elif esito_filter == "ng":
-        esito_condition = "AND p.esito = 6"
-    else:
-        esito_condition = ""
-
-    sql = f"""
-        SELECT COUNT(*) AS cnt
-        FROM (
-            SELECT p.object_id
-            FROM productions p
-            JOIN stations s ON p.station_id = s.id
-            WHERE s.name IN ({placeholders})
-            AND p.end_time BETWEEN %s AND %s
-            {esito_condition}
-            AND NOT EXISTS (
-                SELECT 1
-                FROM productions p2
-                WHERE p2.object_id = p.object_id
-                AND p2.station_id = p.station_id
-                AND p2.end_time > p.end_time
-            )
-        ) AS latest_productions
+@contextmanager
+def zone_unique_counts(zone: str, now: datetime):
     """
-    cursor.execute(sql, tuple(params))
-    return cursor.fetchone()["cnt"] or 0
+    Load the unique-object counts of ``zone`` for every hour of the last 3
+    shifts in one read (rollup table when it covers them, otherwise one
+    window-function pass over productions) for the count_unique_* helpers.
+    """
+    view = None
+    rollup = global_state.production_rollup
+    start = get_previous_shifts(now)[0][1]
+    _, end = get_shift_window(now)
+    stations = {s for v in ZONE_SOURCES.get(zone, {}).values() if isinstance(v, list) for s in v}
+    if stations:
+        try:
+            with get_mysql_connection() as conn:
+                with conn.cursor() as cursor:
+                    view = rollup.load_view(cursor, stations, start, end) \
+                        or load_unique_counts(cursor, stations, start, end)
+        except Exception as e:
+            logger.warning(f"Unique counts for {zone} not preloaded, counting window by window: {e}")
+    token = _unique_counts.set(view)
+    try:
+        yield view
+    finally:
+        _unique_counts.reset(token)
 
-def count_unique_objects_r0(cursor, station_names, start, end, esito_filter):
-    placeholders = ", ".join(["%s"] * len(station_names))
-    params = station_names + [start, end]
+def _count_unique_sql(n_stations: int, kind: str, esito_filter: str | None, distinct_objects: bool = False) -> str:
+    """COUNT of the first-pass (kind first) or latest productions per (object, station) ending in a window."""
+    placeholders = ", ".join(["%s"] * n_stations)
     if esito_filter == "good":
         esito_condition = "AND p.esito IN (1, 5, 7)"
     elif esito_filter == "ng":
         esito_condition = "AND p.esito = 6"
     else:
         esito_condition = ""
-
-    sql = f"""
-        SELECT COUNT(*) AS cnt
-        FROM (
-            SELECT p.object_id
-            FROM productions p
-            JOIN stations s ON p.station_id = s.id
-            WHERE s.name IN ({placeholders})
-              AND p.end_time BETWEEN %s AND %s
-              {esito_condition}
-              AND NOT EXISTS (
-                  SELECT 1
-                  FROM productions p2
-                  WHERE p2.object_id = p.object_id
-                    AND p2.station_id = p.station_id
-                    AND p2.end_time < p.end_time
-              )
-        ) AS first_pass_productions
-    """
-    cursor.execute(sql, tuple(params))
-    return cursor.fetchone()["cnt"] or 0
-
-def count_unique_ng_objects(cursor, all_station_names, start, end):
-    placeholders = ", ".join(["%s"] * len(all_station_names))
-    params = all_station_names + [start, end]
-
-    sql = f"""
-        SELECT COUNT(DISTINCT p.object_id) AS cnt
+    # A production of the same pair earlier (first) / later (latest) disqualifies it; ties go by id
+    cmp = "<" if kind == KIND_FIRST else ">"
+    return f"""
+        SELECT COUNT({"DISTINCT p.object_id" if distinct_objects else "*"}) AS cnt
         FROM productions p
         JOIN stations s ON p.station_id = s.id
         WHERE s.name IN ({placeholders})
-        AND p.end_time BETWEEN %s AND %s
-        AND p.esito = 6
-        AND NOT EXISTS (
-            SELECT 1
-            FROM productions p2
-            WHERE p2.object_id = p.object_id
-            AND p2.station_id = p.station_id
-            AND p2.end_time > p.end_time
-        )
+          AND p.end_time BETWEEN %s AND %s
+          {esito_condition}
+          AND NOT EXISTS (
+              SELECT 1
+              FROM productions p2
+              WHERE p2.object_id = p.object_id
+                AND p2.station_id = p.station_id
+                AND (p2.end_time {cmp} p.end_time OR (p2.end_time = p.end_time AND p2.id {cmp} p.id))
+          )
     """
-    cursor.execute(sql, tuple(params))
+
+def _count_unique(cursor, station_names, start, end, kind, esito_filter, distinct_objects=False):
+    view = _unique_counts.get()
+    if view is not None:
+        counted = view.count(station_names, start, end, kind, esito_filter, distinct_objects=distinct_objects)
+        if counted is not None:
+            return counted
+    sql = _count_unique_sql(len(station_names), kind, esito_filter, distinct_objects)
+    cursor.execute(sql, (*station_names, start, end))
     return cursor.fetchone()["cnt"] or 0
 
+def count_unique_objects(cursor, station_names, start, end, esito_filter):
+    return _count_unique(cursor, station_names, start, end, KIND_LATEST, esito_filter)
+
+def count_unique_objects_r0(cursor, station_names, start, end, esito_filter):
+    return _count_unique(cursor, station_names, start, end, KIND_FIRST, esito_filter)
+
+def count_unique_ng_objects(cursor, all_station_names, start, end):
+    return _count_unique(cursor, all_station_names, start, end, KIND_LATEST, "ng", distinct_objects=True)
+
 def get_previous_shifts(now: datetime, n: int = 3):
     shifts = []
     ref = now
@@ -173,22 +168,177 @@ def compute_yield(good: int, ng: int):
 def time_to_seconds(time_val: timedelta) -> int:
     return time_val.seconds if isinstance(time_val, timedelta) else 0
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Zone state: visual_data[zone] is computed once (cold start) and from then on
+# is a fold over production events (update_visual_data_on_new_module). When the
+# hour / shift moves on only the bins leaving the window are dropped and empty
+# ones opened, without any query.
+
+_YIELD_BIN = {"good": 0, "ng": 0, "yield": 0}
+
+# Last-8h series per zone -> counters of an empty hour bin
+HOUR_SERIES = {
+    "AIN": {
+        "last_8h_throughput": {"total": 0, "ng": 0},
+        "station_1_yield_last_8h": _YIELD_BIN,
+        "station_2_yield_last_8h": _YIELD_BIN,
+    },
+    "VPF": {
+        "station_1_yield_last_8h": _YIELD_BIN,
+    },
+    "ELL": {
+        "last_8h_throughput": {"total": 0, "ng": 0, "scrap": 0},
+        "FPY_yield_last_8h": _YIELD_BIN,
+        "RWK_yield_last_8h": {"station_1_in": 0, "station_1_out_ng": 0, "station_2_in": 0, **_YIELD_BIN},
+    },
+    "STR": {
+        "str_yield_last_8h": _YIELD_BIN,
+        "overall_yield_last_8h": _YIELD_BIN,
+    },
+}
+
+# Last-3-shifts series per zone -> counters of an empty shift
+SHIFT_SERIES = {
+    "AIN": {
+        "station_1_yield_shifts": _YIELD_BIN,
+        "station_2_yield_shifts": _YIELD_BIN,
+        "shift_throughput": {"total": 0, "ng": 0},
+    },
+    "VPF": {
+        "station_1_shifts": _YIELD_BIN,
+    },
+    "ELL": {
+        "FPY_yield_shifts": _YIELD_BIN,
+        "RWK_yield_shifts": {"station_1_in": 0, "station_1_out_ng": 0, "station_2_in": 0, **_YIELD_BIN},
+        "shift_throughput": {"total": 0, "ng": 0, "scrap": 0},
+    },
+    "STR": {
+        "str_yield_shifts": {**_YIELD_BIN, "scrap": 0},
+        "overall_yield_shifts": _YIELD_BIN,
+        "shift_throughput": {"total": 0, "ng": 0, "scrap": 0},
+    },
+}
+
+# ELL also keeps the running shift at the front of these (the entry the updates touch)
+LEADING_SHIFT_SERIES = {"ELL": ("FPY_yield_shifts", "RWK_yield_shifts")}
+
+# Current-shift values, back to these when a shift starts
+SHIFT_TOTALS = {
+    "AIN": {
+        **{k: 0 for k in ("station_1_in", "station_2_in", "station_1_out_ng", "station_2_out_ng",
+                          "station_1_yield", "station_2_yield", "total_defects_qg2")},
+        "top_defects_qg2": [], "top_defects_vpf": [],
+    },
+    "VPF": {
+        **{k: 0 for k in ("station_1_in", "station_1_out_ng", "station_1_re_entered", "station_1_yield")},
+        "defects_vpf": [],
+    },
+    "ELL": {
+        **{k: 0 for k in ("station_1_in", "station_2_in", "station_1_ng_qg2", "station_1_out_ng",
+                          "station_2_out_ng", "station_1_esito_ng", "ng_tot", "station_1_r0_in",
+                          "station_1_r0_ng", "station_2_r0_in", "station_2_r0_ng", "FPY_yield",
+                          "RWK_yield", "value_gauge_1", "value_gauge_2")},
+        "top_defects": [], "latest_esito": {},
+        "s1_ng_set": set(), "reworked_set": set(), "good_after_rework_set": set(),
+    },
+    "STR": {
+        **{f"station_{i}_{k}": 0 for i in range(1, 6) for k in ("in", "out_ng", "scrap", "yield")},
+        "top_defects_qg2": [], "top_defects_vpf": [], "total_defects_qg2": 0,
+    },
+}
+
+def _parse_iso(value) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+def _rebin(entries: list, windows, blank: dict, head: dict) -> list:
+    """``entries`` re-aligned on ``windows``: kept where the start matches, empty otherwise."""
+    by_start = {e.get("start"): e for e in entries}
+    return [
+        by_start.get(start.isoformat()) or {**head(label, start, end), **copy.deepcopy(blank)}
+        for label, start, end in windows
+    ]
+
+def rotate_zone_state(zone: str, data: dict, now: datetime) -> bool:
+    """
+    Move the in-memory state of ``zone`` forward to ``now``: open the hour and
+    shift bins started since, drop the ones out of the window and reset the
+    current-shift totals on a new shift. Never goes backwards, runs no query.
+    Call it with the zone lock held; True when something changed.
+    """
+    rotated = False
+    hour_start = now.replace(minute=0, second=0, microsecond=0)
+    last_hour = _parse_iso(data.get("__last_hour"))
+    if last_hour is None or hour_start > last_hour:
+        windows = get_last_8h_bins(now)
+        for key, blank in HOUR_SERIES.get(zone, {}).items():
+            data[key] = _rebin(data.get(key) or [], windows, blank, lambda label, start, end: {
+                "hour": label, "start": start.isoformat(), "end": end.isoformat(),
+            })
+        data["__last_hour"] = hour_start.isoformat()
+        rotated = True
+
+    shift_start, _ = get_shift_window(now)
+    cached_shift = _parse_iso(data.get("__shift_start"))
+    if cached_shift is None or shift_start > cached_shift:
+        windows = get_previous_shifts(now)
+        leading = LEADING_SHIFT_SERIES.get(zone, ())
+        for key, blank in SHIFT_SERIES.get(zone, {}).items():
+            entries = list(data.get(key) or [])
+            if key in leading and entries:
+                # The front entry is the one kept current: fold it back into its shift
+                front = entries.pop(0)
+                for e in entries:
+                    if e.get("start") == front.get("start"):
+                        e.update({k: v for k, v in front.items() if k != "end"})
+            entries = _rebin(entries, windows, blank, lambda label, start, end: {
+                "label": label, "start": start.isoformat(), "end": end.isoformat(),
+            })
+            if key in leading:
+                entries.insert(0, {**copy.deepcopy(entries[-1]), "end": now.isoformat()})
+            data[key] = entries
+        for key, value in SHIFT_TOTALS.get(zone, {}).items():
+            data[key] = copy.deepcopy(value)
+        if "eq_defects" in data:
+            data["eq_defects"] = {cat: dict.fromkeys(names, 0) for cat, names in data["eq_defects"].items()}
+        data["__shift_start"] = shift_start.isoformat()
+        rotated = True
+    return rotated
+
+def zone_view(zone: str) -> ZoneView:
+    """JSON-safe copy of ``zone`` for the WebSocket channels, stamped with the next zone version."""
+    with global_state.zone_locks[zone]:
+        version = global_state.zone_versions.get(zone, 0) + 1
+        global_state.zone_versions[zone] = version
+        return make_view(global_state.visual_data[zone], version)
+
+def advance_zone_state(zone: str, now: datetime) -> Optional[ZoneView]:
+    """Rotate ``zone`` to ``now`` under its lock; the view to broadcast if it changed."""
+    with global_state.zone_locks[zone]:
+        data = global_state.visual_data.get(zone)
+        if data is None or not rotate_zone_state(zone, data, now):
+            return None
+        return zone_view(zone)
+
 def compute_zone_snapshot(zone: str, now: datetime | None = None) -> dict:
     try:
         if now is None:
             now = datetime.now()
         #now = now - timedelta(days=14)
 
-        if zone == "VPF":
-            return _compute_snapshot_vpf(now)
-        elif zone == "AIN":
-            return _compute_snapshot_ain(now)
-        elif zone == "ELL":
-            return _compute_snapshot_ell(now)
-        elif zone == "STR":
-            return _compute_snapshot_str(now)
-        else:
+        if zone not in ("VPF", "AIN", "ELL", "STR"):
             raise ValueError(f"Unknown zone: {zone}")
+        with zone_unique_counts(zone, now):
+            if zone == "VPF":
+                return _compute_snapshot_vpf(now)
+            elif zone == "AIN":
+                return _compute_snapshot_ain(now)
+            elif zone == "ELL":
+                return _compute_snapshot_ell(now)
+            else:
+                return _compute_snapshot_str(now)
 
     except Exception as e:
         logger.exception(f"compute_zone_snapshot() FAILED for zone={zone}: {e}")
@@ -1453,6 +1603,48 @@ def _compute_snapshot_str(now: datetime | None) -> dict:
         "total_defects_qg2": total_defects_qg2,
     }
 
+def fold_production_event(
+    zone: str,
+    station_name: str,
+    esito: int,
+    ts: datetime,
+    cycle_time: Optional[str] = None,
+    reentered: bool = False,
+    bufferIds: List[str] = [],
+    object_id: Optional[str] = None,
+    production_id: Optional[int] = None,
+) -> bool:
+    """
+    Apply one ended production to visual_data[zone] (rotating it to ``ts``
+    first). Call with the zone lock held; False when it was not folded in.
+    """
+    current_shift_start, _ = get_shift_window(ts)
+    data = global_state.visual_data[zone]
+
+    # New hour / shift: rotate the bins in memory, the event is then folded in as usual
+    rotate_zone_state(zone, data, ts)
+    if data.get("__shift_start") != current_shift_start.isoformat():
+        logger.debug(f"{zone}: event at {ts} belongs to an earlier shift, not folded in")
+        return False
+
+    if zone == "VPF":
+        _update_snapshot_vpf(data, station_name, esito, ts, cycle_time, reentered)
+    elif zone == "AIN":
+        _update_snapshot_ain(data, station_name, esito, ts)
+    elif zone == "ELL":
+        data.setdefault("latest_esito", {})
+        if not ELL_VISUAL:
+            return False
+        _update_snapshot_ell_new(data, station_name, esito, ts, cycle_time, bufferIds, object_id)
+    elif zone == "STR":
+        _update_snapshot_str(data, station_name, esito, ts)
+    else:
+        logger.info(f"Unknown zone: {zone}")
+        return False
+
+    global_state.visual_checkpoint.note_folded(zone, ts, production_id)
+    return True
+
 def update_visual_data_on_new_module(
     zone: str,
     station_name: str,
@@ -1461,7 +1653,8 @@ def update_visual_data_on_new_module(
     cycle_time: Optional[str] = None,
     reentered: bool = False,
     bufferIds: List[str] = [],
-    object_id: Optional[str] = None
+    object_id: Optional[str] = None,
+    production_id: Optional[int] = None,
 ) -> None:
     if zone not in global_state.visual_data:
         global_state.visual_data[zone] = compute_zone_snapshot(zone, now=ts)
@@ -1469,32 +1662,12 @@ def update_visual_data_on_new_module(
 
     # ✅ Per-zone lock: does NOT block other zones or the line
     with global_state.zone_locks[zone]:
-        current_shift_start, _ = get_shift_window(ts)
-        data = global_state.visual_data[zone]
-        cached_shift_start = data.get("__shift_start")
-
-        if cached_shift_start != current_shift_start.isoformat():
-            global_state.visual_data[zone] = compute_zone_snapshot(zone, now=ts)
-            return
-
-        if zone == "VPF":
-            _update_snapshot_vpf(data, station_name, esito, ts, cycle_time, reentered)
-        elif zone == "AIN":
-            _update_snapshot_ain(data, station_name, esito, ts)
-        elif zone == "ELL":
-            data.setdefault("latest_esito", {})
-            if not ELL_VISUAL:
-                return
-            print('Calling _update_snapshot_ell_new()')
-            _update_snapshot_ell_new(data, station_name, esito, ts, cycle_time, bufferIds, object_id)
-        elif zone == "STR":
-            _update_snapshot_str(data, station_name, esito, ts)
-        else:
-            logger.info(f"Unknown zone: {zone}")
+        if not fold_production_event(zone, station_name, esito, ts, cycle_time, reentered,
+                                     bufferIds, object_id, production_id):
             return
 
         try:
-            payload = copy.deepcopy(data)
+            payload = zone_view(zone)
             try:
                 loop = asyncio.get_running_loop()
             except RuntimeError:
@@ -1515,6 +1688,89 @@ def update_visual_data_on_new_module(
         except Exception as e:
             logger.warning(f"Could not schedule WebSocket update for {zone}: {e}")
 
+# Productions ended after a checkpoint, replayed through fold_production_event on a warm start.
+# reentered is not stored: a second pass of the object at the same station stands for it
+_TAIL_SQL = """
+    SELECT p.id, p.end_time, p.esito, p.cycle_time, s.name AS station_name, o.id_modulo,
+           EXISTS (
+               SELECT 1 FROM productions p2
+               WHERE p2.object_id = p.object_id AND p2.station_id = p.station_id AND p2.id < p.id
+           ) AS reentered
+    FROM productions p
+    JOIN stations s ON s.id = p.station_id
+    JOIN objects o ON o.id = p.object_id
+    WHERE s.name IN ({stations})
+      AND p.end_time >= %s
+      AND p.esito <> 2
+    ORDER BY p.end_time, p.id
+"""
+
+def save_visual_checkpoint(now: Optional[datetime] = None) -> int:
+    """Checkpoint visual_data to disk; bytes written, 0 when disabled or unchanged."""
+    checkpoint = global_state.visual_checkpoint
+    if not checkpoint.enabled or not global_state.visual_data:
+        return 0
+    # All zone locks, so the states and the watermark are taken at the same point
+    with ExitStack() as stack:
+        for zone in sorted(global_state.zone_locks):
+            stack.enter_context(global_state.zone_locks[zone])
+        zones = copy.deepcopy(global_state.visual_data)
+        marks = checkpoint.marks()
+    shift_start, _ = get_shift_window(now or datetime.now())
+    return checkpoint.save(zones, shift_start, marks)
+
+def restore_visual_data(now: datetime) -> List[str]:
+    """
+    Warm start: load the zones from the checkpoint and fold in the productions
+    ended after it. Returns the zones restored; the others still need
+    compute_zone_snapshot (STR too when it has productions to catch up, its
+    updates read per-module counters that only hold the latest module).
+    """
+    checkpoint = global_state.visual_checkpoint
+    saved = checkpoint.load(now)
+    if saved is None:
+        return []
+    zones = {zone: data for zone, data in saved.zones.items() if zone in ZONE_SOURCES}
+    stations = sorted({s for cfg in ZONE_SOURCES.values() for v in cfg.values() if isinstance(v, list) for s in v})
+    with get_mysql_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(_TAIL_SQL.format(stations=", ".join(["%s"] * len(stations))),
+                           (*stations, saved.replay_from))
+            rows = cursor.fetchall()
+
+    checkpoint.restore_marks(saved)
+    for zone, data in zones.items():
+        with global_state.zone_locks[zone]:
+            global_state.visual_data[zone] = data
+
+    replayed, stale = 0, set()
+    for r in rows:
+        for zone in global_state.get_zones_from_station(r["station_name"]):
+            if zone not in zones or (zone, r["id"]) in saved.folded:
+                continue
+            if zone == "STR":
+                stale.add(zone)
+                continue
+            cycle_time = r["cycle_time"]
+            with global_state.zone_locks[zone]:
+                replayed += fold_production_event(
+                    zone, r["station_name"], r["esito"], r["end_time"],
+                    cycle_time=str(cycle_time) if cycle_time is not None else None,
+                    reentered=bool(r["reentered"]),
+                    object_id=r["id_modulo"],
+                    production_id=r["id"],
+                )
+    for zone in zones:
+        with global_state.zone_locks[zone]:
+            rotate_zone_state(zone, global_state.visual_data[zone], now)
+
+    checkpoint.restored += 1
+    checkpoint.replayed += replayed
+    restored = [zone for zone in zones if zone not in stale]
+    logger.info(f"♻️ visual_data restored from checkpoint of {saved.saved_at:%H:%M:%S} "
+                f"({replayed} productions replayed): {', '.join(restored) or 'none'}")
+    return restored
+
 def _update_snapshot_ain(
     data: dict,
     station_name: str,
@@ -2070,7 +2326,7 @@ def _update_snapshot_ell(bufferIds: List[str]) -> dict:
 
         shift_start, shift_end = get_shift_window(now)
 
-        with get_mysql_connection() as conn:
+        with zone_unique_counts("ELL", now), get_mysql_connection() as conn:
             with conn.cursor() as cursor:
 
                 def count_objects_with_esito_ng(cursor, station_name, start, end):
@@ -2757,7 +3013,7 @@ def refresh_fermi_data(zone: str, ts: datetime) -> None:
         # ✅ Update shared memory under per-zone lock
         with global_state.zone_locks[zone]:
             global_state.visual_data[zone]["fermi_data"] = fermi_data
-            payload = copy.deepcopy(global_state.visual_data[zone])
+            payload = zone_view(zone)
 
         # 🔄 Robust asyncio broadcast
         try:
@@ -2854,7 +3110,7 @@ def refresh_top_defects_qg2(zone: str, ts: datetime) -> None:
             data = global_state.visual_data[zone]
             data["top_defects_qg2"] = top_defects
             data["total_defects_qg2"] = total_defects
-            payload = copy.deepcopy(data)
+            payload = zone_view(zone)
 
         # 🔄 Robust asyncio handling for WebSocket broadcast
         try:
@@ -2946,7 +3202,7 @@ def refresh_top_defects_vpf(zone: str, ts: datetime) -> None:
         with global_state.zone_locks[zone]:
             data = global_state.visual_data[zone]
             data["top_defects_vpf"] = top_defects
-            payload = copy.deepcopy(data)
+            payload = zone_view(zone)
 
         # 🔄 Safe asyncio broadcast
         try:
@@ -3048,7 +3304,7 @@ def refresh_top_defects_ell(zone: str, ts: datetime) -> None:
         with global_state.zone_locks[zone]:
             data = global_state.visual_data[zone]
             data["top_defects"] = top_defects
-            payload = copy.deepcopy(data)
+            payload = zone_view(zone)
 
         try:
             loop = asyncio.get_running_loop()
@@ -3268,7 +3524,7 @@ def refresh_vpf_defects_data(now: datetime) -> None:
                 return
             data["defects_vpf"] = defects_vpf
             data["eq_defects"] = eq_defects
-            payload = copy.deepcopy(data)
+            payload = zone_view("VPF")
 
         # 🔄 Safe asyncio broadcast
         try:
@@ -0,0 +1,157 @@
+# service/helpers/ws_hub.py
+"""
+Serialize-once WebSocket fan-out.
+
+``FanoutHub.publish`` encodes a message once and hands the text to every
+subscriber's bounded send queue; one sender task per client drains it. A
+client whose queue fills up, or whose send stalls past ``send_timeout``, is
+dropped and closed, so one stalled tablet never delays the line displays.
+Publishing never awaits a socket and is safe from any thread or loop: off
+the hub loop it is handed over with ``call_soon_threadsafe``.
+"""
+import asyncio
+from decimal import Decimal
+import logging
+from typing import Optional
+
+from fastapi import WebSocket
+import orjson
+
+logger = logging.getLogger(__name__)
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def encode(message) -> str:
+    """JSON text of ``message``, sent as a text frame like WebSocket.send_json."""
+    return orjson.dumps(message, default=_default, option=_OPTIONS).decode()
+
+
+def _disconnected(ws: WebSocket) -> bool:
+    return any(
+        getattr(state, "name", "CONNECTED") != "CONNECTED"
+        for state in (getattr(ws, "client_state", None), getattr(ws, "application_state", None))
+        if state is not None
+    )
+
+
+class _Client:
+    __slots__ = ("ws", "queue", "task")
+
+    def __init__(self, ws: WebSocket, size: int):
+        self.ws = ws
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=size)
+        self.task: Optional[asyncio.Task] = None
+
+
+class FanoutHub:
+    def __init__(self, queue_size: int = 64, send_timeout: float = 5.0):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients: dict[WebSocket, _Client] = {}
+        self._dropped: set[WebSocket] = set()    # until their route detaches them
+        # Counters exposed on /metrics
+        self.encoded = 0
+        self.sent = 0
+        self.dropped = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """The loop the sockets live on; called once at startup."""
+        self.loop = loop
+
+    @property
+    def queued(self) -> int:
+        return sum(client.queue.qsize() for client in list(self._clients.values()))
+
+    def publish(self, message, *groups: set) -> None:
+        """Encode ``message`` once and queue it for every socket of ``groups``; dropped sockets leave their set."""
+        if not any(groups):
+            return
+        text = encode(message)
+        self.encoded += 1
+        if not self._on_loop():
+            self.loop.call_soon_threadsafe(self._fan_out, text, groups)
+            return
+        self._fan_out(text, groups)
+
+    def send(self, ws: WebSocket, message) -> None:
+        """Queue ``message`` for one socket, after what is already queued for it."""
+        self.publish(message, {ws})
+
+    def detach(self, ws: WebSocket) -> None:
+        """Forget a disconnected socket and stop its sender."""
+        self._dropped.discard(ws)
+        client = self._clients.pop(ws, None)
+        if client is not None and client.task is not None:
+            client.task.cancel()
+
+    def close(self) -> None:
+        for ws in list(self._clients):
+            self.detach(ws)
+
+    def _on_loop(self) -> bool:
+        if self.loop is None or self.loop.is_closed():
+            return True
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _fan_out(self, text: str, groups: tuple[set, ...]) -> None:
+        for sockets in groups:
+            for ws in list(sockets):
+                if not self._offer(ws, text):
+                    sockets.discard(ws)
+
+    def _offer(self, ws: WebSocket, text: str) -> bool:
+        client = self._clients.get(ws)
+        if client is None:
+            if ws in self._dropped or _disconnected(ws):
+                return False
+            client = self._clients[ws] = _Client(ws, self.queue_size)
+            client.task = asyncio.get_running_loop().create_task(self._sender(client))
+        try:
+            client.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            self._drop(client, f"{self.queue_size} messages behind")
+            return False
+        return True
+
+    async def _sender(self, client: _Client) -> None:
+        while True:
+            text = await client.queue.get()
+            try:
+                await asyncio.wait_for(client.ws.send_text(text), self.send_timeout)
+            except asyncio.TimeoutError:
+                self._drop(client, f"send stalled for {self.send_timeout}s")
+                return
+            except Exception as e:
+                self._drop(client, str(e) or type(e).__name__)
+                return
+            self.sent += 1
+
+    def _drop(self, client: _Client, reason: str) -> None:
+        if self._clients.pop(client.ws, None) is None:
+            return
+        self._dropped.add(client.ws)
+        self.dropped += 1
+        logger.warning(f"❌ WebSocket client dropped: {reason}")
+        if client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+        asyncio.get_running_loop().create_task(self._close(client.ws))
+
+    @staticmethod
+    async def _close(ws: WebSocket) -> None:
+        try:
+            await ws.close(code=1013)    # try again later
+        except Exception:
+            pass
@@ -0,0 +1,108 @@
+# service/helpers/zone_delta.py
+"""
+Versioned zone state for the ``/ws/visual`` channels.
+
+Every zone broadcast carries a ``ZoneView``: a JSON-safe copy of the zone
+taken under its lock and stamped with the zone version. One ``ZoneStream``
+per channel keeps the last view sent and turns the next one into JSON-patch
+(RFC 6902) operations numbered by ``seq``. Delta subscribers get a snapshot
+on subscribe and then only the patches; on a gap in ``seq`` they ask for a
+resync and get a new snapshot. Legacy subscribers keep getting the whole
+payload, only when it changed.
+"""
+from decimal import Decimal
+import json
+from typing import NamedTuple, Optional
+
+# Longer patches go out as a snapshot instead (hour / shift rotations, resyncs)
+MAX_PATCH_OPS = 100
+
+
+class ZoneView(NamedTuple):
+    version: Optional[int]    # None: not versioned, never dropped as stale
+    data: dict
+
+
+def _key(key) -> str:
+    # Same key conversion as json.dumps, so patch paths match what the client decoded
+    return key if isinstance(key, str) else json.dumps(key)
+
+
+def json_view(obj):
+    """JSON-safe copy of ``obj``: Decimal → float, set → list, keys → str."""
+    if isinstance(obj, dict):
+        return {_key(k): json_view(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return [json_view(v) for v in obj]
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return obj
+
+
+def make_view(data: dict, version: Optional[int] = None) -> ZoneView:
+    """The view of a zone state as sent to clients (internal ``__seen`` left out)."""
+    return ZoneView(version, {_key(k): json_view(v) for k, v in data.items() if k != "__seen"})
+
+
+def _escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def diff(old, new, path: str = "") -> list[dict]:
+    """JSON-patch operations turning ``old`` into ``new`` (both ``json_view`` trees)."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key in old:
+                ops.extend(diff(old[key], value, child))
+            else:
+                ops.append({"op": "add", "path": child, "value": value})
+        ops.extend({"op": "remove", "path": f"{path}/{_escape(key)}"} for key in old if key not in new)
+        return ops
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        ops = []
+        for i, (a, b) in enumerate(zip(old, new)):
+            ops.extend(diff(a, b, f"{path}/{i}"))
+        return ops
+    # 1 == 1.0 == True, but they are not the same JSON
+    if type(old) is type(new) and old == new:
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+class ZoneStream:
+    """Last view sent on one visual channel and the patch sequence built on it."""
+
+    def __init__(self):
+        self.seq = 0
+        self.version: Optional[int] = None
+        self.state: Optional[dict] = None
+        # Counters exposed on /metrics
+        self.patches = 0
+        self.snapshots = 0
+
+    def seed(self, view: ZoneView) -> None:
+        """First state of the stream, for a subscriber arriving before any broadcast."""
+        if self.state is None:
+            self.state, self.version = view.data, view.version
+
+    def snapshot(self) -> dict:
+        return {"type": "snapshot", "seq": self.seq, "data": self.state}
+
+    def advance(self, view: ZoneView) -> Optional[dict]:
+        """Move to ``view``: the message for the delta subscribers, None when stale or unchanged."""
+        if view.version is not None and self.version is not None and view.version <= self.version:
+            return None
+        if view.version is not None:
+            self.version = view.version
+        ops = diff(self.state, view.data) if self.state is not None else None
+        if ops == []:
+            return None
+        self.state = view.data
+        self.seq += 1
+        if ops is None or len(ops) > MAX_PATCH_OPS:
+            self.snapshots += 1
+            return self.snapshot()
+        self.patches += 1
+        return {"type": "patch", "seq": self.seq, "ops": ops}
@@ -112,21 +112,43 @@ if sys.platform.startswith("win"):
 # Local imports
 from controllers.plc import PLCConnection
 from service.controllers.debug_plc import FakePLCConnection
-from service.config.config import CHANNELS, IMAGES_DIR, LOG_FILE, PLC_DB_RANGES, LOGS_FILE, LOGS_TERMINAL, debug
+from service.controllers.plc_async import AsyncPLCClient
+from service.controllers.plc_poller import PLCBlockPoller
+from service.controllers.plc_replay import (
+    PLCRecorder,
+    ReplayPLCConnection,
+    find_recording,
+    recording_path,
+)
+from service.config.config import (
+    CHANNELS,
+    IMAGES_DIR,
+    LOG_FILE,
+    PLC_DB_RANGES,
+    PLC_RECORD_DIR,
+    PLC_REPLAY_DIR,
+    PLC_REPLAY_LOOP,
+    PLC_REPLAY_SPEED,
+    LOGS_FILE,
+    LOGS_TERMINAL,
+    debug,
+)
 from service.connections.mysql import get_mysql_connection, load_channels_from_db
+from service.connections.production_ingest import ProductionIngest
+from service.helpers.executor import run_in_thread
 from service.tasks.main_esito_task import background_task
 from service.tasks.main_fermi_task import fermi_task
-from service.helpers.visual_helper import refresh_median_cycle_time_ELL, refresh_median_cycle_time_vpf
+from service.tasks.rollup_task import rollup_task
+from service.tasks.zone_clock_task import visual_checkpoint_task, zone_clock_task
+from service.helpers.visual_helper import refresh_median_cycle_time_ELL, refresh_median_cycle_time_vpf, save_visual_checkpoint
 from service.state.global_state import (
     plc_connections,
+    plc_pollers,
     stop_threads,
-    inizio_true_passato_flags,
-    inizio_false_passato_flags,
-    fine_false_passato_flags,
-    fine_true_passato_flags,
     executor,
     db_write_queue,
 )
+import service.state.global_state as global_state
 from service.routes.plc_routes import router as plc_router
 from service.routes.issue_routes import router as issue_router
 from service.routes.warning_routes import router as warning_router
@@ -142,6 +164,7 @@ from service.routes.mbj_routes import router as mbj_router
 from service.routes.ml_routes import router as ml_router
 from service.routes.visual_routes import initialize_visual_cache, router as visual_router
 from service.routes.escalation_routes import router as escalation_router
+from service.routes.metrics_routes import router as metrics_router
 #from service.routes.simix_rca_routes import router as simix_rca_router
 
 LOG_CONFIG = configure_logging()
@@ -206,18 +229,10 @@ async def monitor_plc_ports(plcs: list[tuple[str, int]], interval: int = 10, war
 # ---------------- INIT GLOBAL FLAGS ----------------
 def init_global_flags():
     stop_threads.clear()
-    inizio_true_passato_flags.clear()
-    inizio_false_passato_flags.clear()
-    fine_true_passato_flags.clear()
-    fine_false_passato_flags.clear()
     for line, stations in CHANNELS.items():
         for station in stations:
             key = f"{line}.{station}"
             stop_threads[key] = False
-            inizio_true_passato_flags[key] = False
-            inizio_false_passato_flags[key] = False
-            fine_true_passato_flags[key] = False
-            fine_false_passato_flags[key] = False
 
 # ---------------- FAST STARTUP ----------------
 async def async_load_channels():
@@ -230,17 +245,25 @@ async def async_get_refreshed_settings():
 
 async def start_background_tasks():
     try:
-        initialize_visual_cache()
+        await initialize_visual_cache()
         logger.debug("visual_data cache initialized")
     except Exception as e:
         logger.error(f"visual_data cache init failed: {e}")
 
-    # Start queue for deferred DB writes
+    # Start queue for deferred DB writes; jobs replayed from its journal need the ingest
+    global_state.production_ingest = ProductionIngest()
     db_write_queue.start()
 
+    # Hourly production rollup: table, backfill, periodic catch-up
+    asyncio.create_task(rollup_task())
+
+    # Hour / shift rollover of the zone state, in memory
+    asyncio.create_task(zone_clock_task())
+    asyncio.create_task(visual_checkpoint_task())
+
     logger.debug("Starting PLC background tasks and Fermi tasks")
 
-    shared_conns: dict[tuple[str, int], PLCConnection] = {}
+    shared_conns: dict[tuple[str, int], AsyncPLCClient] = {}
 
     # STEP 1 — Build unique PLC list first
     unique_plcs = set()
@@ -254,15 +277,33 @@ async def start_background_tasks():
             ip, slot = plc_info.get("ip"), plc_info.get("slot", 0)
             unique_plcs.add((ip, slot))
 
-    # STEP 2 — Create 1 connection and fermi_task per PLC
+    # STEP 2 — Create 1 async connection, 1 DB poller and 1 fermi_task per PLC
     for ip, slot in unique_plcs:
         try:
-            if debug:
-                plc = FakePLCConnection(f"{ip}:{slot}")
+            time_scale = 1.0
+            replay_file = find_recording(PLC_REPLAY_DIR, ip, slot) if PLC_REPLAY_DIR else None
+            if replay_file:
+                conn = ReplayPLCConnection(replay_file, ip, slot,
+                                           speed=PLC_REPLAY_SPEED, loop=PLC_REPLAY_LOOP)
+                time_scale = PLC_REPLAY_SPEED
+                logger.info(f"▶️ Replaying {replay_file.name} for PLC {ip}:{slot} at {PLC_REPLAY_SPEED}x")
+            elif debug:
+                conn = FakePLCConnection(f"{ip}:{slot}")
             else:
-                plc = PLCConnection(ip_address=ip, slot=slot, status_callback=None)
+                # Reconnection is handled by the AsyncPLCClient task, not by a thread
+                conn = PLCConnection(ip_address=ip, slot=slot, status_callback=None,
+                                     background_reconnect=False)
+            recorder = None
+            if PLC_RECORD_DIR and not replay_file:
+                recorder = PLCRecorder(recording_path(PLC_RECORD_DIR, ip, slot))
+                logger.info(f"⏺️ Recording PLC {ip}:{slot} to {recorder.path}")
+            plc = AsyncPLCClient(conn, recorder=recorder)
+            plc.start()
             shared_conns[(ip, slot)] = plc
-            asyncio.create_task(fermi_task(plc, ip, slot))
+            poller = PLCBlockPoller(plc, ip, slot, time_scale=time_scale)
+            plc_pollers[(ip, slot)] = poller
+            poller.start()
+            asyncio.create_task(fermi_task(plc, ip, slot, poller))
             logger.debug(f"Fermi task started for PLC {ip}:{slot}")
         except Exception as e:
             logger.error(f"PLC connect failed for {ip}:{slot}: {e}")
@@ -283,7 +324,7 @@ async def start_background_tasks():
                 continue
 
             plc_connections[key] = plc
-            asyncio.create_task(background_task(plc, key))
+            asyncio.create_task(background_task(plc, key, plc_pollers[(ip, slot)]))
             logger.debug(f"Background task started for station {key}")
 
     # STEP 4 — Refresh VPF median every 59 minutes
@@ -337,13 +378,33 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     asyncio.create_task(start_background_tasks())
 
     app.state.plc_connections = plc_connections
+    global_state.ws_hub.bind(asyncio.get_running_loop())
     try:
         logger.debug("STARTUP complete")
         yield
     finally:
         logger.debug("SHUTDOWN phase")
         try:
-            with get_mysql_connection() as conn:
+            await db_write_queue.shutdown(timeout=10)
+        except Exception as e:
+            logger.warning(f"DB write queue shutdown failed: {e}")
+        if global_state.production_ingest is not None:
+            try:
+                await global_state.production_ingest.flush()
+            except Exception as e:
+                logger.warning(f"Production ingest flush failed: {e}")
+        try:
+            await run_in_thread(save_visual_checkpoint)
+        except Exception as e:
+            logger.warning(f"visual_data checkpoint failed: {e}")
+        global_state.ws_hub.close()
+        for plc in set(plc_connections.values()):
+            try:
+                await plc.close()
+            except Exception as e:
+                logger.warning(f"PLC {plc.ip_address} close failed: {e}")
+        try:
+            with get_mysql_connection() as conn:  # sync-db: ok (shutdown)
                 conn.close()
             logger.debug("MySQL disconnected")
         except Exception as e:
@@ -364,7 +425,8 @@ for router, name in [
     (overlay_router, "overlay"), (export_router, "export"), (settings_router, "settings"),
     (graph_router, "graph"), (station_router, "station"), (search_router, "search"),
     (websocket_router, "websocket"), (health_check_router, "health_check"),
-    (mbj_router, "mbj"), (ml_router, "ml"), (visual_router, "visual"), (escalation_router, "escalation")#, (simix_rca_router, "simix_rca")
+    (mbj_router, "mbj"), (ml_router, "ml"), (visual_router, "visual"), (escalation_router, "escalation"),
+    (metrics_router, "metrics")#, (simix_rca_router, "simix_rca")
 ]:
     app.include_router(router)
     logger.debug(f"  • {name}_router registered")
@@ -1,21 +1,21 @@
-import copy
 import logging
-import asyncio
 from fastapi import WebSocket
-from decimal import Decimal
+from snap7.util import get_bool
 import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from service.config.config import debug
-from service.controllers.plc import PLCConnection
+from service.controllers.plc_async import AsyncPLCClient
 from service.helpers.helpers import get_channel_config
+from service.helpers.latency import trace_span
+from service.helpers.zone_delta import ZoneStream, ZoneView, make_view
 from service.state.global_state import subscriptions
 import service.state.global_state as global_state
 
 logger = logging.getLogger(__name__)
 
-async def send_initial_state(websocket: WebSocket, channel_id: str, plc_connection: PLCConnection, line_name: str):
+async def send_initial_state(websocket: WebSocket, channel_id: str, plc_connection: AsyncPLCClient, line_name: str):
     paths = get_channel_config(line_name, channel_id)
     
     if paths is None:
@@ -24,10 +24,28 @@ async def send_initial_state(websocket: WebSocket, channel_id: str, plc_connecti
 
     # ✅ Use `paths` for all access now (already scoped)
     trigger_conf = paths["trigger"]
-    trigger_value = await asyncio.to_thread(
-        plc_connection.read_bool,
-        trigger_conf["db"], trigger_conf["byte"], trigger_conf["bit"]
-    )
+    id_mod_conf = paths.get("id_modulo")
+    str_conf = paths.get("stringatrice")
+    fine_buona_conf = paths.get("fine_buona")
+    fine_scarto_conf = paths.get("fine_scarto")
+    esito_conf = paths.get("esito_scarto_compilato")
+
+    # One batched PLC round-trip instead of 5 + N single reads, over the
+    # areas this channel actually configures
+    areas = {"trigger": (trigger_conf["db"], trigger_conf["byte"], 1)}
+    if id_mod_conf:
+        areas["id_modulo"] = (id_mod_conf["db"], id_mod_conf["byte"], id_mod_conf["length"] + 2)
+    for key, conf in (
+        ("stringatrice", str_conf),
+        ("fine_buona", fine_buona_conf),
+        ("fine_scarto", fine_scarto_conf),
+        ("esito_scarto_compilato", esito_conf),
+    ):
+        if conf:
+            areas[key] = (conf["db"], conf["byte"], 1)
+
+    raw = dict(zip(areas, await plc_connection.read_areas(list(areas.values()))))
+    trigger_value = get_bool(raw["trigger"], 0, trigger_conf["bit"])
 
     object_id = ""
     stringatrice = ""
@@ -36,53 +54,35 @@ async def send_initial_state(websocket: WebSocket, channel_id: str, plc_connecti
     full_id = f"{line_name}.{channel_id}"
 
     if trigger_value:
-        id_mod_conf = paths["id_modulo"]
-
         ###############################################################################################################################
         if debug:
             object_id = global_state.debug_moduli.get(full_id)
-        else:
-            object_id = await asyncio.to_thread(
-                plc_connection.read_string,
-                id_mod_conf["db"], id_mod_conf["byte"], id_mod_conf["length"]
-            )
+        elif id_mod_conf:
+            id_mod_raw = raw["id_modulo"]
+            length = min(id_mod_raw[1], id_mod_conf["length"])
+            object_id = id_mod_raw[2:2 + length].decode("ascii", errors="ignore")
         ###############################################################################################################################
 
-        str_conf = paths["stringatrice"]
-        values = [
-            await asyncio.to_thread(plc_connection.read_bool, str_conf["db"], str_conf["byte"], i)
-            for i in range(str_conf["length"])
-        ]
+        if str_conf:
+            values = [get_bool(raw["stringatrice"], 0, i) for i in range(str_conf["length"])]
 
-        if not any(values):
-            values[0] = True
+            if not any(values):
+                values[0] = True
 
-        stringatrice_index = values.index(True) + 1
-        stringatrice = str(stringatrice_index)
+            stringatrice_index = values.index(True) + 1
+            stringatrice = str(stringatrice_index)
 
-        fine_buona_conf = paths["fine_buona"]
-        fine_buona = await asyncio.to_thread(
-            plc_connection.read_bool,
-            fine_buona_conf["db"], fine_buona_conf["byte"], fine_buona_conf["bit"]
-        )
-
-        fine_scarto_conf = paths["fine_scarto"]
-        fine_scarto = await asyncio.to_thread(
-            plc_connection.read_bool,
-            fine_scarto_conf["db"], fine_scarto_conf["byte"], fine_scarto_conf["bit"]
-        )
+        fine_buona = fine_buona_conf is not None and get_bool(raw["fine_buona"], 0, fine_buona_conf["bit"])
+        fine_scarto = fine_scarto_conf is not None and get_bool(raw["fine_scarto"], 0, fine_scarto_conf["bit"])
 
         if fine_buona:
             outcome = "buona"
         elif fine_scarto:
             outcome = "scarto"
 
-        esito_conf = paths["esito_scarto_compilato"]
-        issues_value = await asyncio.to_thread(
-            plc_connection.read_bool,
-            esito_conf["db"], esito_conf["byte"], esito_conf["bit"]
+        issues_submitted = esito_conf is not None and get_bool(
+            raw["esito_scarto_compilato"], 0, esito_conf["bit"]
         )
-        issues_submitted = issues_value is True
 
     await websocket.send_json({
         "trigger": trigger_value,
@@ -93,108 +93,44 @@ async def send_initial_state(websocket: WebSocket, channel_id: str, plc_connecti
     })
 
 async def broadcast(line_name: str, channel_id: str, message: dict):
-    key = f"{line_name}.{channel_id}"
-    summary_key = f"{line_name}.summary"
-
-    # Helper
-    async def send_safe(ws):
-        try:
-            await ws.send_json(message)
-            return ws  # Keep it
-        except Exception:
-            return None  # Drop it
-
-    # Send to main channel
-    conns = subscriptions.get(key, set())
-    results = await asyncio.gather(*(send_safe(ws) for ws in conns))
-    subscriptions[key] = {ws for ws in results if ws}
-
-    # Send to summary channel
-    summary_conns = subscriptions.get(summary_key, set())
-    summary_results = await asyncio.gather(*(send_safe(ws) for ws in summary_conns))
-    subscriptions[summary_key] = {ws for ws in summary_results if ws}
-
-
-# Clean recursively: convert Decimal → float
-def clean_for_json(obj):
-    if isinstance(obj, dict):
-        return {k: clean_for_json(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [clean_for_json(v) for v in obj]
-    elif isinstance(obj, Decimal):
-        return float(obj)
-    elif isinstance(obj, set):  # 👈 FIX
-        return list(obj)
-    else:
-        return obj
-
-# Initialize once at startup
-if not hasattr(global_state, "last_sent"):
-    global_state.last_sent = {}
-
-async def broadcast_zone_update(line_name: str, zone: str, payload: dict):
-    logger.debug(f"📢 Broadcasting {zone} update to {line_name}")
-    key = f"{line_name}.visual.{zone}"
-    ws_set = subscriptions.get(key, set()).copy()
+    # One encoding for the station channel and the line summary
+    global_state.ws_hub.publish(
+        message,
+        subscriptions.get(f"{line_name}.{channel_id}", set()),
+        subscriptions.get(f"{line_name}.summary", set()),
+    )
 
-    # 🧹 Remove volatile/internal fields
-    payload = copy.deepcopy(payload)
-    payload.pop("__seen", None)
 
-    # 🧼 Clean for JSON serialization
-    payload_clean = clean_for_json(payload)
-    if not isinstance(payload_clean, dict):
-        raise ValueError("broadcast_zone_update expects payload to clean into a dict")
+async def broadcast_zone_update(line_name: str, zone: str, payload: ZoneView | dict):
+    with trace_span("broadcast"):
+        await _broadcast_zone_update(line_name, zone, payload)
 
-    # 🚫 Skip if identical to last payload
-    if global_state.last_sent.get(key) == payload_clean:
-        return
+async def _broadcast_zone_update(line_name: str, zone: str, payload: ZoneView | dict):
+    key = f"{line_name}.visual.{zone}"
+    view = payload if isinstance(payload, ZoneView) else make_view(payload)
+    stream = global_state.zone_streams.setdefault(key, ZoneStream())
 
-    global_state.last_sent[key] = payload_clean
+    # 🚫 Skip if stale or identical to the last payload
+    message = stream.advance(view)
+    if message is None:
+        return
+    logger.debug(f"📢 Broadcasting {zone} update to {line_name} ({message['type']} #{message['seq']})")
 
-    for ws in ws_set:
-        try:
-            if getattr(ws, "client_state", None) and ws.client_state.name != "CONNECTED":
-                raise ConnectionError("WebSocket not connected")
-            await ws.send_json(payload_clean)
-        except Exception as e:
-            logger.warning(f"❌ WebSocket broadcast failed ({key}): {e}")
-            subscriptions[key].discard(ws)
+    # Legacy subscribers: the whole payload; delta subscribers: the patch
+    global_state.ws_hub.publish(view.data, subscriptions.get(key, set()))
+    global_state.ws_hub.publish(message, subscriptions.get(f"{key}.delta", set()))
 
 
 async def broadcast_stringatrice_warning(line_name: str, warning: dict):
     """
     Send a warning packet to every subscriber of /ws/warnings/{line_name}
     """
-    key = f"{line_name}.warnings"
-    websockets = subscriptions.get(key, set()).copy()   # snapshot avoids RuntimeError
-    for ws in websockets:
-        try:
-            await ws.send_json(warning)
-        except Exception:
-            subscriptions[key].discard(ws)
+    global_state.ws_hub.publish(warning, subscriptions.get(f"{line_name}.warnings", set()))
 
 async def broadcast_export_progress(progress_id: str, payload: dict):
     """Broadcast export progress updates to subscribers."""
-    key = f"export.{progress_id}"
-    websockets = subscriptions.get(key, set()).copy()
-    for ws in websockets:
-        try:
-            if getattr(ws, "client_state", None) and ws.client_state.name != "CONNECTED":
-                raise ConnectionError("WebSocket not connected")
-            await ws.send_json(payload)
-        except Exception as e:
-            logger.warning(f"❌ WebSocket broadcast failed ({key}): {e}")
-            subscriptions[key].discard(ws)
+    global_state.ws_hub.publish(payload, subscriptions.get(f"export.{progress_id}", set()))
 
 async def broadcast_escalation_update(payload: list[dict]):
-    message = {"type": "escalation_update", "payload": clean_for_json(payload)}
-    websockets = global_state.escalation_websockets.copy()
-    for ws in websockets:
-        try:
-            if getattr(ws, "client_state", None) and ws.client_state.name != "CONNECTED":
-                raise ConnectionError("WebSocket not connected")
-            await ws.send_json(message)
-        except Exception as e:
-            logger.warning(f"❌ WebSocket broadcast failed (/ws/escalations): {e}")
-            global_state.escalation_websockets.discard(ws)
+    message = {"type": "escalation_update", "payload": payload}
+    global_state.ws_hub.publish(message, global_state.escalation_websockets)
@@ -7,7 +7,7 @@ import logging
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from service.connections.mysql import (
-    get_mysql_connection,
+    run_db,
     create_stop,
     update_stop_status,
     get_escalations_for_station,
@@ -57,7 +57,7 @@ async def api_create_stop(payload: Dict[str, Any]):
     - station_id, start_time, operator_id, stop_type, reason, status, linked_production_id
     """
     try:
-        with get_mysql_connection() as conn:
+        def _create(conn):
             stop_id = create_stop(
                 station_id=payload["station_id"],
                 start_time=payload["start_time"],
@@ -69,8 +69,10 @@ async def api_create_stop(payload: Dict[str, Any]):
                 linked_production_id=payload.get("linked_production_id"),
                 conn=conn,
             )
-            updated = build_escalation_list(conn)
-            await broadcast_escalation_update(updated)
+            return stop_id, build_escalation_list(conn)
+
+        stop_id, updated = await run_db(_create)
+        await broadcast_escalation_update(updated)
         return {"status": "ok", "stop_id": stop_id}
     except Exception as e:
         logger.error(f"Error creating stop: {e}")
@@ -87,7 +89,7 @@ async def api_update_status(payload: Dict[str, Any]):
     - stop_id, new_status, changed_at, operator_id
     """
     try:
-        with get_mysql_connection() as conn:
+        def _update(conn):
             update_stop_status(
                 stop_id=payload["stop_id"],
                 new_status=payload["new_status"],
@@ -95,8 +97,10 @@ async def api_update_status(payload: Dict[str, Any]):
                 operator_id=payload["operator_id"],
                 conn=conn,
             )
-            updated = build_escalation_list(conn)
-            await broadcast_escalation_update(updated)
+            return build_escalation_list(conn)
+
+        updated = await run_db(_update)
+        await broadcast_escalation_update(updated)
         return {"status": "ok"}
     except Exception as e:
         logger.error(f"Error updating stop status: {e}")
@@ -109,14 +113,16 @@ async def api_update_status(payload: Dict[str, Any]):
 async def api_update_reason(payload: Dict[str, Any]):
     """Update reason/title text for an existing stop."""
     try:
-        with get_mysql_connection() as conn:
+        def _update(conn):
             update_stop_reason(
                 stop_id=payload["stop_id"],
                 reason=payload["reason"],
                 conn=conn,
             )
-            updated = build_escalation_list(conn)
-            await broadcast_escalation_update(updated)
+            return build_escalation_list(conn)
+
+        updated = await run_db(_update)
+        await broadcast_escalation_update(updated)
         return {"status": "ok"}
     except Exception as e:
         logger.error(f"Error updating stop reason: {e}")
@@ -127,24 +133,26 @@ async def api_update_reason(payload: Dict[str, Any]):
 # -------------------------
 @router.get("/api/escalation/get_stops/{station_id}")
 async def api_get_stops(station_id: int, shifts_back: int = 3, include_open: int = 0):
-    with get_mysql_connection() as conn:
-        stops = get_escalations_for_station(
+    stops = await run_db(
+        lambda conn: get_escalations_for_station(
             station_id,
             conn,
             shifts_back,
             include_open=bool(include_open)
         )
+    )
     return {"status": "ok", "stops": stops}
 
 @router.get("/api/stops/get_machine_stops/{station_id}")
 async def api_get_machine_stops(station_id: int, shifts_back: int = 3, include_open: int = 0):
-    with get_mysql_connection() as conn:
-        stops = get_machine_stops_for_station(
+    stops = await run_db(
+        lambda conn: get_machine_stops_for_station(
             station_id,
             conn,
             shifts_back,
             include_open=bool(include_open)
         )
+    )
     return {"status": "ok", "stops": stops}
 
 # -------------------------
@@ -153,8 +161,7 @@ async def api_get_machine_stops(station_id: int, shifts_back: int = 3, include_o
 @router.get("/api/escalation/get_stop_details/{stop_id}")
 async def api_get_stop_details(stop_id: int):
     try:
-        with get_mysql_connection() as conn:
-            data = get_stop_with_levels(stop_id, conn)
+        data = await run_db(lambda conn: get_stop_with_levels(stop_id, conn))
         return {"status": "ok", "stop": data}
     except Exception as e:
         logger.error(f"Error fetching stop details: {e}")
@@ -163,7 +170,7 @@ async def api_get_stop_details(stop_id: int):
 @router.delete("/api/escalation/delete_stop/{stop_id}")
 async def api_delete_stop(stop_id: int):
     try:
-        with get_mysql_connection() as conn:
+        def _delete(conn):
             with conn.cursor() as cursor:
                 # 1️⃣ First delete related status change records
                 cursor.execute("DELETE FROM stop_status_changes WHERE stop_id = %s", (stop_id,))
@@ -172,8 +179,10 @@ async def api_delete_stop(stop_id: int):
                 cursor.execute("DELETE FROM stops WHERE id = %s", (stop_id,))
 
             conn.commit()
-            updated = build_escalation_list(conn)
-            await broadcast_escalation_update(updated)
+            return build_escalation_list(conn)
+
+        updated = await run_db(_delete)
+        await broadcast_escalation_update(updated)
         return {"status": "ok"}
     except Exception as e:
         logger.error(f"Error deleting stop {stop_id}: {e}")
@@ -6,7 +6,10 @@ from datetime import datetime, timedelta, time as dt_time
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from service.helpers.export import EXPORT_DIR, clean_old_exports, export_full_excel
+from pymysql.cursors import SSDictCursor
+
+from service.config.config import EXPORT_CHUNK_MODULES, EXPORT_SHEET_WORKERS
+from service.helpers.export import EXPORT_DIR, EXPORT_FORMATS, clean_old_exports, export_full_excel, export_streaming
 from service.routes.broadcast import broadcast_export_progress
 from service.config.settings import load_settings
 from service.connections.mysql import get_mysql_connection
@@ -15,19 +18,8 @@ router = APIRouter()
 
 logger = logging.getLogger(__name__)
 
-# ---------------------------------------------------------------------------
-#  EXPORT END-POINT – ACCETTA:
-#    • modulo_ids     → id_modulo (stringhe) oppure objects.id (int)
-#    • production_ids → productions.id (int) quando full_history=False
-# ---------------------------------------------------------------------------
-@router.post("/api/export_objects")
-def export_objects(background_tasks: BackgroundTasks, data: dict = Body(...)):
-    filters: List[Dict] = data.get("filters", [])
-    object_ids: List[str] = data.get("modulo_ids", [])
-    production_ids_raw = data.get("production_ids", [])
-    full_history: bool = data.get("fullHistory", False)
-    progress_id: str | None = data.get("progressId")
-
+def _progress_sender(progress_id: str | None):
+    """Callback broadcasting export progress to the client waiting on ``progress_id``."""
     def send_progress(step: str, current: int | None = None, total: int | None = None):
         if not progress_id:
             return
@@ -48,6 +40,187 @@ def export_objects(background_tasks: BackgroundTasks, data: dict = Body(...)):
         except Exception as e:
             logger.warning(f"⚠️ Could not broadcast export progress: {e}")
 
+    return send_progress
+
+
+def _filter_defects(defects: List[Dict], filters: List[Dict]) -> List[Dict]:
+    """Apply the "Difetto" filters: keep the defects whose category matches every one."""
+    for f in filters:
+        if f.get("type") == "Difetto":
+            requested = f.get("value", "").split(">")[0].strip().lower()
+            defects = [d for d in defects if requested in d.get("category", "").lower()]
+    return defects
+
+
+def _production_scope(object_ids: List[str], production_ids: List[int], full_history: bool) -> tuple[str, tuple]:
+    """WHERE on ``productions p`` (with its params) selecting what export_objects exports."""
+    modulo_ids = [oid for oid in object_ids if not str(oid).isdigit()]
+    int_obj_ids = [int(oid) for oid in object_ids if str(oid).isdigit()]
+
+    clauses, params = [], []
+    if int_obj_ids:
+        clauses.append(f"id IN ({','.join(['%s'] * len(int_obj_ids))})")
+        params.extend(int_obj_ids)
+    if modulo_ids:
+        clauses.append(f"id_modulo IN ({','.join(['%s'] * len(modulo_ids))})")
+        params.extend(modulo_ids)
+
+    scope = []
+    if clauses:
+        scope.append(f"p.object_id IN (SELECT id FROM objects WHERE {' OR '.join(clauses)})")
+    if not full_history:
+        scope.append(f"p.id IN ({','.join(['%s'] * len(production_ids))})")
+        params.extend(production_ids)
+    return " AND ".join(scope) or "1=1", tuple(params)
+
+
+def _export_meta(cursor, where: str, params: tuple, filters: List[Dict]) -> dict:
+    """What every chunk of a streamed export shares, plus the module count and the NG Altro columns."""
+    settings = load_settings()
+    meta = {
+        "filters": filters,
+        "min_cycle_threshold": settings.get("min_cycle_threshold", 3.0),
+        "export_mbj_image": settings.get("export_mbj_image", True),
+        "mbj_fields": settings.get("mbj_fields", {}),
+    }
+
+    cursor.execute("SELECT * FROM stations")
+    meta["stations"] = cursor.fetchall()
+
+    cursor.execute("SELECT * FROM production_lines")
+    meta["production_lines"] = cursor.fetchall()
+
+    cursor.execute(f"SELECT COUNT(DISTINCT p.object_id) AS n FROM productions p WHERE {where}", params)
+    meta["module_total"] = cursor.fetchone()["n"]
+
+    descriptions = set()
+    if _filter_defects([{"category": "Altro"}], filters):
+        cursor.execute(
+            f"""
+            SELECT DISTINCT od.extra_data
+            FROM object_defects od
+            JOIN defects d ON od.defect_id = d.id
+            JOIN productions p ON od.production_id = p.id
+            WHERE d.category = 'Altro' AND {where}
+            """,
+            params,
+        )
+        descriptions = {str(row["extra_data"]).strip() for row in cursor.fetchall() if row["extra_data"]}
+    meta["altro_descriptions"] = sorted(descriptions - {""})
+    return meta
+
+
+def _load_chunk(cursor, productions: List[Dict], filters: List[Dict]) -> dict:
+    """Objects and (filtered) defects of one chunk of productions."""
+    object_ids = list(dict.fromkeys(p["object_id"] for p in productions))
+    cursor.execute(
+        f"SELECT * FROM objects WHERE id IN ({','.join(['%s'] * len(object_ids))})",
+        tuple(object_ids),
+    )
+    objects = cursor.fetchall()
+
+    production_ids = [p["id"] for p in productions]
+    cursor.execute(
+        f"""
+        SELECT od.*, d.category
+        FROM object_defects od
+        JOIN defects d ON od.defect_id = d.id
+        WHERE od.production_id IN ({','.join(['%s'] * len(production_ids))})
+        """,
+        tuple(production_ids),
+    )
+    return {
+        "objects": objects,
+        "id_moduli": [o["id_modulo"] for o in objects],
+        "productions": productions,
+        "object_defects": _filter_defects(cursor.fetchall(), filters),
+    }
+
+
+def _export_chunks(stream_conn, lookup_conn, where: str, params: tuple, filters: List[Dict], chunk_modules: int):
+    """
+    Export data of the productions matching ``where``, ``chunk_modules``
+    whole modules at a time. Productions come through a server-side cursor
+    ordered by object, so only the current chunk is held in memory; objects
+    and defects of each chunk are read on ``lookup_conn``.
+    """
+    with stream_conn.cursor(SSDictCursor) as stream, lookup_conn.cursor() as lookup:
+        # The stream waits while each chunk is written: don't let the server give up on it
+        stream.execute("SET SESSION net_write_timeout = 600")
+        stream.execute(f"SELECT p.* FROM productions p WHERE {where} ORDER BY p.object_id, p.end_time", params)
+
+        batch: List[Dict] = []
+        modules = 0
+        for production in stream:
+            if not batch or production["object_id"] != batch[-1]["object_id"]:
+                if modules == chunk_modules:
+                    yield _load_chunk(lookup, batch, filters)
+                    batch, modules = [], 0
+                modules += 1
+            batch.append(production)
+        if batch:
+            yield _load_chunk(lookup, batch, filters)
+
+
+def _stream_export(background_tasks: BackgroundTasks, where: str, params: tuple, filters: List[Dict], send_progress,
+                   export_format: str = "xlsx"):
+    """
+    Streaming export of the productions matching ``where``: read and written
+    EXPORT_CHUNK_MODULES modules at a time, with memory bounded by the chunk
+    instead of the time range.
+    """
+    send_progress("db_connect")
+
+    stream_conn = get_mysql_connection()
+    if not stream_conn:
+        return JSONResponse(status_code=500, content={"error": "MySQL connection not available"})
+
+    try:
+        with stream_conn, get_mysql_connection() as lookup_conn:
+            with lookup_conn.cursor() as cursor:
+                meta = _export_meta(cursor, where, params, filters)
+            if not meta["module_total"]:
+                logger.info("Streaming export: no productions found")
+                return {"status": "ok", "filename": None}
+
+            send_progress("excel")
+            filename = export_streaming(
+                _export_chunks(stream_conn, lookup_conn, where, params, filters, EXPORT_CHUNK_MODULES),
+                meta,
+                progress_callback=send_progress,
+                export_format=export_format,
+            )
+    except Exception as e:
+        logger.error(f"❌ Error during streaming export: {e}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+    background_tasks.add_task(clean_old_exports, max_age_hours=2)
+    send_progress("done")
+
+    return {"status": "ok", "filename": filename}
+
+
+# ---------------------------------------------------------------------------
+#  EXPORT END-POINT – ACCETTA:
+#    • modulo_ids     → id_modulo (stringhe) oppure objects.id (int)
+#    • production_ids → productions.id (int) quando full_history=False
+#    • stream         → True: esportazione a blocchi di moduli (memoria costante)
+#    • format         → "xlsx" (default), "xlsx-fast" (xlsxwriter), "csv" / "parquet" (zip, un file per foglio)
+# ---------------------------------------------------------------------------
+@router.post("/api/export_objects")
+def export_objects(background_tasks: BackgroundTasks, data: dict = Body(...)):
+    filters: List[Dict] = data.get("filters", [])
+    object_ids: List[str] = data.get("modulo_ids", [])
+    production_ids_raw = data.get("production_ids", [])
+    full_history: bool = data.get("fullHistory", False)
+    progress_id: str | None = data.get("progressId")
+    export_format: str = data.get("format", "xlsx")
+
+    if export_format not in EXPORT_FORMATS:
+        return JSONResponse(status_code=400, content={"error": f"Unknown export format: {export_format}"})
+
+    send_progress = _progress_sender(progress_id)
+
     object_ids = [oid for oid in object_ids if str(oid).strip()]
     production_ids = [int(pid) for pid in production_ids_raw if str(pid).isdigit()]
 
@@ -56,6 +229,10 @@ def export_objects(background_tasks: BackgroundTasks, data: dict = Body(...)):
     if not full_history and not production_ids:
         return {"status": "ok", "filename": None}
 
+    if data.get("stream"):
+        where, params = _production_scope(object_ids, production_ids, full_history)
+        return _stream_export(background_tasks, where, params, filters, send_progress, export_format)
+
     send_progress("db_connect")
 
     conn = get_mysql_connection()
@@ -167,12 +344,7 @@ def export_objects(background_tasks: BackgroundTasks, data: dict = Body(...)):
                 else:
                     defects = []
 
-                for f in filters:
-                    if f.get("type") == "Difetto":
-                        requested = f.get("value", "").split(">")[0].strip().lower()
-                        defects = [d for d in defects if requested in d.get("category", "").lower()]
-
-                export_data["object_defects"] = defects
+                export_data["object_defects"] = _filter_defects(defects, filters)
                 send_progress("defects")
 
     except Exception as e:
@@ -180,7 +352,22 @@ def export_objects(background_tasks: BackgroundTasks, data: dict = Body(...)):
         return JSONResponse(status_code=500, content={"error": str(e)})
 
     send_progress("excel")
-    filename = export_full_excel(export_data, progress_callback=send_progress)
+    if export_format == "xlsx":
+        filename = export_full_excel(export_data, progress_callback=send_progress, workers=EXPORT_SHEET_WORKERS)
+    else:
+        # Other formats: the whole export as the one chunk of a streaming one.
+        # The Metadata sheet is written from meta, not from the chunk
+        meta = {
+            key: export_data[key]
+            for key in ("filters", "min_cycle_threshold", "stations", "production_lines")
+        }
+        meta["module_total"] = len(export_data.get("id_moduli", []))
+        filename = export_streaming(
+            [export_data],
+            meta,
+            progress_callback=send_progress,
+            export_format=export_format,
+        )
     background_tasks.add_task(clean_old_exports, max_age_hours=2)
     send_progress("done")
 
@@ -197,51 +384,22 @@ def daily_export(background_tasks: BackgroundTasks, data: dict = Body(...)):
     start_dt = datetime.combine(now.date() - timedelta(days=1), dt_time(hour=6))
     end_dt = datetime.combine(now.date(), dt_time(hour=5, minute=59, second=59))
 
-    conn = get_mysql_connection()
-    if not conn:
-        return JSONResponse(status_code=500, content={"error": "MySQL connection not available"})
-
-    try:
-        with conn:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    SELECT p.id AS production_id, o.id_modulo
-                    FROM productions p
-                    JOIN objects o ON p.object_id = o.id
-                    WHERE p.start_time >= %s AND p.start_time <= %s
-                    """,
-                    (start_dt, end_dt),
-                )
-                rows = cursor.fetchall()
-    except Exception as e:
-        logger.error(f"❌ Error during daily export DB query: {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
-
-    if not rows:
-        logger.info("Daily export: no data found for %s - %s", start_dt, end_dt)
-        return {"status": "ok", "filename": None}
-
-    production_ids = [row["production_id"] for row in rows]
-    modulo_ids = [row["id_modulo"] for row in rows]
-
-    full_history = False
     date_format = "%d %b %Y – %H:%M"
-
-    payload = {
-        "filters": [
-            {
-                "type": "Data",
-                "value": f"{start_dt.strftime(date_format)} → {end_dt.strftime(date_format)}",
-            }
-        ],
-        "production_ids": production_ids,
-        "modulo_ids": modulo_ids,
-        "fullHistory": full_history,
-        "progressId": progress_id,
-    }
-
-    return export_objects(background_tasks, payload)
+    filters = [
+        {
+            "type": "Data",
+            "value": f"{start_dt.strftime(date_format)} → {end_dt.strftime(date_format)}",
+        }
+    ]
+
+    # Streamed straight from the time range, no id lists
+    return _stream_export(
+        background_tasks,
+        "p.start_time >= %s AND p.start_time <= %s",
+        (start_dt, end_dt),
+        filters,
+        _progress_sender(progress_id),
+    )
 
 # ---------------------------------------------------------------------------
 #  Download
@@ -253,6 +411,10 @@ def download_export(filename: str):
         return FileResponse(
             filepath,
             filename=filename,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            media_type=(
+                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                if filename.endswith(".xlsx")
+                else "application/zip"    # csv / parquet bundles
+            ),
         )
     raise HTTPException(status_code=404, detail="File not found")
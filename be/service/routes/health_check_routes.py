@@ -14,7 +14,7 @@ from datetime import timedelta, datetime
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from service.connections.mysql import get_mysql_connection
-from service.state.global_state import plc_connections
+from service.state.global_state import plc_connections, cycle_latency
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -116,6 +116,19 @@ async def health_check(response: Response):
     return health_response
 
 
+@router.get("/api/health_check/latency")
+async def cycle_latency_report(reset: bool = False) -> Dict[str, Dict[str, Dict]]:
+    """
+    Per-station latency percentiles of every esito stage, from the PLC edge
+    (``start.*`` trigger, ``end.*`` fine ciclo) to the WebSocket broadcast.
+    ``reset=true`` clears the histograms after reading them.
+    """
+    report = cycle_latency.summary()
+    if reset:
+        cycle_latency.reset()
+    return report
+
+
 # --- Web Health Endpoint ---
 
 @router.get("/web_health")
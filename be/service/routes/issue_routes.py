@@ -3,7 +3,6 @@
 import base64
 from fastapi import APIRouter, HTTPException, Request, Query
 from fastapi.responses import JSONResponse
-import asyncio
 import logging
 
 import os
@@ -12,12 +11,11 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from service.connections.temp_data import load_temp_data, save_temp_data
-from service.connections.mysql import get_mysql_connection, insert_defects, update_esito, check_stringatrice_warnings
+from service.connections.mysql import run_db, insert_defects, update_esito, check_stringatrice_warnings
 from service.helpers.helpers import get_channel_config
 from service.state.global_state import plc_connections, incomplete_productions
 from service.config.settings import load_settings
 from service.config.config import ISSUE_TREE, debug
-from service.helpers.executor import run_in_thread
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -59,7 +57,7 @@ async def set_issues(request: Request):
 
     if production_id:
         try:
-            with get_mysql_connection() as conn:
+            def _save(conn):
                 with conn.cursor() as cursor:
                     result = {
                         "Id_Modulo": object_id,
@@ -67,14 +65,13 @@ async def set_issues(request: Request):
                         "issues": issues
                     }
 
-                    await run_in_thread(insert_defects, result, production_id, channel_id, line_name, cursor=cursor)
-                    await run_in_thread(update_esito, 6, production_id, cursor=cursor, connection=conn)
+                    insert_defects(result, production_id, channel_id, line_name, cursor=cursor)
+                    update_esito(6, production_id, cursor=cursor, connection=conn)
 
                 conn.commit()
 
-            with get_mysql_connection() as conn:
-            # You can call this outside the context manager if it doesn't use the same `conn`
-                await check_stringatrice_warnings(line_name, conn, get_current_settings())
+            await run_db(_save)
+            await check_stringatrice_warnings(line_name, get_current_settings())
 
         except ValueError as e:
             return JSONResponse(status_code=400, content={"error": str(e)})
@@ -87,7 +84,7 @@ async def set_issues(request: Request):
 
     # ✅ Write confirmation back to PLC
     target = paths["esito_scarto_compilato"]
-    await asyncio.to_thread(plc_connection.write_bool, target["db"], target["byte"], target["bit"], True)
+    await plc_connection.write_bool(target["db"], target["byte"], target["bit"], True)
 
     return {"status": "ok"}
 
@@ -147,7 +144,7 @@ async def get_issues_for_object(
                 return JSONResponse(status_code=404, content={"error": "esito_scarto_compilato not found in mapping"})
             target = paths["esito_scarto_compilato"]
 
-        with get_mysql_connection() as conn:
+        def _fetch_defects(conn, production_id):
             with conn.cursor() as cursor:
                 # 1. Trova l'object_id
                 cursor.execute("SELECT id FROM objects WHERE id_modulo = %s", (id_modulo,))
@@ -169,10 +166,10 @@ async def get_issues_for_object(
                     latest_prod = cursor.fetchone()
 
                     if not latest_prod:
-                        return {"issue_paths": [], "pictures": []}
+                        return None
                     if latest_prod["station_type"] == "rework":
                         logger.debug("Latest production is rework → skipping defect extraction.")
-                        return {"issue_paths": [], "pictures": []}
+                        return None
 
                     cursor.execute("""
                         SELECT p.id
@@ -185,7 +182,7 @@ async def get_issues_for_object(
                     qc_prod = cursor.fetchone()
 
                     if not qc_prod:
-                        return {"issue_paths": [], "pictures": []}
+                        return None
                     production_id = qc_prod["id"]
                 else:
                     logger.debug(f'Using provided ProductionId: {production_id}')
@@ -200,7 +197,11 @@ async def get_issues_for_object(
                     WHERE od.production_id = %s
                 """, (production_id,))
 
-                defects = cursor.fetchall()
+                return cursor.fetchall()
+
+        defects = await run_db(_fetch_defects, production_id)
+        if defects is None:
+            return {"issue_paths": [], "pictures": []}
 
         # 4. Fuori dal context → costruzione risposte
         issue_paths, pictures = [], []
@@ -243,7 +244,7 @@ async def get_issues_for_object(
             if debug:
                 logger.debug(f"Writing to PLC for {full_id}")
             else:
-                await asyncio.to_thread(plc_connection.write_bool, target["db"], target["byte"], target["bit"], True)
+                await plc_connection.write_bool(target["db"], target["byte"], target["bit"], True)
 
         return {"issue_paths": issue_paths, "pictures": pictures}
 
@@ -0,0 +1,182 @@
+from datetime import datetime
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import service.state.global_state as global_state
+from service.state.global_state import metrics
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+metrics.describe("pms_mysql_pool_connections", "gauge", "MySQL pool connections by state")
+metrics.describe("pms_mysql_pool_wait_seconds", "histogram", "Time spent waiting for a pooled MySQL connection")
+metrics.describe("pms_mysql_pool_errors_total", "counter", "Failed attempts to get a pooled MySQL connection")
+metrics.describe("pms_executor_threads", "gauge", "Thread pool workers by state")
+metrics.describe("pms_executor_queue_depth", "gauge", "Jobs waiting for a thread pool worker")
+metrics.describe("pms_db_write_queue_depth", "gauge", "Deferred DB writes waiting in DBWriteQueue")
+metrics.describe("pms_db_write_queue_tasks_total", "counter", "DBWriteQueue jobs by outcome")
+metrics.describe("pms_db_write_queue_spilled", "gauge", "Deferred DB writes held only in the on-disk journal")
+metrics.describe("pms_db_write_queue_batches_total", "counter", "Same-type DBWriteQueue jobs run as one batch")
+metrics.describe("pms_db_write_queue_journal_bytes", "gauge", "Size of the DBWriteQueue journal file")
+metrics.describe("pms_ingest_batches_total", "counter", "Production ingest windows committed")
+metrics.describe("pms_ingest_events_total", "counter", "Production starts, ends and defect sets written by the ingest")
+metrics.describe("pms_ingest_fallbacks_total", "counter", "Ingest windows retried event by event after a failure")
+metrics.describe("pms_ingest_commit_seconds", "histogram", "Time to write and commit one ingest window")
+metrics.describe("pms_reference_object_lookups_total", "counter", "id_modulo -> objects.id cache lookups by result")
+metrics.describe("pms_reference_object_cache_size", "gauge", "id_modulo -> objects.id entries cached")
+metrics.describe("pms_reference_reloads_total", "counter", "Reference data (lines, stations, defects) loads")
+metrics.describe("pms_rollup_deltas_total", "counter", "Incremental updates applied to the hourly production rollup")
+metrics.describe("pms_rollup_rebuilds_total", "counter", "Hour ranges of the production rollup rebuilt from productions")
+metrics.describe("pms_rollup_covered_hours", "gauge", "Hours back from now the production rollup can answer")
+metrics.describe("pms_visual_checkpoint_saves_total", "counter", "visual_data checkpoints written")
+metrics.describe("pms_visual_checkpoint_bytes", "gauge", "Size of the last visual_data checkpoint")
+metrics.describe("pms_visual_checkpoint_replayed_total", "counter", "Productions replayed onto a restored checkpoint")
+metrics.describe("pms_visual_messages_total", "counter", "Zone messages broadcast to delta subscribers, by type")
+metrics.describe("pms_plc_connected", "gauge", "1 when the PLC link is up")
+metrics.describe("pms_plc_request_queue_depth", "gauge", "S7 requests waiting for the PLC connection thread")
+metrics.describe("pms_plc_request_seconds", "histogram", "S7 request latency, queue wait excluded")
+metrics.describe("pms_plc_errors_total", "counter", "S7 communication errors")
+metrics.describe("pms_plc_reconnects_total", "counter", "PLC reconnect attempts by outcome")
+metrics.describe("pms_plc_poll_interval_seconds", "gauge", "Effective DB poll interval per PLC")
+metrics.describe("pms_ws_subscribers", "gauge", "Open WebSocket subscriptions per channel")
+metrics.describe("pms_ws_messages_encoded_total", "counter", "Broadcast messages encoded (once for all their subscribers)")
+metrics.describe("pms_ws_frames_sent_total", "counter", "WebSocket frames sent by the fan-out hub")
+metrics.describe("pms_ws_send_queue_depth", "gauge", "Frames queued for WebSocket clients")
+metrics.describe("pms_ws_clients_dropped_total", "counter", "Slow or broken WebSocket clients disconnected")
+
+
+def _mysql_pool():
+    pool = global_state.mysql_pool
+    total, available = pool.total_num, pool.available_num
+    return [
+        ("pms_mysql_pool_connections", {"state": "used"}, total - available),
+        ("pms_mysql_pool_connections", {"state": "available"}, available),
+        ("pms_mysql_pool_connections", {"state": "max"}, pool.maxsize),
+    ]
+
+
+def _executors():
+    samples = []
+    for name, executor in (("db", global_state.executor),):
+        alive = sum(1 for t in executor._threads if t.is_alive())
+        idle = executor._idle_semaphore._value
+        samples += [
+            ("pms_executor_threads", {"executor": name, "state": "max"}, executor._max_workers),
+            ("pms_executor_threads", {"executor": name, "state": "alive"}, alive),
+            ("pms_executor_threads", {"executor": name, "state": "busy"}, max(0, alive - idle)),
+            ("pms_executor_queue_depth", {"executor": name}, executor._work_queue.qsize()),
+        ]
+    return samples
+
+
+def _db_write_queue():
+    queue = global_state.db_write_queue
+    return [
+        ("pms_db_write_queue_depth", {}, queue.depth),
+        ("pms_db_write_queue_spilled", {}, queue.spilled),
+        ("pms_db_write_queue_batches_total", {}, queue.batches),
+        ("pms_db_write_queue_journal_bytes", {}, queue.journal.size if queue.journal else 0),
+        ("pms_db_write_queue_tasks_total", {"outcome": "completed"}, queue.completed),
+        ("pms_db_write_queue_tasks_total", {"outcome": "retried"}, queue.retries),
+        ("pms_db_write_queue_tasks_total", {"outcome": "failed"}, queue.failures),
+        ("pms_db_write_queue_tasks_total", {"outcome": "replayed"}, queue.replayed),
+    ]
+
+
+def _production_ingest():
+    ingest = global_state.production_ingest
+    if ingest is None:
+        return []
+    return [
+        ("pms_ingest_batches_total", {}, ingest.batches),
+        ("pms_ingest_events_total", {}, ingest.events),
+        ("pms_ingest_fallbacks_total", {}, ingest.fallbacks),
+    ]
+
+
+def _reference_data():
+    reference_data = global_state.reference_data
+    return [
+        ("pms_reference_object_lookups_total", {"result": "hit"}, reference_data.object_hits),
+        ("pms_reference_object_lookups_total", {"result": "miss"}, reference_data.object_misses),
+        ("pms_reference_object_cache_size", {}, reference_data.object_cache_len),
+        ("pms_reference_reloads_total", {}, reference_data.reloads),
+    ]
+
+
+def _production_rollup():
+    rollup = global_state.production_rollup
+    if rollup.covered_from is None:
+        covered = 0
+    else:
+        covered = max(0.0, (datetime.now() - rollup.covered_from).total_seconds() / 3600)
+    return [
+        ("pms_rollup_deltas_total", {}, rollup.deltas),
+        ("pms_rollup_rebuilds_total", {}, rollup.rebuilds),
+        ("pms_rollup_covered_hours", {}, round(covered, 1)),
+    ]
+
+
+def _visual_checkpoint():
+    checkpoint = global_state.visual_checkpoint
+    return [
+        ("pms_visual_checkpoint_saves_total", {}, checkpoint.saves),
+        ("pms_visual_checkpoint_bytes", {}, checkpoint.size),
+        ("pms_visual_checkpoint_replayed_total", {}, checkpoint.replayed),
+    ]
+
+
+def _visual_streams():
+    samples = []
+    for key, stream in global_state.zone_streams.items():
+        samples += [
+            ("pms_visual_messages_total", {"channel": key, "type": "patch"}, stream.patches),
+            ("pms_visual_messages_total", {"channel": key, "type": "snapshot"}, stream.snapshots),
+        ]
+    return samples
+
+
+def _plc_links():
+    samples = []
+    # plc_connections is keyed by station: several stations share one client
+    for client in {id(c): c for c in global_state.plc_connections.values()}.values():
+        plc = {"plc": f"{client.ip_address}:{client.slot}"}
+        samples += [
+            ("pms_plc_connected", plc, 1 if client.connected else 0),
+            ("pms_plc_request_queue_depth", plc, client.queue_size),
+            ("pms_plc_errors_total", plc, getattr(client.plc, "error_count", 0)),
+            ("pms_plc_reconnects_total", {**plc, "outcome": "attempt"}, client.reconnect_count),
+            ("pms_plc_reconnects_total", {**plc, "outcome": "success"}, client.reconnect_success),
+        ]
+    for (ip, slot), poller in global_state.plc_pollers.items():
+        samples.append(("pms_plc_poll_interval_seconds", {"plc": f"{ip}:{slot}"}, poller.effective_interval))
+    return samples
+
+
+def _websockets():
+    hub = global_state.ws_hub
+    return [
+        ("pms_ws_subscribers", {"channel": key}, len(sockets))
+        for key, sockets in list(global_state.subscriptions.items())
+    ] + [
+        ("pms_ws_messages_encoded_total", {}, hub.encoded),
+        ("pms_ws_frames_sent_total", {}, hub.sent),
+        ("pms_ws_send_queue_depth", {}, hub.queued),
+        ("pms_ws_clients_dropped_total", {}, hub.dropped),
+    ]
+
+
+for collector in (_mysql_pool, _executors, _db_write_queue, _production_ingest, _reference_data, _production_rollup,
+                  _visual_checkpoint, _visual_streams, _plc_links, _websockets):
+    metrics.add_collector(collector)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+    """Prometheus text exposition of pool, executor, queue, PLC and WebSocket metrics."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -18,6 +18,7 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from service.config.config import KNOWN_DEFECTS, DEFECT_SIMILARITY_MODEL_PATH
 from service.connections.mysql import get_mysql_connection
+from service.helpers.executor import run_in_thread
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -129,7 +130,7 @@ def filter_outliers(values, factor=1.5):
 
 # ------------------- MAIN LOGIC -------------------
 
-async def run_eta_prediction(production_id: int):
+def eta_prediction(production_id: int):
     try:
         with get_mysql_connection() as conn:
             with conn.cursor() as cursor:
@@ -229,25 +230,22 @@ async def run_eta_prediction(production_id: int):
         logger.error(f"❌ ETA prediction error: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
-# ------------------- ROUTES -------------------
-
-@router.post("/api/ml/predict_eta")
-async def predict_eta(req: PredictionRequest):
-    return await run_eta_prediction(req.production_id)
+async def run_eta_prediction(production_id: int):
+    # DB lookups and matching are blocking: keep them off the event loop
+    return await run_in_thread(eta_prediction, production_id)
 
-@router.post("/api/ml/predict_eta_by_id_modulo")
-async def predict_eta_by_id_modulo(req: EtaByModuloRequest):
+def eta_prediction_by_id_modulo(id_modulo: str):
     try:
         with get_mysql_connection() as conn:
             with conn.cursor() as cursor:
                 # Step 1: Resolve id_modulo → object.id
                 cursor.execute("""
                     SELECT id FROM objects WHERE id_modulo = %s
-                """, (req.id_modulo,))
+                """, (id_modulo,))
                 object_row = cursor.fetchone()
 
                 if not object_row:
-                    return JSONResponse(status_code=404, content={"error": f"id_modulo '{req.id_modulo}' not found in object table"})
+                    return JSONResponse(status_code=404, content={"error": f"id_modulo '{id_modulo}' not found in object table"})
 
                 object_id = object_row["id"]
 
@@ -267,8 +265,18 @@ async def predict_eta_by_id_modulo(req: EtaByModuloRequest):
 
                 production_id = prod_row["production_id"]
 
-        return await run_eta_prediction(production_id)
+        return eta_prediction(production_id)
 
     except Exception as e:
         logger.error(f"❌ predict_eta_by_id_modulo error: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
+
+# ------------------- ROUTES -------------------
+
+@router.post("/api/ml/predict_eta")
+async def predict_eta(req: PredictionRequest):
+    return await run_eta_prediction(req.production_id)
+
+@router.post("/api/ml/predict_eta_by_id_modulo")
+async def predict_eta_by_id_modulo(req: EtaByModuloRequest):
+    return await run_in_thread(eta_prediction_by_id_modulo, req.id_modulo)
@@ -6,7 +6,7 @@ import sys
 from pydantic import BaseModel
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from service.state.global_state import plc_connections
+from service.state.global_state import plc_connections, plc_pollers
 import service.state.global_state as global_state
 
 router = APIRouter()
@@ -29,6 +29,14 @@ async def plc_status():
 
     return statuses
 
+@router.get("/api/plc_poll_rate")
+async def plc_poll_rate():
+    """Effective poll interval of every PLC and the interval wanted by each of its stations."""
+    return {
+        f"{ip}:{slot}": poller.status()
+        for (ip, slot), poller in plc_pollers.items()
+    }
+
 class DebugTriggerRequest(BaseModel):
     station: str         # e.g. "LineaB.M309"
     trigger: bool        # True or False
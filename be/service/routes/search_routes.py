@@ -11,7 +11,7 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from service.config.config import COLUMN_MAP
-from service.connections.mysql import get_mysql_connection
+from service.connections.mysql import run_db
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -337,7 +337,7 @@ async def search_results(request: Request):
                 MIN(od.extra_data) AS extra_data
             """
 
-        with get_mysql_connection() as conn:
+        def _query(conn):
             with conn.cursor() as cursor:
                 if show_all_events:
                     # First: Get object_ids that match filters
@@ -421,6 +421,8 @@ async def search_results(request: Request):
                     })
                 return {"results": results}
 
+        return await run_db(_query)
+
     except Exception as e:
         logger.error(f"Search API Error: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
\ No newline at end of file
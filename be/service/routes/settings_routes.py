@@ -8,6 +8,7 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from service.config.settings import load_settings, save_settings, AllSettings
 from service.connections.mysql import get_mysql_connection
 from service.config.config import CHANNELS
+from service.state import global_state
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -35,6 +36,7 @@ def get_all_settings():
 @router.post("/api/settings")
 def set_all_settings(data: AllSettings):
     save_settings(data.dict())
+    global_state.reference_data.invalidate()
     return {"message": "Settings saved"}
 
 
@@ -42,9 +44,27 @@ def set_all_settings(data: AllSettings):
 def refresh_settings():
     global REFRESHED_SETTINGS
     REFRESHED_SETTINGS = load_settings()
+    global_state.reference_data.invalidate()
     return {"message": "Settings refreshed", "settings": REFRESHED_SETTINGS}
 
 
+@router.post("/api/reference_data/refresh")
+def refresh_reference_data(forget_objects: bool = False):
+    """Reload lines / stations / defects after editing them in the DB."""
+    reference_data = global_state.reference_data
+    with get_mysql_connection() as conn:
+        reference_data.load(conn)
+    if forget_objects:
+        reference_data.forget_objects()
+    return {
+        "message": "Reference data reloaded",
+        "lines": len(reference_data.lines),
+        "stations": len(reference_data.stations),
+        "defect_categories": len(reference_data.defect_categories),
+        "cached_objects": reference_data.object_cache_len,
+    }
+
+
 def get_refreshed_settings():
     global REFRESHED_SETTINGS
     if not REFRESHED_SETTINGS:
@@ -1,6 +1,5 @@
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import JSONResponse
-import asyncio
 import logging
 
 import os
@@ -12,7 +11,7 @@ from service.helpers.helpers import get_channel_config
 from service.state.global_state import plc_connections
 from service.routes.broadcast import broadcast
 from service.config.config import debug
-from service.connections.mysql import get_mysql_connection
+from service.connections.mysql import run_db
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -21,7 +20,7 @@ logger = logging.getLogger(__name__)
 @router.get("/api/station_for_object")
 async def get_station_for_object(id_modulo: str):
     try:
-        with get_mysql_connection() as conn:
+        def _query(conn):
             with conn.cursor() as cursor:
                 cursor.execute("SELECT id FROM objects WHERE id_modulo = %s", (id_modulo,))
                 obj = cursor.fetchone()
@@ -47,6 +46,8 @@ async def get_station_for_object(id_modulo: str):
 
                 return {"station": row["station_name"]}
 
+        return await run_db(_query)
+
     except Exception as e:
         logger.error(f"Error in get_station_for_object({id_modulo}): {e}")
         raise HTTPException(status_code=500, detail="Server error.")
@@ -74,8 +75,8 @@ async def set_outcome(request: Request):
 
     read_conf = config["id_modulo"]
     try:
-        current_object_id = await asyncio.to_thread(
-            plc_connection.read_string, read_conf["db"], read_conf["byte"], read_conf["length"]
+        current_object_id = await plc_connection.read_string(
+            read_conf["db"], read_conf["byte"], read_conf["length"]
         )
     except Exception as e:
         logger.error(f"Error reading PLC data: {e}")
@@ -94,7 +95,7 @@ async def set_outcome(request: Request):
 @router.get("/api/tablet_stations")
 async def get_qg_stations(line_name: str | None = None):
     try:
-        with get_mysql_connection() as conn:
+        def _query(conn):
             with conn.cursor() as cursor:
                 if line_name:
                     cursor.execute(
@@ -123,7 +124,9 @@ async def get_qg_stations(line_name: str | None = None):
                       AND plc != ''
                     """
                     )
-                stations = cursor.fetchall()
+                return cursor.fetchall()
+
+        stations = await run_db(_query)
         return {"stations": stations}
     except Exception as e:
         return {"error": str(e)}
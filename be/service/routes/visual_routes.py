@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException, Query
+import asyncio
 from datetime import datetime, timedelta
 import logging
 import os
@@ -6,15 +7,38 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from service.state import global_state
-from service.helpers.visual_helper import compute_zone_snapshot, load_targets, save_targets
+from service.helpers.executor import run_in_thread
+from service.helpers.visual_helper import (
+    advance_zone_state,
+    compute_zone_snapshot,
+    load_targets,
+    restore_visual_data,
+    save_targets,
+)
 from service.config.config import ZONE_SOURCES
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-def initialize_visual_cache():
-    for zone in ZONE_SOURCES:
-        global_state.visual_data[zone] = compute_zone_snapshot(zone)
+async def initialize_visual_cache():
+    """Warm start from the visual_data checkpoint; full snapshots only for the zones it cannot restore."""
+    now = datetime.now()
+    restored = []
+    if global_state.visual_checkpoint.enabled:
+        try:
+            restored = await run_in_thread(restore_visual_data, now)
+        except Exception as e:
+            logger.warning(f"visual_data checkpoint restore failed, recomputing: {e}")
+    missing = [zone for zone in ZONE_SOURCES if zone not in restored]
+    snapshots = await asyncio.gather(
+        *(run_in_thread(compute_zone_snapshot, zone, now=now) for zone in missing),
+        return_exceptions=True,
+    )
+    for zone, snapshot in zip(missing, snapshots):
+        if isinstance(snapshot, Exception):
+            logger.error(f"visual_data snapshot for {zone} failed: {snapshot}")
+            continue
+        global_state.visual_data[zone] = snapshot
 
 # ──────────────────────────────────────────────────
 @router.get("/api/visual_data")
@@ -23,18 +47,15 @@ async def get_visual_data(zone: str = Query(...), useCache: bool = Query(True)):
         raise HTTPException(status_code=404, detail="Unknown zone")
 
     now = datetime.now()
-    current_hour = now.strftime("%Y-%m-%d %H")
-    cached_data = global_state.visual_data[zone]
-    last_hour = cached_data.get("__last_hour")
-
-    # Force recompute if the hour has changed
-    if last_hour != current_hour or not useCache:
-        logger.debug(f"🕒 Hour changed: recomputing snapshot for {zone}")
-        cached_data = compute_zone_snapshot(zone, now=now)
-        cached_data["__last_hour"] = current_hour
-        global_state.visual_data[zone] = cached_data
-
-    return dict(cached_data)
+    if not useCache:
+        # Explicit resync from the DB; hour / shift changes never get here
+        logger.debug(f"🔄 Resync requested: recomputing snapshot for {zone}")
+        global_state.visual_data[zone] = await run_in_thread(compute_zone_snapshot, zone, now=now)
+    elif global_state.visual_data[zone].get("__last_hour") != now.replace(minute=0, second=0, microsecond=0).isoformat():
+        # The zone clock rotates on the hour; only a request racing it gets here
+        await run_in_thread(advance_zone_state, zone, now)
+
+    return dict(global_state.visual_data[zone])
 
 @router.get("/api/visual_targets")
 async def get_visual_targets():
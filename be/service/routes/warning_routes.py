@@ -12,7 +12,7 @@ import os
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from service.connections.mysql import get_mysql_connection, save_warning_on_mysql
+from service.connections.mysql import get_mysql_connection, run_db, save_warning_on_mysql
 from service.routes.broadcast import broadcast_stringatrice_warning
 from service.helpers.helpers import compress_base64_to_jpeg_blob
 
@@ -53,7 +53,7 @@ def acknowledge_warning(warning_id: int):
     return {"message": "Warning acknowledged"}
 
 @router.post("/api/suppress_warning")
-async def suppress_warning(payload: dict):
+def suppress_warning(payload: dict):
     with get_mysql_connection() as conn:
         try:
             line = payload.get("line_name")
@@ -84,7 +84,7 @@ async def suppress_warning(payload: dict):
 
 
 @router.post("/api/warnings/suppress_with_photo")
-async def suppress_with_photo(data: dict = Body(...)):
+def suppress_with_photo(data: dict = Body(...)):
     with get_mysql_connection() as conn:
 
         line_name = data["line_name"]
@@ -147,7 +147,7 @@ if debug:
             "display_name": station_display,
         }
 
-        with get_mysql_connection() as conn:
+        def _save(conn):
             inserted_id = save_warning_on_mysql(
                 warning_payload,
                 conn,
@@ -156,26 +156,28 @@ if debug:
                 {"display_name": source_station},
                 suppress_on_source=False
             )
+            if not inserted_id:
+                return None
 
-            if inserted_id:
-                with conn.cursor(DictCursor) as cursor:
-                    cursor.execute("""
-                        SELECT w.*, p.photo
-                        FROM stringatrice_warnings w
-                        LEFT JOIN photos p ON w.photo_id = p.id
-                        WHERE w.id = %s
-                    """, (inserted_id,))
-                    row = cursor.fetchone()
-
-                    if row:
-                        row["suppress_on_source"] = bool(int(row.get("suppress_on_source", 0)))
-                        if row.get("photo"):
-                            row["photo"] = base64.b64encode(row["photo"]).decode("utf-8")
-
-                        if isinstance(row.get("timestamp"), datetime):
-                            row["timestamp"] = row["timestamp"].isoformat()
-
-                        await broadcast_stringatrice_warning(line, row)
-                        return {"status": "sent", "payload": row}
+            with conn.cursor(DictCursor) as cursor:
+                cursor.execute("""
+                    SELECT w.*, p.photo
+                    FROM stringatrice_warnings w
+                    LEFT JOIN photos p ON w.photo_id = p.id
+                    WHERE w.id = %s
+                """, (inserted_id,))
+                return cursor.fetchone()
+
+        row = await run_db(_save)
+        if row:
+            row["suppress_on_source"] = bool(int(row.get("suppress_on_source", 0)))
+            if row.get("photo"):
+                row["photo"] = base64.b64encode(row["photo"]).decode("utf-8")
+
+            if isinstance(row.get("timestamp"), datetime):
+                row["timestamp"] = row["timestamp"].isoformat()
+
+            await broadcast_stringatrice_warning(line, row)
+            return {"status": "sent", "payload": row}
 
         return {"status": "error", "reason": "Could not insert warning"}
\ No newline at end of file
@@ -6,8 +6,12 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
+from service.helpers.executor import run_in_thread
 from service.helpers.helpers import get_channel_config
+from service.helpers.visual_helper import zone_view
+from service.helpers.zone_delta import ZoneStream
 from service.routes.broadcast import send_initial_state
+from service.state import global_state
 from service.state.global_state import subscriptions, escalation_websockets
 
 router = APIRouter()
@@ -28,22 +32,46 @@ async def websocket_summary(websocket: WebSocket, line_name: str):
             await websocket.receive_text()  # keep-alive
     except WebSocketDisconnect:
         logger.debug(f"Dashboard summary client for {line_name} disconnected")
-        subscriptions[key].remove(websocket)
+    finally:
+        subscriptions[key].discard(websocket)
+        global_state.ws_hub.detach(websocket)
+
+async def send_zone_snapshot(websocket: WebSocket, line_name: str, zone: str):
+    """Full zone state for a delta subscriber, on subscribe and on resync."""
+    stream = global_state.zone_streams.setdefault(f"{line_name}.visual.{zone}", ZoneStream())
+    if stream.state is None and zone in global_state.visual_data:
+        stream.seed(await run_in_thread(zone_view, zone))
+    # Nothing to send yet: the first broadcast goes out as a snapshot
+    if stream.state is not None:
+        # Through the hub, so it is not overtaken by the patches already queued
+        global_state.ws_hub.send(websocket, stream.snapshot())
 
 @router.websocket("/ws/visual/{line_name}/{zone}")
-async def websocket_visual(websocket: WebSocket, line_name: str, zone: str):
+async def websocket_visual(websocket: WebSocket, line_name: str, zone: str, protocol: str = "full"):
+    """
+    ``protocol=full`` (default): the whole zone payload on every change.
+    ``protocol=delta``: a snapshot, then JSON-patch messages numbered by ``seq``;
+    the client sends ``{"type": "resync"}`` to get a new snapshot.
+    """
     await websocket.accept()
-    key = f"{line_name}.visual.{zone}"
-    logger.debug(f"Visual page client connected for {line_name} / {zone}")
-
-    subscriptions.setdefault(key, set()).add(websocket)
+    delta = protocol == "delta"
+    key = f"{line_name}.visual.{zone}" + (".delta" if delta else "")
+    logger.debug(f"Visual page client connected for {line_name} / {zone} ({protocol})")
 
     try:
+        if delta:
+            await send_zone_snapshot(websocket, line_name, zone)
+        subscriptions.setdefault(key, set()).add(websocket)
         while True:
-            await websocket.receive_text()
+            message = await websocket.receive_text()
+            if delta and "resync" in message:
+                logger.debug(f"🔄 Resync requested by visual client {line_name}/{zone}")
+                await send_zone_snapshot(websocket, line_name, zone)
     except WebSocketDisconnect:
         logger.debug(f"Visual page client for {line_name}/{zone} disconnected")
-        subscriptions[key].remove(websocket)
+    finally:
+        subscriptions.get(key, set()).discard(websocket)
+        global_state.ws_hub.detach(websocket)
 
 @router.websocket("/ws/warnings/{line_name}")
 async def websocket_warnings(websocket: WebSocket, line_name: str):
@@ -58,7 +86,9 @@ async def websocket_warnings(websocket: WebSocket, line_name: str):
             await websocket.receive_text()  # keep-alive
     except WebSocketDisconnect:
         logger.debug(f"Stringatrice‑warning client for {line_name} disconnected")
-        subscriptions[key].remove(websocket)
+    finally:
+        subscriptions[key].discard(websocket)
+        global_state.ws_hub.detach(websocket)
 
 
 @router.websocket("/ws/escalations")
@@ -73,6 +103,7 @@ async def websocket_escalations(websocket: WebSocket):
         logger.debug("Escalation client disconnected")
     finally:
         escalation_websockets.discard(websocket)
+        global_state.ws_hub.detach(websocket)
 
 
 @router.websocket("/ws/export/{progress_id}")
@@ -87,7 +118,10 @@ async def websocket_export_progress(websocket: WebSocket, progress_id: str):
         while True:
             await websocket.receive_text()  # keep-alive
     except WebSocketDisconnect:
-        subscriptions[key].remove(websocket)
+        pass
+    finally:
+        subscriptions[key].discard(websocket)
+        global_state.ws_hub.detach(websocket)
 
 
 @router.websocket("/ws/{line_name}/{channel_id}")
@@ -117,7 +151,7 @@ async def websocket_endpoint(websocket: WebSocket, line_name: str, channel_id: s
 
     if not plc_connection.connected or not plc_connection.is_connected():
         logger.debug(f"⚠️ PLC for {full_id} is disconnected. Attempting reconnect for WebSocket...")
-        if not plc_connection.reconnect(retries=3, delay=5):
+        if not await plc_connection.wait_connected(timeout=15):
             logger.warning(f"Failed to reconnect PLC for {full_id}. Closing socket.")
             await websocket.close()
             return
@@ -132,4 +166,5 @@ async def websocket_endpoint(websocket: WebSocket, line_name: str, channel_id: s
     except WebSocketDisconnect:
         logger.debug(f"Client disconnected from {full_id}")
     finally:
-        subscriptions[full_id].remove(websocket)
+        subscriptions[full_id].discard(websocket)
+        global_state.ws_hub.detach(websocket)
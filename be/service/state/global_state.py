@@ -6,12 +6,32 @@ from dotenv import load_dotenv, find_dotenv
 from pymysql.cursors import DictCursor
 from pymysqlpool import ConnectionPool
 from service.helpers.db_queue import DBWriteQueue
+from service.helpers.plc_edges import EdgeChannel
+from service.helpers.latency import LatencyRegistry
+from service.helpers.metrics import MetricsRegistry
+from service.helpers.reference_data import ReferenceData
+from service.helpers.rollup import ProductionRollup
+from service.helpers.visual_checkpoint import VisualCheckpoint
+from service.helpers.ws_hub import FanoutHub
+from service.helpers.zone_delta import ZoneStream
 from collections import defaultdict
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from service.config.config import ZONE_SOURCES
+from service.config.config import (
+    DB_QUEUE_FSYNC,
+    DB_QUEUE_JOURNAL,
+    DB_QUEUE_MAX_BATCH,
+    DB_QUEUE_SIZE,
+    DB_QUEUE_WORKERS,
+    OBJECT_CACHE_SIZE,
+    VISUAL_CHECKPOINT,
+    VISUAL_CHECKPOINT_MAX_AGE,
+    WS_SEND_QUEUE,
+    WS_SEND_TIMEOUT,
+    ZONE_SOURCES,
+)
 
 # Load .env variables
 load_dotenv(find_dotenv())
@@ -63,21 +83,37 @@ def get_zones_from_station(station: str) -> List[str]:
 
 # Thread-safe DB executor
 executor = ThreadPoolExecutor(max_workers=20)
-plc_executor = ThreadPoolExecutor(max_workers=30)
 
-# Asynchronous queue for deferred DB writes
-db_write_queue = DBWriteQueue()
+# Asynchronous queue for deferred DB writes, journaled so a restart does not lose them
+db_write_queue = DBWriteQueue(
+    workers=DB_QUEUE_WORKERS,
+    max_size=DB_QUEUE_SIZE,
+    max_batch=DB_QUEUE_MAX_BATCH,
+    journal_path=DB_QUEUE_JOURNAL or None,
+    fsync=DB_QUEUE_FSYNC,
+)
+
+# Lines / stations / defects and id_modulo -> objects.id, loaded with the channels
+reference_data = ReferenceData(object_cache_size=OBJECT_CACHE_SIZE)
+
+# Per-station hourly counts read by the visuals and graphs (table created / backfilled by tasks.rollup_task)
+production_rollup = ProductionRollup()
+
+# Group commit of production starts / ends / defects (connections.production_ingest.ProductionIngest, set at startup)
+production_ingest = None
 
 # Global runtime state
 plc_connections = {}
+plc_pollers = {}  # {(ip, slot): PLCBlockPoller}
+station_decoders = {}  # {"Line.Station": StationDecoder}
 subscriptions = {}
+ws_hub = FanoutHub(WS_SEND_QUEUE, WS_SEND_TIMEOUT)  # every broadcast goes through it
 trigger_timestamps = {}
 incomplete_productions = {}
 stop_threads = {}
-fine_true_passato_flags = {}
-fine_false_passato_flags = {}
-inizio_true_passato_flags = {}
-inizio_false_passato_flags = {}
+plc_edge_channel = EdgeChannel()  # rising/falling PLC bits per station
+cycle_latency = LatencyRegistry()  # {(station, stage): LatencyHistogram}
+metrics = MetricsRegistry()  # served on /metrics
 escalation_websockets = set()
 
 # Debug tools
@@ -91,8 +127,8 @@ xml_index = {}
 
 # Visual snapshot state
 visual_data: dict[str, dict] = {}
+visual_checkpoint = VisualCheckpoint(VISUAL_CHECKPOINT or None, max_age_hours=VISUAL_CHECKPOINT_MAX_AGE)
 visual_data_lock = Lock()
-last_sent: dict[str, dict] = {}
-
-db_range_cache: dict[str, tuple[int, int]] = {}
+zone_versions: dict[str, int] = {}  # bumped by every view taken for a broadcast
+zone_streams: dict[str, ZoneStream] = {}  # one per /ws/visual channel
 
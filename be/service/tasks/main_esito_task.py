@@ -7,31 +7,32 @@ import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from service.connections.mysql import get_mysql_connection, insert_defects, insert_initial_production_data, update_production_final, insert_str_data
+from service.connections.mysql import run_db, insert_str_data
 from service.connections.temp_data import remove_temp_issues
-from service.controllers.plc import PLCConnection
+from service.controllers.plc_async import AsyncPLCClient
+from service.controllers.plc_poller import POLL_INTERVAL, PLCBlockPoller, StationPollRate
 from service.helpers.helpers import get_channel_config
-from service.config.config import PLC_DB_RANGES, debug
+from service.config.config import debug
 from service.routes.broadcast import broadcast
 from service.state.global_state import (
     get_zones_from_station,
-    inizio_true_passato_flags,
-    inizio_false_passato_flags,
-    fine_true_passato_flags,
-    fine_false_passato_flags,
     trigger_timestamps,
     incomplete_productions,
-    plc_executor,
     db_write_queue,
-    db_range_cache,
-
+    station_decoders,
+    plc_edge_channel,
+    cycle_latency,
 )
 import service.state.global_state as global_state
-from service.helpers.buffer_plc_extract import extract_bool, extract_s7_string, extract_string, extract_swapped_int, extract_int
+from service.helpers.buffer_plc_extract import extract_s7_string, extract_string
+from service.helpers.plc_decoder import StationDecoder, StationRecord
+from service.helpers.plc_edges import FALLING, RISING, SnapshotDiffer
+from service.helpers.latency import CycleTrace, current_trace, trace_span, traced_task
 from service.helpers.visual_helper import refresh_top_defects_ell, refresh_top_defects_qg2, refresh_top_defects_vpf, refresh_vpf_defects_data, update_visual_data_on_new_module
 from service.routes.mbj_routes import parse_mbj_details
 from service.helpers.executor import run_in_thread
-from service.helpers.ell_buffer import mirror_defects, mirror_ell_production
+from service.helpers.ell_buffer import mirror_defects
+from service.helpers.db_queue import RETRYABLE_ERRORS
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +44,15 @@ def log_duration(msg: str, duration: float, threshold: float = TIMING_THRESHOLD)
     log_fn = logger.warning if duration > threshold else logger.debug
     log_fn(f"{msg} in {duration:.3f}s")
 
+def get_station_decoder(full_id: str, config: dict, start_byte: int) -> StationDecoder:
+    """Return the decoder compiled at startup, recompiling it if the buffer base differs."""
+    decoder = station_decoders.get(full_id)
+    if decoder is None or decoder.base != start_byte:
+        channel_id = full_id.split(".")[1]
+        decoder = StationDecoder(config, start_byte, str_counters=channel_id.startswith("STR"))
+        station_decoders[full_id] = decoder
+    return decoder
+
 async def process_final_update(
     full_station_id: str,
     line_name: str,
@@ -58,29 +68,32 @@ async def process_final_update(
     """Handle MySQL updates and visual refresh after sending PLC response."""
     t0 = time.perf_counter()
     print('Entering Final Update')
+    trace = current_trace.get()
+    if trace:
+        trace.checkpoint("db_queue")
+    ended = False
     try:
-        with get_mysql_connection() as conn:
-            with conn.cursor() as cursor:
-                t3 = time.perf_counter()
-                success, final_esito, end_time = await run_in_thread(
-                    update_production_final,
-                    production_id,
-                    result,
-                    channel_id,
-                    conn,
-                    fine_buona,
-                    fine_scarto,
-                )
+        t3 = time.perf_counter()
+        with trace_span("db_update"):
+            success, final_esito, end_time = await global_state.production_ingest.end_production(
+                production_id,
+                result,
+                channel_id,
+                fine_buona,
+            )
+        ended = True
 
         if success:
             async_tasks = []
 
+            mbj_task = None
             if channel_id == "ELL01" and fine_scarto and "MBJ_Defects" not in result:
                 async def fetch_mbj():
                     mbj = await run_in_thread(parse_mbj_details, result.get("Id_Modulo"))
                     if mbj:
                         result["MBJ_Defects"] = mbj
-                async_tasks.append(asyncio.create_task(fetch_mbj()))
+                mbj_task = asyncio.create_task(fetch_mbj())
+                async_tasks.append(mbj_task)
             
             if channel_id == "VPF01" and fine_scarto and result.get("Tipo_NG_VPF"):
                 async_tasks.append(
@@ -103,23 +116,24 @@ async def process_final_update(
                 async_tasks.append(asyncio.create_task(run_in_thread(refresh_vpf_defects_data, timestamp)))
 
             elif channel_id == "ELL01" and fine_scarto:
-                async_tasks.append(
-                    asyncio.create_task(
-                        insert_defects_async(
-                            result,
-                            production_id,
-                            channel_id,
-                            line_name,
-                            from_ell=True,
-                        )
+                async def insert_ell_defects(mbj_task=mbj_task):
+                    # Defect_Rows exists only once the MBJ details are in and the defects written
+                    if mbj_task is not None:
+                        await asyncio.gather(mbj_task, return_exceptions=True)
+                    await insert_defects_async(
+                        result,
+                        production_id,
+                        channel_id,
+                        line_name,
+                        from_ell=True,
                     )
-                )
-                ell_defects = result.get("Defect_Rows")
-                if ell_defects:
-                    for d in ell_defects:
-                        d["station_id"] = 9
-                        d["category"] = "ELL"
-                    async_tasks.append(asyncio.create_task(mirror_defects_async(ell_defects)))
+                    ell_defects = result.get("Defect_Rows")
+                    if ell_defects:
+                        for d in ell_defects:
+                            d["station_id"] = 9
+                            d["category"] = "ELL"
+                        await mirror_defects_async(ell_defects)
+                async_tasks.append(asyncio.create_task(insert_ell_defects()))
 
             elif channel_id in ("AIN01", "AIN02") and fine_scarto and result.get("Tipo_NG_AIN"):
                 async_tasks.append(
@@ -188,7 +202,7 @@ async def process_final_update(
                         async_tasks.append(
                             asyncio.create_task(
                                 run_in_thread(
-                                    update_visual_data_on_new_module,
+                                    _traced_visual_update,
                                     zone=zone,
                                     station_name=channel_id,
                                     esito=final_esito,
@@ -197,6 +211,7 @@ async def process_final_update(
                                     reentered=bool(reentered),
                                     bufferIds=bufferIds,
                                     object_id=object_id,
+                                    production_id=production_id,
                                 )
                             )
                         )
@@ -211,54 +226,45 @@ async def process_final_update(
                 logger.warning(f"Could not update visual_data for {channel_id}: {vis_err}")
 
             if async_tasks:
-                await asyncio.gather(*async_tasks)
+                with trace_span("post_update"):
+                    await asyncio.gather(*async_tasks)
 
     except Exception as e:
+        if not ended and isinstance(e, RETRYABLE_ERRORS):
+            # Nothing written yet: the DB write queue retries the whole update once MySQL is back
+            raise
         logger.error(f"[{full_station_id}] Async final update failed: {e}")
     finally:
         incomplete_productions.pop(full_station_id, None)
         remove_temp_issues(line_name, channel_id, result.get("Id_Modulo"))
+        if trace:
+            trace.finish()
 
-async def process_mirror_ell_production(row: dict) -> None:
-    """Background task to mirror production into the ELL buffer."""
-    try:
-        with get_mysql_connection() as conn:
-            await run_in_thread(mirror_ell_production, row, conn)
-    except Exception as e:  # pragma: no cover - best effort logging
-        logger.warning(f"process_mirror_production failed: {e}")
+def _traced_visual_update(**kwargs) -> None:
+    """update_visual_data_on_new_module (worker thread) as a span of the current cycle."""
+    with trace_span("visual_update"):
+        update_visual_data_on_new_module(**kwargs)
 
-async def insert_defects_async(*args, **kwargs) -> None:
-    """Wrapper to run insert_defects in thread with its own connection."""
+async def insert_defects_async(data, production_id, channel_id, line_name, **flags) -> None:
+    """Queue the defects of a production on the ingest; returns once they are committed."""
     try:
-        with get_mysql_connection() as conn:
-            with conn.cursor() as cursor:
-                await run_in_thread(
-                    insert_defects,
-                    *args,
-                    cursor=cursor,
-                    **kwargs,
-                )
+        await global_state.production_ingest.add_defects(data, production_id, channel_id, line_name, **flags)
     except Exception as e:
         logger.warning(f"insert_defects_async failed: {e}")
 
 async def insert_str_data_async(*args, **kwargs) -> None:
     """Wrapper to run insert_str_data in thread with its own connection."""
     try:
-        with get_mysql_connection() as conn:
+        def _insert(conn):
             with conn.cursor() as cursor:
-                await run_in_thread(
-                    insert_str_data,
-                    *args,
-                    cursor=cursor,
-                    **kwargs,
-                )
+                insert_str_data(*args, cursor=cursor, **kwargs)
+        await run_db(_insert)
     except Exception as e:
         logger.warning(f"insert_str_data_async failed: {e}")
 
 async def mirror_defects_async(rows):
     try:
-        with get_mysql_connection() as conn:
-            await run_in_thread(mirror_defects, rows, conn)
+        await run_db(lambda conn: mirror_defects(rows, conn))
     except Exception as e:
         logger.warning(f"mirror_defects_async failed: {e}")
 
@@ -271,193 +277,159 @@ async def process_initial_production(
 ) -> None:
     """Background task to insert initial production and mirror if needed."""
     try:
-        with get_mysql_connection() as conn:
-            prod_id = await run_in_thread(
-                insert_initial_production_data,
+        # ELL01 / RMI01 productions are mirrored into the ELL buffer in the same commit
+        mirror_station_id = {"ELL01": 9, "RMI01": 3}.get(channel_id) if initial_data else None
+        with trace_span("db_insert"):
+            prod_id = await global_state.production_ingest.start_production(
                 initial_data,
                 channel_id,
-                conn,
                 esito,
+                mirror_station_id=mirror_station_id,
             )
         if prod_id:
             incomplete_productions[full_station_id] = prod_id
             logger.debug(
                 f"[{full_station_id}] ✅ Inserted production record: prod_id={prod_id}"
             )
-            if channel_id in ("ELL01", "RMI01") and initial_data:
-                await process_mirror_ell_production(
-                    {
-                        "id": prod_id,
-                        "object_id": object_id,
-                        "station_id": 9 if channel_id == "ELL01" else 3,
-                        "start_time": initial_data.get("DataInizio"),
-                        "end_time": None,
-                        "esito": esito,
-                    }
-                )
         else:
             logger.warning(
                 f"[{full_station_id}] ⚠️ No prod_id returned from insert_initial_production_data (object_id={object_id})"
             )
+    except RETRYABLE_ERRORS:
+        raise   # MySQL unavailable: retried by the DB write queue
     except Exception as e:  # pragma: no cover - best effort logging
         logger.exception(
             f"[{full_station_id}] Exception during insert_initial_production_data: {e}"
         )
 
-async def background_task(plc_connection: PLCConnection, full_station_id: str):
+def _debug_overrides(full_station_id: str) -> dict[str, bool]:
+    """Trigger / outcome bits forced from the debug endpoints instead of the PLC."""
+    # fallback to trigger flag if specific G/NG not enabled
+    force_ng = global_state.debug_trigger_NG.get(full_station_id, False)
+    force_g = global_state.debug_trigger_G.get(full_station_id, False)
+    return {
+        "trigger": global_state.debug_triggers.get(full_station_id, False),
+        "fine_buona": bool(force_g),
+        "fine_scarto": bool(force_ng and not force_g),
+    }
+
+async def background_task(plc_connection: AsyncPLCClient, full_station_id: str, poller: PLCBlockPoller):
+    """Turn the shared PLC snapshots of a station into edge events."""
     logger.debug(f"[{full_station_id}] Starting background task.")
 
     line_name, channel_id = full_station_id.split(".")
 
+    paths = get_channel_config(line_name, channel_id)
+    if not paths:
+        logger.error(f"Invalid line/channel: {line_name}.{channel_id}")
+        return
+
+    db = paths["trigger"]["db"]
+    if not poller.register(db):
+        return
+
+    start_byte, _ = poller.ranges[db]
+    differ = SnapshotDiffer(full_station_id, get_station_decoder(full_station_id, paths, start_byte))
+
+    rate = poller.poll_rate(full_station_id)
+    queue = plc_edge_channel.subscribe(full_station_id)
+    asyncio.create_task(station_edge_handler(plc_connection, full_station_id, queue, rate))
+
+    last_tick = 0
+
     while True:
         try:
-            # Ensure connection is alive or try reconnect
-            if not plc_connection.connected or not plc_connection.is_connected():
-                await asyncio.sleep(0.45)          # << NEW (was a tight loop)
-                continue  # Retry after delay
+            # Wait for the shared snapshot of this PLC tick
+            snapshot = await poller.next_snapshot(db, last_tick)
+            last_tick = snapshot.tick
 
-            paths = get_channel_config(line_name, channel_id)
-            if not paths:
-                logger.error(f"Invalid line/channel: {line_name}.{channel_id}")
-                await asyncio.sleep(0.45)
-                continue  # Skip this cycle if config not found
-
-            trigger_conf = paths["trigger"]
-            db = trigger_conf["db"]
-
-            cache_key = f"{full_station_id}_DB{db}"
-            if cache_key not in db_range_cache:
-                plc_key = (plc_connection.ip_address, plc_connection.slot)
-                raw = PLC_DB_RANGES.get(plc_key, {}).get(db)
-                if not raw:
-                    logger.error(f"No DB range defined for {plc_key} DB{db}")
-                    await asyncio.sleep(0.45)
-                    continue
-                db_range_cache[cache_key] = (raw["min"], raw["max"])
-
-            start_byte, end_byte = db_range_cache[cache_key]
-            size = end_byte - start_byte + 1
-
-            # Read full DB buffer
-            timer_0 = time.perf_counter()
-            buffer = await asyncio.get_event_loop().run_in_executor(
-                plc_executor, plc_connection.db_read, db, start_byte, size
-            )
-            timer_1 = time.perf_counter()
-            #print('Lettura Buffer [%s] in %.3f s' % (full_station_id, timer_1 - timer_0))
-
-            trigger_conf = paths["trigger"]
-            if debug:
-                trigger_value = global_state.debug_triggers.get(full_station_id, False)
-            else:
-                trigger_value = extract_bool(buffer, trigger_conf["byte"], trigger_conf["bit"], start_byte)
-            
-            #if full_station_id =="Linea2.VPF01":
-            #    logger.info(f"Triggr value of VPF : {trigger_value}")
+            # Unchanged snapshots stop here after a single buffer comparison
+            events = differ.diff(snapshot, _debug_overrides(full_station_id) if debug else None)
+            if events:
+                plc_edge_channel.publish(full_station_id, events)
 
-            if trigger_value is None:
-                raise Exception("Trigger read returned None")
-            
-            if not trigger_value:
-                inizio_true_passato_flags[full_station_id] = False
-                if not inizio_false_passato_flags[full_station_id]:
-                    #if full_station_id == "Linea2.ELL01":  # DEBUG
-                    #    logger.info(f"[{full_station_id}] 🟥 Trigger = FALSE (lettura @ {timer_1:.3f}s)")
-                    inizio_false_passato_flags[full_station_id] = True
-                    await broadcast(line_name, channel_id, {
-                        "trigger": False,
-                        "objectId": None,
-                        "stringatrice": None,
-                        "outcome": None,
-                        "issuesSubmitted": False
-                    })
-
-            if trigger_value:
-                #if full_station_id == "Linea2.ELL01":  # DEBUG
-                #    logger.info(f"[{full_station_id}] 🟩 Trigger = TRUE (lettura @ {timer_1:.3f}s)")
-                if not inizio_true_passato_flags[full_station_id]:
-                    #if full_station_id == "Linea2.ELL01":  # DEBUG
-                    #    logger.info(f"[{full_station_id}] 🆕 NEW Trigger → dispatching on_trigger_change()")
-                    inizio_true_passato_flags[full_station_id] = True
-                    inizio_false_passato_flags[full_station_id] = False
-                    trigger_timestamp = time.perf_counter()
-                    #if full_station_id == "Linea2.ELL01":  # DEBUG
-                    #    logger.info(f"[{full_station_id}] 🕒 Creating on_trigger_change() at {time.perf_counter():.6f}, buffer read @ {timer_1:.6f}")
-                    asyncio.create_task(
-                        on_trigger_change(
-                            plc_connection,
-                            line_name,
-                            channel_id,
-                            trigger_value,
-                            buffer,
-                            start_byte,
-                            trigger_timestamp
-                        )
-                    )
-                else:
-                    logger.debug(f"[{full_station_id}] Trigger TRUE but already handled.")
+        except Exception as e:
+            logger.error(f"[{full_station_id}], Error in background task: {str(e)}")
+            await asyncio.sleep(POLL_INTERVAL)
 
+async def station_edge_handler(plc_connection: AsyncPLCClient, full_station_id: str,
+                               queue: asyncio.Queue, rate: StationPollRate):
+    """Dispatch start / end of cycle from the edge events of one station and adapt its poll rate."""
+    line_name, channel_id = full_station_id.split(".")
+
+    while True:
+        events = await queue.get()
+        try:
+            edges = {event.field: event for event in events}
+            first = events[0]
+            buffer, start_byte = first.snapshot.data, first.snapshot.start
+            record, levels = first.record, first.levels
 
+            paths = get_channel_config(line_name, channel_id)
             if not paths:
-                logger.error(f"Missing config for {line_name}.{channel_id}")
-                await asyncio.sleep(0.45)
-                continue  # Or return / skip, depending on context
-
-            # Now you're safe to use it:
-            fb_conf = paths["fine_buona"]
-            fs_conf = paths["fine_scarto"]
-            if debug:
-                # fallback to trigger flag if specific G/NG not enabled
-                force_ng = global_state.debug_trigger_NG.get(full_station_id, False)
-                force_g  = global_state.debug_trigger_G.get(full_station_id, False)
-
-                if force_g:
-                    fine_buona = True
-                    fine_scarto = False
-                elif force_ng:
-                    fine_buona = False
-                    fine_scarto = True
-                else:
-                    fine_buona = False
-                    fine_scarto = False
-            else:
-                fine_buona = extract_bool(buffer, fb_conf["byte"], fb_conf["bit"], start_byte)
-                fine_scarto = extract_bool(buffer, fs_conf["byte"], fs_conf["bit"], start_byte)
-
-            if fine_buona is None or fine_scarto is None:
-                raise Exception("Outcome read returned None")
-            
-            if not fine_buona and not fine_scarto:
-                fine_true_passato_flags[full_station_id] = False
-                if not fine_false_passato_flags[full_station_id]:
-                    fine_false_passato_flags[full_station_id] = True
-                    #if full_station_id == "Linea2.ELL01":
-                    #    logger.info(f"Fine Ciclo on {full_station_id} FALSE ...")
-                
-
-            if (fine_buona or fine_scarto) and not fine_true_passato_flags[full_station_id]:
-                fine_true_passato_flags[full_station_id] = True
-                fine_false_passato_flags[full_station_id] = False
-                asyncio.create_task(handle_end_cycle(
+                logger.error(f"Invalid line/channel: {line_name}.{channel_id}")
+                continue
+
+            if "id_modulo" in edges:
+                logger.debug(f"[{full_station_id}] Id_Modulo changed: {edges['id_modulo'].previous} → {edges['id_modulo'].value}")
+
+            trigger_edge = edges.get("trigger")
+            if trigger_edge and trigger_edge.kind == FALLING:
+                await broadcast(line_name, channel_id, {
+                    "trigger": False,
+                    "objectId": None,
+                    "stringatrice": None,
+                    "outcome": None,
+                    "issuesSubmitted": False
+                })
+            elif trigger_edge and trigger_edge.kind == RISING:
+                # Poll fast until the outcome bits arrive
+                rate.boost()
+                trace = CycleTrace(cycle_latency, full_station_id, "start",
+                                   max(0.0, time.time() - first.snapshot.timestamp))
+                traced_task(trace, on_trigger_change(
                     plc_connection,
                     line_name,
                     channel_id,
+                    True,
                     buffer,
                     start_byte,
-                    fine_buona,
-                    fine_scarto,
-                    paths,
-                    trigger_timestamps.get(full_station_id)
+                    time.perf_counter(),
+                    record,
                 ))
 
-
-            await asyncio.sleep(0.45)
+            fb_edge = edges.get("fine_buona")
+            fs_edge = edges.get("fine_scarto")
+            if fb_edge or fs_edge:
+                fine_buona = levels.get("fine_buona", False)
+                fine_scarto = levels.get("fine_scarto", False)
+                # The cycle ends when the first of the two outcome bits rises
+                was_active = any(
+                    bool(edge.previous) if edge else levels.get(name, False)
+                    for name, edge in (("fine_buona", fb_edge), ("fine_scarto", fs_edge))
+                )
+                if (fine_buona or fine_scarto) and not was_active:
+                    rate.idle()
+                    trace = CycleTrace(cycle_latency, full_station_id, "end",
+                                       max(0.0, time.time() - first.snapshot.timestamp))
+                    traced_task(trace, handle_end_cycle(
+                        plc_connection,
+                        line_name,
+                        channel_id,
+                        buffer,
+                        start_byte,
+                        fine_buona,
+                        fine_scarto,
+                        paths,
+                        trigger_timestamps.get(full_station_id),
+                        record,
+                    ))
 
         except Exception as e:
-            logger.error(f"[{full_station_id}], Error in background task: {str(e)}")
+            logger.error(f"[{full_station_id}], Error handling PLC edges: {str(e)}")
 
 async def handle_end_cycle(
-    plc_connection: PLCConnection,
+    plc_connection: AsyncPLCClient,
     line_name: str,
     channel_id: str,
     buffer: bytes,
@@ -466,6 +438,7 @@ async def handle_end_cycle(
     fine_scarto: bool,
     paths: dict,
     data_inizio: datetime | None,
+    record: StationRecord | None = None,
 ):
     """Process end-cycle logic in a background task."""
     full_station_id = f"{line_name}.{channel_id}"
@@ -479,71 +452,58 @@ async def handle_end_cycle(
     pezzo_archivia_conf = paths["pezzo_archiviato"]
     timer_0 = time.perf_counter()
     
-    result = await read_data(
-            plc_connection,
-            line_name,
-            channel_id,
-            richiesta_ok=fine_buona,
-            richiesta_ko=fine_scarto,
-            data_inizio=data_inizio,
-            buffer=buffer,
-            start_byte=start_byte,
-            is_EndCycle=True,
-        )
+    with trace_span("read_data"):
+        result = await read_data(
+                plc_connection,
+                line_name,
+                channel_id,
+                richiesta_ok=fine_buona,
+                richiesta_ko=fine_scarto,
+                data_inizio=data_inizio,
+                buffer=buffer,
+                start_byte=start_byte,
+                is_EndCycle=True,
+                record=record,
+            )
     timer_1 = time.perf_counter()
     logger.debug(f"[{full_station_id}] read_data", timer_1 - timer_0)
     
     t11 = time.perf_counter()
-    queue_size_arch = get_executor_status(plc_executor)["queue_size"]
+    queue_size_arch = plc_connection.queue_size
     t_write_start = time.perf_counter()
-    future_arch = plc_executor.submit(
-        plc_connection.write_bool,
+    # archivio TRUE and esito FALSE leave in the same PLC write batch
+    acks = [plc_connection.queue_write_bool(
         pezzo_archivia_conf["db"],
         pezzo_archivia_conf["byte"],
         pezzo_archivia_conf["bit"],
         True,
-    )
-    await asyncio.wrap_future(future_arch)
-    t_write_done = time.perf_counter()
-    log_duration(
-        f"[{full_station_id}] archivio TRUE (queue_size={queue_size_arch})",
-        t_write_done - t_write_start,
-    )
-
+    )]
     if esito_conf:
-        queue_size_esito = get_executor_status(plc_executor)["queue_size"]
-        t_esito_start = time.perf_counter()
-        future_esito = plc_executor.submit(
-            plc_connection.write_bool,
+        acks.append(plc_connection.queue_write_bool(
             esito_conf["db"],
             esito_conf["byte"],
             esito_conf["bit"],
             False,
-        )
-        await asyncio.wrap_future(future_esito)
-        t_esito_end = time.perf_counter()
-        log_duration(
-            f"[{full_station_id}] esito FALSE (queue_size={queue_size_esito})",
-            t_esito_end - t_esito_start,
-        )
-        #await asyncio.get_event_loop().run_in_executor(
-        #    plc_executor,
-        #    plc_connection.write_bool,
-        #    esito_conf["db"],
-        #    esito_conf["byte"],
-        #    esito_conf["bit"],
-        #    False,
-        #)
+        ))
+    with trace_span("plc_ack"):
+        await asyncio.gather(*acks)
+    t_write_done = time.perf_counter()
+    log_duration(
+        f"[{full_station_id}] archivio TRUE{' + esito FALSE' if esito_conf else ''} (queue_size={queue_size_arch})",
+        t_write_done - t_write_start,
+    )
     t_write_end = time.perf_counter()
     log_duration(
         f"[{full_station_id}] from PLC TRUE to write_bool(TRUE)",
         t_write_end - t_plc_detect,
     )
 
+    final_update_queued = False
     if result:
         production_id = incomplete_productions.get(full_station_id)
 
         if production_id:
+            final_update_queued = True
             asyncio.create_task(
                 db_write_queue.enqueue(
                     process_final_update,
@@ -557,6 +517,7 @@ async def handle_end_cycle(
                     fine_buona,
                     fine_scarto,
                     paths,
+                    key=full_station_id,
                 )
             )
         else:
@@ -564,6 +525,11 @@ async def handle_end_cycle(
                 f"[{full_station_id}] Module was not found in incomplete productions. Wrote archivio bit anyway."
             )
 
+    # Without a final update to wait for, the cycle ends with the PLC acknowledgement
+    trace = current_trace.get()
+    if trace and not final_update_queued:
+        trace.finish()
+
     #duration = time.perf_counter() - t0
     #log_duration(f"[{full_station_id}] Total Fine Ciclo processing", duration)
 
@@ -579,13 +545,14 @@ def get_executor_status(executor):
     }
 
 async def on_trigger_change(
-    plc_connection: PLCConnection,
+    plc_connection: AsyncPLCClient,
     line_name: str,
     channel_id: str,
     val,
     buffer: bytes | None = None,
     start_byte: int | None = None,
-    trigger_timestamp: float | None = None
+    trigger_timestamp: float | None = None,
+    record: StationRecord | None = None,
 ):  
     #if channel_id == "ELL01":
     #    logger.info(f"[{channel_id}] 🚀 on_trigger_change() START at {time.perf_counter():.6f}")
@@ -627,18 +594,16 @@ async def on_trigger_change(
     #durations["reset_flags"] = t1 - t0
 
     # Extract object_id + stringatrice + issues_submitted
+    if record is None:
+        record = get_station_decoder(full_id, paths, start_byte).decode(buffer)
+
     if debug:
         object_id = global_state.debug_moduli.get(full_id)
     else:
-        id_mod_conf = paths["id_modulo"]
-        object_id = extract_string(buffer, id_mod_conf["byte"], id_mod_conf["length"], start_byte)
+        object_id = record.id_modulo
 
     if "STR" not in channel_id:
-        str_conf = paths.get("stringatrice")
-        values = [
-            extract_bool(buffer, str_conf["byte"], i, start_byte)
-            for i in range(str_conf["length"])
-        ]
+        values = list(record.stringatrice)
         if not any(values):
             values[0] = True
     else:
@@ -650,29 +615,29 @@ async def on_trigger_change(
     stringatrice_index = values.index(True) + 1
     stringatrice = str(stringatrice_index)
 
-    issues_submitted = extract_bool(buffer, esito_conf["byte"], esito_conf["bit"], start_byte) if esito_conf else False
+    issues_submitted = bool(record.esito_scarto_compilato)
 
     # Timestamp
     trigger_timestamps[full_id] = datetime.now()
     data_inizio = trigger_timestamps[full_id]
 
     # Read data
-    initial_data = await read_data(
-        plc_connection, line_name, channel_id,
-        richiesta_ok=False, richiesta_ko=False,
-        data_inizio=data_inizio, buffer=buffer,
-        start_byte=start_byte, is_EndCycle=False
-    )
+    with trace_span("read_data"):
+        initial_data = await read_data(
+            plc_connection, line_name, channel_id,
+            richiesta_ok=False, richiesta_ko=False,
+            data_inizio=data_inizio, buffer=buffer,
+            start_byte=start_byte, is_EndCycle=False, record=record
+        )
 
     # Determine esito
-    escl_conf = paths.get("stazione_esclusa")
-    esclusione_attiva = extract_bool(buffer, escl_conf["byte"], escl_conf["bit"], start_byte) if escl_conf else False
-    esito = 4 if esclusione_attiva else 2
+    esito = 4 if record.stazione_esclusa else 2
 
     # Enqueue + expected_moduli update
     logger.debug(f"[{full_id}] Starting initial production insert for object_id={object_id}")
     asyncio.create_task(db_write_queue.enqueue(
-        process_initial_production, full_id, channel_id, initial_data, esito, object_id
+        process_initial_production, full_id, channel_id, initial_data, esito, object_id,
+        key=full_id,
     ))
     global_state.expected_moduli[full_id] = object_id
     logger.debug(f"[{full_id}] expected_moduli updated with object_id={object_id}")
@@ -680,16 +645,15 @@ async def on_trigger_change(
     # Write TRUE
     t10 = time.perf_counter()
     if not debug:
-        queue_size = get_executor_status(plc_executor)["queue_size"]
+        queue_size = plc_connection.queue_size
         t_pre = time.perf_counter()
-        future = plc_executor.submit(
-            plc_connection.write_bool,
-            pezzo_conf["db"],
-            pezzo_conf["byte"],
-            pezzo_conf["bit"],
-            True,
-        )
-        await asyncio.wrap_future(future)
+        with trace_span("plc_ack"):
+            await plc_connection.write_bool(
+                pezzo_conf["db"],
+                pezzo_conf["byte"],
+                pezzo_conf["bit"],
+                True,
+            )
         t_post = time.perf_counter()
 
         durations["executor_queue"] = t_pre - t10
@@ -702,16 +666,20 @@ async def on_trigger_change(
         )
 
     # Broadcast
-    await broadcast(line_name, channel_id, {
-        "trigger": True,
-        "objectId": object_id,
-        "stringatrice": stringatrice,
-        "outcome": None,
-        "issuesSubmitted": issues_submitted
-    })
+    with trace_span("broadcast"):
+        await broadcast(line_name, channel_id, {
+            "trigger": True,
+            "objectId": object_id,
+            "stringatrice": stringatrice,
+            "outcome": None,
+            "issuesSubmitted": issues_submitted
+        })
+    trace = current_trace.get()
+    if trace:
+        trace.finish()
 
 async def read_data(
-    plc_connection: PLCConnection,
+    plc_connection: AsyncPLCClient,
     line_name: str,
     channel_id: str,
     richiesta_ko: bool,
@@ -719,7 +687,8 @@ async def read_data(
     data_inizio: datetime | None,
     buffer: bytes | None = None,
     start_byte: int | None = None,
-    is_EndCycle: bool = True
+    is_EndCycle: bool = True,
+    record: StationRecord | None = None,
 ):
     full_id = f"{line_name}.{channel_id}"
 
@@ -734,26 +703,27 @@ async def read_data(
             logger.warning(f"[{full_id}], data_inizio was None or invalid; using current time instead")
             data_inizio = datetime.now()
 
-        # Step 3: Load config
+        # Step 3: Load config and decode the snapshot in one pass
         config = get_channel_config(line_name, channel_id)
         if config is None:
             logger.error(f"[{full_id}], Missing config for line/channel")
             return None
 
+        if record is None:
+            record = get_station_decoder(full_id, config, start_byte).decode(buffer)
+
         data = {}
 
         # Step 4: Read Id_Modulo
-        id_mod_conf = config["id_modulo"]
         if debug:
             data["Id_Modulo"] = global_state.debug_moduli.get(full_id) or ""
         else:
-            data["Id_Modulo"] = extract_string(buffer, id_mod_conf["byte"], id_mod_conf["length"], start_byte) or ""
+            data["Id_Modulo"] = record.id_modulo
         if not data["Id_Modulo"]:
             logger.warning(f"[{full_id}], Id_Modulo is empty or unreadable")
 
         # Step 5: Read Id_Utente
-        id_utente_conf = config["id_utente"]
-        data["Id_Utente"] = extract_string(buffer, id_utente_conf["byte"], id_utente_conf["length"], start_byte) or ""
+        data["Id_Utente"] = record.id_utente
 
         # Always record the start timestamp
         data["DataInizio"] = data_inizio
@@ -769,11 +739,7 @@ async def read_data(
 
         # Step 8: Stringatrice logic
         if "STR" not in channel_id:
-            str_conf = config.get("stringatrice")
-            values = [
-                extract_bool(buffer, str_conf["byte"], i, start_byte)
-                for i in range(str_conf["length"])
-            ]
+            values = list(record.stringatrice)
             if not any(values):
                 values[0] = True
             data["Lavorazione_Eseguita_Su_Stringatrice"] = values
@@ -795,38 +761,19 @@ async def read_data(
         tempo_ciclo = data["DataFine"] - data_inizio
         data["Tempo_Ciclo"] = str(tempo_ciclo)
 
-        # Step 9: Read VPF defects (BYTE48)
-        vpf_values_1 = []
-        vpf_conf = config.get("difetti_vpf_1")
-        if vpf_conf and richiesta_ko and channel_id == "VPF01":
-            vpf_values_1 = [
-                extract_bool(buffer, vpf_conf["byte"], i, start_byte)
-                for i in range(vpf_conf["length"])
-            ]
-
-        # Step 10: Read VPF defects (BYTE49)
-        vpf_values_2 = []
-        vpf_conf = config.get("difetti_vpf_2")
-        if vpf_conf and richiesta_ko and channel_id == "VPF01":
-            vpf_values_2 = [
-                extract_bool(buffer, vpf_conf["byte"], i, start_byte)
-                for i in range(vpf_conf["length"])
-            ]
-
-        # Combine VPF defects
-        combined = vpf_values_1 + vpf_values_2
-        if combined:
-            data["Tipo_NG_VPF"] = combined
-            logger.debug(f"[{full_id}], VPF Defect flags: {combined}")
+        # Step 9-10: VPF defects (BYTE48 + BYTE49)
+        if richiesta_ko and channel_id == "VPF01":
+            combined = (record.difetti_vpf_1 or []) + (record.difetti_vpf_2 or [])
+            if combined:
+                data["Tipo_NG_VPF"] = combined
+                logger.debug(f"[{full_id}], VPF Defect flags: {combined}")
 
         # Re-entered flags for VPF and ELL
-        conf506 = config.get("re_entered_from_m506")
-        if conf506 and channel_id == "VPF01":
-            data["Re_entered_from_m506"] = extract_bool(buffer, conf506["byte"], conf506["bit"], start_byte)
+        if record.re_entered_from_m506 is not None and channel_id == "VPF01":
+            data["Re_entered_from_m506"] = record.re_entered_from_m506
 
-        conf326 = config.get("re_entered_from_m326")
-        if conf326 and channel_id == "ELL01":
-            data["Re_entered_from_m326"] = extract_bool(buffer, conf326["byte"], conf326["bit"], start_byte)
+        if record.re_entered_from_m326 is not None and channel_id == "ELL01":
+            data["Re_entered_from_m326"] = record.re_entered_from_m326
 
         if debug:
             dbg = global_state.reentryDebug.get(full_id)
@@ -834,13 +781,8 @@ async def read_data(
                 data["Re_entered_from_m326"] = dbg
 
         # Step 11: AIN defects
-        ain_conf = config.get("difetti_ain")
-        if ain_conf and richiesta_ko and channel_id in ("AIN01", "AIN02"):
-            bits = [
-                extract_bool(buffer, ain_conf["byte"], i, start_byte)
-                for i in range(ain_conf["length"])
-            ]
-            data["Tipo_NG_AIN"] = bits[3:5]
+        if record.difetti_ain is not None and richiesta_ko and channel_id in ("AIN01", "AIN02"):
+            data["Tipo_NG_AIN"] = record.difetti_ain[3:5]
             logger.debug(f"[{full_id}], AIN Defect flags: {data['Tipo_NG_AIN']}")
 
         # Step 12: NG flag
@@ -854,7 +796,7 @@ async def read_data(
             db, base = rwk_conf["db"], rwk_conf["byte"]
             count = rwk_conf["length"]
             slen = rwk_conf.get("string_length", 20) + 2
-            raw = await asyncio.to_thread(plc_connection.db_read, db, base, count * slen)
+            raw = await plc_connection.db_read(db, base, count * slen)
             rwk_vals = [extract_s7_string(raw, i * slen) for i in range(count)]
             #print('RWK_VALS:', rwk_vals)
         elif debug:
@@ -870,16 +812,13 @@ async def read_data(
             "STR05": 8,
         }
 
-        STR_OFFSETS = [46, 48, 50, 52]  # Bytes for cell_G, cell_NG, string_G, string_NG
-
         # Step 14: STR Visual Snapshot Insert (only for STR stations)
         if channel_id.startswith("STR"):
             try:
-                # Read 4 integers directly from the current DB buffer
-                data["cell_G"]    = extract_int(buffer, STR_OFFSETS[0], start_byte)
-                data["cell_NG"]   = extract_int(buffer, STR_OFFSETS[1], start_byte)
-                data["string_NG"]  = extract_int(buffer, STR_OFFSETS[2], start_byte)
-                data["string_G"] = extract_int(buffer, STR_OFFSETS[3], start_byte)
+                # 4 integers decoded from the current DB buffer
+                if record.str_counters is None:
+                    raise ValueError("STR counters outside the polled DB range")
+                data["cell_G"], data["cell_NG"], data["string_NG"], data["string_G"] = record.str_counters
 
                 # Map channel_id to station_id
                 station_id = STR_STATION_MAP.get(channel_id)
@@ -9,17 +9,19 @@ logger = logging.getLogger(__name__)
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from service.connections.mysql import create_stop, get_mysql_connection
-from service.controllers.plc import PLCConnection
+from service.connections.mysql import create_stop, run_db
+from service.controllers.plc_async import AsyncPLCClient
+from service.controllers.plc_poller import PLCBlockPoller
 from service.helpers.helpers import get_channel_config
 from service.config.config import CHANNELS, PLC_DB_RANGES, debug
 from service.helpers.buffer_plc_extract import extract_bool, extract_string, extract_int, extract_DT
 from service.helpers.visual_helper import refresh_fermi_data
-from service.state.global_state import db_write_queue, plc_executor
+from service.state.global_state import db_write_queue
+from service.helpers.db_queue import RETRYABLE_ERRORS
 from service.helpers.executor import run_in_thread
 
 
-async def fermi_task(plc_connection: PLCConnection, ip: str, slot: int):
+async def fermi_task(plc_connection: AsyncPLCClient, ip: str, slot: int, poller: PLCBlockPoller):
     logger.debug(f"[{ip}:{slot}] Starting fermi task.")
 
     # Find all stations connected to this PLC
@@ -49,30 +51,21 @@ async def fermi_task(plc_connection: PLCConnection, ip: str, slot: int):
     prev_trigger = False
     clock = False
 
-    plc_key = (plc_connection.ip_address, plc_connection.slot)
     db = trigger_conf["db"]
-    db_range = PLC_DB_RANGES.get(plc_key, {}).get(db)
-    if not db_range:
-        logger.error(f"❌ No DB range defined for {plc_key} DB{db}")
+    if not poller.register(db):
         return
+    # Keep the old 1s cadence as an upper bound while the stations of this PLC are idle
+    poller.poll_rate(f"fermi:{ip}:{slot}", min_interval=1.0, max_interval=1.0)
 
-    start_byte = db_range["min"]
-    size = db_range["max"] - db_range["min"] + 1
+    last_tick = 0
 
     while True:
         try:
-            if not plc_connection.connected or not plc_connection.is_connected():
-                await asyncio.sleep(1)          # << NEW (was a tight loop)
-                continue
+            # Reuse the snapshot already read for the station tasks of this PLC
+            snapshot = await poller.next_snapshot(db, last_tick)
+            last_tick = snapshot.tick
+            buffer, start_byte = snapshot.data, snapshot.start
 
-            # Read trigger buffer once
-            buffer = await asyncio.get_event_loop().run_in_executor(
-                plc_executor,
-                plc_connection.db_read,
-                db,
-                start_byte,
-                size,
-            )
             trigger_value = extract_bool(buffer, trigger_conf["byte"], trigger_conf["bit"], start_byte)
 
             if trigger_value is None:
@@ -84,7 +77,7 @@ async def fermi_task(plc_connection: PLCConnection, ip: str, slot: int):
 
                 # Use representative station info
                 line_name, channel_id, _ = ref_station
-                await fermi_trigger_change(plc_connection, line_name, channel_id, trigger_value)
+                await fermi_trigger_change(plc_connection, line_name, channel_id, trigger_value, poller)
 
             # Write PLC-wide clock toggle
             # if clock_conf and not debug:
@@ -94,17 +87,17 @@ async def fermi_task(plc_connection: PLCConnection, ip: str, slot: int):
             #    clock_conf["db"], clock_conf["byte"], clock_conf["bit"], clock
             # )
 
-            await asyncio.sleep(1)
-
         except Exception as e:
             logger.error(f"[{ip}:{slot}] 🔴 Error in fermi_task: {e}")
+            await asyncio.sleep(1)
 
 
 async def fermi_trigger_change(
-    plc_connection: PLCConnection,
+    plc_connection: AsyncPLCClient,
     line_name: str,
     channel_id: str,
-    val
+    val,
+    poller: PLCBlockPoller | None = None,
 ):
     if not isinstance(val, bool):
         return
@@ -118,17 +111,15 @@ async def fermi_trigger_change(
     if val:
         logger.debug(f"Dati Pronti FERMI on {full_id} TRUE ...")
         # leggere i dati:
-        data = await read_fermi_data(plc_connection, line_name, channel_id)
+        data = await read_fermi_data(plc_connection, line_name, channel_id, poller)
 
         # Queue DB write + visual refresh
-        asyncio.create_task(db_write_queue.enqueue(process_fermo_update, data))
+        asyncio.create_task(db_write_queue.enqueue(process_fermo_update, data, key="fermi"))
 
         # poi quando leggo scrivo Dati Letti fermi a TRUE
         dati_letti_conf = paths.get("dati_letti_fermi")
         if dati_letti_conf and not debug:
-            await asyncio.get_event_loop().run_in_executor(
-                plc_executor,
-                plc_connection.write_bool,
+            await plc_connection.write_bool(
                 dati_letti_conf["db"],
                 dati_letti_conf["byte"],
                 dati_letti_conf["bit"],
@@ -140,9 +131,7 @@ async def fermi_trigger_change(
         # METTERE A ZERO DATI LETTI
         dati_letti_conf = paths.get("dati_letti_fermi")
         if dati_letti_conf and not debug:
-            await asyncio.get_event_loop().run_in_executor(
-                plc_executor,
-                plc_connection.write_bool,
+            await plc_connection.write_bool(
                 dati_letti_conf["db"],
                 dati_letti_conf["byte"],
                 dati_letti_conf["bit"],
@@ -150,7 +139,12 @@ async def fermi_trigger_change(
             )
 
 
-async def read_fermi_data(plc_connection: PLCConnection, line_name: str, channel_id: str):
+async def read_fermi_data(
+    plc_connection: AsyncPLCClient,
+    line_name: str,
+    channel_id: str,
+    poller: PLCBlockPoller | None = None,
+):
     full_id = f"{line_name}.{channel_id}"
 
     try:
@@ -171,6 +165,12 @@ async def read_fermi_data(plc_connection: PLCConnection, line_name: str, channel
         # 2️⃣ Read all needed DBs
         buffers = {}
         for db in dbs_needed:
+            # DBs already polled for this PLC come straight from the shared snapshot
+            snapshot = poller.latest(db) if poller else None
+            if snapshot is not None:
+                buffers[db] = (snapshot.data, snapshot.start)
+                continue
+
             plc_key = (plc_connection.ip_address, plc_connection.slot)
             db_range = PLC_DB_RANGES.get(plc_key, {}).get(db)
             if not db_range:
@@ -179,9 +179,7 @@ async def read_fermi_data(plc_connection: PLCConnection, line_name: str, channel
 
             start_byte = db_range["min"]
             size = db_range["max"] - db_range["min"] + 1
-            buffer = await asyncio.get_event_loop().run_in_executor(
-                plc_executor,
-                plc_connection.db_read,
+            buffer = await plc_connection.db_read(
                 db,
                 start_byte,
                 size,
@@ -243,47 +241,71 @@ async def read_fermi_data(plc_connection: PLCConnection, line_name: str, channel
         return None
 
 
-async def insert_fermo_data(data, conn):
-    reason = "Fermo Generico"
-    if data["Evento_Fermo"] == 1:
-        reason = "Cancelli Aperti"
-    elif data["Evento_Fermo"] == 3:
-        reason = "Anomalia"
-    elif data["Evento_Fermo"] == 4:
-        reason = "Ciclo non Automatico"
-    elif data["Evento_Fermo"] == 6:
-        reason = "Fuori Tempo Ciclo"
-    elif data["Evento_Fermo"] == 7:
-        reason = "Mancato Carico Particolari"
-    elif data["Evento_Fermo"] == 8:
-        reason = "Mancato Scarico"
-    elif data["Evento_Fermo"] == 9:
-        reason = "Mancato Carico"
-
-    stop_id = await run_in_thread(
-        create_stop,
+FERMO_REASONS = {
+    1: "Cancelli Aperti",
+    3: "Anomalia",
+    4: "Ciclo non Automatico",
+    6: "Fuori Tempo Ciclo",
+    7: "Mancato Carico Particolari",
+    8: "Mancato Scarico",
+    9: "Mancato Carico",
+}
+
+
+def _create_fermo_stop(data, conn) -> int:
+    return create_stop(
         station_id=data["Stazione_Fermo"],
         start_time=data["DataInizio"],
         end_time=data["DataFine"],
         operator_id=data["Id_Utente"],
         stop_type="STOP",
-        reason=reason,
+        reason=FERMO_REASONS.get(data["Evento_Fermo"], "Fermo Generico"),
         status="CLOSED",
         linked_production_id=None,
         conn=conn,
     )
 
+
+async def insert_fermo_data(data):
+    stop_id = await run_db(lambda conn: _create_fermo_stop(data, conn))
     logger.debug(f"Added FERMO stop_id={stop_id}")
 
 
+async def _refresh_fermi_visuals(ts) -> None:
+    await run_in_thread(refresh_fermi_data, "AIN", ts)
+    await run_in_thread(refresh_fermi_data, "ELL", ts)
+
+
 async def process_fermo_update(data):
     """Background task: insert stop data and refresh visuals."""
     try:
-        with get_mysql_connection() as conn:
-            await insert_fermo_data(data, conn)
-
-        ts = data.get("DataInizio") or datetime.now()
-        await run_in_thread(refresh_fermi_data, "AIN", ts)
-        await run_in_thread(refresh_fermi_data, "ELL", ts)
+        await insert_fermo_data(data)
+        await _refresh_fermi_visuals(data.get("DataInizio") or datetime.now())
+    except RETRYABLE_ERRORS:
+        raise   # MySQL unavailable: retried by the DB write queue
     except Exception as e:  # pragma: no cover - best effort logging
         logger.warning(f"process_fermo_update failed: {e}")
+
+
+async def process_fermo_updates(calls: list[tuple]) -> None:
+    """Batch form of ``process_fermo_update``: the stops share a connection and one visual refresh."""
+    ts = max(data.get("DataInizio") or datetime.now() for (data,) in calls)
+
+    def _insert(conn):
+        stop_ids = []
+        while calls:
+            stop_ids.append(_create_fermo_stop(calls[0][0], conn))
+            calls.pop(0)    # committed: a retry of the batch only inserts the rest
+        return stop_ids
+
+    try:
+        stop_ids = await run_db(_insert)
+        logger.debug(f"Added {len(stop_ids)} FERMO stops: {stop_ids}")
+        await _refresh_fermi_visuals(ts)
+    except RETRYABLE_ERRORS:
+        raise
+    except Exception as e:  # pragma: no cover - best effort logging
+        logger.warning(f"process_fermo_updates failed: {e}")
+
+
+db_write_queue.register_batch(process_fermo_update, process_fermo_updates)
@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime, timedelta
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from service.config.config import ROLLUP_BACKFILL_DAYS, ROLLUP_CATCHUP_HOURS, ROLLUP_CATCHUP_INTERVAL
+from service.connections.mysql import run_db
+from service.helpers.rollup import hour_floor
+from service.state import global_state
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHUNK = timedelta(days=1)
+
+
+def _oldest_end_time(conn) -> datetime | None:
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT MIN(end_time) AS oldest FROM productions")
+        row = cursor.fetchone()
+    return row["oldest"] if row else None
+
+
+async def backfill_rollup() -> None:
+    """Rebuild the rollup from the current hour backwards, one day per transaction."""
+    rollup = global_state.production_rollup
+    oldest = await run_db(_oldest_end_time)
+    end = hour_floor(datetime.now()) + timedelta(hours=1)
+    limit = end - timedelta(days=ROLLUP_BACKFILL_DAYS) if ROLLUP_BACKFILL_DAYS > 0 else None
+    if oldest is None:
+        rollup.mark_covered(end, complete=True)
+        return
+
+    floor = hour_floor(oldest) if limit is None else max(hour_floor(oldest), hour_floor(limit))
+    written = 0
+    while end > floor:
+        start = max(end - BACKFILL_CHUNK, floor)
+        written += await run_db(rollup.rebuild, start, end)
+        rollup.mark_covered(start, complete=start <= hour_floor(oldest))
+        end = start
+    logger.info(f"📊 Production rollup backfilled from {floor:%Y-%m-%d %H:%M} ({written} rows)")
+
+
+async def rollup_task() -> None:
+    """Create the rollup table, backfill it, then re-derive the recent hours periodically."""
+    rollup = global_state.production_rollup
+    try:
+        await run_db(rollup.ensure_table)
+    except Exception as e:
+        logger.error(f"❌ Production rollup disabled, table not available: {e}")
+        return
+
+    while True:
+        try:
+            await backfill_rollup()
+            break
+        except Exception as e:
+            logger.error(f"❌ Production rollup backfill failed, retrying: {e}")
+            await asyncio.sleep(ROLLUP_CATCHUP_INTERVAL)
+
+    # Catch-up: anything the incremental updates missed (manual edits, other writers)
+    while True:
+        await asyncio.sleep(ROLLUP_CATCHUP_INTERVAL)
+        end = hour_floor(datetime.now()) + timedelta(hours=1)
+        try:
+            await run_db(rollup.rebuild, end - timedelta(hours=ROLLUP_CATCHUP_HOURS), end)
+        except Exception as e:
+            logger.warning(f"Production rollup catch-up failed: {e}")
@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timedelta
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from service.config.config import VISUAL_CHECKPOINT_INTERVAL, ZONE_SOURCES
+from service.connections.mysql import run_db
+from service.helpers.ell_buffer import prune_ell_buffers
+from service.helpers.executor import run_in_thread
+from service.helpers.visual_helper import (
+    advance_zone_state,
+    get_shift_window,
+    refresh_fermi_data,
+    save_visual_checkpoint,
+)
+from service.routes.broadcast import broadcast_zone_update
+from service.state import global_state
+
+logger = logging.getLogger(__name__)
+
+# Past the hour, so events that ended right before it are folded in first
+ROTATION_DELAY = 1.0
+
+
+async def rotate_zones(now: datetime) -> list[str]:
+    """Rotate every zone to ``now`` in memory and push the zones that changed."""
+    rotated = []
+    for zone in ZONE_SOURCES:
+        if zone not in global_state.visual_data:
+            continue
+        try:
+            payload = await run_in_thread(advance_zone_state, zone, now)
+        except Exception as e:
+            logger.warning(f"Zone {zone} rotation failed: {e}")
+            continue
+        if payload is not None:
+            rotated.append(zone)
+            await broadcast_zone_update(line_name="Linea2", zone=zone, payload=payload)
+    return rotated
+
+
+async def on_new_shift(shift_start: datetime) -> None:
+    """Once per shift: stops still open carry over, the ELL buffers keep only the running shift."""
+    try:
+        await run_in_thread(refresh_fermi_data, "AIN", shift_start)
+    except Exception as e:
+        logger.warning(f"fermi_data refresh at shift start failed: {e}")
+    try:
+        removed = await run_db(prune_ell_buffers, shift_start)
+        logger.debug(f"ELL buffers pruned before {shift_start:%Y-%m-%d %H:%M} ({removed} productions)")
+    except Exception as e:
+        logger.warning(f"ELL buffer prune failed: {e}")
+
+
+async def zone_clock_task() -> None:
+    """Rotate the zones' hour / shift bins on every hour, so no reader has to."""
+    last_shift, _ = get_shift_window(datetime.now())
+    while True:
+        now = datetime.now()
+        next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        await asyncio.sleep((next_hour - now).total_seconds() + ROTATION_DELAY)
+
+        now = datetime.now()
+        rotated = await rotate_zones(now)
+        logger.debug(f"🕒 Zones rotated at {now:%H:%M}: {', '.join(rotated) or 'none'}")
+
+        shift_start, _ = get_shift_window(now)
+        if shift_start > last_shift:
+            last_shift = shift_start
+            await on_new_shift(shift_start)
+
+
+async def visual_checkpoint_task() -> None:
+    """Checkpoint visual_data every VISUAL_CHECKPOINT_INTERVAL seconds for warm restarts."""
+    if not global_state.visual_checkpoint.enabled:
+        return
+    while True:
+        await asyncio.sleep(VISUAL_CHECKPOINT_INTERVAL)
+        try:
+            await run_in_thread(save_visual_checkpoint)
+        except Exception as e:
+            logger.warning(f"visual_data checkpoint failed: {e}")
@@ -0,0 +1,303 @@
+"""
+Benchmark of the Excel export sheets.
+
+Builds a synthetic export (``--productions`` rows over the MIN / QG / ReWork
+stations, with defects of every category at QG and ReWork), runs
+``export_full_excel`` on it and reports, per sheet, the seconds spent and
+the production rows handled per second.
+
+With ``--baseline REV`` the ``helpers/export.py`` of that git revision runs
+on the same data first, for a before / after table; ``--check`` then also
+compares the two workbooks cell by cell (values and fills). ``--stream N``
+runs the current export through ``export_streaming`` in chunks of N
+modules instead, as the streaming export routes do (no per-sheet times);
+``--workers N`` renders the current export's sheets in N worker processes
+(per-sheet times are then the seconds until each sheet was done).
+``--format F`` writes the current export in another of EXPORT_FORMATS
+(through ``export_streaming``, in one chunk with the meta of the export route
+unless ``--stream``); for the csv / parquet bundles ``--check`` compares the
+rows per sheet and the Metadata values only.
+
+Usage (from be/service):
+    python tools/bench_export.py [--productions 50000] [--baseline REV] [--check] [--stream 2000 | --workers 8] [--format xlsx-fast]
+"""
+import argparse
+import csv
+import io
+from collections import defaultdict
+from datetime import datetime, timedelta
+import importlib.util
+import os
+from pathlib import Path
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+STATIONS = [
+    {"id": 1, "name": "MIN01", "type": "other", "line_id": 1},
+    {"id": 2, "name": "MIN02", "type": "other", "line_id": 1},
+    {"id": 3, "name": "QG01", "type": "qc", "line_id": 1},
+    {"id": 4, "name": "RMI01", "type": "rework", "line_id": 1},
+    {"id": 5, "name": "STR01", "type": "other", "line_id": 1},
+]
+LINES = [{"id": 1, "display_name": "Linea A"}]
+CATEGORIES = [
+    "Generali", "Saldatura", "Disallineamento", "Mancanza Ribbon", "I_Ribbon Leadwire",
+    "Macchie ECA", "Celle Rotte", "Lunghezza String Ribbon", "Graffio su Cella",
+    "Bad Soldering", "Altro",
+]
+GENERALI = ["Poe Scaduto", "No Good da Bussing", "Solo Poe", "Solo Vetro", "Test"]
+ALTRO = ["graffio vetro", "bolla", "cornice", "etichetta"]
+
+
+def synthetic_export(productions: int, ng_rate: float, seed: int = 7) -> dict:
+    """Export data as fetched by the export route: MIN -> QG (-> ReWork -> QG) per module."""
+    rng = random.Random(seed)
+    objects, rows, defects = [], [], []
+    t = datetime(2026, 10, 1, 6)
+    while len(rows) < productions:
+        object_id = len(objects) + 1
+        objects.append({"id": object_id, "id_modulo": f"3SBHBGHC25{object_id:08d}"})
+        ng = rng.random() < ng_rate
+        for station_id in [rng.choice((1, 2)), 3] + ([4, 3] if ng else []):
+            production_id = len(rows) + 1
+            rows.append({
+                "id": production_id, "object_id": object_id, "station_id": station_id,
+                "start_time": t, "end_time": t + timedelta(seconds=40),
+                "esito": 6 if ng and station_id == 3 else 1,
+                "cycle_time": f"0:00:{rng.randint(2, 59):02d}", "last_station_id": 5,
+            })
+            t += timedelta(seconds=20)
+            if ng and station_id in (3, 4) and rng.random() < 0.8:
+                for _ in range(rng.randint(1, 3)):
+                    category = rng.choice(CATEGORIES)
+                    defects.append({
+                        "production_id": production_id, "category": category,
+                        "defect_type": rng.choice(GENERALI) if category == "Generali" else None,
+                        "stringa": rng.randint(1, 12),
+                        "ribbon_lato": rng.choice("FMB"),
+                        "i_ribbon": rng.randint(1, 4),
+                        "s_ribbon": rng.randint(1, 2),
+                        "extra_data": rng.choice(ALTRO) if category == "Altro" else "",
+                    })
+    return {
+        "objects": objects, "productions": rows, "stations": STATIONS, "production_lines": LINES,
+        "object_defects": defects, "id_moduli": [o["id_modulo"] for o in objects],
+        # Cycle times run 2-59 s: the threshold splits G from NC
+        "filters": [{"type": "Data", "value": "01 Oct 2026 – 06:00 → 31 Oct 2026 – 05:59"}],
+        "min_cycle_threshold": 30.0,
+    }
+
+
+def stream_chunks(data: dict, chunk_modules: int):
+    """``data`` as the streaming routes read it: whole modules, ``chunk_modules`` at a time."""
+    objects = {o["id"]: o for o in data["objects"]}
+    defects = defaultdict(list)
+    for d in data["object_defects"]:
+        defects[d["production_id"]].append(d)
+
+    def chunk(productions):
+        chunk_objects = [objects[object_id] for object_id in dict.fromkeys(p["object_id"] for p in productions)]
+        return {
+            "objects": chunk_objects,
+            "id_moduli": [o["id_modulo"] for o in chunk_objects],
+            "productions": productions,
+            "object_defects": [d for p in productions for d in defects[p["id"]]],
+        }
+
+    batch, modules = [], 0
+    for production in sorted(data["productions"], key=lambda p: (p["object_id"], p["end_time"])):
+        if not batch or production["object_id"] != batch[-1]["object_id"]:
+            if modules == chunk_modules:
+                yield chunk(batch)
+                batch, modules = [], 0
+            modules += 1
+        batch.append(production)
+    if batch:
+        yield chunk(batch)
+
+
+def stream_meta(data: dict) -> dict:
+    return {
+        "stations": data["stations"], "production_lines": data["production_lines"],
+        "filters": data["filters"], "min_cycle_threshold": data["min_cycle_threshold"],
+        "altro_descriptions": sorted({d["extra_data"] for d in data["object_defects"] if d["category"] == "Altro"}),
+        "module_total": len(data["objects"]),
+    }
+
+
+def route_meta(data: dict) -> dict:
+    """What ``/api/export_objects`` passes along its single chunk for the non-xlsx formats."""
+    meta = {key: data[key] for key in ("filters", "min_cycle_threshold", "stations", "production_lines")}
+    meta["module_total"] = len(data["id_moduli"])
+    return meta
+
+
+def load_export(path: Path, name: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_revision(rev: str, workdir: Path):
+    repo = Path(__file__).resolve().parents[3]
+    source = subprocess.run(
+        ["git", "show", f"{rev}:be/service/helpers/export.py"],
+        cwd=repo, check=True, capture_output=True, text=True,
+    ).stdout
+    path = workdir / "export_baseline.py"
+    path.write_text(source, encoding="utf-8")
+    return load_export(path, "export_baseline")
+
+
+def run(module, data: dict, workbook: Path, stream: int = 0, workers: int = 1,
+        export_format: str = "xlsx") -> tuple[dict, float, Path]:
+    """Seconds per sheet (from the progress events), total seconds and the workbook, moved to ``workbook``."""
+    timings = {}
+    last = [time.perf_counter()]
+
+    def progress(stage, current, total):
+        now = time.perf_counter()
+        if stage.startswith("finished:"):
+            timings[stage.split(":", 1)[1]] = now - last[0]
+        # Sheets rendered side by side are timed from the start of all of them
+        if stage.startswith("finished:") and workers == 1 or stage == "start_sheets":
+            last[0] = now
+        elif stage == "saving":
+            timings["(save)"] = -now
+        elif stage == "done":
+            timings["(save)"] += now
+
+    t0 = time.perf_counter()
+    if stream or export_format != "xlsx":
+        if stream:
+            chunks, meta = stream_chunks(data, stream), stream_meta(data)
+        else:
+            chunks, meta = [data], route_meta(data)
+        filename = module.export_streaming(chunks, meta, progress_callback=progress,
+                                           export_format=export_format)
+    else:
+        kwargs = {"workers": workers} if workers > 1 else {}    # older revisions take no workers
+        filename = module.export_full_excel(data, progress_callback=progress, **kwargs)
+    total = time.perf_counter() - t0
+    # Both runs name the file after the current minute
+    shutil.move(os.path.join(module.EXPORT_DIR, filename), workbook)
+    return timings, total, workbook
+
+
+def workbook_cells(path: Path) -> dict:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path)
+    return {
+        # openpyxl and xlsxwriter write a different alpha in the fill colours;
+        # the export time in Metadata is left out
+        ws.title: [
+            [(None if row[0].value == "Data e ora esportazione:" and c.column > 1 else c.value,
+              str(c.fill.fgColor.rgb)[-6:]) for c in row]
+            for row in ws.iter_rows()
+        ]
+        for ws in wb.worksheets
+    }
+
+
+def bundle_rows(path: Path) -> dict:
+    """Data rows per sheet of a csv / parquet bundle."""
+    import pandas as pd
+
+    rows = {}
+    with zipfile.ZipFile(path) as bundle:
+        for name in bundle.namelist():
+            sheet, ext = os.path.splitext(name)
+            if ext == ".csv":
+                rows[sheet] = sum(1 for _ in csv.reader(io.TextIOWrapper(bundle.open(name), encoding="utf-8"))) - 1
+            elif ext == ".parquet":
+                rows[sheet] = len(pd.read_parquet(io.BytesIO(bundle.read(name))))
+    return rows
+
+
+def bundle_metadata(path: Path) -> list:
+    """(Voce, Valore) pairs of a bundle's Metadata, as text, without the export time."""
+    import pandas as pd
+
+    with zipfile.ZipFile(path) as bundle:
+        name = next(n for n in bundle.namelist() if os.path.splitext(n)[0] == "Metadata")
+        raw = bundle.read(name)
+    frame = pd.read_csv(io.BytesIO(raw), dtype=str) if name.endswith(".csv") else pd.read_parquet(io.BytesIO(raw))
+    return [
+        (as_text(voce), "" if voce == "Data e ora esportazione:" else as_text(valore))
+        for voce, valore in frame.itertuples(index=False)
+    ]
+
+
+def as_text(value) -> str:
+    return "" if value is None or value != value else str(value)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--productions", type=int, default=50_000)
+    parser.add_argument("--ng-rate", type=float, default=0.15, help="share of modules sent to ReWork")
+    parser.add_argument("--baseline", metavar="REV", help="git revision of helpers/export.py to compare with")
+    parser.add_argument("--check", action="store_true", help="compare the workbooks with the baseline")
+    parser.add_argument("--stream", type=int, default=0, metavar="N", help="stream the current export, N modules per chunk")
+    parser.add_argument("--workers", type=int, default=1, metavar="N", help="render the current export's sheets in N processes")
+    parser.add_argument("--format", default="xlsx", help="write the current export in this format of EXPORT_FORMATS")
+    args = parser.parse_args()
+
+    data = synthetic_export(args.productions, args.ng_rate)
+    n = len(data["productions"])
+    print(f"{n} productions, {len(data['objects'])} modules, {len(data['object_defects'])} defects")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = {}
+        if args.baseline:
+            runs["before"] = run(load_revision(args.baseline, Path(tmp)), data, Path(tmp) / "before.xlsx")
+        # Imported by name: worker processes get its functions by reference
+        current = importlib.import_module("service.helpers.export")
+        extension = current.EXPORT_FORMATS[args.format].extension
+        runs["after"] = run(current, data, Path(tmp) / f"after.{extension}", args.stream, args.workers, args.format)
+
+        names = list(dict.fromkeys(name for timings, _, _ in runs.values() for name in timings))
+        print(f"{'sheet':<28}" + "".join(f"{name + ' s':>12}{'rows/s':>10}" for name in runs))
+        for sheet in names:
+            line = f"{sheet:<28}"
+            for timings, _, _ in runs.values():
+                seconds = timings.get(sheet)
+                line += f"{seconds:>12.2f}{n / seconds:>10.0f}" if seconds else f"{'-':>12}{'-':>10}"
+            print(line)
+        print(f"{'total':<28}" + "".join(f"{total:>12.2f}{n / total:>10.0f}" for _, total, _ in runs.values()))
+        if "before" in runs:
+            print(f"speed-up: {runs['before'][1] / runs['after'][1]:.1f}x")
+
+        if args.check and "before" in runs:
+            before = workbook_cells(runs["before"][2])
+            if extension == "xlsx":
+                after = workbook_cells(runs["after"][2])
+                differ = [sheet for sheet in after if before.get(sheet) != after[sheet]]
+            else:
+                after = bundle_rows(runs["after"][2])
+                differ = [
+                    sheet for sheet in before
+                    if sheet != "Metadata" and after.get(sheet, 0) != len(before[sheet]) - 1
+                ]
+                metadata = [
+                    tuple(as_text(value) for value, _ in (row + [(None, None)])[:2])
+                    for row in before["Metadata"] if row and row[0][0] is not None
+                ]
+                if bundle_metadata(runs["after"][2]) != metadata:
+                    differ.append("Metadata")
+            print("exports match" if not differ else f"sheets differ: {', '.join(differ)}")
+            return 1 if differ else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+"""
+Benchmark of the unique-object counts behind the zone snapshots.
+
+Loads a synthetic month of ``productions`` into a scratch schema and times,
+for the same set of windows as ``_compute_snapshot_ain`` (current shift,
+3 previous shifts, last 8 hours, station groups in / NG) plus the combined
+NG count of ``count_unique_ng_objects`` (distinct modules over several
+stations, as the ELL ng_tot):
+
+- legacy   one correlated NOT EXISTS query per (stations, window, filter)
+- single   ``load_unique_counts``: one ROW_NUMBER() pass for every hour
+- rollup   ``production_rollup_hourly`` rebuilt for the month, then one read
+
+and checks that the three give the same numbers. Counts the view declines
+(``RollupView.count`` returns None) run the legacy query, as the
+``count_unique_*`` helpers of visual_helper fall back to SQL.
+
+Usage (from be/service, needs a MySQL 8 user allowed to create the schema):
+    python tools/bench_unique_counts.py --database ix_monitor_bench [--days 30] [--rate 55]
+Connection settings come from MYSQL_HOST / MYSQL_PORT / MYSQL_USER / MYSQL_PASSWORD.
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+from pathlib import Path
+import random
+import statistics
+import sys
+import time
+
+import pymysql
+from pymysql.cursors import DictCursor
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from service.helpers.rollup import (  # noqa: E402
+    KIND_FIRST,
+    KIND_LATEST,
+    ProductionRollup,
+    load_unique_counts,
+)
+
+STATIONS = {1: "MIN01", 2: "MIN02", 3: "RMI01", 9: "ELL01"}
+GROUPS = {   # as ZONE_SOURCES["AIN"]
+    "station_1_in": ["MIN01"],
+    "station_2_in": ["MIN02"],
+    "station_1_out_ng": ["MIN01"],
+    "station_2_out_ng": ["MIN02"],
+}
+# A module NG at MIN and again at ELL counts once
+NG_TOT_STATIONS = ["MIN01", "MIN02", "ELL01"]
+
+LEGACY_SQL = """
+    SELECT COUNT(*) AS cnt
+    FROM (
+        SELECT p.object_id
+        FROM productions p
+        JOIN stations s ON p.station_id = s.id
+        WHERE s.name IN ({placeholders})
+        AND p.end_time BETWEEN %s AND %s
+        {esito_condition}
+        AND NOT EXISTS (
+            SELECT 1
+            FROM productions p2
+            WHERE p2.object_id = p.object_id
+            AND p2.station_id = p.station_id
+            AND p2.end_time {cmp} p.end_time
+        )
+    ) AS counted
+"""
+
+LEGACY_NG_SQL = """
+    SELECT COUNT(DISTINCT p.object_id) AS cnt
+    FROM productions p
+    JOIN stations s ON p.station_id = s.id
+    WHERE s.name IN ({placeholders})
+    AND p.end_time BETWEEN %s AND %s
+    AND p.esito = 6
+    AND NOT EXISTS (
+        SELECT 1
+        FROM productions p2
+        WHERE p2.object_id = p.object_id
+        AND p2.station_id = p.station_id
+        AND p2.end_time > p.end_time
+    )
+"""
+
+SCHEMA = [
+    """CREATE TABLE stations (
+        id int NOT NULL, name varchar(50) NOT NULL, line_id int NOT NULL DEFAULT 1,
+        PRIMARY KEY (id)
+    )""",
+    """CREATE TABLE productions (
+        id int NOT NULL AUTO_INCREMENT,
+        object_id int NOT NULL,
+        station_id int NOT NULL,
+        start_time datetime DEFAULT NULL,
+        end_time datetime DEFAULT NULL,
+        esito int DEFAULT NULL,
+        cycle_time time GENERATED ALWAYS AS (timediff(end_time, start_time)) STORED,
+        PRIMARY KEY (id),
+        KEY idx_prod_time (start_time, end_time),
+        KEY idx_productions_object_station_time (object_id, station_id, start_time),
+        KEY idx_productions_station_esito_endtime (station_id, esito, end_time),
+        KEY idx_productions_object_id (object_id)
+    )""",
+]
+
+
+def connect(database: str | None = None):
+    return pymysql.connect(
+        host=os.getenv("MYSQL_HOST", "localhost"),
+        port=int(os.getenv("MYSQL_PORT", "3306")),
+        user=os.getenv("MYSQL_USER", "root"),
+        password=os.getenv("MYSQL_PASSWORD", ""),
+        database=database,
+        cursorclass=DictCursor,
+        autocommit=False,
+    )
+
+
+def synthetic_month(end: datetime, days: int, rate: int, rework: float, seed: int = 7):
+    """Rows (object_id, station_id, start, end, esito): objects through MIN0x then ELL01, some reworked."""
+    rng = random.Random(seed)
+    t = end - timedelta(days=days)
+    step = 3600 / rate
+    object_id = 0
+    while t < end:
+        for station_id in (1, 2):
+            object_id += 1
+            ts = t + timedelta(seconds=rng.uniform(0, step))
+            passes = 2 if rng.random() < rework else 1
+            for n in range(passes):
+                cycle = rng.randint(25, 60)
+                ng = rng.random() < (0.06 if n == 0 else 0.02)
+                yield object_id, station_id, ts, ts + timedelta(seconds=cycle), 6 if ng else 1
+                ell_end = ts + timedelta(seconds=cycle + rng.randint(120, 600))
+                yield object_id, 9, ell_end - timedelta(seconds=40), ell_end, 6 if rng.random() < 0.03 else 1
+                ts += timedelta(minutes=rng.randint(20, 180))
+        t += timedelta(seconds=step)
+
+
+def snapshot_windows(now: datetime):
+    """(stations, start, end, kind, esito_filter, distinct) of an AIN snapshot and the ELL ng_tot."""
+    def shift_window(ts):
+        h = ts.hour
+        base = ts.replace(minute=0, second=0, microsecond=0)
+        if 6 <= h < 14:
+            return base.replace(hour=6), base.replace(hour=14)
+        if 14 <= h < 22:
+            return base.replace(hour=14), base.replace(hour=22)
+        start = base.replace(hour=22) if h >= 22 else (base - timedelta(days=1)).replace(hour=22)
+        return start, start + timedelta(hours=8)
+
+    windows = []
+    shifts, ref = [], now
+    for _ in range(3):
+        start, end = shift_window(ref)
+        shifts.append((start, end))
+        ref = start - timedelta(seconds=1)
+    hours = []
+    for i in range(8):
+        h = (now - timedelta(hours=7 - i)).replace(minute=0, second=0, microsecond=0)
+        hours.append((h, h + timedelta(hours=1)))
+    for start, end in [shifts[0]] + shifts + hours:
+        windows += [
+            (GROUPS["station_1_in"], start, end, KIND_LATEST, "all", False),
+            (GROUPS["station_2_in"], start, end, KIND_LATEST, "all", False),
+            (GROUPS["station_1_out_ng"], start, end, KIND_LATEST, "ng", False),
+            (GROUPS["station_2_out_ng"], start, end, KIND_LATEST, "ng", False),
+            (GROUPS["station_1_in"], start, end, KIND_FIRST, "all", False),
+            (GROUPS["station_1_out_ng"], start, end, KIND_FIRST, "ng", False),
+            (NG_TOT_STATIONS, start, end, KIND_LATEST, "ng", True),
+        ]
+    return windows, shifts[-1][0], shifts[0][1]
+
+
+def legacy_count(cursor, window):
+    names, start, end, kind, esito_filter, distinct = window
+    esito_condition = {"good": "AND p.esito IN (1, 5, 7)", "ng": "AND p.esito = 6"}.get(esito_filter, "")
+    sql = (LEGACY_NG_SQL if distinct else LEGACY_SQL).format(
+        placeholders=", ".join(["%s"] * len(names)),
+        esito_condition=esito_condition,
+        cmp="<" if kind == KIND_FIRST else ">",
+    )
+    # The legacy window is inclusive; the new ones are half-open hours
+    cursor.execute(sql, (*names, start, end - timedelta(seconds=1)))
+    return cursor.fetchone()["cnt"] or 0
+
+
+def legacy_counts(cursor, windows):
+    return [legacy_count(cursor, window) for window in windows]
+
+
+def view_counts(cursor, view, windows):
+    results = []
+    for window in windows:
+        names, start, end, kind, esito_filter, distinct = window
+        counted = view.count(names, start, end, kind, esito_filter, distinct_objects=distinct)
+        results.append(legacy_count(cursor, window) if counted is None else counted)
+    return results
+
+
+def timed(fn, repeat: int):
+    samples, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples), result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="ix_monitor_bench")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--rate", type=int, default=55, help="modules per hour per MIN station")
+    parser.add_argument("--rework", type=float, default=0.08, help="share of modules reworked once")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="reuse the schema if it is already loaded")
+    args = parser.parse_args()
+
+    now = datetime.now().replace(minute=30, second=0, microsecond=0)
+    admin = connect()
+    with admin.cursor() as cursor:
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{args.database}`")
+    admin.close()
+
+    conn = connect(args.database)
+    with conn.cursor() as cursor:
+        cursor.execute("SHOW TABLES LIKE 'productions'")
+        loaded = args.keep and cursor.fetchone() is not None
+        if not loaded:
+            for table in ("production_rollup_hourly", "productions", "stations"):
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            for ddl in SCHEMA:
+                cursor.execute(ddl)
+            cursor.executemany("INSERT INTO stations (id, name) VALUES (%s, %s)", list(STATIONS.items()))
+            t0 = time.perf_counter()
+            batch, total = [], 0
+            sql = "INSERT INTO productions (object_id, station_id, start_time, end_time, esito) VALUES (%s, %s, %s, %s, %s)"
+            for row in synthetic_month(now, args.days, args.rate, args.rework):
+                batch.append(row)
+                if len(batch) == 5000:
+                    cursor.executemany(sql, batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
+                total += len(batch)
+            cursor.execute("ANALYZE TABLE productions")
+            cursor.fetchall()
+            conn.commit()
+            print(f"Loaded {total} productions over {args.days} days in {time.perf_counter() - t0:.1f}s")
+
+    windows, view_start, view_end = snapshot_windows(now)
+    stations = sorted({name for names, *_ in windows for name in names})
+    print(f"{len(windows)} counts per snapshot, {view_start:%Y-%m-%d %H:%M} -> {view_end:%Y-%m-%d %H:%M}")
+
+    with conn.cursor() as cursor:
+        legacy_t, legacy = timed(lambda: legacy_counts(cursor, windows), args.repeat)
+        single_t, single = timed(
+            lambda: view_counts(cursor, load_unique_counts(cursor, stations, view_start, view_end), windows),
+            args.repeat)
+
+    rollup = ProductionRollup()
+    rollup.ensure_table(conn)
+    t0 = time.perf_counter()
+    # Up to the end of the current shift: reworks of the synthetic month end after now
+    rollup.rebuild(conn, now - timedelta(days=args.days + 1), max(view_end, now + timedelta(hours=1)))
+    rollup.mark_covered(now - timedelta(days=args.days + 1), complete=True)
+    rebuild_t = time.perf_counter() - t0
+    with conn.cursor() as cursor:
+        rollup_t, from_rollup = timed(
+            lambda: view_counts(cursor, rollup.load_view(cursor, stations, view_start, view_end), windows),
+            args.repeat)
+    conn.close()
+
+    print(f"{'method':<10}{'median':>12}{'vs legacy':>12}")
+    for name, seconds in (("legacy", legacy_t), ("single", single_t), ("rollup", rollup_t)):
+        print(f"{name:<10}{seconds * 1000:>10.1f}ms{legacy_t / seconds:>11.1f}x")
+    print(f"rollup rebuild of {args.days} days: {rebuild_t:.1f}s")
+
+    mismatches = [
+        (w[0], w[1], w[2], w[3], w[4], a, b, c)
+        for w, a, b, c in zip(windows, legacy, single, from_rollup) if not a == b == c
+    ]
+    for names, start, end, kind, esito_filter, a, b, c in mismatches[:10]:
+        print(f"  mismatch {'+'.join(names)} {start:%d %H:%M}-{end:%H:%M} {kind}/{esito_filter}: "
+              f"legacy={a} single={b} rollup={c}")
+    print("counts match" if not mismatches else f"{len(mismatches)} counts differ")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Flags blocking MySQL access written directly inside coroutines.
+
+A pymysql call in an ``async def`` runs on the event loop thread and stalls
+everything else (PLC polling, WebSockets) until the query returns. DB work
+belongs in a sync function handed to ``run_db`` / ``run_in_thread``; nested
+sync ``def``s and lambdas inside a coroutine are therefore not reported.
+
+Usage (from be/service):  python tools/check_sync_db.py [paths...]
+Exit code 1 when something is found. Append ``# sync-db: ok`` to a line to
+accept it on purpose.
+"""
+import ast
+from pathlib import Path
+import sys
+
+BLOCKING_FUNCTIONS = {"get_mysql_connection", "get_line_name"}
+BLOCKING_METHODS = {"cursor", "execute", "executemany", "fetchone", "fetchall", "fetchmany", "commit", "rollback"}
+SUPPRESS = "# sync-db: ok"
+DEFAULT_PATHS = ("routes", "tasks", "helpers", "connections", "controllers", "main.py")
+
+
+class _CoroutineVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.findings: list[tuple[int, str, str]] = []
+        self._coroutine: list[str] = []
+
+    def visit_AsyncFunctionDef(self, node):
+        self._coroutine.append(node.name)
+        self.generic_visit(node)
+        self._coroutine.pop()
+
+    def _visit_sync_scope(self, node):
+        # Code in a nested sync function runs wherever it is called, usually a worker thread
+        saved, self._coroutine = self._coroutine, []
+        self.generic_visit(node)
+        self._coroutine = saved
+
+    visit_FunctionDef = _visit_sync_scope
+    visit_Lambda = _visit_sync_scope
+
+    def visit_Call(self, node):
+        if self._coroutine:
+            func = node.func
+            name = None
+            if isinstance(func, ast.Name) and func.id in BLOCKING_FUNCTIONS:
+                name = func.id
+            elif isinstance(func, ast.Attribute) and func.attr in BLOCKING_METHODS:
+                name = f".{func.attr}"
+            if name:
+                self.findings.append((node.lineno, self._coroutine[-1], name))
+        self.generic_visit(node)
+
+
+def check_file(path: Path) -> list[str]:
+    source = path.read_text(encoding="utf-8")
+    try:
+        tree = ast.parse(source, filename=str(path))
+    except SyntaxError as e:
+        return [f"{path}:{e.lineno}: cannot parse ({e.msg})"]
+    lines = source.splitlines()
+    visitor = _CoroutineVisitor()
+    visitor.visit(tree)
+    return [
+        f"{path}:{lineno}: {name}() inside async def {coroutine}"
+        for lineno, coroutine, name in visitor.findings
+        if SUPPRESS not in lines[lineno - 1]
+    ]
+
+
+def iter_files(paths):
+    for raw in paths:
+        path = Path(raw)
+        if path.is_dir():
+            yield from sorted(p for p in path.rglob("*.py") if "__pycache__" not in p.parts)
+        elif path.suffix == ".py":
+            yield path
+
+
+def main(argv: list[str]) -> int:
+    paths = argv or [p for p in DEFAULT_PATHS if Path(p).exists()]
+    problems = [line for f in iter_files(paths) for line in check_file(f)]
+    for line in problems:
+        print(line)
+    print(f"{len(problems)} blocking DB call(s) in coroutines", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
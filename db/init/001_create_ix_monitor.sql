@@ -167,6 +167,26 @@ CREATE TABLE `production_lines` (
 ) ENGINE=InnoDB AUTO_INCREMENT=4 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
+--
+-- Table structure for table `production_rollup_hourly`
+--
+
+DROP TABLE IF EXISTS `production_rollup_hourly`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `production_rollup_hourly` (
+  `station_id` int NOT NULL,
+  `bucket` datetime NOT NULL,
+  `kind` enum('all','first','latest') NOT NULL,
+  `esito` int NOT NULL,
+  `n` int NOT NULL DEFAULT '0',
+  `cycle_seconds` bigint NOT NULL DEFAULT '0',
+  `cycle_n` int NOT NULL DEFAULT '0',
+  PRIMARY KEY (`station_id`,`bucket`,`kind`,`esito`),
+  KEY `idx_rollup_bucket` (`bucket`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
 --
 -- Table structure for table `productions`
 --
@@ -106,6 +106,10 @@ class WebSocketService {
   }
 
   // ----------------- VISUAL MONITORING -----------------
+  // Delta protocol: a snapshot, then JSON-patch messages numbered by seq
+  Map<String, dynamic>? _visualState;
+  int _visualSeq = 0;
+
   void connectToVisual({
     required String line,
     required String zone,
@@ -114,18 +118,76 @@ class WebSocketService {
     void Function(dynamic)? onError,
   }) {
     close();
+    _visualState = null;
 
-    final uri = Uri.parse('$baseUrl/ws/visual/$line/$zone');
+    final uri = Uri.parse('$baseUrl/ws/visual/$line/$zone?protocol=delta');
     _channel = WebSocketChannel.connect(uri);
 
     _handleStream(
       stream: _channel!.stream,
-      onMessage: (msg) => onMessage(jsonDecode(msg)),
+      onMessage: (msg) {
+        final state = _applyVisualMessage(jsonDecode(msg));
+        if (state != null) onMessage(state);
+      },
       onDone: onDone,
       onError: onError,
     );
   }
 
+  // The zone state after the message, null while waiting for a snapshot
+  Map<String, dynamic>? _applyVisualMessage(Map<String, dynamic> message) {
+    final seq = message['seq'] as int;
+    if (message['type'] == 'snapshot') {
+      _visualState = Map<String, dynamic>.from(message['data']);
+      _visualSeq = seq;
+      return _visualState;
+    }
+    if (_visualState == null || seq <= _visualSeq) return null;
+
+    try {
+      if (seq != _visualSeq + 1) throw StateError('missed patch ${_visualSeq + 1}');
+      for (final op in message['ops']) {
+        _applyPatchOp(_visualState!, op);
+      }
+      _visualSeq = seq;
+      return _visualState;
+    } catch (_) {
+      _visualState = null;
+      _channel?.sink.add(jsonEncode({'type': 'resync'}));
+      return null;
+    }
+  }
+
+  static void _applyPatchOp(Map<String, dynamic> doc, Map<String, dynamic> op) {
+    final tokens = (op['path'] as String)
+        .split('/')
+        .skip(1)
+        .map((t) => t.replaceAll('~1', '/').replaceAll('~0', '~'))
+        .toList();
+    dynamic parent = doc;
+    for (final token in tokens.take(tokens.length - 1)) {
+      parent = parent is List ? parent[int.parse(token)] : parent[token];
+    }
+    final last = tokens.last;
+    if (parent is List) {
+      final index = last == '-' ? parent.length : int.parse(last);
+      switch (op['op']) {
+        case 'add':
+          parent.insert(index, op['value']);
+          break;
+        case 'remove':
+          parent.removeAt(index);
+          break;
+        default:
+          parent[index] = op['value'];
+      }
+    } else if (op['op'] == 'remove') {
+      (parent as Map).remove(last);
+    } else {
+      (parent as Map)[last] = op['value'];
+    }
+  }
+
   // ----------------- ESCALATIONS -----------------
   void connectToEscalations({
     void Function()? onDone,